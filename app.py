@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from ui.course_ui import render_course_metadata, load_app_config
 from ui.learning_outcomes_ui import render_learning_outcomes
 from services.file_service import FileService
+from services.prompt_service import get_prompt_service
 
 # Configure logging
 logging.basicConfig(
@@ -18,6 +19,9 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Pick up prompt template edits without restarting the app
+get_prompt_service().start_watching()
+
 # App title and configuration
 st.set_page_config(
     page_title="CourseSmith",
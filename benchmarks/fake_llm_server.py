@@ -0,0 +1,477 @@
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# Words the fake replies are made of, one token each
+REPLY_WORDS = (
+    "learners",
+    "explore",
+    "how",
+    "language",
+    "models",
+    "generate",
+    "structured",
+    "course",
+    "content",
+    "step",
+    "by",
+    "step",
+)
+
+# Tokens sent per streamed chunk
+STREAM_CHUNK_TOKENS = 4
+
+
+class FakeLLMBehavior:
+    """How the fake server responds: its latency, speed and injected failures."""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        output_tokens: int = 200,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 0.1,
+        seed: int = 0,
+    ):
+        """
+        Initialize the behavior.
+
+        Args:
+            latency: Seconds before the first token of every response
+            jitter: Up to this many seconds added to the latency at random
+            tokens_per_second: Output speed (None sends the reply at once)
+            output_tokens: Tokens per reply, capped at the request's max_tokens
+            error_rate: Share of generation requests failed with a server
+                error (529 for Anthropic, 500 for the others)
+            rate_limit_rate: Share of generation requests rejected with 429
+            retry_after: The retry-after header sent with a 429, in seconds
+            seed: Seed of the random failures and jitter
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the behavior's settings."""
+        return dict(vars(self))
+
+
+# Outline of every reply, shaped to pass the pipeline's output validation
+REPLY_TEMPLATE = (
+    "# Lesson: Benchmark\n\n## Introduction\nIntroduction.\n\n"
+    "## Learning Outcomes\nLO 1: Benchmark outcome.\n\n<LO1>\n{body}\n</LO1>\n\n"
+    "## Conclusion\nConclusion."
+)
+
+# Tokens the reply outline takes up
+REPLY_TEMPLATE_TOKENS = 20
+
+
+def reply_text(tokens: int) -> str:
+    """Build a deterministic reply of about a given number of tokens."""
+    count = max(tokens - REPLY_TEMPLATE_TOKENS, 1)
+    words = [REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(count)]
+    return REPLY_TEMPLATE.format(body=" ".join(words))
+
+
+def reply_chunks(text: str) -> Iterator[str]:
+    """Split a reply into streamed chunks of a few tokens each."""
+    words = text.split(" ")
+    for i in range(0, len(words), STREAM_CHUNK_TOKENS):
+        chunk = " ".join(words[i : i + STREAM_CHUNK_TOKENS])
+        yield chunk if i == 0 else " " + chunk
+
+
+class FakeLLMServer:
+    """
+    Local HTTP server that answers like the LLM providers' APIs.
+
+    Speaks enough of the Anthropic Messages API (including streaming and
+    token counting), the OpenAI and LM Studio chat completions API and the
+    Ollama generate API for the LLM services to run unchanged against it,
+    with configurable latency, output speed and injected errors and rate
+    limits. Replies are deterministic, so runs can be compared.
+    """
+
+    def __init__(self, behavior: Optional[FakeLLMBehavior] = None, port: int = 0):
+        """
+        Initialize the server.
+
+        Args:
+            behavior: How the server responds (defaults to FakeLLMBehavior())
+            port: Port to listen on (0 picks a free one)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.behavior = behavior or FakeLLMBehavior()
+        self.port = port
+        self.stats: Dict[str, int] = {}
+        self._random = random.Random(self.behavior.seed)
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Root URL of the running server."""
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> "FakeLLMServer":
+        """Start serving in a background thread."""
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="fake-llm-server", daemon=True
+        )
+        self._thread.start()
+        self.logger.info(f"Fake LLM server listening on {self.url}")
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "FakeLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, key: str):
+        """Count an event in the server's stats."""
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def draw_failure(self) -> Optional[int]:
+        """Decide whether the next generation request fails, and how."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.behavior.rate_limit_rate:
+            return 429
+        if roll < self.behavior.rate_limit_rate + self.behavior.error_rate:
+            return 500
+        return None
+
+    def first_token_delay(self) -> float:
+        """Seconds to wait before a response's first token."""
+        with self._lock:
+            jitter = self._random.uniform(0, self.behavior.jitter)
+        return self.behavior.latency + jitter
+
+    def token_delay(self, tokens: int) -> float:
+        """Seconds it takes to generate some tokens."""
+        if not self.behavior.tokens_per_second:
+            return 0.0
+        return tokens / self.behavior.tokens_per_second
+
+
+def estimate_input_tokens(body: Dict[str, Any]) -> int:
+    """Estimate the prompt tokens of a request (about 4 characters each)."""
+    return max(1, len(json.dumps(body)) // 4)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler of FakeLLMServer."""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self) -> FakeLLMServer:
+        return self.server.fake
+
+    def log_message(self, format: str, *args):
+        """Keep request logs out of benchmark output."""
+
+    # Responses
+
+    def _send_json(
+        self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None
+    ):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str):
+        # Streams end when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _write(self, data: str):
+        self.wfile.write(data.encode())
+        self.wfile.flush()
+
+    def _stream_chunks(self, text: str, encode) -> Iterator[None]:
+        """Write a reply chunk by chunk at the configured token rate."""
+        for chunk in reply_chunks(text):
+            time.sleep(self.fake.token_delay(len(chunk.split())))
+            self._write(encode(chunk))
+            yield
+
+    def _fail(self, status: int, provider: str):
+        """Send an injected failure, if one was drawn."""
+        if status == 429:
+            self.fake.count("rate_limited")
+            self._send_json(
+                429,
+                {"error": {"type": "rate_limit_error", "message": "Rate limited"}},
+                {"retry-after": str(self.fake.behavior.retry_after)},
+            )
+        else:
+            self.fake.count("errors")
+            if provider == "anthropic":
+                status = 529
+            self._send_json(
+                status, {"error": {"type": "overloaded_error", "message": "Overloaded"}}
+            )
+
+    # Routing
+
+    def do_GET(self):
+        self.fake.count("requests")
+        if self.path == "/api/ps":
+            self._send_json(200, {"models": []})
+        elif self.path.startswith("/api/v0/models/"):
+            self._send_json(
+                200, {"id": self.path.rsplit("/", 1)[-1], "state": "loaded"}
+            )
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        self.fake.count("requests")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/v1/messages/count_tokens":
+            self._send_json(200, {"input_tokens": estimate_input_tokens(body)})
+            return
+
+        handlers = {
+            "/v1/messages": ("anthropic", self._anthropic),
+            "/v1/chat/completions": ("openai", self._openai),
+            "/api/generate": ("ollama", self._ollama),
+        }
+        if self.path not in handlers:
+            self._send_json(404, {"error": "Not found"})
+            return
+        provider, handler = handlers[self.path]
+
+        # Loading a model (an empty Ollama prompt) never fails
+        if not (provider == "ollama" and not body.get("prompt")):
+            failure = self.fake.draw_failure()
+            if failure is not None:
+                self._fail(failure, provider)
+                return
+
+        self.fake.count("completions")
+        time.sleep(self.fake.first_token_delay())
+        output_tokens = min(
+            self.fake.behavior.output_tokens,
+            body.get("max_tokens")
+            or body.get("options", {}).get("num_predict")
+            or self.fake.behavior.output_tokens,
+        )
+        handler(body, estimate_input_tokens(body), output_tokens)
+
+    def _anthropic(self, body: Dict[str, Any], input_tokens: int, output_tokens: int):
+        text = reply_text(output_tokens)
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        message = {
+            "id": "msg_benchmark",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [],
+            "stop_reason": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 0},
+        }
+        if not body.get("stream"):
+            time.sleep(self.fake.token_delay(output_tokens))
+            message.update(
+                content=[{"type": "text", "text": text}],
+                stop_reason="end_turn",
+                usage=usage,
+            )
+            self._send_json(200, message)
+            return
+
+        def event(name: str, data: Dict[str, Any]) -> str:
+            return f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n"
+
+        self._start_stream("text/event-stream")
+        self._write(event("message_start", {"message": message}))
+        self._write(
+            event(
+                "content_block_start",
+                {"index": 0, "content_block": {"type": "text", "text": ""}},
+            )
+        )
+        for _ in self._stream_chunks(
+            text,
+            lambda chunk: event(
+                "content_block_delta",
+                {"index": 0, "delta": {"type": "text_delta", "text": chunk}},
+            ),
+        ):
+            pass
+        self._write(event("content_block_stop", {"index": 0}))
+        self._write(
+            event(
+                "message_delta",
+                {
+                    "delta": {"stop_reason": "end_turn"},
+                    "usage": {"output_tokens": output_tokens},
+                },
+            )
+        )
+        self._write(event("message_stop", {}))
+
+    def _openai(self, body: Dict[str, Any], input_tokens: int, output_tokens: int):
+        text = reply_text(output_tokens)
+        if not body.get("stream"):
+            time.sleep(self.fake.token_delay(output_tokens))
+            self._send_json(
+                200,
+                {
+                    "id": "chatcmpl-benchmark",
+                    "object": "chat.completion",
+                    "model": body.get("model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": input_tokens,
+                        "completion_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                },
+            )
+            return
+
+        def data(payload: Dict[str, Any]) -> str:
+            return f"data: {json.dumps(payload)}\n\n"
+
+        self._start_stream("text/event-stream")
+        for _ in self._stream_chunks(
+            text,
+            lambda chunk: data(
+                {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+            ),
+        ):
+            pass
+        self._write(
+            data({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        )
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._write(
+                data(
+                    {
+                        "choices": [],
+                        "usage": {
+                            "prompt_tokens": input_tokens,
+                            "completion_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens,
+                        },
+                    }
+                )
+            )
+        self._write("data: [DONE]\n\n")
+
+    def _ollama(self, body: Dict[str, Any], input_tokens: int, output_tokens: int):
+        if not body.get("prompt"):
+            self._send_json(
+                200, {"model": body.get("model"), "done": True, "done_reason": "load"}
+            )
+            return
+
+        text = reply_text(output_tokens)
+        final = {
+            "model": body.get("model"),
+            "response": "",
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": input_tokens,
+            "eval_count": output_tokens,
+        }
+        if body.get("stream") is False:
+            time.sleep(self.fake.token_delay(output_tokens))
+            self._send_json(200, {**final, "response": text})
+            return
+
+        self._start_stream("application/x-ndjson")
+        for _ in self._stream_chunks(
+            text,
+            lambda chunk: json.dumps(
+                {"model": body.get("model"), "response": chunk, "done": False}
+            )
+            + "\n",
+        ):
+            pass
+        self._write(json.dumps(final) + "\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Serve until interrupted, e.g. to point the app at the fake server."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.fake_llm_server",
+        description="Serve fake Anthropic, OpenAI, Ollama and LM Studio APIs.",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    behavior = FakeLLMBehavior(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+    )
+    with FakeLLMServer(behavior, args.port) as server:
+        print(f"Fake LLM server on {server.url} (Ctrl+C to stop)")
+        print(f"  ANTHROPIC_BASE_URL={server.url}")
+        print(f"  OPENAI_BASE_URL={server.url}")
+        print(f"  OLLAMA_BASE_URL={server.url}")
+        print(f"  LMSTUDIO_BASE_URL={server.url}/v1")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,460 @@
+"""
+Offline benchmark of the lesson pipelines against a fake LLM server.
+
+Runs LessonPipeline, DraftPipeline or a course-wide CourseGenerationRunner
+against FakeLLMServer, so pipeline overhead and concurrency gains can be
+measured without API keys, and reports throughput, lesson latency and the
+latency and overhead of each step.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark --scenario course --lessons 8
+    python -m benchmarks.pipeline_benchmark --provider ollama --latency 0.2 \\
+        --tokens-per-second 400 --rate-limit-rate 0.05 --json
+    python -m benchmarks.pipeline_benchmark --output baseline.json
+    python -m benchmarks.pipeline_benchmark --baseline baseline.json
+
+With --baseline, exits with status 1 when a latency got slower or the
+throughput dropped by more than the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from benchmarks.fake_llm_server import FakeLLMBehavior, FakeLLMServer
+from models.lesson import Lesson
+from services.course_runner import CourseGenerationRunner
+from services.draft_pipeline_service import DraftPipeline
+from services.file_service import FileService
+from services.http_transport import HTTPTransport
+from services.llm_service import (
+    LLMService,
+    LMStudioService,
+    OllamaLLMService,
+    OpenAILLMService,
+)
+from services.anthropic_service import AnthropicLLMService
+from services.pipeline_service import LessonPipeline
+from services.rate_limiter import RateLimiter
+from services.run_history import percentile
+from services.token_budget import get_token_limits
+
+SCENARIOS = ("lesson", "draft", "course")
+
+# Model each provider's service is created with
+BENCHMARK_MODELS = {
+    "anthropic": "claude-3-7-sonnet-20250219",
+    "openai": "gpt-4o",
+    "ollama": "llama3",
+    "lmstudio": "custom",
+}
+
+# Concurrency of the client-side rate limiter (high enough never to queue)
+BENCHMARK_MAX_CONCURRENCY = 256
+
+# Baseline comparison: relative slowdown allowed, and the absolute change
+# (seconds, or lessons per minute) below which differences are noise
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_MIN_DELTA = 0.05
+
+
+def make_service(provider: str, url: str) -> LLMService:
+    """
+    Create an LLM service that sends its requests to the fake server.
+
+    The service gets its own transport and an unlimited rate limiter, so
+    runs don't share connections or throttling state.
+
+    Args:
+        provider: Provider whose API the service speaks
+        url: Root URL of the fake server
+
+    Returns:
+        The LLM service
+
+    Raises:
+        ValueError: If the provider is unknown
+    """
+    if provider not in BENCHMARK_MODELS:
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    model = BENCHMARK_MODELS[provider]
+    options = {
+        "model": model,
+        "transport": HTTPTransport(provider),
+        "rate_limiter": RateLimiter(
+            provider, model, max_concurrency=BENCHMARK_MAX_CONCURRENCY
+        ),
+        "token_limits": get_token_limits(provider, model),
+    }
+    if provider == "anthropic":
+        return AnthropicLLMService(api_key="benchmark", base_url=url, **options)
+    if provider == "openai":
+        return OpenAILLMService(api_key="benchmark", base_url=url, **options)
+    if provider == "ollama":
+        return OllamaLLMService(base_url=url, **options)
+    return LMStudioService(base_url=f"{url}/v1", **options)
+
+
+def benchmark_lesson(number: int) -> Lesson:
+    """Build the metadata of a benchmark lesson."""
+    return Lesson(
+        number=number,
+        title=f"Benchmark Lesson {number}",
+        learning_outcomes=[],
+        module="Benchmark Module",
+        objective=f"Measure the pipeline with lesson {number}",
+        topics="- Latency\n- Throughput\n- Overhead",
+    )
+
+
+async def run_pipelines(
+    pipeline_class: type,
+    service: LLMService,
+    course_dir: str,
+    lessons: int,
+    include_post_draft: bool,
+) -> List[Dict[str, Any]]:
+    """Run one pipeline per lesson, one after another."""
+    results = []
+    for number in range(1, lessons + 1):
+        lesson = benchmark_lesson(number)
+        pipeline = pipeline_class(
+            course_dir, f"lesson_{number:02d}", use_cache=False, llm_service=service
+        )
+        results.append(
+            await pipeline.run_pipeline(
+                module=lesson.module,
+                lesson_objective=lesson.objective,
+                lesson_topics=lesson.topics,
+                title=lesson.title,
+                course_context={"title": "Benchmark Course"},
+                include_post_draft=include_post_draft,
+                resume=False,
+            )
+        )
+    return results
+
+
+async def run_course(
+    service: LLMService,
+    course_dir: str,
+    lessons: int,
+    concurrency: int,
+    provider: str,
+) -> List[Dict[str, Any]]:
+    """Generate every lesson of a benchmark course concurrently."""
+    file_service = FileService()
+    for number in range(1, lessons + 1):
+        file_service.save_lesson(benchmark_lesson(number), course_dir)
+
+    runner = CourseGenerationRunner(
+        course_dir,
+        max_concurrency=concurrency,
+        provider_limits={provider: concurrency},
+        llm_provider=provider,
+        model=BENCHMARK_MODELS[provider],
+        use_cache=False,
+        route=False,
+        llm_service=service,
+    )
+    summary = await runner.run()
+    return list(summary["lessons"].values())
+
+
+def summarize(
+    results: List[Dict[str, Any]], duration: float, requests: int
+) -> Dict[str, Any]:
+    """
+    Summarize the pipeline results of a benchmark.
+
+    A step's overhead is its duration less the time spent waiting for an
+    LLM slot and on the network: prompt building, token counting, retry
+    backoff, parsing and saving.
+
+    Args:
+        results: Pipeline results, one per lesson
+        duration: Wall time of the whole benchmark in seconds
+        requests: Requests the fake server received
+
+    Returns:
+        Dictionary with throughput, lesson latency and per-step stats
+    """
+    lesson_seconds = sorted(
+        result["telemetry"]["duration_seconds"]
+        for result in results
+        if (result.get("telemetry") or {}).get("duration_seconds") is not None
+    )
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for result in results:
+        for step, stats in ((result.get("telemetry") or {}).get("steps") or {}).items():
+            entry = samples.setdefault(
+                step, {"duration": [], "overhead": [], "queue_wait": [], "retries": []}
+            )
+            entry["duration"].append(stats["duration_seconds"])
+            entry["overhead"].append(
+                max(
+                    0.0,
+                    stats["duration_seconds"]
+                    - stats["network_seconds"]
+                    - stats["queue_wait_seconds"],
+                )
+            )
+            entry["queue_wait"].append(stats["queue_wait_seconds"])
+            entry["retries"].append(stats["retries"])
+
+    steps = {}
+    for step, entry in samples.items():
+        duration_seconds = sorted(entry["duration"])
+        overhead = sorted(entry["overhead"])
+        steps[step] = {
+            "count": len(duration_seconds),
+            "p50_seconds": percentile(duration_seconds, 0.5),
+            "p95_seconds": percentile(duration_seconds, 0.95),
+            "overhead_p50_seconds": percentile(overhead, 0.5),
+            "overhead_p95_seconds": percentile(overhead, 0.95),
+            "queue_wait_p95_seconds": percentile(sorted(entry["queue_wait"]), 0.95),
+            "retries": sum(entry["retries"]),
+        }
+
+    succeeded = sum(1 for result in results if result.get("status") == "success")
+    return {
+        "duration_seconds": duration,
+        "lessons_succeeded": succeeded,
+        "lessons_failed": len(results) - succeeded,
+        "throughput": {
+            "lessons_per_minute": succeeded * 60 / duration if duration else 0.0,
+            "requests_per_second": requests / duration if duration else 0.0,
+        },
+        "lesson_latency": {
+            "mean_seconds": (
+                sum(lesson_seconds) / len(lesson_seconds) if lesson_seconds else None
+            ),
+            "p50_seconds": percentile(lesson_seconds, 0.5),
+            "p95_seconds": percentile(lesson_seconds, 0.95),
+        },
+        "steps": steps,
+    }
+
+
+async def run_benchmark(
+    scenario: str = "course",
+    provider: str = "anthropic",
+    lessons: int = 4,
+    concurrency: int = 4,
+    behavior: Optional[FakeLLMBehavior] = None,
+) -> Dict[str, Any]:
+    """
+    Run a benchmark against a fresh fake LLM server.
+
+    Args:
+        scenario: "lesson" (full LessonPipeline runs, one lesson at a time),
+            "draft" (DraftPipeline runs up to the expanded draft, one lesson
+            at a time) or "course" (CourseGenerationRunner over every lesson)
+        provider: Provider whose API the fake server speaks to the pipelines
+        lessons: Number of lessons to generate
+        concurrency: Lessons and LLM calls at once (course scenario)
+        behavior: How the fake server responds
+
+    Returns:
+        The benchmark report
+
+    Raises:
+        ValueError: If the scenario or provider is unknown
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+    behavior = behavior or FakeLLMBehavior()
+    with FakeLLMServer(behavior) as server, tempfile.TemporaryDirectory() as tmp:
+        service = make_service(provider, server.url)
+        course_dir = os.path.join(tmp, "benchmark_course")
+        start = time.monotonic()
+        try:
+            if scenario == "course":
+                results = await run_course(
+                    service, course_dir, lessons, concurrency, provider
+                )
+            else:
+                pipeline_class = (
+                    LessonPipeline if scenario == "lesson" else DraftPipeline
+                )
+                results = await run_pipelines(
+                    pipeline_class,
+                    service,
+                    course_dir,
+                    lessons,
+                    include_post_draft=scenario == "lesson",
+                )
+        finally:
+            await service.transport.aclose()
+        duration = time.monotonic() - start
+        stats = dict(server.stats)
+
+    report = {
+        "scenario": scenario,
+        "provider": provider,
+        "lessons": lessons,
+        "concurrency": concurrency if scenario == "course" else 1,
+        "server": {**behavior.to_dict(), **stats},
+    }
+    report.update(summarize(results, duration, stats.get("requests", 0)))
+    return report
+
+
+def compare_to_baseline(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = DEFAULT_TOLERANCE,
+    min_delta: float = DEFAULT_MIN_DELTA,
+) -> List[str]:
+    """
+    Find what got worse than in a baseline report.
+
+    A latency regresses when it grew by more than the tolerance (and by at
+    least min_delta seconds); throughput regresses when it dropped by more
+    than the tolerance.
+
+    Args:
+        report: Report of the current run
+        baseline: Report of a baseline run of the same benchmark
+        tolerance: Relative change allowed, e.g. 0.2 for 20%
+        min_delta: Absolute change below which differences are ignored
+
+    Returns:
+        A description of each regression (empty if there are none)
+    """
+    regressions = []
+
+    def check(name: str, current: Any, previous: Any, higher_is_worse: bool = True):
+        if current is None or not previous:
+            return
+        change = (current - previous) if higher_is_worse else (previous - current)
+        if change > previous * tolerance and change >= min_delta:
+            regressions.append(
+                f"{name}: {previous:.3f} -> {current:.3f} "
+                f"({'+' if current > previous else ''}"
+                f"{(current - previous) / previous:.0%})"
+            )
+
+    check(
+        "lessons_per_minute",
+        report["throughput"]["lessons_per_minute"],
+        baseline["throughput"]["lessons_per_minute"],
+        higher_is_worse=False,
+    )
+    for field in ("p50_seconds", "p95_seconds"):
+        check(
+            f"lesson {field}",
+            report["lesson_latency"][field],
+            baseline["lesson_latency"][field],
+        )
+    for step, stats in report["steps"].items():
+        previous = baseline.get("steps", {}).get(step)
+        if previous is None:
+            continue
+        for field in ("p95_seconds", "overhead_p95_seconds"):
+            check(f"{step} {field}", stats[field], previous[field])
+    return regressions
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Format a benchmark report as a table."""
+    throughput = report["throughput"]
+    latency = report["lesson_latency"]
+    lines = [
+        f"{report['scenario']} benchmark, {report['provider']} API, "
+        f"{report['lessons']} lesson(s), concurrency {report['concurrency']}",
+        f"  {report['lessons_succeeded']} succeeded, "
+        f"{report['lessons_failed']} failed in {report['duration_seconds']:.2f}s",
+        f"  throughput: {throughput['lessons_per_minute']:.1f} lessons/min, "
+        f"{throughput['requests_per_second']:.1f} requests/s",
+        f"  lesson latency: p50 {latency['p50_seconds'] or 0:.3f}s, "
+        f"p95 {latency['p95_seconds'] or 0:.3f}s",
+        f"  server: {report['server'].get('requests', 0)} requests, "
+        f"{report['server'].get('rate_limited', 0)} rate limited, "
+        f"{report['server'].get('errors', 0)} errors",
+        "",
+        f"  {'step':<28}{'p50':>9}{'p95':>9}{'ovh p50':>9}{'ovh p95':>9}"
+        f"{'queue':>9}{'retries':>9}",
+    ]
+    for step, stats in report["steps"].items():
+        lines.append(
+            f"  {step:<28}{stats['p50_seconds']:>9.3f}{stats['p95_seconds']:>9.3f}"
+            f"{stats['overhead_p50_seconds']:>9.3f}"
+            f"{stats['overhead_p95_seconds']:>9.3f}"
+            f"{stats['queue_wait_p95_seconds']:>9.3f}{stats['retries']:>9}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.pipeline_benchmark",
+        description="Benchmark the lesson pipelines against a fake LLM server.",
+    )
+    parser.add_argument("--scenario", choices=SCENARIOS, default="course")
+    parser.add_argument(
+        "--provider", choices=sorted(BENCHMARK_MODELS), default="anthropic"
+    )
+    parser.add_argument("--lessons", type=int, default=4)
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="lessons at once (course)"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="seconds to first token"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument(
+        "--tokens-per-second", type=float, default=None, help="output speed"
+    )
+    parser.add_argument("--output-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON")
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--baseline", help="report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    behavior = FakeLLMBehavior(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens_per_second=args.tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    report = asyncio.run(
+        run_benchmark(
+            args.scenario, args.provider, args.lessons, args.concurrency, behavior
+        )
+    )
+
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,6 +13,9 @@ class LLMConfig(BaseModel):
         0.7, description="Temperature for generation (0.0 to 1.0)"
     )
     max_tokens: int = Field(4000, description="Maximum tokens to generate")
+    weight: float = Field(
+        1.0, description="Share of requests routed to this configuration"
+    )
 
 
 class Course(BaseModel):
@@ -45,6 +48,13 @@ class Course(BaseModel):
         description="Additional LLM configurations for course generation",
     )
 
+    # Per-step LLM configurations
+    step_llm_configs: Dict[str, LLMConfig] = Field(
+        default_factory=dict,
+        description="LLM configurations by pipeline step name, for steps that "
+        "should use a different model than the primary one",
+    )
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert the course to a dictionary suitable for YAML serialization."""
         return self.model_dump()
@@ -12,6 +12,15 @@ class Lesson(BaseModel):
         ..., description="List of learning outcomes for the lesson"
     )
 
+    # Inputs for learning outcome generation
+    module: Optional[str] = Field(
+        None, description="Module or section the lesson belongs to"
+    )
+    objective: Optional[str] = Field(None, description="Main objective of the lesson")
+    topics: Optional[str] = Field(
+        None, description="Topics covered in the lesson (one per line)"
+    )
+
     # Generation status tracking
     has_shell: bool = Field(
         False, description="Whether the lesson shell has been generated"
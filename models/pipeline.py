@@ -0,0 +1,105 @@
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel, Field
+import os
+
+
+class PipelineStep(BaseModel):
+    """A single LLM step in a lesson generation pipeline."""
+
+    name: str = Field(..., description="Step name, used for progress reporting")
+    prompt: str = Field(..., description="Name of the prompt template in prompts/")
+    inputs: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Map of template variable to the artifact that fills it",
+    )
+    output: str = Field(..., description="Name of the artifact the step produces")
+    output_file: str = Field(
+        ..., description="File name suffix the output is written to, per lesson"
+    )
+
+    # Optional behaviour
+    description: str = Field("", description="Progress message when the step starts")
+    variables: Dict[str, str] = Field(
+        default_factory=dict, description="Fixed template variables for the step"
+    )
+    api_params: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="API parameters that override those in the prompt template",
+    )
+    extract_tag: Optional[str] = Field(
+        None, description="XML tag whose content is kept from the response"
+    )
+    validation: Optional[str] = Field(
+        None, description="Expected output format checked after generation"
+    )
+    cache_inputs: List[str] = Field(
+        default_factory=list,
+        description="Template variables holding long, stable context; the prompt "
+        "up to the last of them is marked for provider-side prompt caching",
+    )
+
+    section_prompt: Optional[str] = Field(
+        None,
+        description="Prompt template used per <LOn> section of section_input when "
+        "sections are generated in parallel",
+    )
+    section_input: Optional[str] = Field(
+        None, description="Template variable holding the draft split into sections"
+    )
+
+    def output_path(self, lesson_dir: str, lesson_id: str) -> str:
+        """
+        Get the path the step's output is written to.
+
+        Args:
+            lesson_dir: Directory holding the lesson files
+            lesson_id: Identifier for the lesson
+
+        Returns:
+            Full path of the output file
+        """
+        return os.path.join(lesson_dir, f"{lesson_id}_{self.output_file}")
+
+
+class StepRecord(BaseModel):
+    """Record of the last run of one pipeline step for a lesson."""
+
+    step: str = Field(..., description="Step name")
+    status: str = Field(..., description="Outcome of the run (success or error)")
+    input_hash: str = Field(
+        ..., description="Hash of the prompt template and inputs the step ran with"
+    )
+    template_hash: Optional[str] = Field(
+        None, description="Hash of the prompt template the step ran with"
+    )
+    input_hashes: Dict[str, str] = Field(
+        default_factory=dict, description="Hash of each template variable's value"
+    )
+    model: Optional[str] = Field(
+        None, description="Provider and model the step ran on (provider/model)"
+    )
+    output_path: Optional[str] = Field(None, description="Path of the output file")
+    output_hash: Optional[str] = Field(None, description="Hash of the output written")
+    artifact_path: Optional[str] = Field(
+        None, description="Path of the content-addressed copy of the output"
+    )
+    updated_at: str = Field(..., description="When the step finished (ISO format)")
+    error: Optional[str] = Field(None, description="Error message if the step failed")
+
+
+class RunManifest(BaseModel):
+    """Per-lesson record of pipeline step runs, used to resume interrupted runs."""
+
+    lesson_id: str = Field(..., description="Identifier for the lesson")
+    steps: Dict[str, StepRecord] = Field(
+        default_factory=dict, description="Latest record of each step, by name"
+    )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the manifest to a dictionary suitable for JSON serialization."""
+        return self.model_dump()
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunManifest":
+        """Create a RunManifest instance from a dictionary (loaded from JSON)."""
+        return cls(**data)
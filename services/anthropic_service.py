@@ -1,28 +1,39 @@
 import os
 import logging
 import json
-import requests
 import asyncio
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, Optional, List, Union
 from dotenv import load_dotenv
-from services.llm_service import LLMService
+from services.llm_service import (
+    ANTHROPIC_BASE_URL,
+    LLMService,
+    parse_anthropic_stream_event,
+)
+from services.http_transport import HTTPTransport, get_transport, iter_sse_data
+from services.rate_limiter import RateLimiter, get_rate_limiter
+from services.llm_usage import record_usage
+from services.token_budget import TokenLimits, estimate_tokens, get_token_limits
+
+# Marks the end of a prompt prefix the API should cache for reuse
+CACHE_CONTROL = {"type": "ephemeral"}
 
 
 class AnthropicLLMService(LLMService):
     """LLM service for Anthropic Claude models with proper API compatibility."""
 
-    # Model maximum token map
-    MODEL_MAX_TOKENS = {
-        "claude-3-sonnet-20240229": 4096,
-        "claude-3-haiku-20240307": 4096,
-        "claude-3-opus-20240229": 4096,
-        "claude-3-7-sonnet-20250219": 4096,
-        "claude-2.0": 100000,  # High value as fallback
-        "claude-2.1": 100000,  # High value as fallback
-    }
+    provider = "anthropic"
+    supports_prompt_caching = True
+    supports_batches = True
+    supports_token_counting = True
 
     def __init__(
-        self, api_key: Optional[str] = None, model: str = "claude-3-7-sonnet-20250219"
+        self,
+        api_key: Optional[str] = None,
+        model: str = "claude-3-7-sonnet-20250219",
+        transport: Optional[HTTPTransport] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        token_limits: Optional[TokenLimits] = None,
+        base_url: Optional[str] = None,
     ):
         """
         Initialize Anthropic LLM service.
@@ -30,6 +41,10 @@ class AnthropicLLMService(LLMService):
         Args:
             api_key: Anthropic API key (if None, loads from ANTHROPIC_API_KEY env var)
             model: Anthropic model to use
+            transport: HTTP transport (defaults to the shared Anthropic transport)
+            rate_limiter: Rate limiter (defaults to the shared limiter for the model)
+            token_limits: Model token limits (defaults to those known for the model)
+            base_url: API root URL (defaults to https://api.anthropic.com)
         """
         super().__init__()
         # Load from environment if not provided
@@ -42,14 +57,15 @@ class AnthropicLLMService(LLMService):
 
         self.api_key = api_key
         self.model = model
-        self.base_url = "https://api.anthropic.com/v1/messages"
+        self.transport = transport or get_transport("anthropic")
+        self.rate_limiter = rate_limiter or get_rate_limiter("anthropic", model)
+        self.token_limits = token_limits or get_token_limits("anthropic", model)
+        self.base_url = f"{(base_url or ANTHROPIC_BASE_URL).rstrip('/')}/v1/messages"
         self.logger.info(f"Initialized Anthropic LLM service with model: {model}")
 
     def _check_token_limit(self, max_tokens: int) -> int:
         """Check if the requested max_tokens is within model limits."""
-        model_limit = self.MODEL_MAX_TOKENS.get(
-            self.model, 4096
-        )  # Default to 4096 if model not found
+        model_limit = self.token_limits.max_output_tokens
 
         if max_tokens > model_limit:
             self.logger.warning(
@@ -59,46 +75,171 @@ class AnthropicLLMService(LLMService):
             return model_limit
         return max_tokens
 
-    async def generate_text(
-        self, prompt: str, temperature: float = 0.7, max_tokens: int = 2000
-    ) -> str:
+    def _user_content(
+        self, prompt: str, cache_prefix: Optional[str]
+    ) -> Union[str, List[Dict[str, Any]]]:
         """
-        Generate text using Anthropic Claude.
+        Build the user message content, with a cache breakpoint after the
+        prefix if one is given.
+        """
+        if not cache_prefix:
+            return prompt
+        if not prompt.strip():
+            # Empty text blocks are rejected, so the prefix carries it all
+            return [
+                {
+                    "type": "text",
+                    "text": cache_prefix + prompt,
+                    "cache_control": CACHE_CONTROL,
+                }
+            ]
+        return [
+            {"type": "text", "text": cache_prefix, "cache_control": CACHE_CONTROL},
+            {"type": "text", "text": prompt},
+        ]
+
+    def _system(
+        self, context: str, cache_system: bool
+    ) -> Union[str, List[Dict[str, Any]]]:
+        """Build the system prompt, as a cached block if requested."""
+        if not cache_system:
+            return context
+        return [{"type": "text", "text": context, "cache_control": CACHE_CONTROL}]
+
+    def _headers(self) -> Dict[str, str]:
+        """Headers with the proper API version."""
+        return {
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+        }
+
+    def build_request(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Build a Messages API request body, to send directly or in a batch.
 
         Args:
             prompt: The prompt text
+            context: Optional system prompt
             temperature: Temperature parameter (0.0 to 1.0)
             max_tokens: Maximum tokens to generate
+            cache_prefix: Stable text sent before the prompt and marked for
+                prompt caching, so later requests starting with it reuse it
+            cache_system: Mark the system prompt for prompt caching
 
         Returns:
-            Generated text
+            The request body
         """
-        # Check token limit for the model
-        max_tokens = self._check_token_limit(max_tokens)
-
-        # Headers with the proper API version
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "anthropic-beta": "messages-2023-12-15",
-        }
-
-        # Payload format per Anthropic API specification
         data = {
             "model": self.model,
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
+            "messages": [
+                {"role": "user", "content": self._user_content(prompt, cache_prefix)}
+            ],
+            "max_tokens": self._check_token_limit(max_tokens),
             "temperature": temperature,
         }
+        if context is not None:
+            # System goes at the top level, not as a message role
+            data["system"] = self._system(context, cache_system)
+        return data
+
+    def message_text(self, result: Dict[str, Any]) -> str:
+        """
+        Record a Messages API response's usage and extract its text.
+
+        Args:
+            result: The response body (a message)
+
+        Returns:
+            Generated text
+        """
+        record_usage(result.get("usage"))
+        if "content" in result and len(result["content"]) > 0:
+            return result["content"][0]["text"]
+        self.logger.error(f"Unexpected response format: {result}")
+        return ""
+
+    def is_truncated(self, result: Dict[str, Any]) -> bool:
+        """Check whether a Messages API response was cut off at max_tokens."""
+        return result.get("stop_reason") == "max_tokens"
+
+    def continuation_request(self, data: Dict[str, Any], text: str) -> Dict[str, Any]:
+        """
+        Build the request that continues a response cut off at max_tokens.
+
+        The text generated so far is sent as the start of the assistant's
+        turn, so the model picks up exactly where it stopped.
+
+        Args:
+            data: The original request body
+            text: Text generated so far, without trailing whitespace (which
+                the API rejects at the end of an assistant turn)
+
+        Returns:
+            The continuation request body
+        """
+        return {
+            **data,
+            "messages": [
+                data["messages"][0],
+                {"role": "assistant", "content": text},
+            ],
+        }
+
+    async def complete(
+        self,
+        data: Dict[str, Any],
+        send: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    ) -> str:
+        """
+        Send a request, continuing the response while it is cut off at
+        max_tokens, and stitch the parts together.
+
+        Args:
+            data: Request body from build_request
+            send: Coroutine function that sends a request body and returns
+                the response message
 
+        Returns:
+            Generated text
+        """
+        text = ""
+        for continuation in range(self.max_continuations + 1):
+            result = await send(data)
+            text += self.message_text(result)
+            if not self.is_truncated(result):
+                break
+            if continuation == self.max_continuations:
+                self.logger.warning(
+                    f"Response still cut off at max_tokens after "
+                    f"{continuation} continuation(s)"
+                )
+                break
+
+            self.logger.info(
+                f"Response cut off at max_tokens; continuing ({continuation + 1})"
+            )
+            text = text.rstrip()
+            data = self.continuation_request(data, text)
+        return text
+
+    async def _send_message(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a Messages API request and return the response message."""
+        headers = self._headers()
         try:
             # Print request details for debugging
             self.logger.debug(f"Making request to: {self.base_url}")
-            self.logger.debug(f"Headers: {headers}")
             self.logger.debug(f"Data: {json.dumps(data, indent=2)}")
 
-            response = requests.post(self.base_url, headers=headers, json=data)
+            response = await self._post(self.base_url, headers=headers, json=data)
 
             # Log response status
             self.logger.debug(f"Response status: {response.status_code}")
@@ -113,25 +254,49 @@ class AnthropicLLMService(LLMService):
                 )
 
             response.raise_for_status()
-            result = response.json()
-
-            # Extract content from the response
-            if "content" in result and len(result["content"]) > 0:
-                return result["content"][0]["text"]
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return ""
+            return response.json()
 
         except Exception as e:
             self.logger.error(f"Error generating text with Anthropic: {e}")
             raise
 
+    async def generate_text(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+    ) -> str:
+        """
+        Generate text using Anthropic Claude.
+
+        Args:
+            prompt: The prompt text
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate per request; longer
+                responses are continued (see complete)
+            cache_prefix: Stable text sent before the prompt and marked for
+                prompt caching, so later requests starting with it reuse it
+
+        Returns:
+            Generated text
+        """
+        data = self.build_request(
+            prompt,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cache_prefix=cache_prefix,
+        )
+        return await self.complete(data, self._send_message)
+
     async def generate_with_context(
         self,
         prompt: str,
         context: str,
         temperature: float = 0.7,
         max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
     ) -> str:
         """
         Generate text with additional context using Anthropic Claude.
@@ -140,61 +305,196 @@ class AnthropicLLMService(LLMService):
             prompt: The prompt text
             context: Additional context to provide
             temperature: Temperature parameter (0.0 to 1.0)
-            max_tokens: Maximum tokens to generate
+            max_tokens: Maximum tokens to generate per request; longer
+                responses are continued (see complete)
+            cache_prefix: Stable text sent before the prompt and marked for
+                prompt caching, so later requests starting with it reuse it
+            cache_system: Mark the system prompt for prompt caching
 
         Returns:
             Generated text
         """
-        # Check token limit for the model
-        max_tokens = self._check_token_limit(max_tokens)
+        data = self.build_request(
+            prompt, context, temperature, max_tokens, cache_prefix, cache_system
+        )
+        return await self.complete(data, self._send_message)
 
-        # Headers with the proper API version
-        headers = {
-            "Content-Type": "application/json",
-            "x-api-key": self.api_key,
-            "anthropic-version": "2023-06-01",
-            "anthropic-beta": "messages-2023-12-15",
-        }
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from Anthropic Claude using server-sent events.
 
-        # System goes at the top level, not as a message role
-        data = {
-            "model": self.model,
-            "system": context,  # System prompt goes here at the top level
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-        }
+        Args:
+            prompt: The prompt text
+            context: Optional system prompt
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+            cache_prefix: Stable text sent before the prompt and marked for
+                prompt caching, so later requests starting with it reuse it
+            cache_system: Mark the system prompt for prompt caching
+
+        Yields:
+            Chunks of generated text as they arrive
+        """
+        headers = self._headers()
+        data = self.build_request(
+            prompt, context, temperature, max_tokens, cache_prefix, cache_system
+        )
+        data["stream"] = True
 
         try:
-            # Print request details for debugging
-            self.logger.debug(f"Making request to: {self.base_url}")
-            self.logger.debug(f"Headers: {headers}")
-            self.logger.debug(f"Data: {json.dumps(data, indent=2)}")
+            text = ""
+            for continuation in range(self.max_continuations + 1):
+                self.logger.debug(f"Streaming request to: {self.base_url}")
+
+                # Input usage arrives in message_start, output usage and the
+                # stop reason in message_delta
+                usage: Dict[str, Any] = {}
+                stop_reason = None
+                # Trailing whitespace is held back until more text follows,
+                # as a continuation regenerates it
+                pending = ""
+                lines = self._stream_lines(self.base_url, headers=headers, json=data)
+                async for event in iter_sse_data(lines):
+                    if event.get("type") == "message_start":
+                        usage.update(event.get("message", {}).get("usage") or {})
+                    elif event.get("type") == "message_delta":
+                        usage.update(event.get("usage") or {})
+                        stop_reason = (event.get("delta") or {}).get("stop_reason")
+                    chunk = pending + parse_anthropic_stream_event(event)
+                    stripped = chunk.rstrip()
+                    pending = chunk[len(stripped) :]
+                    if stripped:
+                        text += stripped
+                        yield stripped
+                record_usage(usage or None)
+
+                if (
+                    stop_reason != "max_tokens"
+                    or continuation == self.max_continuations
+                ):
+                    if pending:
+                        yield pending
+                    break
+
+                self.logger.info(
+                    f"Stream cut off at max_tokens; continuing ({continuation + 1})"
+                )
+                data = {**self.continuation_request(data, text), "stream": True}
 
-            response = requests.post(self.base_url, headers=headers, json=data)
+        except Exception as e:
+            self.logger.error(f"Error streaming text with Anthropic: {e}")
+            raise
 
-            # Log response status
-            self.logger.debug(f"Response status: {response.status_code}")
+    async def count_tokens(self, prompt: str, context: Optional[str] = None) -> int:
+        """
+        Count the input tokens a request would use with the count tokens endpoint.
 
-            # Full response content for debugging
-            self.logger.debug(f"Response content: {response.text}")
+        Falls back to a local estimate if the endpoint can't be reached.
 
-            # If non-successful response, print more details
-            if response.status_code != 200:
-                self.logger.error(
-                    f"API Error - Status: {response.status_code}, Response: {response.text}"
-                )
+        Args:
+            prompt: The prompt text
+            context: Optional system prompt
 
+        Returns:
+            Number of input tokens
+        """
+        data = {"model": self.model, "messages": [{"role": "user", "content": prompt}]}
+        if context is not None:
+            data["system"] = context
+
+        try:
+            response = await self.transport.post(
+                f"{self.base_url}/count_tokens", json=data, headers=self._headers()
+            )
             response.raise_for_status()
-            result = response.json()
+            return int(response.json()["input_tokens"])
+        except Exception as e:
+            self.logger.warning(f"Token count failed, using an estimate: {e}")
+            return estimate_tokens(prompt) + estimate_tokens(context)
 
-            # Extract content from the response
-            if "content" in result and len(result["content"]) > 0:
-                return result["content"][0]["text"]
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return ""
+    @property
+    def batches_url(self) -> str:
+        """URL of the Message Batches endpoint."""
+        return f"{self.base_url}/batches"
 
-        except Exception as e:
-            self.logger.error(f"Error generating text with Anthropic: {e}")
-            raise
+    async def create_batch(self, requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Submit requests as a Message Batch.
+
+        Batches have their own rate limits, so they bypass the rate limiter.
+
+        Args:
+            requests: Batch requests, each {"custom_id": ..., "params": ...}
+                with params built by build_request
+
+        Returns:
+            The created batch
+        """
+        response = await self.transport.post(
+            self.batches_url, json={"requests": requests}, headers=self._headers()
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        """
+        Get the current state of a Message Batch.
+
+        Args:
+            batch_id: Batch ID
+
+        Returns:
+            The batch, with processing_status "ended" once all results are in
+        """
+        response = await self.transport.get(
+            f"{self.batches_url}/{batch_id}", headers=self._headers()
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def cancel_batch(self, batch_id: str) -> Dict[str, Any]:
+        """
+        Cancel a Message Batch that is still processing.
+
+        Args:
+            batch_id: Batch ID
+
+        Returns:
+            The batch
+        """
+        response = await self.transport.post(
+            f"{self.batches_url}/{batch_id}/cancel", headers=self._headers()
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def batch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Download the results of an ended Message Batch.
+
+        Args:
+            batch: The batch, as returned by retrieve_batch
+
+        Returns:
+            Result of each request by custom ID; a result has a "type" of
+            succeeded (with the "message"), errored, canceled or expired
+        """
+        response = await self.transport.get(
+            batch["results_url"], headers=self._headers()
+        )
+        response.raise_for_status()
+
+        results = {}
+        for line in response.text.splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                results[entry["custom_id"]] = entry["result"]
+        return results
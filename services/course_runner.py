@@ -0,0 +1,473 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List
+
+from services.pipeline_service import LessonPipeline
+from services.llm_service_provider import LLMServiceProvider
+from services.file_service import FileService
+from services.llm_usage import track_usage
+from services.llm_batch import BatchedLLMService, DEFAULT_BATCH_CONFIG
+from services.llm_router import LLMRouter, DEFAULT_ROUTING_CONFIG
+from services.llm_service import LLMService
+from models.course import Course, LLMConfig
+from models.lesson import Lesson
+
+# Concurrent LLM calls allowed per provider when app_config.yaml doesn't say
+DEFAULT_PROVIDER_LIMITS = {
+    "anthropic": 8,
+    "openai": 8,
+    "ollama": 1,
+    "lmstudio": 1,
+}
+
+
+class CourseGenerationRunner:
+    """
+    Runs the draft generation pipeline for every lesson in a course concurrently.
+
+    Lessons run under a global limit on concurrent lessons, and the LLM calls
+    they make share a per-provider limit, so hosted APIs can be driven in
+    parallel while a local model server only ever sees one request at a time.
+    """
+
+    def __init__(
+        self,
+        course_dir: str,
+        max_concurrency: Optional[int] = None,
+        provider_limits: Optional[Dict[str, int]] = None,
+        llm_provider: Optional[str] = None,
+        model: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        include_post_draft: bool = False,
+        use_saved_outcomes: bool = True,
+        route: Optional[bool] = None,
+        llm_service: Optional[LLMService] = None,
+    ):
+        """
+        Initialize the course runner.
+
+        Args:
+            course_dir: Directory containing the course
+            max_concurrency: Maximum number of lessons generated at once
+                (defaults to `pipeline.max_concurrent_lessons` in app_config.yaml)
+            provider_limits: Maximum concurrent LLM calls per provider
+                (defaults to `pipeline.provider_limits` in app_config.yaml)
+            llm_provider: LLM provider to use (defaults to course configuration)
+            model: Model to use (defaults to course configuration)
+            use_cache: Serve repeated LLM requests from the course's response cache
+            include_post_draft: Also generate quizzes, activities and the
+                intro/conclusion for each lesson
+            use_saved_outcomes: Use the learning outcomes saved with a lesson
+                instead of generating them, when it has any
+            route: Spread requests over the course's additional LLM
+                configurations as well as its primary one (defaults to
+                `llm.routing.enabled` in app_config.yaml)
+            llm_service: LLM service for every lesson instead of the ones the
+                course configuration names (e.g. a benchmark's fake server)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.course_dir = course_dir
+        self.use_cache = use_cache
+        self.include_post_draft = include_post_draft
+        self.use_saved_outcomes = use_saved_outcomes
+        self.llm_service = llm_service
+        self.file_service = FileService()
+
+        config = LLMServiceProvider().config
+        pipeline_config = config.get("pipeline", {}) or {}
+        self.max_concurrency = max_concurrency or pipeline_config.get(
+            "max_concurrent_lessons", 4
+        )
+        self.provider_limits = dict(DEFAULT_PROVIDER_LIMITS)
+        self.provider_limits.update(pipeline_config.get("provider_limits") or {})
+        self.provider_limits.update(provider_limits or {})
+        self.batch_config = dict(DEFAULT_BATCH_CONFIG)
+        self.batch_config.update(pipeline_config.get("batch") or {})
+        self.routing_config = dict(DEFAULT_ROUTING_CONFIG)
+        self.routing_config.update(config.get("llm", {}).get("routing") or {})
+        self.route = self.routing_config["enabled"] if route is None else route
+
+        self.course = self._load_course()
+        self.llm_provider = llm_provider or (
+            self.course.llm_config.provider if self.course else None
+        )
+        self.model = model or (self.course.llm_config.model if self.course else None)
+
+        # Progress of each lesson, keyed by lesson ID
+        self.progress: Dict[str, Dict[str, str]] = {}
+        self.progress_callback = None
+
+    def _load_course(self) -> Optional[Course]:
+        """Load the course configuration, if the course has a valid one."""
+        config_path = os.path.join(self.course_dir, "course_config.yaml")
+        if not os.path.exists(config_path):
+            return None
+        try:
+            return self.file_service.load_course_config(config_path)
+        except Exception as e:
+            self.logger.warning(f"Running without course configuration: {e}")
+            return None
+
+    def set_progress_callback(self, callback):
+        """
+        Set a callback function for progress updates.
+
+        Args:
+            callback: Function called as callback(lesson_id, step, status, message)
+        """
+        self.progress_callback = callback
+
+    def _update_progress(self, lesson_id: str, step: str, status: str, message: str):
+        """Record a lesson's progress and pass it on to the callback."""
+        if status != "streaming":
+            self.progress[lesson_id] = {
+                "step": step,
+                "status": status,
+                "message": message,
+            }
+        if self.progress_callback:
+            self.progress_callback(lesson_id, step, status, message)
+
+    def load_lessons(self) -> List[Lesson]:
+        """
+        Load every lesson in the course from its metadata file.
+
+        Returns:
+            Lessons ordered by number
+        """
+        lessons_dir = os.path.join(self.course_dir, "lessons")
+        return [
+            self.file_service.load_lesson(
+                os.path.join(lessons_dir, f"lesson_{number:02d}_metadata.yaml")
+            )
+            for number in self.file_service.list_lessons(self.course_dir)
+        ]
+
+    def _course_context(self) -> Dict[str, str]:
+        """Build the course context passed to each lesson pipeline."""
+        if self.course is None:
+            return {}
+        return {
+            "title": self.course.title,
+            "target_audience": self.course.target_audience,
+            "skill_level": self.course.skill_level or "",
+        }
+
+    def _lesson_inputs(self, lesson: Lesson) -> Dict[str, Any]:
+        """Build the pipeline inputs for a lesson from its metadata."""
+        course_title = self.course.title if self.course else ""
+        inputs = {
+            "module": lesson.module or course_title,
+            "lesson_objective": lesson.objective or lesson.title,
+            "lesson_topics": lesson.topics
+            or "\n".join(f"- {lo}" for lo in lesson.learning_outcomes),
+            "title": lesson.title,
+            "course_context": self._course_context(),
+        }
+        if self.use_saved_outcomes and lesson.learning_outcomes:
+            # Learning outcomes reviewed in the UI are used as they are
+            inputs["provided_artifacts"] = {
+                "learning_outcomes": "\n".join(lesson.learning_outcomes)
+            }
+        return inputs
+
+    def _step_llm_configs(self) -> Dict[str, LLMConfig]:
+        """Get the course's per-step LLM configurations."""
+        return self.course.step_llm_configs if self.course else {}
+
+    def _lesson_id(self, lesson: Lesson) -> str:
+        """Get the pipeline identifier for a lesson."""
+        return f"lesson_{lesson.number:02d}"
+
+    def plan(self, lessons: Optional[List[Lesson]] = None) -> Dict[str, List[Dict]]:
+        """
+        Work out which steps of which lessons a run would rebuild.
+
+        Args:
+            lessons: Lessons to check (defaults to every lesson in the course)
+
+        Returns:
+            Dirty steps (with the reason each must run) by lesson ID, for
+            lessons that have any
+        """
+        if lessons is None:
+            lessons = self.load_lessons()
+
+        plan = {}
+        for lesson in lessons:
+            lesson_id = self._lesson_id(lesson)
+            pipeline = LessonPipeline(
+                course_dir=self.course_dir,
+                lesson_id=lesson_id,
+                llm_provider=self.llm_provider,
+                model=self.model,
+                use_cache=self.use_cache,
+                step_llm_configs=self._step_llm_configs(),
+            )
+            dirty = pipeline.plan(
+                **self._lesson_inputs(lesson),
+                include_post_draft=self.include_post_draft,
+            )
+            if dirty:
+                plan[lesson_id] = dirty
+        return plan
+
+    async def rebuild(self, batch: bool = False) -> Dict[str, Any]:
+        """
+        Regenerate only the lessons with dirty steps, and within them only
+        the dirty steps.
+
+        Args:
+            batch: Send the requests as message batches (see run)
+
+        Returns:
+            Dictionary with the overall status, per-lesson results and timing
+        """
+        lessons = self.load_lessons()
+        plan = self.plan(lessons)
+        self.logger.info(
+            f"{len(plan)} of {len(lessons)} lesson(s) need rebuilding: "
+            f"{', '.join(plan) or 'none'}"
+        )
+        return await self.run(
+            [lesson for lesson in lessons if self._lesson_id(lesson) in plan],
+            batch=batch,
+        )
+
+    async def _run_lesson(
+        self,
+        lesson: Lesson,
+        lesson_limit: asyncio.Semaphore,
+        llm_limits: Dict[str, asyncio.Semaphore],
+        llm_service: Optional[LLMService] = None,
+    ) -> Dict[str, Any]:
+        """Run the pipeline for one lesson once a lesson slot is free."""
+        lesson_id = self._lesson_id(lesson)
+        self._update_progress(lesson_id, "queued", "pending", "Waiting to start")
+
+        async with lesson_limit:
+            pipeline = LessonPipeline(
+                course_dir=self.course_dir,
+                lesson_id=lesson_id,
+                llm_provider=self.llm_provider,
+                model=self.model,
+                use_cache=self.use_cache,
+                step_llm_configs=self._step_llm_configs(),
+                llm_service=llm_service,
+            )
+            pipeline.llm_semaphores = llm_limits
+            pipeline.set_progress_callback(
+                lambda step, status, message: self._update_progress(
+                    lesson_id, step, status, message
+                )
+            )
+
+            try:
+                result = await pipeline.run_pipeline(
+                    **self._lesson_inputs(lesson),
+                    include_post_draft=self.include_post_draft,
+                )
+            except Exception as e:
+                self.logger.error(f"Lesson {lesson_id} failed: {e}")
+                result = {
+                    "status": "error",
+                    "message": f"Pipeline failed: {str(e)}",
+                    "lesson_id": lesson_id,
+                }
+
+        if result.get("status") == "success":
+            lesson.has_shell = True
+            lesson.has_rough_draft = True
+            lesson.has_expanded_draft = True
+            if self.include_post_draft:
+                lesson.has_quizzes = True
+                lesson.has_activities = True
+            self.file_service.save_lesson(lesson, self.course_dir)
+            self._update_progress(lesson_id, "done", "success", "Lesson complete")
+        else:
+            self._update_progress(
+                lesson_id, "done", "error", result.get("message", "Lesson failed")
+            )
+        return result
+
+    def _step_summary(self, results: List[Dict[str, Any]]) -> Dict[str, Dict]:
+        """
+        Total up the time, tokens and cost of each step across lessons.
+
+        Args:
+            results: Lesson pipeline results
+
+        Returns:
+            Stats by step name: lessons the step ran for, total and mean
+            duration, requests, input and output tokens, estimated cost and
+            the models used
+        """
+        steps: Dict[str, Dict[str, Any]] = {}
+        for result in results:
+            for step, report in (result.get("step_report") or {}).items():
+                usage = report["token_usage"]
+                entry = steps.setdefault(
+                    step,
+                    {
+                        "lessons": 0,
+                        "duration_seconds": 0.0,
+                        "requests": 0,
+                        "input_tokens": 0,
+                        "output_tokens": 0,
+                        "cost_usd": 0.0,
+                        "models": [],
+                    },
+                )
+                entry["lessons"] += 1
+                entry["duration_seconds"] += report["duration_seconds"]
+                entry["requests"] += usage.get("requests", 0)
+                entry["input_tokens"] += usage.get("input_tokens", 0)
+                entry["output_tokens"] += usage.get("output_tokens", 0)
+                entry["cost_usd"] += report["cost_usd"]
+                model = f"{report['provider']}/{report['model']}"
+                if model not in entry["models"]:
+                    entry["models"].append(model)
+
+        for step, entry in steps.items():
+            entry["mean_duration_seconds"] = (
+                entry["duration_seconds"] / entry["lessons"]
+            )
+            self.logger.info(
+                f"{step}: {entry['mean_duration_seconds']:.1f}s per lesson, "
+                f"{entry['input_tokens']} in / {entry['output_tokens']} out tokens, "
+                f"${entry['cost_usd']:.4f} ({', '.join(entry['models'])})"
+            )
+        return steps
+
+    def _batch_service(self) -> BatchedLLMService:
+        """Create the service that sends a run's requests as message batches."""
+        service = LLMServiceProvider().get_llm_service(
+            provider=self.llm_provider, model=self.model
+        )
+        return BatchedLLMService(
+            service,
+            collect_window=self.batch_config["collect_window_seconds"],
+            poll_interval=self.batch_config["poll_interval_seconds"],
+            max_wait=self.batch_config["max_wait_hours"] * 3600,
+            max_batch_requests=self.batch_config["max_batch_requests"],
+        )
+
+    def _router(self) -> Optional[LLMRouter]:
+        """
+        Create the router over the course's LLM configurations, if the run
+        routes requests and the course has more than one configuration.
+        """
+        if not self.route or self.course is None:
+            return None
+        if not self.course.additional_llm_configs:
+            return None
+        return LLMRouter.from_course(
+            self.course,
+            LLMServiceProvider(),
+            self.routing_config,
+            self.provider_limits,
+        )
+
+    async def run(
+        self, lessons: Optional[List[Lesson]] = None, batch: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Generate drafts for all lessons concurrently.
+
+        In batch mode every lesson runs at once and their LLM requests are
+        sent as message batches, one per pipeline stage, instead of one at a
+        time. Results take longer to arrive but use far less of the
+        provider's rate limits, which suits regenerating large courses
+        unattended.
+
+        Args:
+            lessons: Lessons to generate (defaults to every lesson in the course)
+            batch: Send the requests as message batches (see `pipeline.batch`
+                in app_config.yaml for the polling settings)
+
+        Returns:
+            Dictionary with the overall status, per-lesson results, timing,
+            token usage (including prompt cache reads and writes) and the
+            time, tokens and estimated cost of each step
+        """
+        if lessons is None:
+            lessons = self.load_lessons()
+
+        self.logger.info(
+            f"Generating {len(lessons)} lesson(s) with up to "
+            f"{self.max_concurrency} running at once"
+        )
+        start_time = time.monotonic()
+
+        batch_service = None
+        router = None
+        if batch:
+            # Every lesson must be running for its requests to share a batch
+            batch_service = self._batch_service()
+            lesson_limit = asyncio.Semaphore(max(len(lessons), 1))
+            llm_limits = {}
+        else:
+            lesson_limit = asyncio.Semaphore(self.max_concurrency)
+            router = self._router() if self.llm_service is None else None
+            if router is not None:
+                # The router limits the calls to each provider itself
+                llm_limits = {}
+            else:
+                # One limit per provider, as steps may use other providers
+                # than the course's own through step_llm_configs
+                llm_limits = {
+                    provider.lower(): asyncio.Semaphore(limit)
+                    for provider, limit in self.provider_limits.items()
+                    if limit
+                }
+
+        with track_usage() as usage:
+            results = await asyncio.gather(
+                *(
+                    self._run_lesson(
+                        lesson,
+                        lesson_limit,
+                        llm_limits,
+                        batch_service or router or self.llm_service,
+                    )
+                    for lesson in lessons
+                )
+            )
+
+        succeeded = sum(1 for result in results if result.get("status") == "success")
+        failed = len(results) - succeeded
+        if failed == 0:
+            status = "success"
+        elif succeeded == 0:
+            status = "error"
+        else:
+            status = "partial"
+
+        duration = time.monotonic() - start_time
+        self.logger.info(
+            f"Course generation finished in {duration:.1f}s: "
+            f"{succeeded} succeeded, {failed} failed"
+        )
+        summary = {
+            "status": status,
+            "message": f"{succeeded} of {len(results)} lessons generated",
+            "succeeded": succeeded,
+            "failed": failed,
+            "duration_seconds": duration,
+            "token_usage": usage.to_dict(),
+            "steps": self._step_summary(results),
+            "lessons": {result["lesson_id"]: result for result in results},
+        }
+        warm_ups = [result["warm_up"] for result in results if "warm_up" in result]
+        if warm_ups:
+            summary["warm_up"] = warm_ups
+        summary["cost_usd"] = sum(
+            step["cost_usd"] for step in summary["steps"].values()
+        )
+        if batch_service is not None:
+            summary["batches"] = batch_service.stats()
+        if router is not None:
+            summary["routing"] = router.stats()
+        return summary
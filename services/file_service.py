@@ -1,9 +1,40 @@
 import os
+import json
+import stat
 import yaml
-from typing import Dict, Any, Optional, Union
+import hashlib
+import tempfile
+import threading
+from typing import Callable, Dict, Any, Optional, Union
 import logging
 from models.course import Course
 from models.lesson import Lesson
+from models.pipeline import RunManifest
+
+# Characters of the content hash in content-addressed artifact names
+ARTIFACT_HASH_LENGTH = 16
+
+# Locks serializing updates to each run manifest, keyed by absolute path
+_manifest_locks: Dict[str, threading.Lock] = {}
+_manifest_locks_lock = threading.Lock()
+
+
+def _manifest_lock(path: str) -> threading.Lock:
+    """Get the process-wide lock for updates to a run manifest."""
+    with _manifest_locks_lock:
+        return _manifest_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _fsync_directory(directory: str):
+    """Flush a directory entry (a rename) to disk, where the OS supports it."""
+    if os.name == "nt":
+        # Windows can't open directories; NTFS journals the rename itself
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 class FileService:
@@ -22,6 +53,74 @@ class FileService:
         self.base_dir = base_dir
         self.logger = logging.getLogger(__name__)
 
+    def write_atomic(self, content: Union[str, bytes], file_path: str) -> str:
+        """
+        Write a file so readers only ever see the old or the new content.
+
+        The content goes to a temporary file in the same directory, which
+        is flushed to disk and then renamed over the target. A crash or a
+        concurrent writer can't leave a half-written file behind.
+
+        Args:
+            content: Text (written as UTF-8) or bytes to write
+            file_path: Path of the file to write
+
+        Returns:
+            Path to the written file
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        data = content.encode("utf-8") if isinstance(content, str) else content
+
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(file_path)}.", suffix=".tmp", dir=directory
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # Keep the permissions of the file being replaced
+            try:
+                mode = stat.S_IMODE(os.stat(file_path).st_mode)
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        _fsync_directory(directory)
+        return file_path
+
+    def save_artifact(
+        self, content: str, file_path: str, content_addressed: bool = False
+    ) -> str:
+        """
+        Save a generated artifact atomically.
+
+        Args:
+            content: Artifact content
+            file_path: Path to save the artifact to
+            content_addressed: Name the file after its content instead, e.g.
+                lesson_01_rough_draft.<hash>.md next to file_path; files with
+                the same content are written once and never overwritten
+
+        Returns:
+            Path to the saved artifact
+        """
+        if content_addressed:
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            root, extension = os.path.splitext(file_path)
+            file_path = f"{root}.{digest[:ARTIFACT_HASH_LENGTH]}{extension}"
+            if os.path.exists(file_path):
+                return file_path
+
+        self.write_atomic(content, file_path)
+        self.logger.debug(f"Saved artifact to: {file_path}")
+        return file_path
+
     def create_course_directory(self, course_title: str) -> str:
         """
         Create the course directory structure.
@@ -72,8 +171,10 @@ class FileService:
         config_path = os.path.join(course_dir, "course_config.yaml")
 
         # Convert to dict and save as YAML
-        with open(config_path, "w", encoding="utf-8") as f:
-            yaml.dump(course.to_dict(), f, default_flow_style=False, sort_keys=False)
+        self.write_atomic(
+            yaml.dump(course.to_dict(), default_flow_style=False, sort_keys=False),
+            config_path,
+        )
 
         self.logger.info(f"Saved course config to: {config_path}")
         return config_path
@@ -111,11 +212,7 @@ class FileService:
         Returns:
             Path to the saved file
         """
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        self.write_atomic(content, file_path)
 
         self.logger.info(f"Saved markdown to: {file_path}")
         return file_path
@@ -163,8 +260,10 @@ class FileService:
         )
 
         # Convert to dict and save as YAML
-        with open(metadata_path, "w", encoding="utf-8") as f:
-            yaml.dump(lesson.to_dict(), f, default_flow_style=False, sort_keys=False)
+        self.write_atomic(
+            yaml.dump(lesson.to_dict(), default_flow_style=False, sort_keys=False),
+            metadata_path,
+        )
 
         self.logger.info(f"Saved lesson metadata to: {metadata_path}")
         return metadata_path
@@ -240,3 +339,83 @@ class FileService:
                 continue
 
         return sorted(lesson_numbers)
+
+    def run_manifest_path(self, course_dir: str, lesson_id: str) -> str:
+        """
+        Get the path of a lesson's pipeline run manifest.
+
+        Args:
+            course_dir: Course directory
+            lesson_id: Identifier for the lesson
+
+        Returns:
+            Path to the manifest file
+        """
+        return os.path.join(course_dir, "lessons", f"{lesson_id}_manifest.json")
+
+    def save_run_manifest(self, manifest: RunManifest, course_dir: str) -> str:
+        """
+        Save a lesson's pipeline run manifest to JSON.
+
+        Args:
+            manifest: Run manifest to save
+            course_dir: Course directory
+
+        Returns:
+            Path to the saved manifest file
+        """
+        manifest_path = self.run_manifest_path(course_dir, manifest.lesson_id)
+        return self.write_atomic(
+            json.dumps(manifest.to_dict(), indent=2), manifest_path
+        )
+
+    def update_run_manifest(
+        self,
+        course_dir: str,
+        lesson_id: str,
+        update: Callable[[RunManifest], None],
+    ) -> RunManifest:
+        """
+        Apply a change to the saved run manifest of a lesson.
+
+        The manifest is reloaded, changed and saved while holding the
+        lesson's manifest lock, so pipelines and the UI updating the same
+        lesson at once don't drop each other's step records.
+
+        Args:
+            course_dir: Course directory
+            lesson_id: Identifier for the lesson
+            update: Function that changes the manifest in place
+
+        Returns:
+            The updated manifest
+        """
+        with _manifest_lock(self.run_manifest_path(course_dir, lesson_id)):
+            manifest = self.load_run_manifest(course_dir, lesson_id)
+            update(manifest)
+            self.save_run_manifest(manifest, course_dir)
+        return manifest
+
+    def load_run_manifest(self, course_dir: str, lesson_id: str) -> RunManifest:
+        """
+        Load a lesson's pipeline run manifest.
+
+        Args:
+            course_dir: Course directory
+            lesson_id: Identifier for the lesson
+
+        Returns:
+            The saved manifest, or an empty one if none exists or it is unreadable
+        """
+        manifest_path = self.run_manifest_path(course_dir, lesson_id)
+        if not os.path.exists(manifest_path):
+            return RunManifest(lesson_id=lesson_id)
+
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return RunManifest.from_dict(json.load(f))
+        except Exception as e:
+            self.logger.warning(
+                f"Ignoring unreadable run manifest {manifest_path}: {e}"
+            )
+            return RunManifest(lesson_id=lesson_id)
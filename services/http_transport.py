@@ -0,0 +1,332 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, Any, AsyncIterator, Callable, Optional
+
+import httpx
+
+from services.telemetry import add_to_span, current_span
+
+# Default transport settings, overridable via the `llm.http` section of
+# config/app_config.yaml (and per provider under `llm.models.<provider>.http`)
+DEFAULT_TRANSPORT_CONFIG = {
+    "timeout": 600.0,
+    "connect_timeout": 10.0,
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 30.0,
+    "http2": True,
+}
+
+
+class HTTPTransport:
+    """
+    Non-blocking HTTP transport shared by the LLM services of one provider.
+
+    Wraps an httpx.AsyncClient with keep-alive connection pooling. A separate
+    client is kept per running event loop, because pooled connections are bound
+    to the loop that opened them (the Streamlit UI creates a new loop per call).
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        timeout: float = DEFAULT_TRANSPORT_CONFIG["timeout"],
+        connect_timeout: float = DEFAULT_TRANSPORT_CONFIG["connect_timeout"],
+        max_connections: int = DEFAULT_TRANSPORT_CONFIG["max_connections"],
+        max_keepalive_connections: int = DEFAULT_TRANSPORT_CONFIG[
+            "max_keepalive_connections"
+        ],
+        keepalive_expiry: float = DEFAULT_TRANSPORT_CONFIG["keepalive_expiry"],
+        http2: bool = DEFAULT_TRANSPORT_CONFIG["http2"],
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Initialize the HTTP transport.
+
+        Args:
+            provider: Name of the provider this transport serves
+            timeout: Read/write/pool timeout in seconds
+            connect_timeout: Connection timeout in seconds
+            max_connections: Maximum number of concurrent connections
+            max_keepalive_connections: Maximum number of idle keep-alive connections
+            keepalive_expiry: Seconds an idle connection is kept open
+            http2: Use HTTP/2 when the optional `h2` package is installed
+            transport: Custom httpx transport (used by tests to mock responses)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and self._http2_available()
+        self._transport = transport
+        # Maps event loop -> httpx.AsyncClient; entries vanish with their loop
+        self._clients = weakref.WeakKeyDictionary()
+        self._in_flight = 0
+
+    @staticmethod
+    def _http2_available() -> bool:
+        """Check whether the optional HTTP/2 dependency is installed."""
+        return importlib.util.find_spec("h2") is not None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get (or create) the pooled client for the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+                transport=self._transport,
+            )
+            self._clients[loop] = client
+            self.logger.debug(
+                f"Opened HTTP client for {self.provider} (http2={self.http2})"
+            )
+        return client
+
+    async def post(
+        self,
+        url: str,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        Send a POST request without blocking the event loop.
+
+        Args:
+            url: Request URL
+            json: JSON payload
+            headers: Request headers
+
+        Returns:
+            The HTTP response
+        """
+        client = self._get_client()
+        self._in_flight += 1
+        start = time.monotonic()
+        try:
+            return await client.post(url, json=json, headers=headers)
+        finally:
+            self._in_flight -= 1
+            add_to_span("network_seconds", time.monotonic() - start)
+
+    async def get(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        Send a GET request without blocking the event loop.
+
+        Args:
+            url: Request URL
+            headers: Request headers
+
+        Returns:
+            The HTTP response
+        """
+        client = self._get_client()
+        self._in_flight += 1
+        start = time.monotonic()
+        try:
+            return await client.get(url, headers=headers)
+        finally:
+            self._in_flight -= 1
+            add_to_span("network_seconds", time.monotonic() - start)
+
+    async def stream_lines(
+        self,
+        url: str,
+        json: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        on_response: Optional[Callable[[httpx.Response], None]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Send a POST request and yield the response body line by line as it arrives.
+
+        Args:
+            url: Request URL
+            json: JSON payload
+            headers: Request headers
+            on_response: Called with the response once its headers arrive
+
+        Yields:
+            Non-empty lines of the response body
+
+        Raises:
+            httpx.HTTPStatusError: If the response has an error status
+        """
+        client = self._get_client()
+        self._in_flight += 1
+        # The span of the call that started the stream (read here, as the
+        # consumer's context can change between yields)
+        active = current_span()
+        start = time.monotonic()
+        try:
+            async with client.stream(
+                "POST", url, json=json, headers=headers
+            ) as response:
+                if on_response is not None:
+                    on_response(response)
+                if response.is_error:
+                    await response.aread()
+                    self.logger.error(
+                        f"API Error - Status: {response.status_code}, "
+                        f"Response: {response.text}"
+                    )
+                    response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        if active is not None:
+                            active.set_default(
+                                "time_to_first_byte_seconds", time.monotonic() - start
+                            )
+                        yield line
+        finally:
+            self._in_flight -= 1
+            if active is not None:
+                active.add("network_seconds", time.monotonic() - start)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests currently awaiting a response."""
+        return self._in_flight
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for in-flight requests to finish.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the transport is idle, False if the timeout expired first
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._in_flight > 0:
+            if deadline is not None and loop.time() >= deadline:
+                self.logger.warning(
+                    f"{self._in_flight} {self.provider} request(s) still in flight"
+                )
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def aclose(self) -> None:
+        """Close the client bound to the running event loop and forget the rest."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+        # Clients bound to other loops can't be awaited from here; their
+        # connections are released when those loops are garbage collected
+        self._clients.clear()
+
+
+async def iter_sse_data(lines: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Decode a server-sent event stream.
+
+    Args:
+        lines: Lines of an SSE response body
+
+    Yields:
+        The JSON payload of each `data:` line (the OpenAI `[DONE]` marker is skipped)
+    """
+    async for line in lines:
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if not data or data == "[DONE]":
+            continue
+        try:
+            yield json.loads(data)
+        except ValueError:
+            continue
+
+
+# Process-wide transports, one per provider
+_transports: Dict[str, HTTPTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def load_transport_config(
+    provider: str, llm_config: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Resolve transport settings for a provider.
+
+    Args:
+        provider: LLM provider name
+        llm_config: The `llm` section of app_config.yaml
+
+    Returns:
+        Dictionary of HTTPTransport keyword arguments
+    """
+    settings = dict(DEFAULT_TRANSPORT_CONFIG)
+    if llm_config:
+        settings.update(llm_config.get("http") or {})
+        provider_config = llm_config.get("models", {}).get(provider.lower(), {})
+        settings.update(provider_config.get("http") or {})
+
+    return {k: v for k, v in settings.items() if k in DEFAULT_TRANSPORT_CONFIG}
+
+
+def get_transport(
+    provider: str, llm_config: Optional[Dict[str, Any]] = None
+) -> HTTPTransport:
+    """
+    Get the shared transport for a provider, creating it on first use.
+
+    Args:
+        provider: LLM provider name
+        llm_config: The `llm` section of app_config.yaml (used on first creation)
+
+    Returns:
+        The provider's HTTPTransport
+    """
+    provider = provider.lower()
+    with _transports_lock:
+        if provider not in _transports:
+            _transports[provider] = HTTPTransport(
+                provider, **load_transport_config(provider, llm_config)
+            )
+        return _transports[provider]
+
+
+async def drain_all_transports(timeout: Optional[float] = None) -> bool:
+    """
+    Wait for in-flight requests on every shared transport to finish.
+
+    Args:
+        timeout: Maximum seconds to wait per transport (None waits indefinitely)
+
+    Returns:
+        True if every transport is idle
+    """
+    with _transports_lock:
+        transports = list(_transports.values())
+
+    results = [await transport.drain(timeout) for transport in transports]
+    return all(results)
+
+
+async def close_all_transports() -> None:
+    """Close every shared transport (call on application shutdown)."""
+    with _transports_lock:
+        transports = list(_transports.values())
+        _transports.clear()
+
+    for transport in transports:
+        await transport.aclose()
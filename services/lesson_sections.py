@@ -0,0 +1,171 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+# A Learning Outcome section of a draft, e.g. <LO1>...</LO1>
+LO_SECTION = re.compile(r"<(LO\d+)>(.*?)</\1>", re.DOTALL)
+
+# The line that starts a draft's glossary ("## Glossary", "Glossary:", "<Glossary>")
+GLOSSARY_HEADING = re.compile(
+    r"^[ \t#]*<?glossary>?:?[ \t]*$", re.IGNORECASE | re.MULTILINE
+)
+
+# The expansion summary line the expanded draft prompt asks for
+EXPANSION_CHECK = re.compile(r"^.*Expansion Check:.*(?:\n|$)", re.MULTILINE)
+
+
+def word_count(text: str) -> int:
+    """Count the whitespace-separated words in a text."""
+    return len(text.split())
+
+
+def _term_name(line: str) -> Optional[str]:
+    """Get the term a glossary line defines, lowercased for comparison."""
+    text = line.strip().lstrip("-*• \t").strip()
+    if not text:
+        return None
+    name = re.split(r":| - | – | — | \(", text, maxsplit=1)[0]
+    return name.strip("*_ ").lower() or None
+
+
+def _is_term_line(line: str) -> bool:
+    """Check whether a line looks like a glossary entry."""
+    return line.lstrip().startswith(("-", "*", "•"))
+
+
+def merge_glossary(text: str, terms: List[str]) -> str:
+    """
+    Add glossary entries to a draft, skipping terms it already defines.
+
+    Entries are appended to the draft's glossary, or to a new "## Glossary"
+    section at the end if it has none.
+
+    Args:
+        text: The draft
+        terms: Glossary lines, e.g. "- **Term**: definition"
+
+    Returns:
+        The draft with the new entries added
+    """
+    heading = GLOSSARY_HEADING.search(text)
+    known = set()
+    if heading is None:
+        insert_at = len(text.rstrip())
+    else:
+        # The glossary runs until the next heading or tag, or the first
+        # paragraph after a blank line that isn't an entry
+        insert_at = heading.end()
+        offset = heading.end() + 1
+        blank = False
+        for line in text[offset:].splitlines(keepends=True):
+            stripped = line.strip()
+            if stripped.startswith(("#", "<")) or (
+                blank and stripped and not _is_term_line(line)
+            ):
+                break
+            if stripped:
+                known.add(_term_name(line))
+                insert_at = offset + len(line.rstrip("\r\n"))
+            blank = not stripped
+            offset += len(line)
+
+    new_terms = []
+    for term in terms:
+        name = _term_name(term)
+        if name and name not in known:
+            known.add(name)
+            new_terms.append(term.strip())
+    if not new_terms:
+        return text
+
+    addition = "\n".join(new_terms)
+    if heading is None:
+        addition = f"\n\n## Glossary\n{addition}"
+    else:
+        addition = f"\n{addition}"
+    return text[:insert_at] + addition + text[insert_at:]
+
+
+def parse_section_response(response: str) -> Tuple[str, List[str]]:
+    """
+    Read an expanded section and its new glossary entries from an LLM response.
+
+    Args:
+        response: Response to the expanded section prompt
+
+    Returns:
+        Tuple of (section content without its LO tags, glossary lines)
+    """
+    section = re.search(r"<expanded_section>(.*?)</expanded_section>", response, re.S)
+    content = (
+        section.group(1)
+        if section
+        else re.sub(r"<glossary_terms>.*?</glossary_terms>", "", response, flags=re.S)
+    )
+    tagged = LO_SECTION.fullmatch(content.strip())
+    if tagged:
+        content = tagged.group(2)
+
+    glossary = re.search(r"<glossary_terms>(.*?)</glossary_terms>", response, re.S)
+    terms = []
+    if glossary:
+        terms = [line for line in glossary.group(1).splitlines() if line.strip()]
+    return content.strip(), terms
+
+
+class SectionedDraft:
+    """
+    A lesson draft split into its <LOn> sections and the text around them,
+    so each section can be rewritten separately and the draft put back
+    together.
+    """
+
+    def __init__(self, text: str):
+        """
+        Split a draft into sections.
+
+        Args:
+            text: Draft whose Learning Outcome sections are tagged <LO1>,
+                <LO2>, ... with matching closing tags
+        """
+        self.text = text
+        self.sections: List[Tuple[str, str]] = []
+        # Text before, between and after the sections
+        self.parts: List[str] = []
+
+        position = 0
+        for match in LO_SECTION.finditer(text):
+            self.parts.append(text[position : match.start()])
+            self.sections.append((match.group(1), match.group(2).strip()))
+            position = match.end()
+        self.parts.append(text[position:])
+
+    def assemble(
+        self, expanded: Dict[str, str], glossary_terms: Optional[List[str]] = None
+    ) -> str:
+        """
+        Put the draft back together with rewritten sections.
+
+        New glossary entries are merged into the glossary and the
+        "Expansion Check" line is recomputed for the whole draft.
+
+        Args:
+            expanded: New content by section tag (sections not given keep
+                their content)
+            glossary_terms: Glossary lines introduced by the new content
+
+        Returns:
+            The reassembled draft
+        """
+        pieces = [self.parts[0]]
+        for (tag, content), part in zip(self.sections, self.parts[1:]):
+            pieces.append(f"<{tag}>\n{expanded.get(tag, content)}\n</{tag}>")
+            pieces.append(part)
+
+        text = EXPANSION_CHECK.sub("", "".join(pieces))
+        text = merge_glossary(text, glossary_terms or []).rstrip()
+
+        original = EXPANSION_CHECK.sub("", self.text)
+        return (
+            f"{text}\n\nExpansion Check: {word_count(original)} → "
+            f"{word_count(text)}; LOs and structure preserved"
+        )
@@ -0,0 +1,273 @@
+import time
+import asyncio
+from typing import Dict, Any, AsyncIterator, List, Optional, Set, Tuple
+
+from services.llm_service import LLMService
+
+# Default batch settings, overridable via `pipeline.batch` in app_config.yaml
+DEFAULT_BATCH_CONFIG = {
+    "collect_window_seconds": 2.0,
+    "poll_interval_seconds": 30.0,
+    "max_wait_hours": 24.0,
+    "max_batch_requests": 10000,
+}
+
+
+# Batch result error types that come from the request itself, which fail
+# the same way however often the request is resubmitted
+FATAL_BATCH_ERROR_TYPES = {
+    "invalid_request_error",
+    "authentication_error",
+    "permission_error",
+    "not_found_error",
+}
+
+
+class BatchError(RuntimeError):
+    """A request in a message batch did not succeed."""
+
+    def __init__(self, message: str, error_type: Optional[str] = None):
+        """
+        Initialize the error.
+
+        Args:
+            message: Error message
+            error_type: The provider's error type, e.g. "invalid_request_error"
+        """
+        super().__init__(message)
+        self.error_type = error_type
+
+    @property
+    def retryable(self) -> bool:
+        """Whether resubmitting the request could succeed."""
+        return self.error_type not in FATAL_BATCH_ERROR_TYPES
+
+
+class BatchedLLMService(LLMService):
+    """
+    LLM service that sends requests as provider message batches instead of
+    one at a time.
+
+    Each request is queued until no new request has arrived for
+    collect_window seconds, then everything queued is submitted as one batch
+    and the callers wait until the batch has ended. Lesson pipelines run side
+    by side therefore submit each pipeline stage for all their lessons as a
+    single batch, trading latency for the higher throughput and lower cost of
+    batch processing.
+    """
+
+    def __init__(
+        self,
+        service: LLMService,
+        collect_window: float = DEFAULT_BATCH_CONFIG["collect_window_seconds"],
+        poll_interval: float = DEFAULT_BATCH_CONFIG["poll_interval_seconds"],
+        max_wait: float = DEFAULT_BATCH_CONFIG["max_wait_hours"] * 3600,
+        max_batch_requests: int = DEFAULT_BATCH_CONFIG["max_batch_requests"],
+    ):
+        """
+        Initialize the batched service.
+
+        Args:
+            service: Provider service that supports batches (see supports_batches)
+            collect_window: Seconds without a new request before the queued
+                requests are submitted
+            poll_interval: Seconds between checks on a submitted batch
+            max_wait: Seconds to wait for a batch before cancelling it
+            max_batch_requests: Maximum requests in one batch; a full queue
+                is submitted straight away
+
+        Raises:
+            ValueError: If the service doesn't support batches
+        """
+        super().__init__()
+        if getattr(service, "supports_batches", False) is not True:
+            raise ValueError(
+                f"Batch mode is not supported for provider "
+                f"{getattr(service, 'provider', type(service).__name__)}"
+            )
+        self.service = service
+        self.provider = service.provider
+        self.model = getattr(service, "model", None)
+        self.supports_prompt_caching = service.supports_prompt_caching
+        self.supports_token_counting = service.supports_token_counting
+        self.token_limits = service.token_limits
+        self.collect_window = collect_window
+        self.poll_interval = poll_interval
+        self.max_wait = max_wait
+        self.max_batch_requests = max_batch_requests
+
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: Set[asyncio.Task] = set()
+        self.batches: List[Dict[str, Any]] = []
+
+    async def _submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a request for the next batch and wait for its response message."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((params, future))
+
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        if len(self._queue) >= self.max_batch_requests:
+            self._flush()
+        else:
+            self._flush_timer = loop.call_later(self.collect_window, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Submit everything queued as one batch."""
+        self._flush_timer = None
+        queued, self._queue = self._queue, []
+        queued = [(params, future) for params, future in queued if not future.done()]
+        if not queued:
+            return
+
+        task = asyncio.create_task(self._run_batch(queued))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, queued: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        """Submit a batch, wait for it to end and hand each caller its result."""
+        requests = [
+            {"custom_id": f"request-{index}", "params": params}
+            for index, (params, _) in enumerate(queued)
+        ]
+        stats = {"id": None, "requests": len(requests), "status": "submitting"}
+        self.batches.append(stats)
+
+        try:
+            batch = await self.service.create_batch(requests)
+            stats["id"] = batch["id"]
+            self.logger.info(
+                f"Submitted {self.provider} batch {batch['id']} "
+                f"with {len(requests)} request(s)"
+            )
+
+            batch = await self._wait_for_batch(batch)
+            results = await self.service.batch_results(batch)
+        except asyncio.CancelledError:
+            stats["status"] = "cancelled"
+            for _, future in queued:
+                future.cancel()
+            raise
+        except Exception as e:
+            stats["status"] = "failed"
+            self.logger.error(f"Batch {stats['id'] or '(not created)'} failed: {e}")
+            for _, future in queued:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        succeeded = 0
+        for request, (_, future) in zip(requests, queued):
+            if future.done():
+                continue
+            result = results.get(request["custom_id"])
+            if result is None:
+                future.set_exception(BatchError("No result returned for request"))
+            elif result.get("type") == "succeeded":
+                future.set_result(result["message"])
+                succeeded += 1
+            else:
+                error = (result.get("error") or {}).get("error") or result.get("error")
+                error_type = error.get("type") if isinstance(error, dict) else None
+                future.set_exception(
+                    BatchError(
+                        f"Batch request {result.get('type')}: {error}", error_type
+                    )
+                )
+
+        stats["status"] = "ended"
+        stats["succeeded"] = succeeded
+        self.logger.info(
+            f"Batch {stats['id']} ended: {succeeded} of {len(requests)} succeeded"
+        )
+
+    async def _wait_for_batch(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        """Poll a batch until it ends, cancelling it if it takes too long."""
+        deadline = time.monotonic() + self.max_wait
+        while batch.get("processing_status") != "ended":
+            if time.monotonic() >= deadline:
+                self.logger.error(f"Batch {batch['id']} timed out; cancelling it")
+                await self.service.cancel_batch(batch["id"])
+                raise TimeoutError(
+                    f"Batch {batch['id']} did not end within {self.max_wait}s"
+                )
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.service.retrieve_batch(batch["id"])
+        return batch
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize the batches submitted so far.
+
+        Returns:
+            Dictionary with the batch count, total requests and each batch's
+            ID, size and status
+        """
+        return {
+            "batches": len(self.batches),
+            "requests": sum(batch["requests"] for batch in self.batches),
+            "details": [dict(batch) for batch in self.batches],
+        }
+
+    async def count_tokens(self, prompt: str, context: Optional[str] = None) -> int:
+        """Count input tokens with the wrapped service (outside any batch)."""
+        return await self.service.count_tokens(prompt, context)
+
+    async def generate_text(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+    ) -> str:
+        """
+        Generate text as part of the next batch; a response cut off at
+        max_tokens is continued in a later batch.
+        """
+        return await self.service.complete(
+            self.service.build_request(
+                prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                cache_prefix=cache_prefix,
+            ),
+            self._submit,
+        )
+
+    async def generate_with_context(
+        self,
+        prompt: str,
+        context: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> str:
+        """Generate text with a system prompt as part of the next batch."""
+        return await self.service.complete(
+            self.service.build_request(
+                prompt, context, temperature, max_tokens, cache_prefix, cache_system
+            ),
+            self._submit,
+        )
+
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> AsyncIterator[str]:
+        """Generate text as part of the next batch, yielded as a single chunk."""
+        yield await self.service.complete(
+            self.service.build_request(
+                prompt, context, temperature, max_tokens, cache_prefix, cache_system
+            ),
+            self._submit,
+        )
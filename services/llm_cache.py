@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+
+from services.llm_service import LLMService
+
+
+class ResponseCache:
+    """
+    Content-addressed, on-disk store for LLM responses.
+
+    Responses are stored in a SQLite database keyed by a SHA-256 hash of the
+    request (provider, model, system prompt, user message, temperature,
+    max_tokens). Entries older than max_age_seconds are expired, and the least
+    recently used entries are evicted when the store exceeds max_bytes or
+    max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: Optional[int] = 200 * 1024 * 1024,
+        max_entries: Optional[int] = None,
+        max_age_seconds: Optional[float] = 30 * 24 * 3600,
+    ):
+        """
+        Initialize the response cache.
+
+        Args:
+            path: Path to the SQLite database file
+            max_bytes: Maximum total size of stored responses (None for no limit)
+            max_entries: Maximum number of stored responses (None for no limit)
+            max_age_seconds: Maximum age of an entry (None for no limit)
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    provider TEXT,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+                """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_last_accessed "
+                "ON responses (last_accessed)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the cache database for one transaction."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(
+        provider: Optional[str],
+        model: Optional[str],
+        system_prompt: Optional[str],
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        """
+        Compute the content address of a request.
+
+        Returns:
+            Hex SHA-256 digest of the canonical request
+        """
+        canonical = json.dumps(
+            {
+                "provider": provider,
+                "model": model,
+                "system": system_prompt,
+                "prompt": prompt,
+                "temperature": float(temperature),
+                "max_tokens": int(max_tokens),
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a cached response.
+
+        Args:
+            key: Request key from make_key
+
+        Returns:
+            The cached response, or None on a miss or expired entry
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is not None and self.max_age_seconds is not None:
+                if now - row[1] > self.max_age_seconds:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            conn.execute(
+                "UPDATE responses SET last_accessed = ?, hits = hits + 1 "
+                "WHERE key = ?",
+                (now, key),
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(
+        self,
+        key: str,
+        response: str,
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> None:
+        """
+        Store a response and evict old entries if the store is over its limits.
+
+        Args:
+            key: Request key from make_key
+            response: The response text
+            provider: Provider name (informational)
+            model: Model name (informational)
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses "
+                "(key, provider, model, response, size, created_at, last_accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        """Remove expired entries, then least recently used ones over the limits."""
+        removed = 0
+        if self.max_age_seconds is not None:
+            removed += conn.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (now - self.max_age_seconds,),
+            ).rowcount
+
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if (self.max_entries is None or count <= self.max_entries) and (
+            self.max_bytes is None or total <= self.max_bytes
+        ):
+            return removed
+
+        rows = conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_accessed ASC"
+        ).fetchall()
+        for key, size in rows:
+            if (self.max_entries is None or count <= self.max_entries) and (
+                self.max_bytes is None or total <= self.max_bytes
+            ):
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            removed += 1
+
+        if removed:
+            self.logger.info(f"Evicted {removed} cached LLM response(s)")
+        return removed
+
+    def evict(self) -> int:
+        """
+        Apply the age and size limits now.
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock, self._connect() as conn:
+            return self._evict(conn, time.time())
+
+    def clear(self) -> None:
+        """Remove every cached response."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            Dictionary with hits, misses and hit rate for this instance, plus
+            the number of entries and bytes in the store
+        """
+        with self._lock, self._connect() as conn:
+            entries, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+        }
+
+
+class CachedLLMService(LLMService):
+    """LLM service wrapper that serves repeated requests from a ResponseCache."""
+
+    def __init__(
+        self,
+        service: LLMService,
+        cache: ResponseCache,
+        bypass_sampled: bool = False,
+    ):
+        """
+        Initialize the cached service.
+
+        Args:
+            service: The LLM service to wrap
+            cache: Response store
+            bypass_sampled: Skip cache lookups for temperature > 0 so sampled
+                outputs are always fresh (fresh results are still stored)
+        """
+        super().__init__()
+        self.service = service
+        self.cache = cache
+        self.bypass_sampled = bypass_sampled
+        self.provider = getattr(service, "provider", None) or type(service).__name__
+        self.model = getattr(service, "model", None)
+        self.supports_prompt_caching = (
+            getattr(service, "supports_prompt_caching", False) is True
+        )
+        self.supports_token_counting = (
+            getattr(service, "supports_token_counting", False) is True
+        )
+        self.supports_warm_up = getattr(service, "supports_warm_up", False) is True
+        self.token_limits = getattr(service, "token_limits", None)
+
+    async def count_tokens(self, prompt: str, context: Optional[str] = None) -> int:
+        """Count input tokens with the wrapped service."""
+        return await self.service.count_tokens(prompt, context)
+
+    async def warm_up(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """Load the wrapped service's model ahead of the first request."""
+        return await self.service.warm_up(force)
+
+    def _cache_hints(
+        self, prompt: str, cache_prefix: Optional[str], cache_system: bool = False
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Get the prompt and prompt caching hints to pass to the wrapped service.
+        A service without prompt caching gets the prefix joined to the prompt.
+        """
+        if not self.supports_prompt_caching:
+            return (cache_prefix or "") + prompt, {}
+
+        hints = {}
+        if cache_prefix:
+            hints["cache_prefix"] = cache_prefix
+        if cache_system:
+            hints["cache_system"] = cache_system
+        return prompt, hints
+
+    async def _cached_call(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        call,
+    ) -> str:
+        """Serve a request from the cache, or run the call and store its result."""
+        key = ResponseCache.make_key(
+            self.provider, self.model, system_prompt, prompt, temperature, max_tokens
+        )
+
+        if not (self.bypass_sampled and temperature > 0):
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.logger.info(f"LLM response cache hit ({key[:12]})")
+                return cached
+
+        response = await call()
+        if response:
+            self.cache.put(key, response, provider=self.provider, model=self.model)
+        return response
+
+    async def generate_text(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+    ) -> str:
+        """Generate text, using the cache when possible."""
+        full_prompt = (cache_prefix or "") + prompt
+        prompt, hints = self._cache_hints(prompt, cache_prefix)
+        return await self._cached_call(
+            full_prompt,
+            None,
+            temperature,
+            max_tokens,
+            lambda: self.service.generate_text(
+                prompt=prompt, temperature=temperature, max_tokens=max_tokens, **hints
+            ),
+        )
+
+    async def generate_with_context(
+        self,
+        prompt: str,
+        context: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> str:
+        """Generate text with additional context, using the cache when possible."""
+        full_prompt = (cache_prefix or "") + prompt
+        prompt, hints = self._cache_hints(prompt, cache_prefix, cache_system)
+        return await self._cached_call(
+            full_prompt,
+            context,
+            temperature,
+            max_tokens,
+            lambda: self.service.generate_with_context(
+                prompt=prompt,
+                context=context,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **hints,
+            ),
+        )
+
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> AsyncIterator[str]:
+        """Stream text, replaying a cached response as a single chunk on a hit."""
+        full_prompt = (cache_prefix or "") + prompt
+        prompt, hints = self._cache_hints(prompt, cache_prefix, cache_system)
+        key = ResponseCache.make_key(
+            self.provider,
+            self.model,
+            context,
+            full_prompt,
+            temperature,
+            max_tokens,
+        )
+
+        if not (self.bypass_sampled and temperature > 0):
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.logger.info(f"LLM response cache hit ({key[:12]})")
+                yield cached
+                return
+
+        chunks = []
+        async for chunk in self.service.stream_text(
+            prompt,
+            context=context,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **hints,
+        ):
+            chunks.append(chunk)
+            yield chunk
+
+        response = "".join(chunks)
+        if response:
+            self.cache.put(key, response, provider=self.provider, model=self.model)
@@ -0,0 +1,473 @@
+import time
+import random
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+
+from services.llm_service import LLMService
+from services.retry_policy import is_retryable
+from services.rate_limiter import parse_retry_after
+from services.token_budget import TokenLimits
+
+# Default routing settings, overridable with `llm.routing` in
+# config/app_config.yaml
+DEFAULT_ROUTING_CONFIG = {
+    "enabled": False,
+    "failure_cooldown_seconds": 30,
+    "max_cooldown_seconds": 600,
+    "pins": {},
+}
+
+# Status codes that mean a target can't serve any request (bad key, no access
+# to the model, unknown model), so other targets should be tried
+TARGET_ERROR_STATUS_CODES = {401, 403, 404}
+
+# Weight of the newest latency in a target's moving average
+LATENCY_SMOOTHING = 0.2
+
+# The pipeline step an LLM call is made for, so steps can be pinned to a
+# target. Tasks inherit it, so concurrent steps each see their own.
+_routing_step: ContextVar[Optional[str]] = ContextVar("llm_routing_step", default=None)
+
+
+@contextmanager
+def routing_step(step: Optional[str]) -> Iterator[None]:
+    """
+    Mark the LLM calls made inside the block as belonging to a pipeline step.
+
+    Args:
+        step: Pipeline step name
+    """
+    token = _routing_step.set(step)
+    try:
+        yield
+    finally:
+        _routing_step.reset(token)
+
+
+class RouteTarget:
+    """One provider and model an LLMRouter can send requests to, and its health."""
+
+    def __init__(
+        self,
+        service: LLMService,
+        name: str,
+        weight: float = 1.0,
+        max_concurrency: Optional[int] = None,
+    ):
+        """
+        Initialize the target.
+
+        Args:
+            service: LLM service for the provider and model
+            name: Target name, "provider/model"
+            weight: Share of requests relative to the other targets
+            max_concurrency: Most requests sent to the target at once
+                (None for no limit)
+        """
+        self.service = service
+        self.name = name
+        self.weight = weight
+        self.semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        """Check whether the target is out of its post-failure cooldown."""
+        return now >= self.unhealthy_until
+
+    def record_success(self, seconds: float):
+        """Record a successful request and its latency."""
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def record_failure(self, cooldown: float):
+        """Record a failed request and take the target out of rotation."""
+        self.requests += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.unhealthy_until = max(self.unhealthy_until, time.monotonic() + cooldown)
+
+    def stats(self) -> Dict[str, Any]:
+        """Summarize the target's traffic and health."""
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_seconds": self.latency,
+            "healthy": self.healthy(time.monotonic()),
+        }
+
+
+class LLMRouter(LLMService):
+    """
+    LLM service that spreads requests over several providers and models.
+
+    Requests go to healthy targets at random, in proportion to each target's
+    weight and inversely to its recent latency and current load. A target
+    that fails with an outage, a rate limit or an authentication error is
+    taken out of rotation for a cooldown that grows with each consecutive
+    failure, and the request fails over to the next target. Steps can be
+    pinned to a target (see routing_step), in which case they only ever go
+    to it.
+    """
+
+    supports_prompt_caching = True
+
+    def __init__(
+        self,
+        targets: List[RouteTarget],
+        pins: Optional[Dict[str, str]] = None,
+        failure_cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            targets: Targets to route between, primary first
+            pins: Target name by pipeline step, for steps that need a
+                specific model
+            failure_cooldown: Seconds a target is avoided after a failure,
+                doubling with each consecutive failure
+            max_cooldown: Longest a target is avoided
+
+        Raises:
+            ValueError: If there are no targets, or a pin names an unknown one
+        """
+        super().__init__()
+        if not targets:
+            raise ValueError("LLMRouter needs at least one target")
+        self.targets = targets
+        self.failure_cooldown = failure_cooldown
+        self.max_cooldown = max_cooldown
+
+        by_name = {target.name: target for target in targets}
+        self.pins: Dict[str, RouteTarget] = {}
+        for step, name in (pins or {}).items():
+            if name not in by_name:
+                raise ValueError(
+                    f"Step {step} is pinned to {name}, which is not one of the "
+                    f"course's LLM configurations ({', '.join(by_name)})"
+                )
+            self.pins[step] = by_name[name]
+
+        self.provider = "router"
+        self.model = ",".join(target.name for target in targets)
+
+        # Requests must fit whichever target serves them
+        limits = [target.service.token_limits for target in targets]
+        if all(isinstance(limit, TokenLimits) for limit in limits):
+            self.token_limits = TokenLimits(
+                min(limit.context_window for limit in limits),
+                min(limit.max_output_tokens for limit in limits),
+            )
+
+    @classmethod
+    def from_course(
+        cls,
+        course,
+        service_provider,
+        routing_config: Optional[Dict[str, Any]] = None,
+        provider_limits: Optional[Dict[str, int]] = None,
+    ) -> "LLMRouter":
+        """
+        Create a router over a course's primary and additional LLM configs.
+
+        Configurations whose service can't be created (for example for want
+        of an API key) are left out.
+
+        Args:
+            course: The Course
+            service_provider: LLMServiceProvider to create services with
+            routing_config: The `llm.routing` section of app_config.yaml
+            provider_limits: Most concurrent requests per provider
+
+        Returns:
+            The router
+
+        Raises:
+            ValueError: If no configuration could be used
+        """
+        logger = logging.getLogger(__name__)
+        settings = dict(DEFAULT_ROUTING_CONFIG)
+        settings.update(routing_config or {})
+
+        targets = []
+        seen = set()
+        for config in [course.llm_config, *course.additional_llm_configs]:
+            name = f"{config.provider.lower()}/{config.model}"
+            if name in seen:
+                continue
+            seen.add(name)
+            try:
+                service = service_provider.get_llm_service(
+                    provider=config.provider, model=config.model
+                )
+            except Exception as e:
+                logger.warning(f"Not routing to {name}: {e}")
+                continue
+            targets.append(
+                RouteTarget(
+                    service,
+                    name,
+                    weight=config.weight,
+                    max_concurrency=(provider_limits or {}).get(
+                        config.provider.lower()
+                    ),
+                )
+            )
+
+        if not targets:
+            raise ValueError("None of the course's LLM configurations can be used")
+        return cls(
+            targets,
+            pins=settings["pins"],
+            failure_cooldown=settings["failure_cooldown_seconds"],
+            max_cooldown=settings["max_cooldown_seconds"],
+        )
+
+    def _candidates(self) -> List[RouteTarget]:
+        """
+        Order the targets to try for a request.
+
+        Returns:
+            The pinned target for the current step if it has one; otherwise
+            healthy targets in a weighted random order, followed by targets
+            in cooldown, soonest to recover first, as a last resort
+        """
+        pinned = self.pins.get(_routing_step.get())
+        if pinned is not None:
+            return [pinned]
+
+        now = time.monotonic()
+        healthy = [target for target in self.targets if target.healthy(now)]
+        cooling = sorted(
+            (target for target in self.targets if not target.healthy(now)),
+            key=lambda target: target.unhealthy_until,
+        )
+
+        # Targets without a latency yet are assumed to be average
+        known = [target.latency for target in healthy if target.latency]
+        typical = sum(known) / len(known) if known else 1.0
+
+        ordered = []
+        while healthy:
+            scores = [
+                target.weight / ((target.latency or typical) * (1 + target.in_flight))
+                for target in healthy
+            ]
+            choice = random.choices(healthy, weights=scores)[0]
+            ordered.append(choice)
+            healthy.remove(choice)
+        return ordered + cooling
+
+    def _cooldown(self, target: RouteTarget, error: Exception) -> float:
+        """Work out how long to avoid a target after it failed."""
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = parse_retry_after(error.response.headers.get("retry-after"))
+            if retry_after is not None:
+                return retry_after
+        return min(
+            self.max_cooldown,
+            self.failure_cooldown * (2**target.consecutive_failures),
+        )
+
+    def _fails_over(self, error: Exception) -> bool:
+        """Check whether an error is the target's fault rather than the request's."""
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            if status in TARGET_ERROR_STATUS_CODES:
+                return True
+        return is_retryable(error)
+
+    def _hints(
+        self,
+        target: RouteTarget,
+        prompt: str,
+        cache_prefix: Optional[str],
+        cache_system: bool,
+    ):
+        """
+        Get the prompt and prompt caching hints to pass to a target.
+        A target without prompt caching gets the prefix joined to the prompt.
+        """
+        if getattr(target.service, "supports_prompt_caching", False) is not True:
+            return (cache_prefix or "") + prompt, {}
+        hints = {}
+        if cache_prefix:
+            hints["cache_prefix"] = cache_prefix
+        if cache_system:
+            hints["cache_system"] = cache_system
+        return prompt, hints
+
+    def _failed(self, target: RouteTarget, error: Exception, remaining: int):
+        """Record a target's failure and decide whether to try the next one."""
+        if not self._fails_over(error):
+            raise error
+        cooldown = self._cooldown(target, error)
+        target.record_failure(cooldown)
+        if remaining == 0:
+            raise error
+        self.logger.warning(
+            f"{target.name} failed, failing over for {cooldown:.0f}s: {error}"
+        )
+
+    async def _route(
+        self,
+        prompt: str,
+        context: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        cache_prefix: Optional[str],
+        cache_system: bool,
+    ) -> str:
+        """Send a request to the first target that can serve it."""
+        candidates = self._candidates()
+        for index, target in enumerate(candidates):
+            target_prompt, hints = self._hints(
+                target, prompt, cache_prefix, cache_system
+            )
+            target.in_flight += 1
+            start = time.monotonic()
+            try:
+                if target.semaphore is None:
+                    result = await self._send(
+                        target, target_prompt, context, temperature, max_tokens, hints
+                    )
+                else:
+                    async with target.semaphore:
+                        result = await self._send(
+                            target,
+                            target_prompt,
+                            context,
+                            temperature,
+                            max_tokens,
+                            hints,
+                        )
+            except Exception as e:
+                self._failed(target, e, len(candidates) - index - 1)
+                continue
+            finally:
+                target.in_flight -= 1
+            target.record_success(time.monotonic() - start)
+            return result
+
+    async def _send(
+        self,
+        target: RouteTarget,
+        prompt: str,
+        context: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        hints: Dict[str, Any],
+    ) -> str:
+        """Send a request to one target."""
+        if context is None:
+            return await target.service.generate_text(
+                prompt=prompt, temperature=temperature, max_tokens=max_tokens, **hints
+            )
+        return await target.service.generate_with_context(
+            prompt=prompt,
+            context=context,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **hints,
+        )
+
+    async def generate_text(
+        self,
+        prompt: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+    ) -> str:
+        """Generate text with the first target that can serve the request."""
+        return await self._route(
+            prompt, None, temperature, max_tokens, cache_prefix, False
+        )
+
+    async def generate_with_context(
+        self,
+        prompt: str,
+        context: str,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> str:
+        """Generate text with context with the first target that can serve it."""
+        return await self._route(
+            prompt, context, temperature, max_tokens, cache_prefix, cache_system
+        )
+
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        cache_prefix: Optional[str] = None,
+        cache_system: bool = False,
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from the first target that can serve the request.
+
+        A stream only fails over before its first chunk; once output has
+        been yielded, an error is raised to the caller.
+        """
+        candidates = self._candidates()
+        for index, target in enumerate(candidates):
+            target_prompt, hints = self._hints(
+                target, prompt, cache_prefix, cache_system
+            )
+            started = False
+            target.in_flight += 1
+            start = time.monotonic()
+            try:
+                if target.semaphore is not None:
+                    await target.semaphore.acquire()
+                try:
+                    async for chunk in target.service.stream_text(
+                        target_prompt,
+                        context=context,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **hints,
+                    ):
+                        started = True
+                        yield chunk
+                finally:
+                    if target.semaphore is not None:
+                        target.semaphore.release()
+            except Exception as e:
+                if started:
+                    target.record_failure(self._cooldown(target, e))
+                    raise
+                self._failed(target, e, len(candidates) - index - 1)
+                continue
+            finally:
+                target.in_flight -= 1
+            target.record_success(time.monotonic() - start)
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize the traffic and health of each target.
+
+        Returns:
+            Dictionary of target stats by target name
+        """
+        return {target.name: target.stats() for target in self.targets}
@@ -1,19 +1,279 @@
 import os
 import logging
-from typing import Dict, Any, Optional, List, Union
+from typing import Dict, Any, AsyncIterator, Optional, List, Union
 from abc import ABC, abstractmethod
 import time
 import json
-import requests
 from dotenv import load_dotenv
 
+import httpx
+
+from services.http_transport import HTTPTransport, get_transport, iter_sse_data
+from services.rate_limiter import (
+    RateLimiter,
+    get_rate_limiter,
+    estimate_request_tokens,
+    parse_duration,
+    usage_tokens,
+)
+from services.token_budget import TokenLimits, get_token_limits
+from services.llm_usage import record_usage
+
+# Most follow-up requests made to finish one response cut off at max_tokens
+DEFAULT_MAX_CONTINUATIONS = 3
+
+# API roots of the hosted providers, overridable per service (e.g. for a
+# proxy or a local fake server)
+ANTHROPIC_BASE_URL = "https://api.anthropic.com"
+OPENAI_BASE_URL = "https://api.openai.com"
+
+# How long local model servers keep a model loaded after a request, unless
+# `keep_alive` (Ollama) or `ttl_seconds` (LM Studio) is set under
+# `llm.models.<provider>`; long enough to bridge the gaps between steps
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_TTL_SECONDS = 1800
+
+
+def duration_seconds(value: Union[str, int, float, None]) -> Optional[float]:
+    """
+    Convert an Ollama keep_alive duration such as `30m`, `1h` or `300` to seconds.
+
+    Returns:
+        Seconds, infinity for a negative duration (keep loaded indefinitely),
+        or None if the value is missing or invalid
+    """
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = parse_duration(str(value).lstrip("-"))
+        if seconds is not None and str(value).startswith("-"):
+            seconds = -seconds
+    if seconds is not None and seconds < 0:
+        return float("inf")
+    return seconds
+
+
+# Sent after a truncated reply to chat APIs that can't continue a partial
+# assistant message themselves
+CONTINUE_PROMPT = (
+    "Your previous reply was cut off. Continue exactly where it stopped, "
+    "without repeating anything or adding commentary."
+)
+
 
 class LLMService(ABC):
     """Abstract base class for LLM service providers."""
 
+    # Set by provider services that send requests over HTTP
+    transport: Optional[HTTPTransport] = None
+    rate_limiter: Optional[RateLimiter] = None
+    token_limits: Optional[TokenLimits] = None
+
+    # Set by services whose generate and stream methods accept the
+    # cache_prefix and cache_system prompt caching hints
+    supports_prompt_caching = False
+
+    # Set by services that can submit requests as message batches
+    # (build_request, complete, create_batch, retrieve_batch, cancel_batch
+    # and batch_results)
+    supports_batches = False
+
+    # Set by services with an exact count_tokens(prompt, context) method
+    supports_token_counting = False
+
+    # Set by local model services that can load their model ahead of the
+    # first request (warm_up)
+    supports_warm_up = False
+
+    # Follow-up requests allowed to finish a response cut off at max_tokens,
+    # by services that continue truncated responses
+    max_continuations = DEFAULT_MAX_CONTINUATIONS
+
     def __init__(self):
         self.logger = logging.getLogger(__name__)
 
+    async def _post(
+        self,
+        url: str,
+        json: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        Send a request through the transport, paced by the rate limiter.
+
+        Args:
+            url: Request URL
+            json: JSON payload
+            headers: Request headers
+
+        Returns:
+            The HTTP response
+        """
+        if self.rate_limiter is None:
+            return await self.transport.post(url, json=json, headers=headers)
+
+        async with self.rate_limiter.acquire(estimate_request_tokens(json)) as slot:
+            response = await self.transport.post(url, json=json, headers=headers)
+            slot.record_response(response)
+            if response.is_success:
+                try:
+                    slot.record_usage(usage_tokens(response.json()))
+                except ValueError:
+                    pass
+            return response
+
+    async def _stream_lines(
+        self,
+        url: str,
+        json: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream a response line by line, paced by the rate limiter.
+
+        Args:
+            url: Request URL
+            json: JSON payload
+            headers: Request headers
+
+        Yields:
+            Non-empty lines of the response body
+        """
+        if self.rate_limiter is None:
+            async for line in self.transport.stream_lines(
+                url, json=json, headers=headers
+            ):
+                yield line
+            return
+
+        async with self.rate_limiter.acquire(estimate_request_tokens(json)) as slot:
+            async for line in self.transport.stream_lines(
+                url, json=json, headers=headers, on_response=slot.record_response
+            ):
+                yield line
+
+    async def _complete_chat(
+        self,
+        url: str,
+        data: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> str:
+        """
+        Send an OpenAI-compatible chat completion request, continuing the
+        reply while it is cut off at max_tokens, and stitch the parts together.
+
+        Args:
+            url: Chat completions URL
+            data: JSON payload
+            headers: Request headers
+
+        Returns:
+            Generated text
+        """
+        messages = list(data["messages"])
+        text = ""
+        for continuation in range(self.max_continuations + 1):
+            response = await self._post(url, headers=headers, json=data)
+            response.raise_for_status()
+            result = response.json()
+            self.logger.debug(f"{self.provider} response: {result}")
+            usage = result.get("usage") or {}
+            if usage:
+                record_usage(
+                    {
+                        "input_tokens": usage.get("prompt_tokens"),
+                        "output_tokens": usage.get("completion_tokens"),
+                    }
+                )
+
+            # Extract content from the response
+            if not result.get("choices"):
+                self.logger.error(f"Unexpected response format: {result}")
+                return text
+            choice = result["choices"][0]
+            part = choice["message"]["content"] or ""
+            text += part
+
+            if choice.get("finish_reason") != "length":
+                break
+            if continuation == self.max_continuations:
+                self.logger.warning(
+                    f"Reply still cut off at max_tokens after "
+                    f"{continuation} continuation(s)"
+                )
+                break
+
+            self.logger.info(
+                f"Reply cut off at max_tokens; continuing ({continuation + 1})"
+            )
+            messages += [
+                {"role": "assistant", "content": part},
+                {"role": "user", "content": CONTINUE_PROMPT},
+            ]
+            data = {**data, "messages": messages}
+        return text
+
+    async def _stream_chat(
+        self,
+        url: str,
+        data: Dict[str, Any],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream an OpenAI-compatible chat completion, continuing the reply
+        while it is cut off at max_tokens.
+
+        Args:
+            url: Chat completions URL
+            data: JSON payload with "stream" set
+            headers: Request headers
+
+        Yields:
+            Chunks of generated text
+        """
+        messages = list(data["messages"])
+        for continuation in range(self.max_continuations + 1):
+            part = ""
+            finish_reason = None
+            lines = self._stream_lines(url, headers=headers, json=data)
+            async for event in iter_sse_data(lines):
+                # With include_usage the last chunk carries the usage and no choices
+                usage = event.get("usage") or {}
+                if usage:
+                    record_usage(
+                        {
+                            "input_tokens": usage.get("prompt_tokens"),
+                            "output_tokens": usage.get("completion_tokens"),
+                        }
+                    )
+                choices = event.get("choices") or []
+                if choices and choices[0].get("finish_reason"):
+                    finish_reason = choices[0]["finish_reason"]
+                text = parse_openai_stream_event(event)
+                if text:
+                    part += text
+                    yield text
+
+            if finish_reason != "length":
+                break
+            if continuation == self.max_continuations:
+                self.logger.warning(
+                    f"Stream still cut off at max_tokens after "
+                    f"{continuation} continuation(s)"
+                )
+                break
+
+            self.logger.info(
+                f"Stream cut off at max_tokens; continuing ({continuation + 1})"
+            )
+            messages += [
+                {"role": "assistant", "content": part},
+                {"role": "user", "content": CONTINUE_PROMPT},
+            ]
+            data = {**data, "messages": messages}
+
     @abstractmethod
     async def generate_text(
         self, prompt: str, temperature: float = 0.7, max_tokens: int = 2000
@@ -32,17 +292,60 @@ class LLMService(ABC):
         """Generate text with additional context."""
         pass
 
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+    ) -> AsyncIterator[str]:
+        """
+        Stream generated text as it is produced.
+
+        Providers that support streaming override this; the default yields the
+        whole completion as a single chunk.
+
+        Args:
+            prompt: The prompt text
+            context: Optional system context
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+
+        Yields:
+            Chunks of generated text
+        """
+        if context is None:
+            yield await self.generate_text(prompt, temperature, max_tokens)
+        else:
+            yield await self.generate_with_context(
+                prompt, context, temperature, max_tokens
+            )
+
 
 class AnthropicLLMService(LLMService):
     """LLM service for Anthropic Claude models."""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "claude-3-7-sonnet"):
+    provider = "anthropic"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "claude-3-7-sonnet",
+        transport: Optional[HTTPTransport] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        token_limits: Optional[TokenLimits] = None,
+        base_url: Optional[str] = None,
+    ):
         """
         Initialize Anthropic LLM service.
 
         Args:
             api_key: Anthropic API key (if None, loads from ANTHROPIC_API_KEY env var)
             model: Anthropic model to use
+            transport: HTTP transport (defaults to the shared Anthropic transport)
+            rate_limiter: Rate limiter (defaults to the shared limiter for the model)
+            token_limits: Model token limits (defaults to those known for the model)
+            base_url: API root URL (defaults to https://api.anthropic.com)
         """
         super().__init__()
         # Load from environment if not provided
@@ -54,7 +357,10 @@ class AnthropicLLMService(LLMService):
 
         self.api_key = api_key
         self.model = model
-        self.base_url = "https://api.anthropic.com/v1/messages"
+        self.transport = transport or get_transport("anthropic")
+        self.rate_limiter = rate_limiter or get_rate_limiter("anthropic", model)
+        self.token_limits = token_limits or get_token_limits("anthropic", model)
+        self.base_url = f"{(base_url or ANTHROPIC_BASE_URL).rstrip('/')}/v1/messages"
         self.logger.info(f"Initialized Anthropic LLM service with model: {model}")
 
     async def generate_text(
@@ -85,7 +391,7 @@ class AnthropicLLMService(LLMService):
         }
 
         try:
-            response = requests.post(self.base_url, headers=headers, json=data)
+            response = await self._post(self.base_url, headers=headers, json=data)
             response.raise_for_status()
             result = response.json()
             self.logger.debug(f"Anthropic response: {result}")
@@ -123,17 +429,78 @@ class AnthropicLLMService(LLMService):
         combined_prompt = f"Context:\n{context}\n\nPrompt:\n{prompt}"
         return await self.generate_text(combined_prompt, temperature, max_tokens)
 
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from Anthropic Claude using server-sent events.
+
+        Args:
+            prompt: The prompt text
+            context: Optional context, prepended to the prompt
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+
+        Yields:
+            Chunks of generated text
+        """
+        if context is not None:
+            prompt = f"Context:\n{context}\n\nPrompt:\n{prompt}"
+
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+        }
+
+        data = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+
+        try:
+            lines = self._stream_lines(self.base_url, headers=headers, json=data)
+            async for event in iter_sse_data(lines):
+                text = parse_anthropic_stream_event(event)
+                if text:
+                    yield text
+
+        except Exception as e:
+            self.logger.error(f"Error streaming text with Anthropic: {e}")
+            raise
+
 
 class OpenAILLMService(LLMService):
     """LLM service for OpenAI models."""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4o"):
+    provider = "openai"
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "gpt-4o",
+        transport: Optional[HTTPTransport] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        token_limits: Optional[TokenLimits] = None,
+        base_url: Optional[str] = None,
+    ):
         """
         Initialize OpenAI LLM service.
 
         Args:
             api_key: OpenAI API key (if None, loads from OPENAI_API_KEY env var)
             model: OpenAI model to use
+            transport: HTTP transport (defaults to the shared OpenAI transport)
+            rate_limiter: Rate limiter (defaults to the shared limiter for the model)
+            token_limits: Model token limits (defaults to those known for the model)
+            base_url: API root URL (defaults to https://api.openai.com)
         """
         super().__init__()
         # Load from environment if not provided
@@ -145,7 +512,12 @@ class OpenAILLMService(LLMService):
 
         self.api_key = api_key
         self.model = model
-        self.base_url = "https://api.openai.com/v1/chat/completions"
+        self.transport = transport or get_transport("openai")
+        self.rate_limiter = rate_limiter or get_rate_limiter("openai", model)
+        self.token_limits = token_limits or get_token_limits("openai", model)
+        self.base_url = (
+            f"{(base_url or OPENAI_BASE_URL).rstrip('/')}/v1/chat/completions"
+        )
         self.logger.info(f"Initialized OpenAI LLM service with model: {model}")
 
     async def generate_text(
@@ -175,17 +547,7 @@ class OpenAILLMService(LLMService):
         }
 
         try:
-            response = requests.post(self.base_url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-            self.logger.debug(f"OpenAI response: {result}")
-
-            # Extract content from the response
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return ""
+            return await self._complete_chat(self.base_url, data, headers)
 
         except Exception as e:
             self.logger.error(f"Error generating text with OpenAI: {e}")
@@ -226,32 +588,88 @@ class OpenAILLMService(LLMService):
         }
 
         try:
-            response = requests.post(self.base_url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
-
-            # Extract content from the response
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return ""
+            return await self._complete_chat(self.base_url, data, headers)
 
         except Exception as e:
             self.logger.error(f"Error generating text with OpenAI: {e}")
             raise
 
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from OpenAI GPT using server-sent events.
+
+        A reply cut off at max_tokens (finish_reason "length") is continued
+        with a follow-up turn, up to max_continuations times.
+
+        Args:
+            prompt: The prompt text
+            context: Optional system message
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+
+        Yields:
+            Chunks of generated text
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+        messages = [{"role": "user", "content": prompt}]
+        if context is not None:
+            messages.insert(0, {"role": "system", "content": context})
+
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+
+        try:
+            async for text in self._stream_chat(self.base_url, data, headers):
+                yield text
+
+        except Exception as e:
+            self.logger.error(f"Error streaming text with OpenAI: {e}")
+            raise
+
 
 class OllamaLLMService(LLMService):
     """LLM service for Ollama models."""
 
-    def __init__(self, base_url: Optional[str] = None, model: str = "llama3"):
+    provider = "ollama"
+    supports_warm_up = True
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        model: str = "llama3",
+        transport: Optional[HTTPTransport] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        token_limits: Optional[TokenLimits] = None,
+        keep_alive: Union[str, int, None] = DEFAULT_KEEP_ALIVE,
+    ):
         """
         Initialize Ollama LLM service.
 
         Args:
             base_url: Base URL for Ollama API (if None, loads from OLLAMA_BASE_URL env var)
             model: Ollama model to use
+            transport: HTTP transport (defaults to the shared Ollama transport)
+            rate_limiter: Rate limiter (defaults to the shared limiter for the model)
+            token_limits: Model token limits (defaults to those known for the model)
+            keep_alive: How long Ollama keeps the model loaded after each
+                request, e.g. "30m" or -1 for indefinitely (None for the
+                server's default)
         """
         super().__init__()
         # Load from environment if not provided
@@ -261,8 +679,71 @@ class OllamaLLMService(LLMService):
 
         self.base_url = base_url
         self.model = model
+        self.transport = transport or get_transport("ollama")
+        self.rate_limiter = rate_limiter or get_rate_limiter("ollama", model)
+        self.token_limits = token_limits or get_token_limits("ollama", model)
+        self.keep_alive = keep_alive
+        self._last_used: Optional[float] = None
         self.logger.info(f"Initialized Ollama LLM service with model: {model}")
 
+    def _recently_used(self) -> bool:
+        """Check whether the model was used recently enough to still be loaded."""
+        keep_alive = duration_seconds(self.keep_alive)
+        if self._last_used is None or not keep_alive:
+            return False
+        return time.monotonic() - self._last_used < keep_alive
+
+    async def _is_loaded(self) -> Optional[bool]:
+        """Ask Ollama whether the model is loaded (None if it can't say)."""
+        try:
+            response = await self.transport.get(f"{self.base_url}/api/ps")
+            response.raise_for_status()
+            loaded = response.json().get("models") or []
+        except Exception as e:
+            self.logger.debug(f"Could not list loaded Ollama models: {e}")
+            return None
+        return any(self.model in (m.get("name"), m.get("model")) for m in loaded)
+
+    async def warm_up(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Load the model ahead of the first request, and keep it loaded for
+        keep_alive.
+
+        Args:
+            force: Warm up even if the model was used recently enough to
+                still be loaded
+
+        Returns:
+            Dictionary with the provider, model, whether it was already
+            loaded, the seconds the load took and keep_alive; None if the
+            model was used recently
+        """
+        if not force and self._recently_used():
+            return None
+
+        was_loaded = await self._is_loaded()
+        data = {"model": self.model, "prompt": "", "stream": False}
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
+
+        start = time.monotonic()
+        response = await self._post(f"{self.base_url}/api/generate", json=data)
+        response.raise_for_status()
+        load_seconds = time.monotonic() - start
+        self._last_used = time.monotonic()
+
+        self.logger.info(
+            f"Ollama model {self.model} "
+            f"{'refreshed' if was_loaded else 'loaded'} in {load_seconds:.1f}s"
+        )
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "was_loaded": was_loaded,
+            "load_seconds": load_seconds,
+            "keep_alive": self.keep_alive,
+        }
+
     async def generate_text(
         self, prompt: str, temperature: float = 0.7, max_tokens: int = 2000
     ) -> str:
@@ -277,34 +758,100 @@ class OllamaLLMService(LLMService):
         Returns:
             Generated text
         """
+        # Ollama streams one JSON object per line; consume them as they arrive
+        # instead of buffering the whole body
+        chunks = []
+        async for chunk in self.stream_text(prompt, None, temperature, max_tokens):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from Ollama's newline-delimited JSON response.
+
+        A reply cut off at max_tokens (done_reason "length") is continued
+        with a follow-up prompt in the same conversation, up to
+        max_continuations times.
+
+        Args:
+            prompt: The prompt text
+            context: Optional context, prepended to the prompt
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+
+        Yields:
+            Chunks of generated text
+        """
+        if context is not None:
+            prompt = f"Context:\n{context}\n\nPrompt:\n{prompt}"
+
         api_url = f"{self.base_url}/api/generate"
 
         data = {
             "model": self.model,
             "prompt": prompt,
-            "temperature": temperature,
-            "num_predict": max_tokens,
+            "stream": True,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
         }
+        if self.keep_alive is not None:
+            data["keep_alive"] = self.keep_alive
 
         try:
-            response = requests.post(api_url, json=data)
-            response.raise_for_status()
-            result = response.text
-
-            # Ollama returns each token as a separate line of JSON
-            # We need to join them together to get the full response
-            lines = result.strip().split("\n")
-            response_text = ""
-
-            for line in lines:
-                try:
-                    chunk = json.loads(line)
-                    if "response" in chunk:
-                        response_text += chunk["response"]
-                except json.JSONDecodeError:
-                    continue
-
-            return response_text
+            text = ""
+            for continuation in range(self.max_continuations + 1):
+                final: Dict[str, Any] = {}
+                async for line in self._stream_lines(api_url, json=data):
+                    try:
+                        chunk = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if chunk.get("error"):
+                        raise RuntimeError(f"Ollama error: {chunk['error']}")
+                    if chunk.get("response"):
+                        text += chunk["response"]
+                        yield chunk["response"]
+                    if chunk.get("done"):
+                        final = chunk
+                self._last_used = time.monotonic()
+                if "prompt_eval_count" in final or "eval_count" in final:
+                    record_usage(
+                        {
+                            "input_tokens": final.get("prompt_eval_count") or 0,
+                            "output_tokens": final.get("eval_count") or 0,
+                        }
+                    )
+
+                if final.get("done_reason") != "length":
+                    break
+                if continuation == self.max_continuations:
+                    self.logger.warning(
+                        f"Reply still cut off at max_tokens after "
+                        f"{continuation} continuation(s)"
+                    )
+                    break
+
+                self.logger.info(
+                    f"Reply cut off at max_tokens; continuing ({continuation + 1})"
+                )
+                if final.get("context"):
+                    # The returned context carries the conversation so far
+                    data = {
+                        **data,
+                        "prompt": CONTINUE_PROMPT,
+                        "context": final["context"],
+                    }
+                else:
+                    data = {
+                        **data,
+                        "prompt": f"{prompt}\n\nYour reply so far:\n{text}\n\n"
+                        f"{CONTINUE_PROMPT}",
+                    }
 
         except Exception as e:
             self.logger.error(f"Error generating text with Ollama: {e}")
@@ -336,13 +883,29 @@ class OllamaLLMService(LLMService):
 class LMStudioService(LLMService):
     """LLM service for LM Studio local models."""
 
-    def __init__(self, base_url: Optional[str] = None, model: str = "custom"):
+    provider = "lmstudio"
+    supports_warm_up = True
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        model: str = "custom",
+        transport: Optional[HTTPTransport] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        token_limits: Optional[TokenLimits] = None,
+        ttl: Optional[int] = DEFAULT_TTL_SECONDS,
+    ):
         """
         Initialize LM Studio service.
 
         Args:
             base_url: Base URL for LM Studio API (if None, loads from LMSTUDIO_BASE_URL env var)
             model: Model name (usually just "custom" for local models)
+            transport: HTTP transport (defaults to the shared LM Studio transport)
+            rate_limiter: Rate limiter (defaults to the shared limiter for the model)
+            token_limits: Model token limits (defaults to those known for the model)
+            ttl: Seconds LM Studio keeps a model it loaded on demand after
+                the last request (None for the server's default)
         """
         super().__init__()
         # Load from environment if not provided
@@ -352,8 +915,88 @@ class LMStudioService(LLMService):
 
         self.base_url = base_url
         self.model = model
+        self.transport = transport or get_transport("lmstudio")
+        self.rate_limiter = rate_limiter or get_rate_limiter("lmstudio", model)
+        self.token_limits = token_limits or get_token_limits("lmstudio", model)
+        self.ttl = ttl
+        self._last_used: Optional[float] = None
         self.logger.info(f"Initialized LM Studio service with model: {model}")
 
+    def _chat_data(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False,
+    ) -> Dict[str, Any]:
+        """Build a chat completion request for the model."""
+        data = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if stream:
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}
+        if self.ttl is not None:
+            data["ttl"] = self.ttl
+        return data
+
+    async def _is_loaded(self) -> Optional[bool]:
+        """Ask LM Studio whether the model is loaded (None if it can't say)."""
+        root = self.base_url.rstrip("/")
+        if root.endswith("/v1"):
+            root = root[: -len("/v1")]
+        try:
+            response = await self.transport.get(f"{root}/api/v0/models/{self.model}")
+            response.raise_for_status()
+            return response.json().get("state") == "loaded"
+        except Exception as e:
+            self.logger.debug(f"Could not get LM Studio model state: {e}")
+            return None
+
+    async def warm_up(self, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Load the model ahead of the first request with a one-token completion.
+
+        Args:
+            force: Warm up even if the model was used within its TTL
+
+        Returns:
+            Dictionary with the provider, model, whether it was already
+            loaded, the seconds the load took and the TTL; None if the model
+            was used recently
+        """
+        recent = (
+            self._last_used is not None
+            and self.ttl
+            and time.monotonic() - self._last_used < self.ttl
+        )
+        if not force and recent:
+            return None
+
+        was_loaded = await self._is_loaded()
+        data = self._chat_data([{"role": "user", "content": "Hi"}], 0.0, 1)
+
+        start = time.monotonic()
+        response = await self._post(f"{self.base_url}/chat/completions", json=data)
+        response.raise_for_status()
+        load_seconds = time.monotonic() - start
+        self._last_used = time.monotonic()
+
+        self.logger.info(
+            f"LM Studio model {self.model} "
+            f"{'refreshed' if was_loaded else 'loaded'} in {load_seconds:.1f}s"
+        )
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "was_loaded": was_loaded,
+            "load_seconds": load_seconds,
+            "ttl": self.ttl,
+        }
+
     async def generate_text(
         self, prompt: str, temperature: float = 0.7, max_tokens: int = 2000
     ) -> str:
@@ -369,25 +1012,14 @@ class LMStudioService(LLMService):
             Generated text
         """
         api_url = f"{self.base_url}/chat/completions"
-
-        data = {
-            "model": self.model,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-        }
+        data = self._chat_data(
+            [{"role": "user", "content": prompt}], temperature, max_tokens
+        )
 
         try:
-            response = requests.post(api_url, json=data)
-            response.raise_for_status()
-            result = response.json()
-
-            # Extract content from the response
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return ""
+            text = await self._complete_chat(api_url, data)
+            self._last_used = time.monotonic()
+            return text
 
         except Exception as e:
             self.logger.error(f"Error generating text with LM Studio: {e}")
@@ -413,33 +1045,82 @@ class LMStudioService(LLMService):
             Generated text
         """
         api_url = f"{self.base_url}/chat/completions"
-
-        data = {
-            "model": self.model,
-            "messages": [
+        data = self._chat_data(
+            [
                 {"role": "system", "content": context},
                 {"role": "user", "content": prompt},
             ],
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-        }
+            temperature,
+            max_tokens,
+        )
 
         try:
-            response = requests.post(api_url, json=data)
-            response.raise_for_status()
-            result = response.json()
-
-            # Extract content from the response
-            if "choices" in result and len(result["choices"]) > 0:
-                return result["choices"][0]["message"]["content"]
-            else:
-                self.logger.error(f"Unexpected response format: {result}")
-                return ""
+            text = await self._complete_chat(api_url, data)
+            self._last_used = time.monotonic()
+            return text
 
         except Exception as e:
             self.logger.error(f"Error generating text with LM Studio: {e}")
             raise
 
+    async def stream_text(
+        self,
+        prompt: str,
+        context: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+    ) -> AsyncIterator[str]:
+        """
+        Stream text from LM Studio using its OpenAI-compatible event stream.
+
+        A reply cut off at max_tokens (finish_reason "length") is continued
+        with a follow-up turn, up to max_continuations times.
+
+        Args:
+            prompt: The prompt text
+            context: Optional system message
+            temperature: Temperature parameter (0.0 to 1.0)
+            max_tokens: Maximum tokens to generate
+
+        Yields:
+            Chunks of generated text
+        """
+        api_url = f"{self.base_url}/chat/completions"
+
+        messages = [{"role": "user", "content": prompt}]
+        if context is not None:
+            messages.insert(0, {"role": "system", "content": context})
+
+        data = self._chat_data(messages, temperature, max_tokens, stream=True)
+
+        try:
+            async for text in self._stream_chat(api_url, data):
+                yield text
+            self._last_used = time.monotonic()
+
+        except Exception as e:
+            self.logger.error(f"Error streaming text with LM Studio: {e}")
+            raise
+
+
+def parse_anthropic_stream_event(event: Dict[str, Any]) -> str:
+    """Extract generated text from an Anthropic streaming event."""
+    if event.get("type") == "error":
+        raise RuntimeError(f"Anthropic stream error: {event.get('error')}")
+    if event.get("type") == "content_block_delta":
+        delta = event.get("delta", {})
+        if delta.get("type") == "text_delta":
+            return delta.get("text", "")
+    return ""
+
+
+def parse_openai_stream_event(event: Dict[str, Any]) -> str:
+    """Extract generated text from an OpenAI-compatible streaming chunk."""
+    choices = event.get("choices") or []
+    if choices:
+        return (choices[0].get("delta") or {}).get("content") or ""
+    return ""
+
 
 class LLMServiceFactory:
     """Factory for creating LLM service instances."""
@@ -459,7 +1140,8 @@ class LLMServiceFactory:
             provider: LLM provider name (anthropic, openai, ollama, lmstudio)
             model: Model name (optional, provider-specific default used if None)
             api_key: API key (optional, loaded from env vars if None)
-            base_url: Base URL for API (optional, used for local models)
+            base_url: Base URL for API (optional; defaults to the provider's
+                *_BASE_URL environment variable, then its public API)
             config: Additional configuration dictionary from app_config.yaml
 
         Returns:
@@ -489,28 +1171,63 @@ class LLMServiceFactory:
             if base_url is None and "base_url" in provider_config:
                 base_url = provider_config["base_url"]
 
+        if provider.lower() not in default_models:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+
+        # Shared, pooled HTTP transport for the provider
+        transport = get_transport(provider, config)
+
         # Create appropriate service based on provider
         if provider.lower() == "anthropic":
-            return AnthropicLLMService(
-                api_key=api_key, model=model or default_models["anthropic"]
+            # Use the Messages API implementation with system prompt support
+            from services.anthropic_service import (
+                AnthropicLLMService as ClaudeLLMService,
+            )
+
+            model = model or default_models["anthropic"]
+            return ClaudeLLMService(
+                api_key=api_key,
+                model=model,
+                transport=transport,
+                rate_limiter=get_rate_limiter(provider, model, config),
+                token_limits=get_token_limits(provider, model, config),
+                base_url=base_url or os.getenv("ANTHROPIC_BASE_URL"),
             )
         elif provider.lower() == "openai":
+            model = model or default_models["openai"]
             return OpenAILLMService(
-                api_key=api_key, model=model or default_models["openai"]
+                api_key=api_key,
+                model=model,
+                transport=transport,
+                rate_limiter=get_rate_limiter(provider, model, config),
+                token_limits=get_token_limits(provider, model, config),
+                base_url=base_url or os.getenv("OPENAI_BASE_URL"),
             )
         elif provider.lower() == "ollama":
             # Default Ollama base URL
             if base_url is None:
                 base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+            model = model or default_models["ollama"]
             return OllamaLLMService(
-                base_url=base_url, model=model or default_models["ollama"]
+                base_url=base_url,
+                model=model,
+                transport=transport,
+                rate_limiter=get_rate_limiter(provider, model, config),
+                token_limits=get_token_limits(provider, model, config),
+                keep_alive=provider_config.get("keep_alive", DEFAULT_KEEP_ALIVE),
             )
         elif provider.lower() == "lmstudio":
             # Default LM Studio base URL
             if base_url is None:
                 base_url = os.getenv("LMSTUDIO_BASE_URL", "http://localhost:1234/v1")
+            model = model or default_models["lmstudio"]
             return LMStudioService(
-                base_url=base_url, model=model or default_models["lmstudio"]
+                base_url=base_url,
+                model=model,
+                transport=transport,
+                rate_limiter=get_rate_limiter(provider, model, config),
+                token_limits=get_token_limits(provider, model, config),
+                ttl=provider_config.get("ttl_seconds", DEFAULT_TTL_SECONDS),
             )
         else:
             raise ValueError(f"Unsupported LLM provider: {provider}")
@@ -4,11 +4,15 @@ import yaml
 from typing import Optional, Dict, Any
 
 from services.llm_service import LLMServiceFactory, LLMService
+from services.llm_service_registry import get_service_registry
 
 
 class LLMServiceProvider:
     """
     Service for providing LLM service instances based on configuration.
+
+    Instances are shared process-wide through the LLMServiceRegistry, so
+    repeated requests for the same configuration reuse one service.
     """
 
     def __init__(self):
@@ -50,7 +54,7 @@ class LLMServiceProvider:
             base_url: Base URL for API (optional, used for local models)
 
         Returns:
-            LLM service instance
+            Shared LLM service instance
         """
         llm_config = self.config.get("llm", {})
 
@@ -69,14 +73,20 @@ class LLMServiceProvider:
         if base_url is None and "base_url" in provider_config:
             base_url = provider_config.get("base_url")
 
-        # Create and return the LLM service
-        self.logger.info(
-            f"Creating LLM service for provider: {provider}, model: {model}"
-        )
-        return LLMServiceFactory.create_llm_service(
-            provider=provider,
-            model=model,
-            api_key=api_key,
-            base_url=base_url,
-            config=llm_config,
-        )
+        # Reuse the registered service, creating it on first request
+        registry = get_service_registry()
+        key = registry.make_key(provider, model, base_url, api_key)
+
+        def create_service() -> LLMService:
+            self.logger.info(
+                f"Creating LLM service for provider: {provider}, model: {model}"
+            )
+            return LLMServiceFactory.create_llm_service(
+                provider=provider,
+                model=model,
+                api_key=api_key,
+                base_url=base_url,
+                config=llm_config,
+            )
+
+        return registry.get_or_create(key, create_service)
@@ -0,0 +1,146 @@
+import os
+import hashlib
+import logging
+import threading
+from typing import Dict, Callable, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from services.llm_service import LLMService
+from services.http_transport import drain_all_transports, close_all_transports
+
+# Environment variables holding the API key for hosted providers
+API_KEY_ENV_VARS = {
+    "anthropic": "ANTHROPIC_API_KEY",
+    "openai": "OPENAI_API_KEY",
+}
+
+ServiceKey = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+
+class LLMServiceRegistry:
+    """
+    Process-wide cache of long-lived LLM service instances.
+
+    Services are keyed by (provider, model, base_url, API key fingerprint), so
+    every pipeline step asking for the same configuration shares one instance
+    and, through it, one warm connection pool.
+    """
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self.logger = logging.getLogger(__name__)
+        self._services: Dict[ServiceKey, LLMService] = {}
+        self._lock = threading.Lock()
+        self._env_loaded = False
+
+    def _resolve_api_key(self, provider: str, api_key: Optional[str]) -> Optional[str]:
+        """Return the explicit API key, or the one the service would load from env."""
+        if api_key is not None:
+            return api_key
+
+        env_var = API_KEY_ENV_VARS.get(provider)
+        if env_var is None:
+            return None
+
+        if not self._env_loaded:
+            load_dotenv()
+            self._env_loaded = True
+        return os.getenv(env_var)
+
+    def make_key(
+        self,
+        provider: str,
+        model: Optional[str] = None,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+    ) -> ServiceKey:
+        """
+        Build the registry key for a service configuration.
+
+        Args:
+            provider: LLM provider name
+            model: Model name
+            base_url: Base URL for the API
+            api_key: API key (if None, the provider's env var is used)
+
+        Returns:
+            Hashable key; the API key itself is only kept as a short fingerprint
+        """
+        provider = provider.lower()
+        api_key = self._resolve_api_key(provider, api_key)
+        fingerprint = (
+            hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+            if api_key
+            else None
+        )
+        return (provider, model, base_url, fingerprint)
+
+    def get_or_create(
+        self, key: ServiceKey, factory: Callable[[], LLMService]
+    ) -> LLMService:
+        """
+        Get the service registered under a key, creating it on first use.
+
+        Args:
+            key: Registry key from make_key
+            factory: Callable that builds the service if it isn't registered yet
+
+        Returns:
+            The shared LLM service instance
+        """
+        with self._lock:
+            service = self._services.get(key)
+            if service is None:
+                service = factory()
+                self._services[key] = service
+                self.logger.info(
+                    f"Registered LLM service for provider: {key[0]}, model: {key[1]}"
+                )
+            return service
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+    def clear(self) -> None:
+        """Forget all registered services without closing their transports."""
+        with self._lock:
+            self._services.clear()
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait for in-flight LLM requests to finish.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if all requests finished before the timeout
+        """
+        return await drain_all_transports(timeout)
+
+    async def aclose(self, timeout: Optional[float] = 30.0) -> None:
+        """
+        Drain in-flight requests, then close the connection pools and forget
+        every registered service.
+
+        Args:
+            timeout: Maximum seconds to wait for in-flight requests
+        """
+        await self.drain(timeout)
+        await close_all_transports()
+        self.clear()
+        self.logger.info("Closed all LLM services")
+
+
+_registry: Optional[LLMServiceRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_service_registry() -> LLMServiceRegistry:
+    """Get the process-wide LLM service registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = LLMServiceRegistry()
+        return _registry
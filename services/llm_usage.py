@@ -0,0 +1,157 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, Optional, Tuple
+
+from services.telemetry import record_span_usage
+
+# Token counts reported in an Anthropic response's usage block
+USAGE_FIELDS = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+# USD per million input and output tokens by model name prefix (the longest
+# matching prefix wins). Models not listed, such as local ones, are free.
+MODEL_PRICING = {
+    "claude-opus-4": (15.0, 75.0),
+    "claude-sonnet-4": (3.0, 15.0),
+    "claude-3-7-sonnet": (3.0, 15.0),
+    "claude-3-5-sonnet": (3.0, 15.0),
+    "claude-3-5-haiku": (0.8, 4.0),
+    "claude-3-opus": (15.0, 75.0),
+    "claude-3-haiku": (0.25, 1.25),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+
+# Price of prompt cache writes and reads relative to input tokens
+CACHE_WRITE_PRICE_FACTOR = 1.25
+CACHE_READ_PRICE_FACTOR = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_cost(model: Optional[str], usage: Dict[str, Any]) -> float:
+    """
+    Estimate the cost of LLM calls from their token usage.
+
+    Args:
+        model: Model name
+        usage: Token counts, as from UsageRecorder.to_dict
+
+    Returns:
+        Estimated cost in USD (0 for models without a listed price)
+    """
+    matches = [prefix for prefix in MODEL_PRICING if (model or "").startswith(prefix)]
+    if not matches:
+        return 0.0
+    input_price, output_price = MODEL_PRICING[max(matches, key=len)]
+    input_cost = (
+        (usage.get("input_tokens") or 0)
+        + (usage.get("cache_creation_input_tokens") or 0) * CACHE_WRITE_PRICE_FACTOR
+        + (usage.get("cache_read_input_tokens") or 0) * CACHE_READ_PRICE_FACTOR
+    ) * input_price
+    return (input_cost + (usage.get("output_tokens") or 0) * output_price) / 1e6
+
+
+class UsageRecorder:
+    """Running totals of the tokens used by LLM calls."""
+
+    def __init__(self):
+        """Initialize an empty recorder."""
+        self.requests = 0
+        self.totals = {field: 0 for field in USAGE_FIELDS}
+        self._lock = threading.Lock()
+
+    def add(self, usage: Dict[str, Any]) -> None:
+        """
+        Add the usage reported for one LLM call.
+
+        Args:
+            usage: Usage block from a provider response
+        """
+        with self._lock:
+            self.requests += 1
+            for field in USAGE_FIELDS:
+                self.totals[field] += int(usage.get(field) or 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Summarize the recorded usage.
+
+        Returns:
+            Dictionary with the request count, the total of each token count
+            and the share of prompt tokens served from the provider's cache
+        """
+        with self._lock:
+            totals = dict(self.totals)
+            requests = self.requests
+
+        prompt_tokens = (
+            totals["input_tokens"]
+            + totals["cache_creation_input_tokens"]
+            + totals["cache_read_input_tokens"]
+        )
+        return {
+            "requests": requests,
+            **totals,
+            "cache_hit_ratio": (
+                totals["cache_read_input_tokens"] / prompt_tokens
+                if prompt_tokens
+                else 0.0
+            ),
+        }
+
+
+# Recorders that LLM calls made in the current context report to. Tasks
+# inherit the tuple, so calls made by a pipeline's concurrent steps are
+# counted by the recorder the pipeline started.
+_active_recorders: ContextVar[Tuple[UsageRecorder, ...]] = ContextVar(
+    "llm_usage_recorders", default=()
+)
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageRecorder]:
+    """
+    Record the token usage of every LLM call made inside the block.
+
+    Blocks can be nested; each call is counted by every enclosing recorder.
+
+    Yields:
+        The recorder for the block
+    """
+    recorder = UsageRecorder()
+    token = _active_recorders.set(_active_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _active_recorders.reset(token)
+
+
+def record_usage(usage: Optional[Dict[str, Any]]) -> None:
+    """
+    Report the usage of one LLM call to the active recorders.
+
+    Args:
+        usage: Usage block from a provider response (ignored if missing)
+    """
+    if not isinstance(usage, dict):
+        return
+
+    cache_read = usage.get("cache_read_input_tokens") or 0
+    cache_write = usage.get("cache_creation_input_tokens") or 0
+    if cache_read or cache_write:
+        logger.debug(
+            f"Prompt cache: {cache_read} tokens read, {cache_write} tokens written"
+        )
+
+    for recorder in _active_recorders.get():
+        recorder.add(usage)
+    record_span_usage(usage)
@@ -0,0 +1,268 @@
+import os
+import gzip
+import json
+import queue
+import shutil
+import atexit
+import logging
+import threading
+from time import monotonic
+from typing import Any, Dict, List, Optional
+
+# Default log sink settings, overridable with `pipeline.logging` in
+# config/app_config.yaml
+DEFAULT_LOG_SINK_CONFIG = {
+    "flush_interval_seconds": 1.0,
+    "max_batch_entries": 200,
+    "max_bytes": 10 * 1024 * 1024,
+    "backup_count": 5,
+}
+
+# Tells the writer thread to write what it has and stop
+_STOP = object()
+
+
+class LogSink:
+    """
+    Appends JSON log entries to a file from a background writer thread.
+
+    Writers only put entries on a queue, so logging never blocks the event
+    loop on file I/O. The writer batches entries into one append per flush
+    interval (or sooner once a batch is full), and once the file grows past
+    a size limit rotates it to gzip-compressed backups (`<file>.1.gz` being
+    the most recent).
+
+    There is one sink per log file in the process (see get_log_sink), so
+    pipelines writing to the same course directory share its writer.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        max_batch: int = 200,
+        max_bytes: Optional[int] = 10 * 1024 * 1024,
+        backup_count: int = 5,
+    ):
+        """
+        Initialize the sink.
+
+        Args:
+            path: Log file to append to
+            flush_interval: Longest seconds an entry waits before it's written
+            max_batch: Entries that trigger a write without waiting
+            max_bytes: Size after which the file is rotated (None to never
+                rotate)
+            backup_count: Compressed backups kept when rotating
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.written = 0
+        self.rotations = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def configure(self, log_config: Optional[Dict[str, Any]] = None):
+        """
+        Apply settings to the sink.
+
+        Args:
+            log_config: The `pipeline.logging` section of app_config.yaml
+        """
+        settings = dict(DEFAULT_LOG_SINK_CONFIG)
+        settings.update(log_config or {})
+        self.flush_interval = settings["flush_interval_seconds"]
+        self.max_batch = settings["max_batch_entries"]
+        self.max_bytes = settings["max_bytes"]
+        self.backup_count = settings["backup_count"]
+
+    def _ensure_writer(self):
+        """Start the writer thread if it isn't running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"log-sink:{os.path.basename(self.path)}",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def write(self, entry: Dict[str, Any]):
+        """
+        Queue an entry to be appended to the log file.
+
+        Args:
+            entry: JSON-serializable log entry
+        """
+        self._ensure_writer()
+        self._queue.put(json.dumps(entry) + "\n")
+
+    def flush(self, timeout: Optional[float] = 5.0) -> bool:
+        """
+        Write every entry queued so far.
+
+        Args:
+            timeout: Maximum seconds to wait (None waits indefinitely)
+
+        Returns:
+            True if the entries were written before the timeout
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        written = threading.Event()
+        self._queue.put(written)
+        return written.wait(timeout)
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """
+        Write every queued entry and stop the writer thread.
+
+        Args:
+            timeout: Maximum seconds to wait for the writer
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _run(self):
+        """Write queued entries in batches until told to stop."""
+        batch: List[str] = []
+        deadline = 0.0
+
+        while True:
+            timeout = max(0.0, deadline - monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if isinstance(item, str):
+                if not batch:
+                    deadline = monotonic() + self.flush_interval
+                batch.append(item)
+                if len(batch) < self.max_batch:
+                    continue
+
+            # Timed out, full batch, flush request or stop
+            if batch:
+                self._write(batch)
+                batch = []
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, lines: List[str]):
+        """Append lines to the log file, rotating it first if it's full."""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            if self._should_rotate():
+                self._rotate()
+            with open(self.path, "a") as f:
+                f.write("".join(lines))
+            self.written += len(lines)
+        except Exception as e:
+            self.logger.error(f"Error writing to log file {self.path}: {e}")
+
+    def _should_rotate(self) -> bool:
+        """Check whether the log file has reached its size limit."""
+        if not self.max_bytes:
+            return False
+        try:
+            return os.path.getsize(self.path) >= self.max_bytes
+        except OSError:
+            return False
+
+    def _backup_path(self, index: int) -> str:
+        """Get the path of a compressed backup, 1 being the most recent."""
+        return f"{self.path}.{index}.gz"
+
+    def _rotate(self):
+        """Compress the log file into the backups and start a new one."""
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            self.rotations += 1
+            return
+
+        oldest = self._backup_path(self.backup_count)
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(self._backup_path(index)):
+                os.replace(self._backup_path(index), self._backup_path(index + 1))
+
+        with open(self.path, "rb") as source, gzip.open(
+            self._backup_path(1), "wb"
+        ) as target:
+            shutil.copyfileobj(source, target)
+        os.remove(self.path)
+        self.rotations += 1
+        self.logger.info(f"Rotated log file {self.path}")
+
+
+# Process-wide log sinks, one per log file
+_log_sinks: Dict[str, LogSink] = {}
+_log_sinks_lock = threading.Lock()
+
+
+def get_log_sink(path: str, log_config: Optional[Dict[str, Any]] = None) -> LogSink:
+    """
+    Get the shared sink for a log file, creating it on first use.
+
+    Args:
+        path: Log file the sink appends to
+        log_config: The `pipeline.logging` section of app_config.yaml, applied
+            when the sink is created
+
+    Returns:
+        The LogSink for the file
+    """
+    key = os.path.abspath(path)
+    with _log_sinks_lock:
+        if key not in _log_sinks:
+            sink = LogSink(path)
+            sink.configure(log_config)
+            _log_sinks[key] = sink
+        return _log_sinks[key]
+
+
+def flush_all_log_sinks(timeout: Optional[float] = 5.0) -> bool:
+    """
+    Write the entries queued in every log sink.
+
+    Args:
+        timeout: Maximum seconds to wait per sink
+
+    Returns:
+        True if every sink was flushed before the timeout
+    """
+    with _log_sinks_lock:
+        sinks = list(_log_sinks.values())
+    return all([sink.flush(timeout) for sink in sinks])
+
+
+def close_all_log_sinks(timeout: Optional[float] = 5.0):
+    """
+    Write the entries queued in every log sink and stop their writers.
+
+    Args:
+        timeout: Maximum seconds to wait per sink
+    """
+    with _log_sinks_lock:
+        sinks = list(_log_sinks.values())
+        _log_sinks.clear()
+    for sink in sinks:
+        sink.close(timeout)
+
+
+# Don't lose queued entries when the process exits
+atexit.register(close_all_log_sinks)
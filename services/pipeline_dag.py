@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from typing import Dict, Awaitable, Callable, Iterable, List, Optional, Set
+
+from models.pipeline import PipelineStep
+
+# Runs one step given the artifacts produced so far, returning its output
+StepRunner = Callable[[PipelineStep, Dict[str, str]], Awaitable[str]]
+
+
+class PipelineDAG:
+    """
+    Dependency graph of pipeline steps.
+
+    A step depends on every step whose output it takes as an input. Inputs
+    that no step produces must be supplied as initial artifacts when the
+    graph is run.
+    """
+
+    def __init__(self, steps: Iterable[PipelineStep]):
+        """
+        Build the graph and check that it is acyclic.
+
+        Args:
+            steps: Steps in the graph
+
+        Raises:
+            ValueError: If step names or outputs are duplicated, or the steps
+                form a cycle
+        """
+        self.logger = logging.getLogger(__name__)
+        self.steps: Dict[str, PipelineStep] = {}
+        self.producers: Dict[str, str] = {}
+
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"Duplicate pipeline step: {step.name}")
+            if step.output in self.producers:
+                raise ValueError(
+                    f"Artifact {step.output} is produced by both "
+                    f"{self.producers[step.output]} and {step.name}"
+                )
+            self.steps[step.name] = step
+            self.producers[step.output] = step.name
+
+        self.order = self._topological_order()
+
+        # The step whose error the last run raised
+        self.failed_step: Optional[str] = None
+
+    def dependencies(self, name: str) -> Set[str]:
+        """Get the names of the steps a step directly depends on."""
+        return {
+            self.producers[artifact]
+            for artifact in self.steps[name].inputs.values()
+            if artifact in self.producers
+        }
+
+    def external_inputs(self) -> Set[str]:
+        """Get the artifacts that must be supplied to run the graph."""
+        return {
+            artifact
+            for step in self.steps.values()
+            for artifact in step.inputs.values()
+            if artifact not in self.producers
+        }
+
+    def _topological_order(self) -> List[str]:
+        """Order the steps so each comes after its dependencies."""
+        order = []
+        state: Dict[str, str] = {}
+
+        def visit(name: str, path: List[str]):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                cycle = " -> ".join(path[path.index(name) :] + [name])
+                raise ValueError(f"Pipeline steps form a cycle: {cycle}")
+            state[name] = "visiting"
+            for dependency in sorted(self.dependencies(name)):
+                visit(dependency, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.steps:
+            visit(name, [])
+        return order
+
+    async def run(
+        self,
+        run_step: StepRunner,
+        artifacts: Dict[str, str],
+        max_parallel: Optional[int] = None,
+    ) -> Dict[str, str]:
+        """
+        Run every step, starting each as soon as its inputs are available.
+
+        Independent steps run concurrently. If a step fails, steps already
+        running are allowed to finish, no further steps are started, and the
+        first error is raised (its step is kept in failed_step).
+
+        Args:
+            run_step: Coroutine function that runs one step
+            artifacts: Initial artifacts (the graph's external inputs)
+            max_parallel: Maximum number of steps running at once (None for no limit)
+
+        Returns:
+            All artifacts, including the initial ones
+
+        Raises:
+            ValueError: If an external input is missing
+        """
+        missing = self.external_inputs() - set(artifacts)
+        if missing:
+            raise ValueError(f"Missing pipeline inputs: {', '.join(sorted(missing))}")
+
+        artifacts = dict(artifacts)
+        done: Set[str] = set()
+        running: Dict[asyncio.Task, str] = {}
+        error: Optional[BaseException] = None
+        self.failed_step = None
+
+        try:
+            while True:
+                if error is None:
+                    for name in self.order:
+                        if max_parallel and len(running) >= max_parallel:
+                            break
+                        if name in done or name in running.values():
+                            continue
+                        if self.dependencies(name) <= done:
+                            task = asyncio.create_task(
+                                run_step(self.steps[name], artifacts)
+                            )
+                            running[task] = name
+
+                if not running:
+                    break
+
+                finished, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    name = running.pop(task)
+                    if task.exception() is not None:
+                        self.logger.error(f"Pipeline step {name} failed")
+                        if error is None:
+                            error = task.exception()
+                            self.failed_step = name
+                        continue
+                    artifacts[self.steps[name].output] = task.result()
+                    done.add(name)
+        finally:
+            for task in running:
+                task.cancel()
+
+        if error is not None:
+            raise error
+        return artifacts
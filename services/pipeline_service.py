@@ -1,17 +1,193 @@
 import os
+import time
 import asyncio
 import logging
 import json
 import re
+import hashlib
+import uuid
+from contextvars import ContextVar
 from datetime import datetime
 from typing import Dict, Any, Optional, List, Tuple
 
+from services.llm_service import LLMService
 from services.llm_service_provider import LLMServiceProvider
-from services.prompt_service import PromptService
+from services.llm_cache import ResponseCache, CachedLLMService
+from services.llm_batch import BatchedLLMService
+from services.llm_router import routing_step
+from services.retry_policy import RetryPolicy
+from services.llm_usage import estimate_cost, track_usage
+from services.log_sink import get_log_sink
+from services.telemetry import (
+    SPAN_KIND_CLIENT,
+    Span,
+    add_to_span,
+    create_span_exporter,
+    current_span,
+    span,
+    summarize_spans,
+    track_spans,
+)
+from services.token_budget import (
+    EXACT_COUNT_THRESHOLD,
+    TokenLimits,
+    estimate_tokens,
+    get_token_limits,
+)
+from services.prompt_service import get_prompt_service
+from services.pipeline_dag import PipelineDAG
+from services.lesson_sections import SectionedDraft, parse_section_response
 from services.file_service import FileService
-from services.anthropic_service import AnthropicLLMService
-from models.course import Course
+from models.course import Course, LLMConfig
 from models.lesson import Lesson
+from models.pipeline import PipelineStep, RunManifest, StepRecord
+
+
+def _sha256(text: str) -> str:
+    """Hex SHA-256 digest of a string."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# The pipeline step being run. Tasks inherit it, so steps running side by
+# side in the DAG each see their own.
+_running_step: ContextVar[Optional[str]] = ContextVar("pipeline_step", default=None)
+
+
+# Course context variables used by the post-draft prompt templates
+COURSE_CONTEXT_INPUTS = {
+    "course_title": "course_title",
+    "target_audience": "target_audience",
+    "skill_level": "skill_level",
+}
+
+# Steps that take a lesson from its objective to the expanded draft
+DRAFT_STEPS = [
+    PipelineStep(
+        name="learning_outcomes",
+        prompt="lo_generator",
+        inputs={
+            "MODULE": "module",
+            "LESSON_OBJECTIVE": "lesson_objective",
+            "LESSON_TOPICS": "lesson_topics",
+        },
+        output="learning_outcomes",
+        output_file="los.md",
+        description="Generating learning outcomes",
+        validation="learning_outcomes",
+    ),
+    PipelineStep(
+        name="lesson_shell",
+        prompt="lesson_shell",
+        inputs={"TITLE": "title", "LOs": "learning_outcomes"},
+        output="lesson_shell",
+        output_file="shell.md",
+        description="Generating lesson shell",
+        validation="lesson_shell",
+    ),
+    PipelineStep(
+        name="rough_draft",
+        prompt="rough_draft",
+        inputs={"LESSON_SHELL": "lesson_shell"},
+        output="rough_draft",
+        output_file="rough_draft.md",
+        description="Generating rough draft",
+        extract_tag="lesson_content",
+        validation="rough_draft",
+    ),
+    PipelineStep(
+        name="expanded_draft",
+        prompt="expanded_draft",
+        inputs={"LESSON": "rough_draft"},
+        output="expanded_draft",
+        output_file="expanded_draft.md",
+        description="Generating expanded draft",
+        extract_tag="expanded_lesson",
+        validation="expanded_draft",
+        cache_inputs=["LESSON"],
+        section_prompt="expanded_section",
+        section_input="LESSON",
+    ),
+]
+
+# Steps generated from the expanded draft; all but activity_analysis are
+# independent of each other and run in parallel
+POST_DRAFT_STEPS = [
+    *[
+        PipelineStep(
+            name=f"quiz_{quiz_type}",
+            prompt="quiz_generator",
+            inputs={
+                "expanded_draft": "expanded_draft",
+                "learning_outcomes": "learning_outcomes",
+            },
+            variables={"quiz_type": quiz_type},
+            output=output,
+            output_file=f"{output}.md",
+            description=f"Generating {quiz_type.replace('_', ' ')} quiz",
+            api_params={"max_tokens": 4000},
+            # The lesson and outcomes come before the quiz type, so the three
+            # quiz steps share a cacheable prefix
+            cache_inputs=["expanded_draft", "learning_outcomes"],
+        )
+        for output, quiz_type in [
+            ("quiz1", "multiple_choice"),
+            ("quiz2", "fill_in_blank"),
+            ("quiz3", "true_false"),
+        ]
+    ],
+    PipelineStep(
+        name="activities",
+        prompt="activity_generator",
+        inputs={
+            "expanded_draft": "expanded_draft",
+            "learning_outcomes": "learning_outcomes",
+            **COURSE_CONTEXT_INPUTS,
+        },
+        output="activities",
+        output_file="activities.md",
+        description="Generating activities",
+        api_params={"max_tokens": 4000},
+    ),
+    PipelineStep(
+        name="activity_analysis",
+        prompt="activity_analysis",
+        inputs={
+            "activity": "activities",
+            "learning_outcomes": "learning_outcomes",
+            **COURSE_CONTEXT_INPUTS,
+        },
+        output="activity_analysis",
+        output_file="activity_analysis.md",
+        description="Analyzing activities",
+        api_params={"max_tokens": 4000},
+    ),
+    PipelineStep(
+        name="intro_conclusion",
+        prompt="intro_conclusion",
+        inputs={
+            "expanded_draft": "expanded_draft",
+            "learning_outcomes": "learning_outcomes",
+            **COURSE_CONTEXT_INPUTS,
+        },
+        output="intro_conclusion",
+        output_file="intro_conclusion.md",
+        description="Generating introduction and conclusion",
+        api_params={"max_tokens": 4000},
+    ),
+    PipelineStep(
+        name="match_code_blocks",
+        prompt="match_code_blocks_to_los",
+        inputs={
+            "expanded_draft": "expanded_draft",
+            "learning_outcomes": "learning_outcomes",
+            **COURSE_CONTEXT_INPUTS,
+        },
+        output="matched_code_blocks",
+        output_file="matched_code_blocks.md",
+        description="Matching code blocks to learning outcomes",
+        api_params={"max_tokens": 4000},
+    ),
+]
 
 
 class LessonPipeline:
@@ -26,6 +202,10 @@ class LessonPipeline:
         lesson_id: str,
         llm_provider: Optional[str] = None,
         model: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        llm_service: Optional[LLMService] = None,
+        parallel_sections: Optional[bool] = None,
+        step_llm_configs: Optional[Dict[str, LLMConfig]] = None,
     ):
         """
         Initialize the draft pipeline.
@@ -35,118 +215,536 @@ class LessonPipeline:
             lesson_id: Identifier for the lesson
             llm_provider: LLM provider to use (defaults to course configuration)
             model: Model to use (defaults to course configuration)
+            use_cache: Serve repeated LLM requests from the course's response
+                cache (defaults to `llm.cache.enabled` in app_config.yaml)
+            llm_service: LLM service to send requests through instead of the
+                one for llm_provider and model (e.g. a BatchedLLMService); it
+                is still wrapped in the response cache if that is enabled
+            parallel_sections: Expand each <LOn> section of the rough draft in
+                its own concurrent request instead of the whole draft at once
+                (defaults to `pipeline.parallel_sections` in app_config.yaml)
+            step_llm_configs: LLM configurations by step name, for steps that
+                use a different model (defaults to the course configuration's
+                `step_llm_configs`); not applied when llm_service is given
         """
         self.logger = logging.getLogger(__name__)
         self.course_dir = course_dir
         self.lesson_id = lesson_id
         self.llm_provider = llm_provider
         self.model = model
+        self.use_cache = use_cache
+        self.response_cache: Optional[ResponseCache] = None
+
+        # Optional limits on concurrent LLM calls by provider, shared between
+        # pipelines (set by CourseGenerationRunner); each call waits on the
+        # one for the provider its step resolves to
+        self.llm_semaphores: Dict[str, asyncio.Semaphore] = {}
 
         # Initialize services
         self.llm_service_provider = LLMServiceProvider()
-        self.prompt_service = PromptService()
+        self.prompt_service = get_prompt_service()
         self.file_service = FileService()
+        self._base_llm_service = llm_service
+        pipeline_config = self.llm_service_provider.config.get("pipeline") or {}
+        if parallel_sections is None:
+            parallel_sections = pipeline_config.get("parallel_sections", False)
+        self.parallel_sections = parallel_sections
+        self.warm_up = pipeline_config.get("warm_up", True)
+        # Also keep each step output under its content hash in lessons/artifacts/
+        self.content_addressed = (pipeline_config.get("artifacts") or {}).get(
+            "content_addressed", False
+        )
+
+        # How failed LLM calls are retried (see `pipeline.retry`)
+        self.retry_policy = RetryPolicy.from_config(pipeline_config.get("retry"))
+        if isinstance(llm_service, BatchedLLMService):
+            # Batched requests wait on the whole batch, so neither the step
+            # deadline nor hedging applies
+            self.retry_policy.deadline = None
+            self.retry_policy.hedge_percentile = None
+        self._llm_service: Optional[LLMService] = None
+
+        # Services for steps that use a different model, by (provider, model)
+        if step_llm_configs is None:
+            step_llm_configs = self._load_step_llm_configs()
+        self.step_llm_configs = step_llm_configs
+        self._step_services: Dict[Tuple[str, Optional[str]], LLMService] = {}
 
         # Set up lesson directory
         self.lesson_dir = os.path.join(course_dir, "lessons")
         os.makedirs(self.lesson_dir, exist_ok=True)
 
-        # Track the current step
-        self.current_step = None
+        # Steps by name, for running them individually
+        self.steps = {step.name: step for step in DRAFT_STEPS + POST_DRAFT_STEPS}
+
+        # Record of completed steps, for resuming interrupted runs
+        self.manifest = self.file_service.load_run_manifest(course_dir, lesson_id)
+        self.resume = False
+        self.skipped_steps: List[str] = []
+
         self.progress_callback = None
+
+        # Model, timing, token usage and cost of each step run, by step name
+        self.step_report: Dict[str, Dict[str, Any]] = {}
+        self._step_models: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.stream_tokens = False
         self.log_file = os.path.join(course_dir, "pipeline_logs.jsonl")
+        self.log_config = pipeline_config.get("logging")
 
-    def set_progress_callback(self, callback):
-        """Set a callback function to report progress."""
+        # Where each run's spans are exported (see `pipeline.telemetry`)
+        self.span_exporter = create_span_exporter(
+            pipeline_config.get("telemetry"), course_dir
+        )
+        self.run_id: Optional[str] = None
+
+    # Minimum seconds between "streaming" progress updates
+    STREAM_UPDATE_INTERVAL = 0.1
+
+    def set_progress_callback(self, callback, stream_tokens: bool = False):
+        """
+        Set a callback function to report progress.
+
+        Args:
+            callback: Called as callback(step, status, message)
+            stream_tokens: Stream LLM output and report it as it arrives, as
+                status "streaming" with the text generated so far as message
+        """
         self.progress_callback = callback
+        self.stream_tokens = stream_tokens
 
-    def _update_progress(self, step: str, status: str, message: str = ""):
-        """Update progress using the callback if available."""
-        self.current_step = step
+    def _update_progress(
+        self,
+        step: str,
+        status: str,
+        message: str = "",
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Update progress using the callback if available.
 
-        # Log the progress
-        self._log_step(step, status, message)
+        Args:
+            step: Name of the step
+            status: Its status, e.g. "starting", "success" or "error"
+            message: Message for the callback and the log
+            details: Extra fields for the log entry only, such as the step's
+                duration and token usage
+        """
+        # Log the progress (partial streamed output isn't worth persisting)
+        if status != "streaming":
+            self._log_step(step, status, message, details)
 
         # Call the callback if available
         if self.progress_callback:
             self.progress_callback(step, status, message)
 
-    def _log_step(self, step: str, status: str, message: str = ""):
-        """Log pipeline step to a file."""
+    def _log_step(
+        self,
+        step: str,
+        status: str,
+        message: str = "",
+        details: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Log pipeline step to a file.
+
+        Entries are queued on the log file's shared sink, which writes them
+        in batches from a background thread (see `pipeline.logging`).
+        services.run_history indexes them for querying across courses.
+        """
         log_entry = {
             "timestamp": datetime.now().isoformat(),
+            "run_id": self.run_id,
+            "lesson_id": self.lesson_id,
             "step": step,
             "status": status,
             "message": message,
         }
+        log_entry.update(details or {})
+        get_log_sink(self.log_file, self.log_config).write(log_entry)
+
+    async def _flush_log(self):
+        """Wait for this run's log entries to be written to the log file."""
+        sink = get_log_sink(self.log_file, self.log_config)
+        if not await asyncio.to_thread(sink.flush):
+            self.logger.warning(f"Timed out writing log entries to {self.log_file}")
+
+    async def _export_spans(self, spans: List[Span]):
+        """Export a run's spans, if an exporter is configured."""
+        if self.span_exporter is not None:
+            await self.span_exporter.export(spans)
+
+    def _load_step_llm_configs(self) -> Dict[str, LLMConfig]:
+        """Load the per-step LLM configurations from the course configuration."""
+        config_path = os.path.join(self.course_dir, "course_config.yaml")
+        if not os.path.exists(config_path):
+            return {}
+        try:
+            return self.file_service.load_course_config(config_path).step_llm_configs
+        except Exception as e:
+            self.logger.warning(f"Could not load per-step LLM configurations: {e}")
+            return {}
+
+    def _with_response_cache(self, llm_service: LLMService) -> LLMService:
+        """Wrap a service in the course's response cache, if it is enabled."""
+        cache_config = self.llm_service_provider.config.get("llm", {}).get("cache", {})
+        use_cache = self.use_cache
+        if use_cache is None:
+            use_cache = cache_config.get("enabled", False)
+        if not use_cache:
+            return llm_service
+
+        if self.response_cache is None:
+            self.response_cache = ResponseCache(
+                os.path.join(self.course_dir, ".cache", "llm_responses.sqlite"),
+                max_bytes=int(cache_config.get("max_size_mb", 200) * 1024 * 1024),
+                max_age_seconds=cache_config.get("max_age_days", 30) * 24 * 3600,
+            )
+        return CachedLLMService(
+            llm_service,
+            self.response_cache,
+            bypass_sampled=cache_config.get("bypass_sampled", False),
+        )
 
+    def _get_llm_service(self) -> LLMService:
+        """Get the LLM service for this pipeline, resolving it on first use."""
+        if self._llm_service is None:
+            llm_service = self._base_llm_service
+            if llm_service is None:
+                llm_service = self.llm_service_provider.get_llm_service(
+                    provider=self.llm_provider, model=self.model
+                )
+            self._llm_service = self._with_response_cache(llm_service)
+        return self._llm_service
+
+    async def _warm_up_model(self) -> Optional[Dict[str, Any]]:
+        """
+        Load a local model before the first step needs it.
+
+        Returns:
+            Load metrics from the service's warm_up, or None if the service
+            has no warm-up, its model was used recently or the warm-up failed
+        """
+        if not self.warm_up:
+            return None
+        llm_service = self._get_llm_service()
+        if getattr(llm_service, "supports_warm_up", False) is not True:
+            return None
+
+        self._update_progress("warm_up", "starting", "Loading model")
+        semaphore = self.llm_semaphores.get(self._resolved_model(None, {})[0])
         try:
-            with open(self.log_file, "a") as f:
-                f.write(json.dumps(log_entry) + "\n")
+            if semaphore is None:
+                metrics = await llm_service.warm_up()
+            else:
+                async with semaphore:
+                    metrics = await llm_service.warm_up()
         except Exception as e:
-            self.logger.error(f"Error writing to log file: {e}")
+            # The first step will load the model, or report the real problem
+            self.logger.warning(f"Model warm-up failed: {e}")
+            self._update_progress("warm_up", "warning", f"Warm-up failed: {e}")
+            return None
+
+        if metrics is None:
+            message = "Model already loaded"
+        else:
+            message = f"Model ready in {metrics['load_seconds']:.1f}s"
+        self._update_progress("warm_up", "success", message)
+        return metrics
+
+    def _default_model(self) -> Tuple[str, Optional[str]]:
+        """Get the provider and model used by steps without their own."""
+        llm_config = self.llm_service_provider.config.get("llm", {})
+        provider = self.llm_provider or llm_config.get("default_provider", "anthropic")
+        model = self.model or llm_config.get("models", {}).get(
+            provider.lower(), {}
+        ).get("default_model")
+        return provider.lower(), model
+
+    def _step_model(
+        self, step: Optional[str], api_params: Dict[str, Any]
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Resolve the provider and model a step's requests go to.
+
+        The course's `step_llm_configs` entry for the step comes first. Next
+        is a Provider and Model named in the prompt template's API
+        Parameters, which applies only to pipelines using that provider:
+        templates are shared by every course, so they pick a model within
+        the course's provider rather than switching provider. Otherwise the
+        pipeline's own provider and model are used.
+
+        Args:
+            step: Step name
+            api_params: API parameters from _build_request
+
+        Returns:
+            Tuple of (provider, model)
+        """
+        config = self.step_llm_configs.get(step) if step else None
+        if config is not None:
+            return config.provider.lower(), config.model
+
+        provider, model = self._default_model()
+        if api_params.get("model") and api_params.get("provider") == provider:
+            return provider, api_params["model"]
+        return provider, model
+
+    def _resolved_model(
+        self, step: Optional[str], api_params: Dict[str, Any]
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Get the provider and model a step's requests go to, including the
+        pipeline's own LLM service when it was given one.
+
+        Returns:
+            Tuple of (provider, model)
+        """
+        if self._base_llm_service is not None:
+            provider = getattr(self._base_llm_service, "provider", None)
+            model = getattr(self._base_llm_service, "model", None)
+            return (
+                provider if isinstance(provider, str) else self._default_model()[0],
+                model if isinstance(model, str) else None,
+            )
+        return self._step_model(step, api_params)
+
+    def _service_for(
+        self, step: Optional[str], api_params: Dict[str, Any]
+    ) -> Tuple[LLMService, Tuple[str, Optional[str]]]:
+        """
+        Get the LLM service for a step's requests.
+
+        Returns:
+            Tuple of (service, (provider, model))
+        """
+        resolved = self._resolved_model(step, api_params)
+        if self._base_llm_service is not None:
+            return self._get_llm_service(), resolved
+        if resolved == self._default_model():
+            return self._get_llm_service(), resolved
+
+        if resolved not in self._step_services:
+            self.logger.info(f"Using {resolved[0]}/{resolved[1]} for {step}")
+            self._step_services[resolved] = self._with_response_cache(
+                self.llm_service_provider.get_llm_service(
+                    provider=resolved[0], model=resolved[1]
+                )
+            )
+        return self._step_services[resolved], resolved
 
     async def _call_llm_with_retry(
-        self,
-        prompt: str,
-        model_params: Dict[str, Any],
-        max_retries: int = 3,
-        initial_delay: float = 1.0,
+        self, prompt: str, model_params: Dict[str, Any]
     ) -> str:
-        """Call LLM with exponential backoff retry logic."""
+        """
+        Call the LLM under the pipeline's retry policy.
+
+        Errors that retrying can't fix (bad requests, missing configuration)
+        fail at once; transient ones are retried with backoff until the
+        step's deadline.
+
+        Args:
+            prompt: The user message
+            model_params: API parameters from _build_request
+
+        Returns:
+            The generated text
+        """
 
         # Extract parameters
         temperature = model_params.get("temperature", 0.7)
         max_tokens = model_params.get("max_tokens", 2000)
-        prompt_type = model_params.get("prompt_type", "standard")
 
-        # Get the LLM service - always use AnthropicLLMService if provider is "anthropic"
-        llm_service = None
-        if self.llm_provider and self.llm_provider.lower() == "anthropic":
-            self.logger.info(f"Using Anthropic service with model: {self.model}")
-            llm_service = AnthropicLLMService(model=self.model)
-        else:
-            # Use the regular service provider for other providers
-            llm_service = self.llm_service_provider.get_llm_service(
-                provider=self.llm_provider, model=self.model
-            )
+        # Get the shared LLM service for the step's model (created once per
+        # configuration)
+        step = model_params.get("step") or _running_step.get()
+        llm_service, (provider, model) = self._service_for(step, model_params)
+        if step:
+            self._step_models[step] = (provider, model)
+
+        # Size the request against the model's limits before sending it; a
+        # prompt that doesn't fit fails here rather than being retried
+        max_tokens = await self._budget_max_tokens(
+            llm_service, prompt, model_params, max_tokens
+        )
 
-        # Retry logic
-        retries = 0
-        last_error = None
+        labels = {"step": step, "provider": provider, "model": model}
+        semaphore = self.llm_semaphores.get(provider)
 
-        while retries <= max_retries:
-            try:
-                # Call the appropriate method based on prompt type
-                if prompt_type == "with_system" and "system_prompt" in model_params:
-                    return await llm_service.generate_with_context(
-                        prompt=prompt,
-                        context=model_params["system_prompt"],
-                        temperature=temperature,
-                        max_tokens=max_tokens,
+        async def call() -> str:
+            call_span.add("attempts", 1)
+            with span("llm.attempt", SPAN_KIND_CLIENT, **labels):
+                if semaphore is None:
+                    return await self._call_llm(
+                        llm_service, prompt, model_params, temperature, max_tokens
                     )
-                else:
-                    return await llm_service.generate_text(
-                        prompt=prompt, temperature=temperature, max_tokens=max_tokens
+                queued = time.monotonic()
+                async with semaphore:
+                    add_to_span("queue_wait_seconds", time.monotonic() - queued)
+                    return await self._call_llm(
+                        llm_service, prompt, model_params, temperature, max_tokens
                     )
 
-            except Exception as e:
-                last_error = e
-                self.logger.warning(
-                    f"LLM API error (attempt {retries+1}/{max_retries+1}): {str(e)}"
-                )
+        # Hedged duplicates would stream over each other's progress updates
+        with routing_step(step), span("llm.call", **labels) as call_span:
+            return await self.retry_policy.run(
+                call,
+                key=f"{provider}/{model}/{step}",
+                hedge=not self.stream_tokens,
+            )
 
-                # Implement exponential backoff
-                delay = initial_delay * (2**retries)
-                self.logger.info(f"Retrying in {delay}s")
-                await asyncio.sleep(delay)
-                retries += 1
+    def _token_limits(
+        self, llm_service: LLMService, model_params: Dict[str, Any]
+    ) -> TokenLimits:
+        """Get the token limits of the model a request is sent to."""
+        limits = getattr(llm_service, "token_limits", None)
+        if isinstance(limits, TokenLimits):
+            return limits
 
-        # If we've exhausted retries, log and raise the error
-        self.logger.error(
-            f"Maximum retries exceeded when calling LLM API: {last_error}"
-        )
-        raise last_error
+        llm_config = self.llm_service_provider.config.get("llm", {})
+        provider, model = self._step_model(model_params.get("step"), model_params)
+        return get_token_limits(provider, model, llm_config)
+
+    async def _budget_max_tokens(
+        self,
+        llm_service: LLMService,
+        prompt: str,
+        model_params: Dict[str, Any],
+        requested: int,
+    ) -> int:
+        """
+        Pick max_tokens for a request from the model's context window and
+        output limit, given the size of its prompt.
+
+        The prompt is measured with a local estimate; if that comes close to
+        filling the context window, providers that can count tokens exactly
+        are asked to.
+
+        Args:
+            llm_service: The LLM service
+            prompt: The user message
+            model_params: API parameters from _build_request
+            requested: max_tokens asked for by the template or step
+
+        Returns:
+            max_tokens to send
+
+        Raises:
+            TokenBudgetError: If the prompt leaves too little room for output
+        """
+        limits = self._token_limits(llm_service, model_params)
+        context = None
+        if model_params.get("prompt_type", "standard") == "with_system":
+            context = model_params.get("system_prompt")
+        text = (model_params.get("cache_prefix") or "") + prompt
+
+        prompt_tokens = estimate_tokens(text) + estimate_tokens(context)
+        if (
+            prompt_tokens + requested > limits.context_window * EXACT_COUNT_THRESHOLD
+            and getattr(llm_service, "supports_token_counting", False) is True
+        ):
+            prompt_tokens = await llm_service.count_tokens(text, context)
+
+        max_tokens = limits.plan_max_tokens(prompt_tokens, requested)
+        if max_tokens < requested:
+            self.logger.info(
+                f"Reduced max_tokens from {requested} to {max_tokens} for a "
+                f"~{prompt_tokens}-token prompt (model limits: "
+                f"{limits.context_window} context, "
+                f"{limits.max_output_tokens} output)"
+            )
+        return max_tokens
+
+    async def _call_llm(
+        self,
+        llm_service: LLMService,
+        prompt: str,
+        model_params: Dict[str, Any],
+        temperature: float,
+        max_tokens: int,
+    ) -> str:
+        """Make a single LLM call for a prompt."""
+        prompt_type = model_params.get("prompt_type", "standard")
+        context = None
+        if prompt_type == "with_system" and "system_prompt" in model_params:
+            context = model_params["system_prompt"]
+
+        # Mark the system prompt and any stable prompt prefix for caching by
+        # providers that support it; others get the prefix joined back on
+        cache_prefix = model_params.get("cache_prefix")
+        cache_hints = {}
+        if getattr(llm_service, "supports_prompt_caching", False) is True:
+            if cache_prefix:
+                cache_hints["cache_prefix"] = cache_prefix
+            if context is not None:
+                cache_hints["cache_system"] = True
+        elif cache_prefix:
+            prompt = cache_prefix + prompt
+
+        # Stream the output to the progress callback if requested
+        if self.stream_tokens and self.progress_callback:
+            return await self._stream_llm(
+                llm_service,
+                prompt,
+                context,
+                temperature,
+                max_tokens,
+                step=model_params.get("step"),
+                cache_hints=cache_hints,
+            )
+
+        # Call the appropriate method based on prompt type
+        if context is not None:
+            return await llm_service.generate_with_context(
+                prompt=prompt,
+                context=context,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **cache_hints,
+            )
+        else:
+            return await llm_service.generate_text(
+                prompt=prompt,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **cache_hints,
+            )
+
+    async def _stream_llm(
+        self,
+        llm_service: LLMService,
+        prompt: str,
+        context: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        step: Optional[str] = None,
+        cache_hints: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Stream an LLM response, reporting the text so far as it arrives."""
+        step = step or _running_step.get()
+        text = ""
+        last_update = 0.0
+        attempt_span = current_span()
+
+        async for chunk in llm_service.stream_text(
+            prompt,
+            context=context,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            **(cache_hints or {}),
+        ):
+            if attempt_span is not None and chunk:
+                attempt_span.set_default(
+                    "time_to_first_token_seconds", attempt_span.elapsed
+                )
+            text += chunk
+            now = time.monotonic()
+            if now - last_update >= self.STREAM_UPDATE_INTERVAL:
+                self._update_progress(step, "streaming", text)
+                last_update = now
+
+        # Always deliver the complete text
+        self._update_progress(step, "streaming", text)
+        return text
 
     async def _validate_output(
         self, output: str, expected_format: str
@@ -202,247 +800,428 @@ class LessonPipeline:
         # Default to success if no specific validation is defined
         return True, "Validation passed"
 
-    async def _generate_learning_outcomes(
-        self, module: str, lesson_objective: str, lesson_topics: str
-    ) -> str:
+    def _build_request(
+        self, step: PipelineStep, variables: Dict[str, str]
+    ) -> Tuple[str, Dict[str, Any]]:
         """
-        Step 1: Generate Learning Outcomes.
+        Render a step's prompt template into a user message and API parameters.
+
+        Templates with a "User Message Template" section use {{VARIABLE}}
+        placeholders; other templates use $variable placeholders and are sent
+        whole.
 
         Args:
-            module: The module name
-            lesson_objective: The lesson objective
-            lesson_topics: The lesson topics
+            step: The pipeline step
+            variables: Template variables
 
         Returns:
-            The generated learning outcomes
+            Tuple of (user message, API parameters)
         """
-        self._update_progress(
-            "learning_outcomes", "starting", "Generating learning outcomes"
+        template = self.prompt_service.get_compiled(step.prompt)
+        if not template:
+            raise ValueError(f"Prompt template {step.prompt} not found")
+
+        api_params = dict(template.api_params)
+        api_params.update(step.api_params)
+
+        if template.system_prompt:
+            api_params["prompt_type"] = "with_system"
+            api_params["system_prompt"] = template.system_prompt
+
+        if not step.cache_inputs:
+            return template.render_user_message(variables), api_params
+
+        # Send the prompt up to the step's long, stable inputs as a separate
+        # prefix the provider can cache
+        cache_prefix, user_message = template.split_user_message(
+            variables, step.cache_inputs
         )
+        if cache_prefix:
+            api_params["cache_prefix"] = cache_prefix
+        return user_message, api_params
 
-        try:
-            # Get the LO generator prompt template
-            template = self.prompt_service.get_prompt("lo_generator")
-            if not template:
-                raise ValueError("LO generator prompt template not found")
+    async def _run_step(self, step: PipelineStep, artifacts: Dict[str, str]) -> str:
+        """
+        Run one pipeline step: render its prompt, call the LLM and save the output.
 
+        Args:
+            step: The pipeline step
+            artifacts: Artifacts produced so far, including the step's inputs
+
+        Returns:
+            The step's output
+        """
+        self._update_progress(step.name, "starting", step.description)
+        step_start = time.monotonic()
+        fingerprint = None
+        running = _running_step.set(step.name)
+
+        try:
             # Prepare variables for the template
-            # Note: The prompt service uses $variable format, but our templates use {{VARIABLE}}
-            # We need to convert between the formats
-            variables = {
-                "MODULE": module,
-                "LESSON_OBJECTIVE": lesson_objective,
-                "LESSON_TOPICS": lesson_topics,
-            }
-
-            # Extract API parameters from the template with safer token limits
-            api_params = self._extract_api_params(template)
-
-            # Limit max_tokens to 4000 to work with claude-3-sonnet
-            if api_params.get("max_tokens", 0) > 4000:
-                api_params["max_tokens"] = 4000
-                self.logger.info("Reduced max_tokens to 4000 for compatibility")
-
-            # Extract system prompt from the template
-            system_prompt = self._extract_system_prompt(template)
-            if system_prompt:
-                api_params["prompt_type"] = "with_system"
-                api_params["system_prompt"] = system_prompt
-
-            # Prepare the prompt with variable substitution by manually replacing {{VARIABLE}} format
-            prompt = template
-            for key, value in variables.items():
-                prompt = prompt.replace(f"{{{{{key}}}}}", value)
-
-            # Use only the user message part for the API call
-            user_message = self._extract_user_message(prompt)
-            if not user_message:
-                raise ValueError("Failed to extract user message from template")
-
-            # Call the LLM with retry
-            self.logger.info("Calling LLM for learning outcomes generation")
-            response = await self._call_llm_with_retry(user_message, api_params)
+            variables = self._step_variables(step, artifacts)
+
+            # Reuse the output of an earlier run with the same inputs
+            fingerprint = self._fingerprint(step, variables)
+            output_path = step.output_path(self.lesson_dir, self.lesson_id)
+            if self.resume and self._stale_reason(step, fingerprint) is None:
+                with open(output_path, "r", encoding="utf-8") as f:
+                    response = f.read()
+                self.skipped_steps.append(step.name)
+                self._update_progress(
+                    step.name, "skipped", "Inputs unchanged; reusing existing output"
+                )
+                return response
+
+            start = time.monotonic()
+            with track_usage() as usage:
+                if self._runs_by_section(step):
+                    response = await self._run_sections(step, variables)
+                else:
+                    response = await self._generate(step, variables)
+            self._report_step(step.name, time.monotonic() - start, usage.to_dict())
 
             # Validate the output
-            is_valid, message = await self._validate_output(
-                response, "learning_outcomes"
-            )
-            if not is_valid:
-                self.logger.warning(f"LO validation failed: {message}")
-                self._update_progress(
-                    "learning_outcomes", "warning", f"Validation issue: {message}"
+            if step.validation:
+                is_valid, message = await self._validate_output(
+                    response, step.validation
                 )
-                # Continue anyway but log the warning
+                if not is_valid:
+                    self.logger.warning(f"{step.name} validation failed: {message}")
+                    self._update_progress(
+                        step.name, "warning", f"Validation issue: {message}"
+                    )
+                    # Continue anyway but log the warning
 
-            # Write the learning outcomes to a file
-            los_file = os.path.join(self.lesson_dir, f"{self.lesson_id}_los.md")
-            with open(los_file, "w", encoding="utf-8") as f:
-                f.write(response)
+            # Write the output to a file, off the event loop (it's fsynced)
+            await asyncio.to_thread(
+                self.file_service.save_artifact, response, output_path
+            )
+            artifact_path = None
+            if self.content_addressed:
+                artifact_path = await asyncio.to_thread(
+                    self.file_service.save_artifact,
+                    response,
+                    os.path.join(
+                        self.lesson_dir, "artifacts", os.path.basename(output_path)
+                    ),
+                    True,
+                )
+            await self._record_step(
+                step.name,
+                "success",
+                fingerprint,
+                output_path,
+                response,
+                artifact_path=artifact_path,
+            )
 
+            label = step.name.replace("_", " ").capitalize()
             self._update_progress(
-                "learning_outcomes", "success", "Learning outcomes generated"
+                step.name,
+                "success",
+                f"{label} generated",
+                self.step_report.get(step.name),
             )
             return response
 
         except Exception as e:
-            self.logger.error(f"Error generating learning outcomes: {str(e)}")
-            self._update_progress("learning_outcomes", "error", f"Error: {str(e)}")
+            self.logger.error(f"Error in step {step.name}: {str(e)}")
+            self._update_progress(
+                step.name,
+                "error",
+                f"Error: {str(e)}",
+                {
+                    "duration_seconds": time.monotonic() - step_start,
+                    "error": type(e).__name__,
+                },
+            )
+            if fingerprint is not None:
+                await self._record_step(step.name, "error", fingerprint, error=str(e))
             raise
+        finally:
+            _running_step.reset(running)
 
-    async def _generate_lesson_shell(self, learning_outcomes: str, title: str) -> str:
+    async def _run_traced_step(
+        self, step: PipelineStep, artifacts: Dict[str, str]
+    ) -> str:
+        """Run one pipeline step (see _run_step) as a telemetry span."""
+        with span("pipeline.step", step=step.name, lesson_id=self.lesson_id) as trace:
+            output = await self._run_step(step, artifacts)
+            skipped = step.name in self.skipped_steps
+            trace.set("status", "skipped" if skipped else "success")
+            if not skipped and step.name in self.step_report:
+                trace.set("cost_usd", self.step_report[step.name]["cost_usd"])
+            return output
+
+    def _report_step(self, step: str, duration: float, usage: Dict[str, Any]):
+        """Record the model, time, token usage and estimated cost of a step."""
+        provider, model = self._step_models.get(step) or self._default_model()
+        self.step_report[step] = {
+            "provider": provider,
+            "model": model,
+            "duration_seconds": duration,
+            "token_usage": usage,
+            "cost_usd": estimate_cost(model, usage),
+        }
+
+    async def _generate(self, step: PipelineStep, variables: Dict[str, str]) -> str:
+        """Generate a step's output with a single LLM call."""
+        user_message, api_params = self._build_request(step, variables)
+        api_params["step"] = step.name
+
+        # Call the LLM with retry
+        self.logger.info(f"Calling LLM for {step.name} generation")
+        response = await self._call_llm_with_retry(user_message, api_params)
+
+        # Extract content from the step's output tags if present
+        if step.extract_tag:
+            content_match = re.search(
+                rf"<{step.extract_tag}>(.*?)</{step.extract_tag}>",
+                response,
+                re.DOTALL,
+            )
+            if content_match:
+                response = content_match.group(1).strip()
+        return response
+
+    def _runs_by_section(self, step: PipelineStep) -> bool:
+        """Check whether a step generates its output section by section."""
+        return bool(self.parallel_sections and step.section_prompt)
+
+    async def _run_sections(self, step: PipelineStep, variables: Dict[str, str]) -> str:
         """
-        Step 2: Generate Lesson Shell.
+        Generate a step's output by rewriting each <LOn> section of its
+        section input in a concurrent LLM call, then reassembling the draft.
+
+        Every call gets the whole draft as shared context (sent first, so
+        providers can cache it) plus the one section to rewrite.
 
         Args:
-            learning_outcomes: The learning outcomes generated in step 1
-            title: The lesson title
+            step: The pipeline step
+            variables: The step's template variables
 
         Returns:
-            The generated lesson shell
+            The reassembled output
         """
-        self._update_progress("lesson_shell", "starting", "Generating lesson shell")
+        draft = SectionedDraft(variables[step.section_input])
+        if not draft.sections:
+            self.logger.info(
+                f"No <LOn> sections found for {step.name}; generating it whole"
+            )
+            return await self._generate(step, variables)
 
-        try:
-            # Get the lesson shell prompt template
-            template = self.prompt_service.get_prompt("lesson_shell")
-            if not template:
-                raise ValueError("Lesson shell prompt template not found")
+        section_step = step.model_copy(
+            update={"prompt": step.section_prompt, "extract_tag": None}
+        )
 
-            # Prepare variables for the template
-            variables = {"TITLE": title, "LOs": learning_outcomes}
-
-            # Extract API parameters from the template with safer token limits
-            api_params = self._extract_api_params(template)
-
-            # Limit max_tokens to 4000 to work with claude-3-sonnet
-            if api_params.get("max_tokens", 0) > 4000:
-                api_params["max_tokens"] = 4000
-                self.logger.info("Reduced max_tokens to 4000 for compatibility")
-
-            # Extract system prompt from the template
-            system_prompt = self._extract_system_prompt(template)
-            if system_prompt:
-                api_params["prompt_type"] = "with_system"
-                api_params["system_prompt"] = system_prompt
-
-            # Prepare the prompt with variable substitution by manually replacing {{VARIABLE}} format
-            prompt = template
-            for key, value in variables.items():
-                prompt = prompt.replace(f"{{{{{key}}}}}", value)
-
-            # Use only the user message part for the API call
-            user_message = self._extract_user_message(prompt)
-            if not user_message:
-                raise ValueError("Failed to extract user message from template")
-
-            # Call the LLM with retry
-            self.logger.info("Calling LLM for lesson shell generation")
+        async def rewrite(tag: str, content: str) -> Tuple[str, List[str]]:
+            user_message, api_params = self._build_request(
+                section_step, {**variables, "SECTION_TAG": tag, "SECTION": content}
+            )
+            api_params["step"] = step.name
             response = await self._call_llm_with_retry(user_message, api_params)
+            return parse_section_response(response)
 
-            # Validate the output
-            is_valid, message = await self._validate_output(response, "lesson_shell")
-            if not is_valid:
-                self.logger.warning(f"Lesson shell validation failed: {message}")
-                self._update_progress(
-                    "lesson_shell", "warning", f"Validation issue: {message}"
-                )
-                # Continue anyway but log the warning
-
-            # Write the lesson shell to a file
-            shell_file = os.path.join(self.lesson_dir, f"{self.lesson_id}_shell.md")
-            with open(shell_file, "w", encoding="utf-8") as f:
-                f.write(response)
+        self.logger.info(
+            f"Calling LLM for {step.name} generation in "
+            f"{len(draft.sections)} parallel sections"
+        )
+        results = await asyncio.gather(
+            *(rewrite(tag, content) for tag, content in draft.sections)
+        )
 
-            self._update_progress("lesson_shell", "success", "Lesson shell generated")
-            return response
+        expanded = {}
+        glossary_terms = []
+        for (tag, _), (content, terms) in zip(draft.sections, results):
+            expanded[tag] = content
+            glossary_terms += terms
+        return draft.assemble(expanded, glossary_terms)
+
+    @staticmethod
+    def _step_variables(
+        step: PipelineStep, artifacts: Dict[str, str]
+    ) -> Dict[str, str]:
+        """Collect a step's template variables from the artifacts."""
+        variables = dict(step.variables)
+        for variable, artifact in step.inputs.items():
+            variables[variable] = artifacts[artifact]
+        return variables
+
+    def _fingerprint(
+        self, step: PipelineStep, variables: Dict[str, str]
+    ) -> Dict[str, Any]:
+        """
+        Hash a step's prompt template, parameters, model and input values.
 
-        except Exception as e:
-            self.logger.error(f"Error generating lesson shell: {str(e)}")
-            self._update_progress("lesson_shell", "error", f"Error: {str(e)}")
-            raise
+        Returns:
+            Dictionary with the combined input_hash, plus the template_hash,
+            per-variable input_hashes and "provider/model" used to explain
+            why a step is stale
+        """
+        template = self.prompt_service.get_compiled(step.prompt)
+        template_hash = template.hash if template else _sha256("")
+        api_params = dict(template.api_params) if template else {}
+        api_params.update(step.api_params)
+        provider, model = self._resolved_model(step.name, api_params)
+        model_name = f"{provider}/{model}"
+        if self._runs_by_section(step):
+            # Switching modes, or editing the section prompt, rebuilds the step
+            section_template = self.prompt_service.get_compiled(step.section_prompt)
+            template_hash = _sha256(
+                template_hash + (section_template.hash if section_template else "")
+            )
+        input_hashes = {name: _sha256(value) for name, value in variables.items()}
+        canonical = json.dumps(
+            {
+                "prompt": step.prompt,
+                "template": template_hash,
+                "api_params": step.api_params,
+                "extract_tag": step.extract_tag,
+                "inputs": input_hashes,
+                "model": model_name,
+            },
+            sort_keys=True,
+        )
+        return {
+            "input_hash": _sha256(canonical),
+            "template_hash": template_hash,
+            "input_hashes": input_hashes,
+            "model": model_name,
+        }
 
-    async def _generate_rough_draft(self, lesson_shell: str) -> str:
+    def _stale_reason(
+        self, step: PipelineStep, fingerprint: Dict[str, Any]
+    ) -> Optional[str]:
         """
-        Step 3: Generate Rough Draft.
+        Explain why a step's saved output can't be reused.
 
         Args:
-            lesson_shell: The lesson shell generated in step 2
+            step: The pipeline step
+            fingerprint: The step's current fingerprint from _fingerprint
 
         Returns:
-            The generated rough draft
+            The reason the step must run, or None if its output is up to date
         """
-        self._update_progress("rough_draft", "starting", "Generating rough draft")
-
-        try:
-            # Get the rough draft prompt template
-            template = self.prompt_service.get_prompt("rough_draft")
-            if not template:
-                raise ValueError("Rough draft prompt template not found")
-
-            # Prepare variables for the template
-            variables = {"LESSON_SHELL": lesson_shell}
+        record = self.manifest.steps.get(step.name)
+        if record is None:
+            return "never built"
+        if record.status != "success":
+            return "last run failed"
+        if not os.path.exists(step.output_path(self.lesson_dir, self.lesson_id)):
+            return "output missing"
+        if record.input_hash == fingerprint["input_hash"]:
+            return None
+
+        if record.template_hash != fingerprint["template_hash"]:
+            return "prompt template changed"
+        changed = sorted(
+            name
+            for name, value_hash in fingerprint["input_hashes"].items()
+            if record.input_hashes.get(name) != value_hash
+        )
+        if changed:
+            return f"input changed: {', '.join(changed)}"
+        if record.model and record.model != fingerprint["model"]:
+            return f"model changed: {record.model} -> {fingerprint['model']}"
+        return "step definition changed"
 
-            # Extract API parameters from the template with safer token limits
-            api_params = self._extract_api_params(template)
+    async def _record_step(
+        self,
+        step: str,
+        status: str,
+        fingerprint: Dict[str, Any],
+        output_path: Optional[str] = None,
+        output: Optional[str] = None,
+        error: Optional[str] = None,
+        artifact_path: Optional[str] = None,
+    ):
+        """
+        Record a step's outcome in the run manifest and save it.
 
-            # Limit max_tokens to 4000 to work with claude-3-sonnet
-            if api_params.get("max_tokens", 0) > 4000:
-                api_params["max_tokens"] = 4000
-                self.logger.info("Reduced max_tokens to 4000 for compatibility")
+        The record is merged into the manifest on disk rather than saving
+        this pipeline's copy over it, so records written by other pipelines
+        for the lesson since it was loaded are kept.
+        """
+        record = StepRecord(
+            step=step,
+            status=status,
+            input_hash=fingerprint["input_hash"],
+            template_hash=fingerprint["template_hash"],
+            input_hashes=fingerprint["input_hashes"],
+            model=fingerprint["model"],
+            output_path=output_path,
+            output_hash=_sha256(output) if output is not None else None,
+            artifact_path=artifact_path,
+            updated_at=datetime.now().isoformat(),
+            error=error,
+        )
+        self.manifest.steps[step] = record
 
-            # Extract system prompt from the template
-            system_prompt = self._extract_system_prompt(template)
-            if system_prompt:
-                api_params["prompt_type"] = "with_system"
-                api_params["system_prompt"] = system_prompt
+        def add_record(manifest: RunManifest):
+            manifest.steps[step] = record
 
-            # Extract the template part from the <template> tags
-            template_part_match = re.search(
-                r"<template>(.*?)</template>", template, re.DOTALL
+        try:
+            await asyncio.to_thread(
+                self.file_service.update_run_manifest,
+                self.course_dir,
+                self.lesson_id,
+                add_record,
             )
-            if not template_part_match:
-                raise ValueError("Could not find <template> tags in rough draft prompt")
+        except Exception as e:
+            self.logger.error(f"Error saving run manifest: {e}")
 
-            template_part = template_part_match.group(1).strip()
+    async def _generate_learning_outcomes(
+        self, module: str, lesson_objective: str, lesson_topics: str
+    ) -> str:
+        """
+        Step 1: Generate Learning Outcomes.
 
-            # Replace variables in the template part
-            for key, value in variables.items():
-                template_part = template_part.replace(f"{{{{{key}}}}}", value)
+        Args:
+            module: The module name
+            lesson_objective: The lesson objective
+            lesson_topics: The lesson topics
 
-            # Call the LLM with retry
-            self.logger.info("Calling LLM for rough draft generation")
-            response = await self._call_llm_with_retry(template_part, api_params)
+        Returns:
+            The generated learning outcomes
+        """
+        return await self._run_step(
+            self.steps["learning_outcomes"],
+            {
+                "module": module,
+                "lesson_objective": lesson_objective,
+                "lesson_topics": lesson_topics,
+            },
+        )
 
-            # Extract content from <lesson_content> tags if present
-            content_match = re.search(
-                r"<lesson_content>(.*?)</lesson_content>", response, re.DOTALL
-            )
-            if content_match:
-                response = content_match.group(1).strip()
+    async def _generate_lesson_shell(self, learning_outcomes: str, title: str) -> str:
+        """
+        Step 2: Generate Lesson Shell.
 
-            # Validate the output
-            is_valid, message = await self._validate_output(response, "rough_draft")
-            if not is_valid:
-                self.logger.warning(f"Rough draft validation failed: {message}")
-                self._update_progress(
-                    "rough_draft", "warning", f"Validation issue: {message}"
-                )
-                # Continue anyway but log the warning
+        Args:
+            learning_outcomes: The learning outcomes generated in step 1
+            title: The lesson title
 
-            # Write the rough draft to a file
-            rough_draft_file = os.path.join(
-                self.lesson_dir, f"{self.lesson_id}_rough_draft.md"
-            )
-            with open(rough_draft_file, "w", encoding="utf-8") as f:
-                f.write(response)
+        Returns:
+            The generated lesson shell
+        """
+        return await self._run_step(
+            self.steps["lesson_shell"],
+            {"learning_outcomes": learning_outcomes, "title": title},
+        )
 
-            self._update_progress("rough_draft", "success", "Rough draft generated")
-            return response
+    async def _generate_rough_draft(self, lesson_shell: str) -> str:
+        """
+        Step 3: Generate Rough Draft.
 
-        except Exception as e:
-            self.logger.error(f"Error generating rough draft: {str(e)}")
-            self._update_progress("rough_draft", "error", f"Error: {str(e)}")
-            raise
+        Args:
+            lesson_shell: The lesson shell generated in step 2
+
+        Returns:
+            The generated rough draft
+        """
+        return await self._run_step(
+            self.steps["rough_draft"], {"lesson_shell": lesson_shell}
+        )
 
     async def _generate_expanded_draft(self, rough_draft: str) -> str:
         """
@@ -454,126 +1233,103 @@ class LessonPipeline:
         Returns:
             The generated expanded draft
         """
-        self._update_progress("expanded_draft", "starting", "Generating expanded draft")
-
-        try:
-            # Get the expanded draft prompt template
-            template = self.prompt_service.get_prompt("expanded_draft")
-            if not template:
-                raise ValueError("Expanded draft prompt template not found")
-
-            # Prepare variables for the template
-            variables = {"LESSON": rough_draft}
-
-            # Extract API parameters from the template with safer token limits
-            api_params = self._extract_api_params(template)
-
-            # Limit max_tokens to 4000 to work with claude-3-sonnet
-            if api_params.get("max_tokens", 0) > 4000:
-                api_params["max_tokens"] = 4000
-                self.logger.info("Reduced max_tokens to 4000 for compatibility")
-
-            # Extract system prompt from the template
-            system_prompt = self._extract_system_prompt(template)
-            if system_prompt:
-                api_params["prompt_type"] = "with_system"
-                api_params["system_prompt"] = system_prompt
-
-            # Prepare the prompt with variable substitution by manually replacing {{VARIABLE}} format
-            prompt = template
-            for key, value in variables.items():
-                prompt = prompt.replace(f"{{{{{key}}}}}", value)
-
-            # Use only the user message part for the API call
-            user_message = self._extract_user_message(prompt)
-            if not user_message:
-                raise ValueError("Failed to extract user message from template")
-
-            # Call the LLM with retry
-            self.logger.info("Calling LLM for expanded draft generation")
-            response = await self._call_llm_with_retry(user_message, api_params)
+        return await self._run_step(
+            self.steps["expanded_draft"], {"rough_draft": rough_draft}
+        )
 
-            # Extract content from <expanded_lesson> tags if present
-            content_match = re.search(
-                r"<expanded_lesson>(.*?)</expanded_lesson>", response, re.DOTALL
-            )
-            if content_match:
-                response = content_match.group(1).strip()
+    def _prepare_run(
+        self,
+        module: str,
+        lesson_objective: str,
+        lesson_topics: str,
+        title: str,
+        course_context: Dict[str, str],
+        include_post_draft: bool,
+        provided_artifacts: Optional[Dict[str, str]],
+    ) -> Tuple[PipelineDAG, Dict[str, str]]:
+        """Build the step graph and initial artifacts for a run."""
+        provided_artifacts = provided_artifacts or {}
+
+        steps = list(DRAFT_STEPS)
+        if include_post_draft:
+            steps += POST_DRAFT_STEPS
+        # Steps whose output the caller supplies (e.g. human-edited learning
+        # outcomes) are not run; their output becomes an input instead
+        steps = [step for step in steps if step.output not in provided_artifacts]
+
+        artifacts = {
+            "module": module,
+            "lesson_objective": lesson_objective,
+            "lesson_topics": lesson_topics,
+            "title": title,
+            "course_title": course_context.get("title", ""),
+            "target_audience": course_context.get("target_audience", ""),
+            "skill_level": course_context.get("skill_level", ""),
+            **provided_artifacts,
+        }
+        return PipelineDAG(steps), artifacts
 
-            # Validate the output
-            is_valid, message = await self._validate_output(response, "expanded_draft")
-            if not is_valid:
-                self.logger.warning(f"Expanded draft validation failed: {message}")
-                self._update_progress(
-                    "expanded_draft", "warning", f"Validation issue: {message}"
-                )
-                # Continue anyway but log the warning
+    def plan(
+        self,
+        module: str,
+        lesson_objective: str,
+        lesson_topics: str,
+        title: str,
+        course_context: Dict[str, str],
+        include_post_draft: bool = False,
+        provided_artifacts: Optional[Dict[str, str]] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Work out which steps a run would rebuild, without calling the LLM.
 
-            # Write the expanded draft to a file
-            expanded_draft_file = os.path.join(
-                self.lesson_dir, f"{self.lesson_id}_expanded_draft.md"
-            )
-            with open(expanded_draft_file, "w", encoding="utf-8") as f:
-                f.write(response)
+        A step is dirty if its prompt template or inputs changed since its
+        output was last built, or if a step it depends on is dirty. Clean steps
+        contribute their saved output (including any human edits) as input to
+        the steps after them.
 
-            self._update_progress(
-                "expanded_draft", "success", "Expanded draft generated"
-            )
-            return response
+        Args:
+            module: The module name
+            lesson_objective: The lesson objective
+            lesson_topics: The lesson topics
+            title: The lesson title
+            course_context: Course context information
+            include_post_draft: Include the post-draft steps
+            provided_artifacts: Artifacts supplied instead of generated
 
-        except Exception as e:
-            self.logger.error(f"Error generating expanded draft: {str(e)}")
-            self._update_progress("expanded_draft", "error", f"Error: {str(e)}")
-            raise
+        Returns:
+            Dirty steps in run order, as dictionaries with "step" and "reason"
+        """
+        dag, artifacts = self._prepare_run(
+            module,
+            lesson_objective,
+            lesson_topics,
+            title,
+            course_context,
+            include_post_draft,
+            provided_artifacts,
+        )
 
-    def _extract_api_params(self, template: str) -> Dict[str, Any]:
-        """Extract API parameters from the template."""
-        api_params = {"temperature": 0.7, "max_tokens": 2000}
+        dirty: Dict[str, str] = {}
+        for name in dag.order:
+            step = dag.steps[name]
+            upstream = sorted(dag.dependencies(name) & set(dirty))
+            if upstream:
+                dirty[name] = f"upstream step rebuilt: {', '.join(upstream)}"
+                continue
 
-        # Look for API Parameters section
-        api_params_match = re.search(
-            r"## API Parameters\s*\n(.*?)(?:\n##|\Z)", template, re.DOTALL
-        )
-        if api_params_match:
-            api_params_text = api_params_match.group(1)
-
-            # Extract temperature
-            temp_match = re.search(r"Temperature: ([\d\.]+)", api_params_text)
-            if temp_match:
-                api_params["temperature"] = float(temp_match.group(1))
-
-            # Extract max tokens
-            tokens_match = re.search(r"Max Tokens: (\d+)", api_params_text)
-            if tokens_match:
-                # Cap max tokens at 4000 for safety with Claude 3 Sonnet
-                api_params["max_tokens"] = min(int(tokens_match.group(1)), 4000)
-
-            # Extract thinking budget if present
-            thinking_match = re.search(
-                r"Thinking: Enabled \(budget: (\d+) tokens\)", api_params_text
+            reason = self._stale_reason(
+                step, self._fingerprint(step, self._step_variables(step, artifacts))
             )
-            if thinking_match:
-                api_params["thinking_budget"] = int(thinking_match.group(1))
+            if reason:
+                dirty[name] = reason
+                continue
 
-        return api_params
+            with open(
+                step.output_path(self.lesson_dir, self.lesson_id), "r", encoding="utf-8"
+            ) as f:
+                artifacts[step.output] = f.read()
 
-    def _extract_system_prompt(self, template: str) -> Optional[str]:
-        """Extract system prompt from the template."""
-        system_prompt_match = re.search(
-            r"## System Prompt\s*\n(.*?)(?:\n##|\Z)", template, re.DOTALL
-        )
-        if system_prompt_match:
-            return system_prompt_match.group(1).strip()
-        return None
-
-    def _extract_user_message(self, template: str) -> Optional[str]:
-        """Extract user message from the template."""
-        user_message_match = re.search(
-            r"## User Message Template\s*\n(.*?)(?:\n##|\Z)", template, re.DOTALL
-        )
-        if user_message_match:
-            return user_message_match.group(1).strip()
-        return None
+        return [{"step": name, "reason": reason} for name, reason in dirty.items()]
 
     async def run_pipeline(
         self,
@@ -582,6 +1338,9 @@ class LessonPipeline:
         lesson_topics: str,
         title: str,
         course_context: Dict[str, str],
+        include_post_draft: bool = False,
+        resume: bool = True,
+        provided_artifacts: Optional[Dict[str, str]] = None,
     ) -> Dict[str, Any]:
         """
         Run the draft generation pipeline.
@@ -592,6 +1351,12 @@ class LessonPipeline:
             lesson_topics: The lesson topics
             title: The lesson title
             course_context: Course context information
+            include_post_draft: Also generate the quizzes, activities and
+                intro/conclusion from the expanded draft
+            resume: Reuse the outputs of steps that already succeeded with the
+                same prompt template and inputs (per the lesson's run manifest)
+            provided_artifacts: Artifacts supplied instead of generated, e.g.
+                {"learning_outcomes": ...} for human-edited learning outcomes
 
         Returns:
             Dictionary with pipeline results
@@ -600,44 +1365,68 @@ class LessonPipeline:
             f"Starting draft generation pipeline for lesson: {self.lesson_id}"
         )
 
-        try:
-            # Step 1: Generate Learning Outcomes
-            los = await self._generate_learning_outcomes(
-                module, lesson_objective, lesson_topics
-            )
-
-            # Step 2: Generate Lesson Shell
-            shell = await self._generate_lesson_shell(los, title)
+        dag, artifacts = self._prepare_run(
+            module,
+            lesson_objective,
+            lesson_topics,
+            title,
+            course_context,
+            include_post_draft,
+            provided_artifacts,
+        )
+        self.resume = resume
+        self.skipped_steps = []
+        self.step_report = {}
+        self.run_id = uuid.uuid4().hex
 
-            # Step 3: Generate Rough Draft
-            rough_draft = await self._generate_rough_draft(shell)
+        with track_spans() as spans:
+            try:
+                with span("pipeline.run", lesson_id=self.lesson_id, run_id=self.run_id):
+                    with span("pipeline.warm_up"):
+                        warm_up = await self._warm_up_model()
 
-            # Step 4: Generate Expanded Draft
-            expanded_draft = await self._generate_expanded_draft(rough_draft)
+                    # Steps run as soon as their inputs exist, so independent
+                    # post-draft steps fan out in parallel
+                    with track_usage() as usage:
+                        await dag.run(self._run_traced_step, artifacts)
 
-            self.logger.info(
-                f"Draft generation pipeline completed for lesson: {self.lesson_id}"
-            )
+                self.logger.info(
+                    f"Draft generation pipeline completed for lesson: {self.lesson_id}"
+                )
 
-            return {
-                "status": "success",
-                "message": "Draft generation complete",
-                "files": {
-                    "learning_outcomes": f"{self.lesson_id}_los.md",
-                    "lesson_shell": f"{self.lesson_id}_shell.md",
-                    "rough_draft": f"{self.lesson_id}_rough_draft.md",
-                    "expanded_draft": f"{self.lesson_id}_expanded_draft.md",
-                },
-                "lesson_id": self.lesson_id,
-            }
-        except Exception as e:
-            self.logger.error(f"Pipeline failed: {str(e)}")
-            return {
-                "status": "error",
-                "message": f"Pipeline failed: {str(e)}",
-                "step": self.current_step,
-                "lesson_id": self.lesson_id,
-            }
+                result = {
+                    "status": "success",
+                    "message": "Draft generation complete",
+                    "files": {
+                        step.output: f"{self.lesson_id}_{step.output_file}"
+                        for step in dag.steps.values()
+                    },
+                    "lesson_id": self.lesson_id,
+                    "run_id": self.run_id,
+                    "skipped_steps": list(self.skipped_steps),
+                    "token_usage": usage.to_dict(),
+                    "step_report": dict(self.step_report),
+                    "telemetry": summarize_spans(spans.spans),
+                }
+                if warm_up is not None:
+                    result["warm_up"] = warm_up
+                if self.response_cache is not None:
+                    result["cache_stats"] = self.response_cache.stats()
+                return result
+            except Exception as e:
+                self.logger.error(f"Pipeline failed: {str(e)}")
+                return {
+                    "status": "error",
+                    "message": f"Pipeline failed: {str(e)}",
+                    "step": dag.failed_step,
+                    "lesson_id": self.lesson_id,
+                    "run_id": self.run_id,
+                    "step_report": dict(self.step_report),
+                    "telemetry": summarize_spans(spans.spans),
+                }
+            finally:
+                await self._export_spans(spans.spans)
+                await self._flush_log()
 
 
 class PolishingPipeline:
@@ -672,12 +1461,15 @@ class PolishingPipeline:
 
         # Initialize services
         self.llm_service_provider = LLMServiceProvider()
-        self.prompt_service = PromptService()
+        self.prompt_service = get_prompt_service()
         self.file_service = FileService()
 
         # Set up lesson directory
         self.lesson_dir = os.path.join(course_dir, "lessons")
 
+        # Steps by name, for running them individually
+        self.steps = {step.name: step for step in DRAFT_STEPS + POST_DRAFT_STEPS}
+
         # Track the current step
         self.current_step = None
         self.log_file = os.path.join(course_dir, "polish_logs.jsonl")
@@ -1,50 +1,460 @@
 import os
+import time
 import logging
-from typing import Dict, Any, List, Optional
+import hashlib
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
 import re
 import string
 
+# {{VARIABLE}} placeholders in "User Message Template" sections
+BRACE_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+# Default minimum seconds between rescans of the prompts directory
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class CompiledTemplate:
+    """
+    Template text split into literal parts and placeholder slots.
+
+    Rendering fills the slots and joins the parts, so the cost is linear in
+    the size of the output. Placeholders whose variable isn't supplied are
+    left as they are.
+    """
+
+    def __init__(self, parts: List[str], slots: List[Tuple[int, str]]):
+        """
+        Initialize the compiled template.
+
+        Args:
+            parts: Literal text, with each slot holding its placeholder text
+            slots: (index into parts, variable name) for each placeholder
+        """
+        self.parts = parts
+        self.slots = slots
+
+    @property
+    def variables(self) -> List[str]:
+        """Names of the variables the template uses, in order of appearance."""
+        return list(dict.fromkeys(name for _, name in self.slots))
+
+    @classmethod
+    def from_braces(cls, text: str) -> "CompiledTemplate":
+        """Compile text with {{VARIABLE}} placeholders."""
+        parts, slots, position = [], [], 0
+        for match in BRACE_PLACEHOLDER.finditer(text):
+            parts.append(text[position : match.start()])
+            slots.append((len(parts), match.group(1)))
+            parts.append(match.group(0))
+            position = match.end()
+        parts.append(text[position:])
+        return cls(parts, slots)
+
+    @classmethod
+    def from_dollars(cls, text: str) -> "CompiledTemplate":
+        """
+        Compile text with $variable placeholders, following the rules of
+        string.Template.safe_substitute.
+        """
+        parts, slots, position = [], [], 0
+        for match in string.Template.pattern.finditer(text):
+            parts.append(text[position : match.start()])
+            name = match.group("named") or match.group("braced")
+            if name is not None:
+                slots.append((len(parts), name))
+                parts.append(match.group(0))
+            elif match.group("escaped") is not None:
+                parts.append(string.Template.delimiter)
+            else:
+                parts.append(match.group(0))
+            position = match.end()
+        parts.append(text[position:])
+        return cls(parts, slots)
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        """
+        Render the template.
+
+        Args:
+            variables: Dictionary of variables to substitute
+
+        Returns:
+            The rendered text
+        """
+        return "".join(self._fill(variables))
+
+    def render_split(
+        self, variables: Dict[str, Any], split_after: Iterable[str]
+    ) -> Tuple[str, str]:
+        """
+        Render the template in two parts, split after the last placeholder
+        for any of the given variables.
+
+        Args:
+            variables: Dictionary of variables to substitute
+            split_after: Names of the variables to split after
+
+        Returns:
+            Tuple of (prefix, rest); the prefix is empty if none of the
+            variables is used and supplied
+        """
+        split_after = set(split_after)
+        parts = self._fill(variables)
+        split = max(
+            (
+                index + 1
+                for index, name in self.slots
+                if name in split_after and name in variables
+            ),
+            default=0,
+        )
+        return "".join(parts[:split]), "".join(parts[split:])
+
+    def _fill(self, variables: Dict[str, Any]) -> List[str]:
+        """Get the parts with each supplied variable's slot filled in."""
+        parts = list(self.parts)
+        for index, name in self.slots:
+            if name in variables:
+                parts[index] = str(variables[name])
+        return parts
+
+
+def _section(text: str, heading: str) -> Optional[str]:
+    """Get the body of a "## <heading>" section, up to the next heading."""
+    match = re.search(rf"## {heading}\s*\n(.*?)(?:\n##|\Z)", text, re.DOTALL)
+    return match.group(1) if match else None
+
+
+def parse_api_params(text: str) -> Dict[str, Any]:
+    """
+    Read the API parameters from a template's "API Parameters" section.
+
+    Args:
+        text: Template text
+
+    Returns:
+        Dictionary of temperature, max_tokens and (if given) thinking_budget,
+        provider and model
+    """
+    api_params = {"temperature": 0.7, "max_tokens": 2000}
+
+    api_params_text = _section(text, "API Parameters")
+    if api_params_text:
+        temp_match = re.search(r"Temperature: ([\d\.]+)", api_params_text)
+        if temp_match:
+            api_params["temperature"] = float(temp_match.group(1))
+
+        tokens_match = re.search(r"Max Tokens: (\d+)", api_params_text)
+        if tokens_match:
+            api_params["max_tokens"] = int(tokens_match.group(1))
+
+        thinking_match = re.search(
+            r"Thinking: Enabled \(budget: (\d+) tokens\)", api_params_text
+        )
+        if thinking_match:
+            api_params["thinking_budget"] = int(thinking_match.group(1))
+
+        # The model a step prefers; see LessonPipeline._step_model
+        provider_match = re.search(r"Provider: (\S+)", api_params_text)
+        if provider_match:
+            api_params["provider"] = provider_match.group(1).lower()
+
+        model_match = re.search(r"Model: (\S+)", api_params_text)
+        if model_match:
+            api_params["model"] = model_match.group(1)
+
+    return api_params
+
+
+class CompiledPrompt:
+    """
+    A prompt template file parsed once into its API parameters, system prompt
+    and compiled user message.
+
+    Templates with a "User Message Template" section use {{VARIABLE}}
+    placeholders and send only that section (or the part of it inside
+    <template> tags). Other templates use $variable placeholders and are sent
+    whole.
+    """
+
+    def __init__(self, name: str, text: str, stamp: Optional[Tuple] = None):
+        """
+        Parse a prompt template.
+
+        Args:
+            name: Name of the prompt template
+            text: The template text
+            stamp: (mtime, size) of the file the text was read from, if any
+        """
+        self.name = name
+        self.text = text
+        self.stamp = stamp
+        self.hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        self.api_params = parse_api_params(text)
+
+        system_prompt = _section(text, "System Prompt")
+        self.system_prompt = system_prompt.strip() if system_prompt else None
+
+        self.body = CompiledTemplate.from_dollars(text)
+        self.user_message: Optional[CompiledTemplate] = None
+        if "## User Message Template" in text:
+            template_part = re.search(r"<template>(.*?)</template>", text, re.DOTALL)
+            if template_part:
+                user_message = template_part.group(1).strip()
+            else:
+                user_message = (_section(text, "User Message Template") or "").strip()
+            if user_message:
+                self.user_message = CompiledTemplate.from_braces(user_message)
+
+    @property
+    def uses_user_message(self) -> bool:
+        """Whether the template sends a "User Message Template" section."""
+        return "## User Message Template" in self.text
+
+    def render_user_message(self, variables: Dict[str, Any]) -> str:
+        """
+        Render the message sent to the model.
+
+        Args:
+            variables: Dictionary of variables to substitute
+
+        Returns:
+            The rendered user message
+
+        Raises:
+            ValueError: If the "User Message Template" section is empty
+        """
+        return self._message_template().render(variables)
+
+    def split_user_message(
+        self, variables: Dict[str, Any], cache_variables: Iterable[str]
+    ) -> Tuple[str, str]:
+        """
+        Render the message sent to the model as a stable prefix, ending with
+        the last of the given variables, and the rest.
+
+        Args:
+            variables: Dictionary of variables to substitute
+            cache_variables: Variables holding long, stable context
+
+        Returns:
+            Tuple of (prefix, rest), which join to the full user message
+
+        Raises:
+            ValueError: If the "User Message Template" section is empty
+        """
+        return self._message_template().render_split(variables, cache_variables)
+
+    def _message_template(self) -> CompiledTemplate:
+        """Get the compiled template for the message sent to the model."""
+        if not self.uses_user_message:
+            return self.body
+        if self.user_message is None:
+            raise ValueError("Failed to extract user message from template")
+        return self.user_message
+
 
 class PromptService:
     """
     Service for managing and rendering prompt templates.
     Loads templates from files and renders them with variable substitution.
+
+    Templates are loaded on first use and parsed once into CompiledPrompt
+    objects. After that the prompts directory is rescanned at most every
+    poll_interval seconds, or continuously by a watcher thread (see
+    start_watching). Changed files are recompiled and the whole set is
+    swapped in at once, so a reader never sees a half-updated set.
+
+    Use get_prompt_service() to share one instance across the process.
     """
 
-    def __init__(self, prompts_dir: str = "prompts"):
+    def __init__(
+        self,
+        prompts_dir: str = "prompts",
+        poll_interval: Optional[float] = DEFAULT_POLL_INTERVAL,
+    ):
         """
         Initialize the prompt service.
 
         Args:
             prompts_dir: Directory containing prompt template files
+            poll_interval: Minimum seconds between rescans of the directory
+                when templates are requested (None to only rescan on
+                refresh() or from the watcher thread)
         """
         self.prompts_dir = prompts_dir
+        self.poll_interval = poll_interval
         self.logger = logging.getLogger(__name__)
-        self.templates = {}
-        self._load_templates()
+        self.compiled: Dict[str, CompiledPrompt] = {}
+        self._loaded = False
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop_watching = threading.Event()
 
-    def _load_templates(self) -> None:
-        """Load all prompt templates from the prompts directory."""
-        if not os.path.exists(self.prompts_dir):
-            self.logger.warning(f"Prompts directory {self.prompts_dir} does not exist.")
-            return
+    @property
+    def templates(self) -> Dict[str, str]:
+        """Text of every loaded prompt template, by name."""
+        self._ensure_current()
+        return {name: compiled.text for name, compiled in self.compiled.items()}
 
-        prompt_files = [f for f in os.listdir(self.prompts_dir) if f.endswith(".md")]
+    def _template_path(self, prompt_name: str) -> str:
+        """Get the path of a prompt template file."""
+        return os.path.join(self.prompts_dir, f"{prompt_name}.md")
 
-        for filename in prompt_files:
-            prompt_name = os.path.splitext(filename)[0]
-            path = os.path.join(self.prompts_dir, filename)
-            try:
-                with open(path, "r", encoding="utf-8") as file:
-                    self.templates[prompt_name] = file.read()
-                self.logger.info(f"Loaded prompt template: {prompt_name}")
-            except Exception as e:
-                self.logger.error(f"Error loading prompt template {prompt_name}: {e}")
+    @staticmethod
+    def _file_stamp(path: str) -> Optional[Tuple[int, int]]:
+        """Get a file's (mtime, size), or None if it doesn't exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """Get the (mtime, size) of every template file in the prompts directory."""
+        stamps = {}
+        with os.scandir(self.prompts_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".md") and entry.is_file():
+                    stat = entry.stat()
+                    prompt_name = os.path.splitext(entry.name)[0]
+                    stamps[prompt_name] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def _compile_file(self, prompt_name: str) -> Optional[CompiledPrompt]:
+        """Read and compile a prompt template file."""
+        path = self._template_path(prompt_name)
+        try:
+            stamp = self._file_stamp(path)
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+        except Exception as e:
+            self.logger.error(f"Error loading prompt template {prompt_name}: {e}")
+            return None
+        return CompiledPrompt(prompt_name, text, stamp)
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """
+        Rescan the prompts directory and swap in recompiled templates for any
+        files that were added, changed or removed.
+
+        Args:
+            force: Recompile every template, changed or not
+
+        Returns:
+            Names of the templates that were loaded, reloaded or removed
+        """
+        with self._lock:
+            first_load = not self._loaded
+            self._loaded = True
+            self._last_scan = time.monotonic()
+
+            if not os.path.isdir(self.prompts_dir):
+                if first_load:
+                    self.logger.warning(
+                        f"Prompts directory {self.prompts_dir} does not exist."
+                    )
+                return []
+
+            current = self.compiled
+            updated: Dict[str, CompiledPrompt] = {}
+            changed = []
+            for prompt_name, stamp in self._scan().items():
+                compiled = current.get(prompt_name)
+                if force or compiled is None or compiled.stamp != stamp:
+                    recompiled = self._compile_file(prompt_name)
+                    if recompiled is not None:
+                        compiled = recompiled
+                        changed.append(prompt_name)
+                        action = "Loaded" if first_load else "Reloaded"
+                        self.logger.info(f"{action} prompt template: {prompt_name}")
+                if compiled is not None:
+                    updated[prompt_name] = compiled
+
+            # Templates added in memory that never made it to disk are kept
+            for prompt_name, compiled in current.items():
+                if prompt_name in updated:
+                    continue
+                if compiled.stamp is None:
+                    updated[prompt_name] = compiled
+                else:
+                    changed.append(prompt_name)
+                    self.logger.info(f"Removed prompt template: {prompt_name}")
+
+            self.compiled = updated
+            return changed
+
+    def _ensure_current(self) -> None:
+        """Load the templates on first use, then poll for changes."""
+        if not self._loaded:
+            self.refresh()
+        elif (
+            self._watcher is None
+            and self.poll_interval is not None
+            and time.monotonic() - self._last_scan >= self.poll_interval
+        ):
+            self.refresh()
 
     def reload_templates(self) -> None:
         """Reload all prompt templates from disk."""
-        self.templates = {}
-        self._load_templates()
+        self.refresh(force=True)
+
+    def start_watching(self, interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """
+        Start a background thread that rescans the prompts directory, so
+        template edits are picked up without polling on each request.
+        Calling it again while the watcher is running does nothing.
+
+        Args:
+            interval: Seconds between rescans
+        """
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._stop_watching.clear()
+            self._watcher = threading.Thread(
+                target=self._watch,
+                args=(interval,),
+                name=f"prompt-watcher:{self.prompts_dir}",
+                daemon=True,
+            )
+            self._watcher.start()
+        self.logger.info(f"Watching {self.prompts_dir} for prompt template changes")
+
+    def stop_watching(self) -> None:
+        """Stop the background watcher thread, if it is running."""
+        watcher = self._watcher
+        if watcher is None:
+            return
+        self._stop_watching.set()
+        watcher.join()
+        self._watcher = None
+
+    def _watch(self, interval: float) -> None:
+        """Rescan the prompts directory until asked to stop."""
+        while not self._stop_watching.wait(interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.error(f"Error rescanning prompt templates: {e}")
+
+    def get_compiled(self, prompt_name: str) -> Optional[CompiledPrompt]:
+        """
+        Get a compiled prompt template by name.
+
+        Args:
+            prompt_name: Name of the prompt template
+
+        Returns:
+            The compiled template, or None if not found
+        """
+        self._ensure_current()
+        compiled = self.compiled.get(prompt_name)
+        if compiled is None:
+            self.logger.warning(f"Prompt template {prompt_name} not found.")
+        return compiled
 
     def get_prompt(self, prompt_name: str) -> Optional[str]:
         """
@@ -56,11 +466,8 @@ class PromptService:
         Returns:
             The prompt template text, or None if not found
         """
-        if prompt_name not in self.templates:
-            self.logger.warning(f"Prompt template {prompt_name} not found.")
-            return None
-
-        return self.templates[prompt_name]
+        compiled = self.get_compiled(prompt_name)
+        return compiled.text if compiled else None
 
     def render_prompt(
         self, prompt_name: str, variables: Dict[str, Any]
@@ -75,24 +482,11 @@ class PromptService:
         Returns:
             The rendered prompt, or None if the template is not found
         """
-        template = self.get_prompt(prompt_name)
-        if not template:
+        compiled = self.get_compiled(prompt_name)
+        if not compiled or not compiled.text:
             return None
 
-        # Convert all variables to strings
-        str_variables = {k: str(v) for k, v in variables.items()}
-
-        # Simple string template substitution
-        try:
-            # Convert the template to a string.Template
-            template_obj = string.Template(template)
-
-            # Render the template with the variables
-            rendered = template_obj.safe_substitute(str_variables)
-            return rendered
-        except Exception as e:
-            self.logger.error(f"Error rendering template {prompt_name}: {e}")
-            return template
+        return compiled.body.render(variables)
 
     def chain_prompts(
         self, prompt_names: List[str], variables: Dict[str, Any]
@@ -125,15 +519,43 @@ class PromptService:
             prompt_name: Name of the prompt template
             template_text: The template text
         """
-        self.templates[prompt_name] = template_text
+        compiled = CompiledPrompt(prompt_name, template_text)
         self.logger.info(f"Added prompt template: {prompt_name}")
 
         # Also save to disk
-        path = os.path.join(self.prompts_dir, f"{prompt_name}.md")
+        path = self._template_path(prompt_name)
         os.makedirs(os.path.dirname(path), exist_ok=True)
         try:
             with open(path, "w", encoding="utf-8") as file:
                 file.write(template_text)
+            compiled.stamp = self._file_stamp(path)
             self.logger.info(f"Saved prompt template to disk: {prompt_name}")
         except Exception as e:
             self.logger.error(f"Error saving prompt template {prompt_name}: {e}")
+
+        self._ensure_current()
+        with self._lock:
+            self.compiled = {**self.compiled, prompt_name: compiled}
+
+
+_prompt_services: Dict[str, PromptService] = {}
+_prompt_services_lock = threading.Lock()
+
+
+def get_prompt_service(prompts_dir: str = "prompts") -> PromptService:
+    """
+    Get the process-wide prompt service for a prompts directory.
+
+    Args:
+        prompts_dir: Directory containing prompt template files
+
+    Returns:
+        The shared PromptService, created (without loading anything) on first use
+    """
+    key = os.path.abspath(prompts_dir)
+    with _prompt_services_lock:
+        service = _prompt_services.get(key)
+        if service is None:
+            service = PromptService(prompts_dir)
+            _prompt_services[key] = service
+        return service
@@ -0,0 +1,480 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, AsyncIterator, Mapping, Optional, Tuple
+
+import httpx
+
+from services.telemetry import add_to_span
+
+# Default rate limits, overridable per provider with a `rate_limits` block under
+# `llm.models.<provider>` in config/app_config.yaml (and per model under
+# `rate_limits.models.<model>`). None means no limit.
+DEFAULT_RATE_LIMITS = {
+    "requests_per_minute": None,
+    "tokens_per_minute": None,
+    "max_concurrency": 16,
+    "min_concurrency": 1,
+}
+
+# Status codes that mean the provider wants us to slow down
+THROTTLE_STATUS_CODES = {429, 503, 529}
+
+# Seconds between checks while waiting for a free concurrency slot
+SLOT_POLL_INTERVAL = 0.05
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at a per-minute rate.
+
+    The bucket holds at most one minute of capacity, so an idle client can
+    burst up to its per-minute budget and is then paced at the refill rate.
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            per_minute: Tokens added per minute (also the bucket capacity)
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """Add the tokens accrued since the last update."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` tokens are available (0 if they are now).
+
+        Requests larger than the capacity only wait for a full bucket.
+        """
+        self._refill(now)
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate)
+
+    def consume(self, amount: float) -> None:
+        """Take tokens from the bucket (it may go negative for oversized requests)."""
+        self.tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """Return tokens that an estimate over-reserved."""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def sync(self, remaining: float, now: float) -> None:
+        """Trust the provider's count of remaining capacity if it is lower than ours."""
+        self._refill(now)
+        self.tokens = min(self.tokens, remaining)
+
+
+class RateLimitSlot:
+    """A single admitted request, used to report its outcome to the limiter."""
+
+    def __init__(self, limiter: "RateLimiter", estimated_tokens: int, started: float):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+        self.started = started
+        self.status_code: Optional[int] = None
+        self.used_tokens: Optional[int] = None
+
+    def record_response(self, response: httpx.Response) -> None:
+        """Record a response's status and apply its rate limit headers."""
+        self.status_code = response.status_code
+        self.limiter.update_from_headers(response.headers, response.status_code)
+
+    def record_usage(self, tokens: Optional[int]) -> None:
+        """Record the tokens the request actually used."""
+        self.used_tokens = tokens
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter for one provider and model.
+
+    Requests wait for a requests-per-minute bucket, a tokens-per-minute bucket
+    and a concurrency slot. The concurrency limit adapts with AIMD: it grows by
+    one per window of successful requests and halves when the provider
+    throttles. Provider `retry-after` and rate limit headers pause or slow
+    admission until the advertised reset time.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: Optional[str] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: int = DEFAULT_RATE_LIMITS["max_concurrency"],
+        min_concurrency: int = DEFAULT_RATE_LIMITS["min_concurrency"],
+    ):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            provider: Provider name
+            model: Model name
+            requests_per_minute: Request budget per minute (None for no limit)
+            tokens_per_minute: Token budget per minute (None for no limit)
+            max_concurrency: Upper bound on requests in flight
+            min_concurrency: Lower bound the adaptive limit can shrink to
+        """
+        self.logger = logging.getLogger(__name__)
+        self.provider = provider
+        self.model = model
+        self.request_bucket = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.concurrency = float(self.max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        # Plain lock so the limiter works across the event loops the UI creates
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency_limit(self) -> int:
+        """Current number of requests allowed in flight."""
+        return max(self.min_concurrency, int(self.concurrency))
+
+    def _try_admit(self, estimated_tokens: int) -> float:
+        """Admit the request if possible, else return seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            waits = [self.blocked_until - now]
+            if self.request_bucket is not None:
+                waits.append(self.request_bucket.wait_time(1, now))
+            if self.token_bucket is not None:
+                waits.append(self.token_bucket.wait_time(estimated_tokens, now))
+            wait = max(waits)
+            if wait > 0:
+                return wait
+            if self.in_flight >= self.concurrency_limit:
+                return SLOT_POLL_INTERVAL
+
+            if self.request_bucket is not None:
+                self.request_bucket.consume(1)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(estimated_tokens)
+            self.in_flight += 1
+            return 0.0
+
+    @asynccontextmanager
+    async def acquire(self, estimated_tokens: int = 0) -> AsyncIterator[RateLimitSlot]:
+        """
+        Wait until a request may be sent, and hold its slot while it runs.
+
+        Args:
+            estimated_tokens: Tokens the request is expected to use
+
+        Yields:
+            Slot used to report the response and actual token usage
+        """
+        queued = time.monotonic()
+        while True:
+            wait = self._try_admit(estimated_tokens)
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        add_to_span("queue_wait_seconds", time.monotonic() - queued)
+
+        slot = RateLimitSlot(self, estimated_tokens, time.monotonic())
+        try:
+            yield slot
+        finally:
+            self._release(slot)
+
+    def _release(self, slot: RateLimitSlot) -> None:
+        """Free a slot and adapt the concurrency limit to its outcome."""
+        with self._lock:
+            self.in_flight -= 1
+
+            if (
+                self.token_bucket is not None
+                and slot.used_tokens is not None
+                and slot.used_tokens < slot.estimated_tokens
+            ):
+                self.token_bucket.refund(slot.estimated_tokens - slot.used_tokens)
+
+            if slot.status_code in THROTTLE_STATUS_CODES:
+                self.throttled += 1
+                # Halve once per congestion event: requests sent before the
+                # last decrease were already accounted for by it
+                if slot.started >= self._last_decrease:
+                    self.concurrency = max(
+                        float(self.min_concurrency), self.concurrency / 2
+                    )
+                    self._last_decrease = time.monotonic()
+                    self.logger.warning(
+                        f"{self.provider} throttled ({slot.status_code}); "
+                        f"concurrency limit now {self.concurrency_limit}"
+                    )
+            elif slot.status_code is not None and slot.status_code < 400:
+                self.concurrency = min(
+                    float(self.max_concurrency),
+                    self.concurrency + 1.0 / self.concurrency,
+                )
+
+    def pause(self, seconds: float) -> None:
+        """Stop admitting requests for the given number of seconds."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def update_from_headers(
+        self, headers: Mapping[str, str], status_code: Optional[int] = None
+    ) -> None:
+        """
+        Apply `retry-after` and Anthropic/OpenAI rate limit headers.
+
+        Args:
+            headers: Response headers
+            status_code: Response status code
+        """
+        retry_after = parse_retry_after(headers.get("retry-after"))
+        if retry_after is not None and (
+            status_code is None or status_code in THROTTLE_STATUS_CODES
+        ):
+            self.logger.info(
+                f"{self.provider} asked to retry after {retry_after:.1f}s; pausing"
+            )
+            self.pause(retry_after)
+        elif status_code in THROTTLE_STATUS_CODES:
+            # Throttled without a hint: back off briefly rather than thundering back
+            self.pause(1.0)
+
+        now = time.monotonic()
+        for bucket_name, (remaining, reset_after) in parse_rate_limit_headers(
+            headers
+        ).items():
+            bucket = (
+                self.request_bucket if bucket_name == "requests" else self.token_bucket
+            )
+            if remaining is None:
+                continue
+            with self._lock:
+                if bucket is not None:
+                    bucket.sync(remaining, now)
+            if remaining <= 0 and reset_after:
+                self.pause(reset_after)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the limiter's current state."""
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+        }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a `retry-after` header given in seconds or as an HTTP date.
+
+    Returns:
+        Seconds to wait, or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_duration(value: str) -> Optional[float]:
+    """Parse an OpenAI reset duration such as `1s`, `6m0s` or `20ms` into seconds."""
+    total = 0.0
+    number = ""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char.isdigit() or char == ".":
+            number += char
+            i += 1
+            continue
+        unit = "ms" if value[i : i + 2] == "ms" else char
+        if unit not in units or not number:
+            return None
+        total += float(number) * units[unit]
+        number = ""
+        i += len(unit)
+    if number:
+        return None
+    return total
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse a reset header as an RFC 3339 timestamp (Anthropic) or duration (OpenAI)."""
+    if not value:
+        return None
+    if "T" in value:
+        try:
+            when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    return parse_duration(value)
+
+
+def _parse_number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def parse_rate_limit_headers(
+    headers: Mapping[str, str],
+) -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """
+    Read the remaining budget and reset time from rate limit headers.
+
+    Args:
+        headers: Response headers
+
+    Returns:
+        Mapping of "requests"/"tokens" to (remaining, seconds until reset) for
+        whichever of them the provider reported
+    """
+    names = {
+        "requests": [
+            (
+                "anthropic-ratelimit-requests-remaining",
+                "anthropic-ratelimit-requests-reset",
+            ),
+            ("x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+        ],
+        "tokens": [
+            (
+                "anthropic-ratelimit-tokens-remaining",
+                "anthropic-ratelimit-tokens-reset",
+            ),
+            ("x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+        ],
+    }
+
+    limits = {}
+    for bucket_name, candidates in names.items():
+        for remaining_header, reset_header in candidates:
+            remaining = _parse_number(headers.get(remaining_header))
+            if remaining is not None:
+                limits[bucket_name] = (
+                    remaining,
+                    _parse_reset(headers.get(reset_header)),
+                )
+                break
+    return limits
+
+
+def estimate_request_tokens(payload: Dict[str, Any]) -> int:
+    """
+    Estimate the tokens a request will use: its input at roughly four
+    characters per token, plus the maximum number of tokens to generate.
+
+    Args:
+        payload: JSON request payload
+
+    Returns:
+        Estimated token count
+    """
+    max_tokens = payload.get("max_tokens") or (payload.get("options") or {}).get(
+        "num_predict", 0
+    )
+    content = {k: v for k, v in payload.items() if k not in ("model", "options")}
+    return len(json.dumps(content, ensure_ascii=False)) // 4 + int(max_tokens or 0)
+
+
+def usage_tokens(result: Dict[str, Any]) -> Optional[int]:
+    """
+    Read the total tokens used from an Anthropic or OpenAI response body.
+
+    Returns:
+        Token count, or None if the response doesn't report usage
+    """
+    usage = result.get("usage") if isinstance(result, dict) else None
+    if not isinstance(usage, dict):
+        return None
+    if "total_tokens" in usage:
+        return int(usage["total_tokens"])
+    if "input_tokens" in usage or "output_tokens" in usage:
+        return int(usage.get("input_tokens", 0)) + int(usage.get("output_tokens", 0))
+    return None
+
+
+def load_rate_limit_config(
+    provider: str, model: Optional[str], llm_config: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Resolve rate limit settings for a provider and model.
+
+    Args:
+        provider: LLM provider name
+        model: Model name
+        llm_config: The `llm` section of app_config.yaml
+
+    Returns:
+        Dictionary of RateLimiter keyword arguments
+    """
+    settings = dict(DEFAULT_RATE_LIMITS)
+    if llm_config:
+        provider_config = llm_config.get("models", {}).get(provider.lower(), {})
+        rate_limits = dict(provider_config.get("rate_limits") or {})
+        model_limits = (rate_limits.pop("models", None) or {}).get(model) or {}
+        settings.update(rate_limits)
+        settings.update(model_limits)
+
+    return {k: v for k, v in settings.items() if k in DEFAULT_RATE_LIMITS}
+
+
+# Process-wide rate limiters, one per provider and model
+_rate_limiters: Dict[Tuple[str, Optional[str]], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    provider: str,
+    model: Optional[str] = None,
+    llm_config: Optional[Dict[str, Any]] = None,
+) -> RateLimiter:
+    """
+    Get the shared rate limiter for a provider and model, creating it on first use.
+
+    Args:
+        provider: LLM provider name
+        model: Model name
+        llm_config: The `llm` section of app_config.yaml (used on first creation)
+
+    Returns:
+        The RateLimiter for the provider and model
+    """
+    key = (provider.lower(), model)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(
+                key[0], model, **load_rate_limit_config(key[0], model, llm_config)
+            )
+        return _rate_limiters[key]
@@ -0,0 +1,323 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import httpx
+
+from services.rate_limiter import parse_retry_after
+
+T = TypeVar("T")
+
+# Default retry settings, overridable with `pipeline.retry` in
+# config/app_config.yaml
+DEFAULT_RETRY_CONFIG = {
+    "max_retries": 3,
+    "initial_delay_seconds": 1.0,
+    "max_delay_seconds": 60.0,
+    "deadline_seconds": 1800,
+    "hedge_percentile": None,
+    "hedge_min_samples": 20,
+}
+
+# Status codes worth retrying: timeouts, conflicts, rate limits, server
+# errors and Anthropic's "overloaded"
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+# Errors that come from the request or configuration rather than the
+# provider (bad parameters, a missing API key, a prompt over the token
+# budget), which fail the same way however often they're retried
+FATAL_ERRORS = (ValueError, TypeError, KeyError, NotImplementedError)
+
+# Latencies kept per call key for working out when to hedge
+LATENCY_WINDOW = 200
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Decide whether a failed LLM call is worth retrying.
+
+    HTTP errors are retryable for the status codes in RETRYABLE_STATUS_CODES
+    and fatal otherwise; connection problems and timeouts are retryable;
+    FATAL_ERRORS are not. Errors with a `retryable` attribute (such as a
+    BatchError from a failed message batch request) decide for themselves.
+    Anything else (such as a provider error reported mid-stream) is assumed
+    to be transient.
+
+    Args:
+        error: The exception the call raised
+
+    Returns:
+        True if the call should be retried
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    retryable = getattr(error, "retryable", None)
+    if isinstance(retryable, bool):
+        return retryable
+    return not isinstance(error, FATAL_ERRORS)
+
+
+class LatencyWindow:
+    """Recent latencies of one kind of call, for percentile estimates."""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        """
+        Initialize the window.
+
+        Args:
+            size: Number of most recent latencies kept
+        """
+        self.samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Record the latency of a successful call."""
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """
+        Get a latency percentile.
+
+        Args:
+            fraction: Percentile as a fraction, e.g. 0.95
+
+        Returns:
+            The latency at that percentile, or None with no samples
+        """
+        with self._lock:
+            ordered = sorted(self.samples)
+        if not ordered:
+            return None
+        index = min(len(ordered) - 1, int(fraction * len(ordered)))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+# Process-wide latency windows, one per call key (e.g. provider, model and step)
+_latency_windows: Dict[str, LatencyWindow] = {}
+_latency_windows_lock = threading.Lock()
+
+
+def get_latency_window(key: str) -> LatencyWindow:
+    """
+    Get the shared latency window for a call key, creating it on first use.
+
+    Args:
+        key: Identifies a kind of call whose latencies are comparable
+
+    Returns:
+        The LatencyWindow for the key
+    """
+    with _latency_windows_lock:
+        if key not in _latency_windows:
+            _latency_windows[key] = LatencyWindow()
+        return _latency_windows[key]
+
+
+class RetryPolicy:
+    """
+    Retries failed LLM calls that are worth retrying, with jittered
+    exponential backoff, within a total deadline.
+
+    Optionally hedges slow calls: once a call has run longer than a given
+    percentile of recent calls of the same kind, a duplicate is sent and
+    whichever finishes first is used, so a few slow-tail responses don't
+    hold up a whole course.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        initial_delay: float = 1.0,
+        max_delay: float = 60.0,
+        deadline: Optional[float] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            max_retries: Retries after the first attempt
+            initial_delay: Base delay in seconds before the first retry,
+                doubling with each retry
+            max_delay: Longest delay between attempts
+            deadline: Seconds after which a call is abandoned, attempts and
+                delays included (None for no deadline)
+            hedge_percentile: Latency percentile (e.g. 0.95) after which a
+                duplicate request is sent (None to never hedge)
+            hedge_min_samples: Latencies needed before hedging starts
+        """
+        self.logger = logging.getLogger(__name__)
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+
+    @classmethod
+    def from_config(cls, retry_config: Optional[Dict[str, Any]] = None):
+        """
+        Create a policy from settings.
+
+        Args:
+            retry_config: The `pipeline.retry` section of app_config.yaml
+
+        Returns:
+            The RetryPolicy
+        """
+        settings = dict(DEFAULT_RETRY_CONFIG)
+        settings.update(retry_config or {})
+        return cls(
+            max_retries=settings["max_retries"],
+            initial_delay=settings["initial_delay_seconds"],
+            max_delay=settings["max_delay_seconds"],
+            deadline=settings["deadline_seconds"],
+            hedge_percentile=settings["hedge_percentile"],
+            hedge_min_samples=settings["hedge_min_samples"],
+        )
+
+    def backoff(self, attempt: int, error: Optional[BaseException] = None) -> float:
+        """
+        Work out how long to wait before retrying.
+
+        Args:
+            attempt: Number of the attempt that failed, from 0
+            error: The error it failed with
+
+        Returns:
+            Seconds to wait: what the provider's retry-after header asked
+            for, if it sent one, and otherwise a random delay between half
+            and all of the exponential backoff
+        """
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = parse_retry_after(error.response.headers.get("retry-after"))
+            if retry_after is not None:
+                return retry_after
+        delay = min(self.max_delay, self.initial_delay * (2**attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _hedge_delay(self, latencies: Optional[LatencyWindow]) -> Optional[float]:
+        """Get how long to wait for a call before hedging it, if at all."""
+        if (
+            self.hedge_percentile is None
+            or latencies is None
+            or len(latencies) < self.hedge_min_samples
+        ):
+            return None
+        return latencies.percentile(self.hedge_percentile)
+
+    async def _attempt(
+        self,
+        call: Callable[[], Awaitable[T]],
+        latencies: Optional[LatencyWindow],
+        hedge: bool,
+    ) -> T:
+        """Make one attempt, hedged with a duplicate if it runs slow."""
+        start = time.monotonic()
+        hedge_delay = self._hedge_delay(latencies) if hedge else None
+        if hedge_delay is None:
+            result = await call()
+            if latencies is not None:
+                latencies.record(time.monotonic() - start)
+            return result
+
+        tasks = [asyncio.ensure_future(call())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self.logger.info(
+                    f"No response after {hedge_delay:.1f}s, sending a hedged request"
+                )
+                tasks.append(asyncio.ensure_future(call()))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if latencies is not None:
+                            latencies.record(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        key: Optional[str] = None,
+        hedge: bool = True,
+    ) -> T:
+        """
+        Make a call, retrying it under the policy.
+
+        Args:
+            call: Makes the call; invoked once per attempt (and per hedge)
+            key: Identifies the kind of call, for the latency percentiles
+                hedging uses (calls without a key are never hedged)
+            hedge: Allow hedged duplicate requests for this call
+
+        Returns:
+            The call's result
+
+        Raises:
+            The call's last error, once it's not worth retrying, the retries
+            are used up or the next attempt would miss the deadline
+            (asyncio.TimeoutError if the deadline passes mid-attempt)
+        """
+        latencies = get_latency_window(key) if key else None
+        start = time.monotonic()
+        attempt = 0
+
+        while True:
+            remaining = None
+            if self.deadline is not None:
+                remaining = self.deadline - (time.monotonic() - start)
+            try:
+                if remaining is None:
+                    return await self._attempt(call, latencies, hedge)
+                return await asyncio.wait_for(
+                    self._attempt(call, latencies, hedge), timeout=remaining
+                )
+            except Exception as e:
+                attempts = f"attempt {attempt + 1}/{self.max_retries + 1}"
+                if not is_retryable(e):
+                    self.logger.error(
+                        f"LLM call failed ({attempts}), not retrying: {e}"
+                    )
+                    raise
+                if attempt >= self.max_retries:
+                    self.logger.error(f"LLM call failed ({attempts}), giving up: {e}")
+                    raise
+
+                delay = self.backoff(attempt, e)
+                elapsed = time.monotonic() - start
+                if self.deadline is not None and elapsed + delay >= self.deadline:
+                    self.logger.error(
+                        f"LLM call failed ({attempts}) and the {self.deadline}s "
+                        f"deadline leaves no time to retry: {e}"
+                    )
+                    raise
+
+                self.logger.warning(
+                    f"LLM call failed ({attempts}), retrying in {delay:.1f}s: {e}"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
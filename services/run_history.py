@@ -0,0 +1,547 @@
+"""
+Queryable history of pipeline runs across all courses.
+
+Indexes the pipeline_logs.jsonl of every course directory into a SQLite
+database, so step latencies and failure rates can be queried without
+grepping the logs. Indexing is incremental: each log file is read from
+where the last refresh stopped, and rotated logs are picked up from their
+most recent compressed backup.
+
+Usage:
+    python -m services.run_history latency [--step STEP] [--since DATE]
+    python -m services.run_history failures [--course COURSE] [--since DATE]
+    python -m services.run_history errors [--limit N]
+"""
+
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import yaml
+
+LOG_FILE_NAME = "pipeline_logs.jsonl"
+HISTORY_FILE_NAME = "run_history.sqlite"
+
+# Latency percentiles reported by default
+DEFAULT_PERCENTILES = (0.5, 0.9, 0.99)
+
+# Statuses that end a step
+FINAL_STATUSES = ("success", "error")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS step_events (
+    id INTEGER PRIMARY KEY,
+    entry_hash TEXT NOT NULL UNIQUE,
+    course TEXT NOT NULL,
+    run_id TEXT,
+    lesson_id TEXT,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    message TEXT,
+    duration_seconds REAL,
+    prompt_tokens INTEGER,
+    output_tokens INTEGER,
+    cost_usd REAL,
+    provider TEXT,
+    model TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS step_events_step
+    ON step_events (step, status, timestamp);
+CREATE INDEX IF NOT EXISTS step_events_course ON step_events (course, timestamp);
+CREATE INDEX IF NOT EXISTS step_events_run ON step_events (run_id);
+CREATE TABLE IF NOT EXISTS log_files (
+    path TEXT PRIMARY KEY,
+    read_bytes INTEGER NOT NULL,
+    first_line TEXT
+);
+"""
+
+
+def percentile(ordered: Sequence[float], fraction: float) -> Optional[float]:
+    """
+    Get a percentile of sorted values (nearest rank).
+
+    Args:
+        ordered: Values in ascending order
+        fraction: Percentile as a fraction, e.g. 0.95
+
+    Returns:
+        The value at that percentile, or None with no values
+    """
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class RunHistory:
+    """
+    SQLite index of pipeline step events.
+
+    Every logged step event becomes a row keyed by a hash of its log line,
+    so reading a log twice never double counts. Events logged before the
+    log carried durations get one from the matching "starting" event.
+    """
+
+    def __init__(self, db_path: str):
+        """
+        Initialize the history, creating the database if needed.
+
+        Args:
+            db_path: Path of the SQLite database
+        """
+        self.logger = logging.getLogger(__name__)
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Indexing
+
+    def refresh(self, courses_dir: str) -> int:
+        """
+        Index new events from the logs of every course in a directory.
+
+        Args:
+            courses_dir: Directory containing the course directories
+
+        Returns:
+            Number of events added
+        """
+        added = 0
+        if not os.path.isdir(courses_dir):
+            return added
+        for name in sorted(os.listdir(courses_dir)):
+            log_path = os.path.join(courses_dir, name, LOG_FILE_NAME)
+            if os.path.isfile(log_path):
+                added += self.ingest_log(log_path, course=name)
+        return added
+
+    def ingest_log(self, log_path: str, course: Optional[str] = None) -> int:
+        """
+        Index the events of a log file written since it was last read.
+
+        Args:
+            log_path: Path of a pipeline_logs.jsonl file
+            course: Course the log belongs to (defaults to the name of the
+                log's directory)
+
+        Returns:
+            Number of events added
+        """
+        path = os.path.abspath(log_path)
+        course = course or os.path.basename(os.path.dirname(path))
+
+        with open(path, "rb") as f:
+            first_line = f.readline()
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT read_bytes, first_line FROM log_files WHERE path = ?",
+                    (path,),
+                ).fetchone()
+                offset = row["read_bytes"] if row else 0
+                rotated = row is not None and (
+                    row["first_line"] != first_line.decode("utf-8", "replace")
+                    or os.path.getsize(path) < offset
+                )
+
+                added = 0
+                if rotated:
+                    # The lines after the offset were rotated into the newest
+                    # backup before they were read
+                    added += self._ingest_backup(path, course)
+                    offset = 0
+
+                f.seek(offset)
+                data = f.read()
+                # Leave a partly written last line for the next refresh
+                complete = data[: data.rfind(b"\n") + 1]
+                added += self._insert_lines(complete.splitlines(), course)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO log_files (path, read_bytes, first_line) "
+                    "VALUES (?, ?, ?)",
+                    (
+                        path,
+                        offset + len(complete),
+                        first_line.decode("utf-8", "replace"),
+                    ),
+                )
+                self._conn.commit()
+
+        if added:
+            self.logger.info(f"Indexed {added} pipeline events from {path}")
+        return added
+
+    def _ingest_backup(self, path: str, course: str) -> int:
+        """Index the newest compressed backup of a rotated log."""
+        backup = f"{path}.1.gz"
+        if not os.path.exists(backup):
+            return 0
+        try:
+            with gzip.open(backup, "rb") as f:
+                return self._insert_lines(f.read().splitlines(), course)
+        except (OSError, EOFError) as e:
+            self.logger.warning(f"Error reading rotated log {backup}: {e}")
+            return 0
+
+    def _insert_lines(self, lines: Iterable[bytes], course: str) -> int:
+        """Insert log lines as events, skipping ones already indexed."""
+        added = 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                self.logger.warning(f"Skipping malformed log line: {line[:80]!r}")
+                continue
+            if not isinstance(entry, dict) or "step" not in entry:
+                continue
+
+            row = self._event_row(entry, course, hashlib.sha256(line).hexdigest())
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO step_events (entry_hash, course, run_id, "
+                "lesson_id, step, status, timestamp, message, duration_seconds, "
+                "prompt_tokens, output_tokens, cost_usd, provider, model, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            added += cursor.rowcount
+        return added
+
+    def _event_row(self, entry: Dict[str, Any], course: str, entry_hash: str) -> Tuple:
+        """Turn a log entry into a step_events row."""
+        usage = entry.get("token_usage") or {}
+        prompt_tokens = None
+        if usage:
+            prompt_tokens = (
+                usage.get("input_tokens", 0)
+                + usage.get("cache_creation_input_tokens", 0)
+                + usage.get("cache_read_input_tokens", 0)
+            )
+
+        status = entry.get("status", "")
+        duration = entry.get("duration_seconds")
+        if duration is None and status in FINAL_STATUSES:
+            duration = self._duration_since_start(entry, course)
+
+        error = entry.get("error")
+        if error is None and status == "error":
+            error = entry.get("message")
+
+        return (
+            entry_hash,
+            course,
+            entry.get("run_id"),
+            entry.get("lesson_id"),
+            entry["step"],
+            status,
+            entry.get("timestamp", ""),
+            entry.get("message"),
+            duration,
+            prompt_tokens,
+            usage.get("output_tokens"),
+            entry.get("cost_usd"),
+            entry.get("provider"),
+            entry.get("model"),
+            error,
+        )
+
+    def _duration_since_start(
+        self, entry: Dict[str, Any], course: str
+    ) -> Optional[float]:
+        """Work out a step's duration from its "starting" event, if indexed."""
+        row = self._conn.execute(
+            "SELECT timestamp FROM step_events WHERE course = ? AND step = ? "
+            "AND status = 'starting' AND run_id IS ? AND lesson_id IS ? "
+            "AND timestamp <= ? ORDER BY timestamp DESC LIMIT 1",
+            (
+                course,
+                entry["step"],
+                entry.get("run_id"),
+                entry.get("lesson_id"),
+                entry.get("timestamp", ""),
+            ),
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            start = datetime.fromisoformat(row["timestamp"])
+            end = datetime.fromisoformat(entry["timestamp"])
+        except (KeyError, ValueError):
+            return None
+        return (end - start).total_seconds()
+
+    # Queries
+
+    def _where(
+        self,
+        step: Optional[str] = None,
+        course: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Tuple[str, List[Any]]:
+        """Build the filter clauses shared by the queries."""
+        clauses, params = [], []
+        for column, value, operator in (
+            ("step", step, "="),
+            ("course", course, "="),
+            ("timestamp", since, ">="),
+            ("timestamp", until, "<"),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        return "".join(f" AND {clause}" for clause in clauses), params
+
+    def step_latency(
+        self,
+        step: Optional[str] = None,
+        course: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get latency percentiles of successful steps.
+
+        Args:
+            step: Only this step
+            course: Only this course
+            since: Only events at or after this ISO date or timestamp
+            until: Only events before this ISO date or timestamp
+            percentiles: Percentiles to report, as fractions
+
+        Returns:
+            Dictionary by step name with the count, mean, the requested
+            percentiles (keyed e.g. "p90") and the mean tokens and cost
+        """
+        where, params = self._where(step, course, since, until)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step, duration_seconds, prompt_tokens, output_tokens, "
+                "cost_usd FROM step_events WHERE status = 'success' "
+                f"AND duration_seconds IS NOT NULL{where} ORDER BY step",
+                params,
+            ).fetchall()
+
+        by_step: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            by_step.setdefault(row["step"], []).append(row)
+
+        latency = {}
+        for name, step_rows in by_step.items():
+            durations = sorted(row["duration_seconds"] for row in step_rows)
+            stats = {
+                "count": len(durations),
+                "mean_seconds": sum(durations) / len(durations),
+            }
+            for fraction in percentiles:
+                stats[f"p{fraction * 100:g}"] = percentile(durations, fraction)
+            for column in ("prompt_tokens", "output_tokens", "cost_usd"):
+                values = [row[column] for row in step_rows if row[column] is not None]
+                stats[f"mean_{column}"] = sum(values) / len(values) if values else None
+            latency[name] = stats
+        return latency
+
+    def failure_rates(
+        self,
+        step: Optional[str] = None,
+        course: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Get how often steps fail.
+
+        Args:
+            step: Only this step
+            course: Only this course
+            since: Only events at or after this ISO date or timestamp
+            until: Only events before this ISO date or timestamp
+
+        Returns:
+            Dictionary by step name with the number of finished runs of the
+            step, how many failed and the failure rate
+        """
+        where, params = self._where(step, course, since, until)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT step, SUM(status = 'success') AS successes, "
+                "SUM(status = 'error') AS failures FROM step_events "
+                f"WHERE status IN ('success', 'error'){where} "
+                "GROUP BY step ORDER BY step",
+                params,
+            ).fetchall()
+
+        return {
+            row["step"]: {
+                "runs": row["successes"] + row["failures"],
+                "failures": row["failures"],
+                "failure_rate": row["failures"] / (row["successes"] + row["failures"]),
+            }
+            for row in rows
+        }
+
+    def errors(
+        self,
+        step: Optional[str] = None,
+        course: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get the most recent step failures.
+
+        Args:
+            step: Only this step
+            course: Only this course
+            since: Only events at or after this ISO date or timestamp
+            until: Only events before this ISO date or timestamp
+            limit: Maximum number of failures
+
+        Returns:
+            Failures, newest first, with their course, run, lesson, step,
+            timestamp, error and message
+        """
+        where, params = self._where(step, course, since, until)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT course, run_id, lesson_id, step, timestamp, error, message "
+                f"FROM step_events WHERE status = 'error'{where} "
+                "ORDER BY timestamp DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def _load_courses_dir() -> str:
+    """Get the courses directory from the application configuration."""
+    config_path = os.path.join("config", "app_config.yaml")
+    try:
+        with open(config_path, "r") as file:
+            config = yaml.safe_load(file) or {}
+    except Exception:
+        config = {}
+    return (config.get("app") or {}).get("courses_directory", "courses")
+
+
+def _format_table(rows: Dict[str, Dict[str, Any]]) -> str:
+    """Format query results by step as a plain-text table."""
+    if not rows:
+        return "No matching events"
+    columns = list(next(iter(rows.values())))
+    table = [["step"] + columns]
+    for name, stats in rows.items():
+        table.append(
+            [name]
+            + [
+                "-" if value is None else f"{value:.3f}".rstrip("0").rstrip(".")
+                for value in (stats[column] for column in columns)
+            ]
+        )
+    widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in table
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the run-history command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m services.run_history",
+        description="Query pipeline step latencies and failures across courses.",
+    )
+    parser.add_argument(
+        "--courses-dir", help="Directory of course directories (default: config)"
+    )
+    parser.add_argument(
+        "--db", help=f"History database (default: <courses-dir>/{HISTORY_FILE_NAME})"
+    )
+    parser.add_argument(
+        "--no-refresh",
+        action="store_true",
+        help="Query the index without reading new log entries first",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    subcommands.add_parser("refresh", help="Index new log entries")
+    for name, description in (
+        ("latency", "Step latency percentiles"),
+        ("failures", "Step failure rates"),
+        ("errors", "Most recent step failures"),
+    ):
+        command = subcommands.add_parser(name, help=description)
+        command.add_argument("--step", help="Only this step")
+        command.add_argument("--course", help="Only this course")
+        command.add_argument("--since", help="Only events from this ISO date on")
+        command.add_argument("--until", help="Only events before this ISO date")
+        if name == "errors":
+            command.add_argument("--limit", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    courses_dir = args.courses_dir or _load_courses_dir()
+    db_path = args.db or os.path.join(courses_dir, HISTORY_FILE_NAME)
+
+    with RunHistory(db_path) as history:
+        if not args.no_refresh or args.command == "refresh":
+            added = history.refresh(courses_dir)
+            if args.command == "refresh":
+                print(f"Indexed {added} new events into {db_path}")
+                return 0
+
+        filters = dict(
+            step=args.step, course=args.course, since=args.since, until=args.until
+        )
+        if args.command == "latency":
+            results = history.step_latency(**filters)
+        elif args.command == "failures":
+            results = history.failure_rates(**filters)
+        else:
+            results = history.errors(**filters, limit=args.limit)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif args.command == "errors":
+        for error in results:
+            print(
+                f"{error['timestamp']}  {error['course']}  {error['lesson_id']}  "
+                f"{error['step']}: {error['error']}"
+            )
+        if not results:
+            print("No matching events")
+    else:
+        print(_format_table(results))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
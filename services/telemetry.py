@@ -0,0 +1,644 @@
+import os
+import time
+import secrets
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from services.log_sink import get_log_sink
+
+# Default telemetry settings, overridable with `pipeline.telemetry` in
+# config/app_config.yaml
+DEFAULT_TELEMETRY_CONFIG = {
+    "exporter": None,
+    "endpoint": "http://localhost:4318/v1/traces",
+    "headers": {},
+    "path": None,
+    "service_name": "course-writer",
+    "timeout_seconds": 10.0,
+}
+
+# Name of the file the otlp_file exporter writes in the course directory
+TRACE_FILE_NAME = "traces.otlp.jsonl"
+
+# Span attributes that label metrics (any others that are numbers are
+# recorded as metrics themselves)
+METRIC_LABELS = ("step", "provider", "model", "status")
+
+# Token counts from the provider usage fields, added to the active span
+TOKEN_ATTRIBUTES = (
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+)
+
+# Values kept per metric series for percentiles
+METRIC_WINDOW = 1000
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+
+class Span:
+    """
+    A timed operation, such as a pipeline step or one LLM call.
+
+    Spans nest: a span started while another is active in the same task
+    becomes its child and shares its trace. Numeric attributes accumulate
+    with add(), so a call's token counts and time spent waiting or on the
+    network can be reported from wherever they're measured.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        parent: Optional["Span"] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Start the span.
+
+        Args:
+            name: Name of the operation, e.g. "llm.call"
+            parent: The enclosing span, if any
+            kind: OTLP span kind
+            attributes: Initial attributes
+        """
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Tuple[int, str, Dict[str, Any]]] = []
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        self._start = time.monotonic()
+        self._end: Optional[float] = None
+        self._collectors = _active_collectors.get()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the span started (its duration once it has ended)."""
+        return (self._end or time.monotonic()) - self._start
+
+    def set(self, key: str, value: Any):
+        """Set an attribute."""
+        with self._lock:
+            self.attributes[key] = value
+
+    def set_default(self, key: str, value: Any):
+        """Set an attribute unless it's already set."""
+        with self._lock:
+            self.attributes.setdefault(key, value)
+
+    def add(self, key: str, value: float):
+        """Add to a numeric attribute, starting from 0."""
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def add_event(self, name: str, **attributes):
+        """Record something that happened during the span."""
+        with self._lock:
+            self.events.append((time.time_ns(), name, attributes))
+
+    def end(self, error: Optional[BaseException] = None):
+        """
+        End the span and report it to the collectors and metrics.
+
+        Args:
+            error: The error the operation failed with, if it did
+        """
+        if self._end is not None:
+            return
+        self._end = time.monotonic()
+        self.end_time_ns = self.start_time_ns + int(self.elapsed * 1e9)
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        for collector in self._collectors:
+            collector.add(self)
+        get_metrics().record_span(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Summarize the span.
+
+        Returns:
+            Dictionary with the span's name, ids, duration, attributes,
+            events and error
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_seconds": self.elapsed,
+            "attributes": dict(self.attributes),
+            "events": [
+                {"name": name, "attributes": attributes}
+                for _, name, attributes in self.events
+            ],
+            "error": self.error,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Encode the span as OTLP/JSON."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or time.time_ns()),
+            "attributes": _otlp_attributes(self.attributes),
+            "events": [
+                {
+                    "timeUnixNano": str(timestamp),
+                    "name": name,
+                    "attributes": _otlp_attributes(attributes),
+                }
+                for timestamp, name, attributes in self.events
+            ],
+            "status": (
+                {"code": STATUS_CODE_ERROR, "message": self.error}
+                if self.error
+                else {"code": STATUS_CODE_OK}
+            ),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Encode attributes as OTLP key/values, leaving out unset ones."""
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class SpanCollector:
+    """Collects the spans started while it's active (see track_spans)."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        """Add a finished span."""
+        with self._lock:
+            self.spans.append(span)
+
+
+# The span that spans started in the current context become children of,
+# and the collectors they report to. Tasks inherit both, so spans started by
+# a pipeline's concurrent steps nest under the pipeline's span.
+_current_span: ContextVar[Optional[Span]] = ContextVar("telemetry_span", default=None)
+_active_collectors: ContextVar[Tuple[SpanCollector, ...]] = ContextVar(
+    "telemetry_collectors", default=()
+)
+
+
+def current_span() -> Optional[Span]:
+    """Get the active span, if any."""
+    return _current_span.get()
+
+
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Span:
+    """
+    Start a span without making it the active one.
+
+    Use in async generators, which can't safely change the active span
+    across a yield; end it with span.end().
+
+    Args:
+        name: Name of the operation
+        kind: OTLP span kind
+        **attributes: Initial attributes
+
+    Returns:
+        The started span, a child of the active span if there is one
+    """
+    return Span(name, current_span(), kind, attributes)
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes) -> Iterator[Span]:
+    """
+    Time the block as a span, the active span inside it.
+
+    Args:
+        name: Name of the operation
+        kind: OTLP span kind
+        **attributes: Initial attributes
+
+    Yields:
+        The span, ended (with any error the block raised) on exit
+    """
+    current = start_span(name, kind, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+@contextmanager
+def track_spans() -> Iterator[SpanCollector]:
+    """
+    Collect every span started inside the block, once it ends.
+
+    Yields:
+        The collector for the block
+    """
+    collector = SpanCollector()
+    token = _active_collectors.set(_active_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        _active_collectors.reset(token)
+
+
+def add_to_span(key: str, value: float):
+    """
+    Add to a numeric attribute of the active span, if there is one.
+
+    Args:
+        key: Attribute, e.g. "network_seconds"
+        value: Amount to add
+    """
+    active = current_span()
+    if active is not None:
+        active.add(key, value)
+
+
+def record_span_usage(usage: Dict[str, Any]):
+    """
+    Add the token counts of a provider usage block to the active span.
+
+    Args:
+        usage: Usage block from a provider response
+    """
+    active = current_span()
+    if active is None:
+        return
+    for field in TOKEN_ATTRIBUTES:
+        if usage.get(field):
+            active.add(field, usage[field])
+
+
+class MetricsRegistry:
+    """
+    In-process metrics derived from finished spans.
+
+    Every span records its duration, and each of its numeric attributes,
+    as a distribution labelled by its step, provider, model and status.
+    """
+
+    def __init__(self, window: int = METRIC_WINDOW):
+        """
+        Initialize the registry.
+
+        Args:
+            window: Most recent values kept per series for percentiles
+        """
+        self.window = window
+        self._series: Dict[Tuple[str, Tuple], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value: float, **labels):
+        """
+        Record a value of a metric.
+
+        Args:
+            name: Metric name, e.g. "llm.call.duration_seconds"
+            value: The value
+            **labels: Labels of the series the value belongs to
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"count": 0, "sum": 0.0, "values": deque(maxlen=self.window)}
+                self._series[key] = series
+            series["count"] += 1
+            series["sum"] += value
+            series["values"].append(value)
+
+    def record_span(self, finished: Span):
+        """Record a finished span's duration and numeric attributes."""
+        labels = {
+            label: finished.attributes[label]
+            for label in METRIC_LABELS
+            if isinstance(finished.attributes.get(label), str)
+        }
+        labels["status"] = "error" if finished.error else labels.get("status", "ok")
+        self.record(f"{finished.name}.duration_seconds", finished.elapsed, **labels)
+        for key, value in finished.attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.record(f"{finished.name}.{key}", value, **labels)
+
+    def snapshot(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Summarize the recorded metrics.
+
+        Args:
+            name: Only this metric
+
+        Returns:
+            One entry per series with its name, labels, count, sum, mean and
+            p50/p95/p99 of its most recent values
+        """
+        with self._lock:
+            items = [
+                (key, dict(series), sorted(series["values"]))
+                for key, series in self._series.items()
+                if name is None or key[0] == name
+            ]
+
+        snapshot = []
+        for (metric, labels), series, ordered in sorted(items, key=lambda i: i[0]):
+            entry = {
+                "name": metric,
+                "labels": dict(labels),
+                "count": series["count"],
+                "sum": series["sum"],
+                "mean": series["sum"] / series["count"],
+            }
+            for fraction in (0.5, 0.95, 0.99):
+                index = min(len(ordered) - 1, int(fraction * len(ordered)))
+                entry[f"p{int(fraction * 100)}"] = ordered[index]
+            snapshot.append(entry)
+        return snapshot
+
+    def clear(self):
+        """Forget every recorded value."""
+        with self._lock:
+            self._series.clear()
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get the process-wide metrics registry."""
+    return _metrics
+
+
+def summarize_spans(spans: List[Span]) -> Dict[str, Any]:
+    """
+    Summarize where a pipeline run's time went.
+
+    Args:
+        spans: The run's finished spans
+
+    Returns:
+        Dictionary with the run's total duration and, per step, its
+        duration, LLM calls and attempts, time waiting for a slot and on the
+        network, time to first token and tokens used
+    """
+    children: Dict[str, List[Span]] = {}
+    for finished in spans:
+        if finished.parent_id:
+            children.setdefault(finished.parent_id, []).append(finished)
+
+    def descendants(parent: Span) -> Iterator[Span]:
+        for child in children.get(parent.span_id, []):
+            yield child
+            yield from descendants(child)
+
+    steps: Dict[str, Dict[str, Any]] = {}
+    for finished in spans:
+        if finished.name != "pipeline.step":
+            continue
+        below = list(descendants(finished))
+        calls = [s for s in below if s.name == "llm.call"]
+        attempts = [s for s in below if s.name == "llm.attempt"]
+        first_tokens = [
+            s.attributes["time_to_first_token_seconds"]
+            for s in attempts
+            if "time_to_first_token_seconds" in s.attributes
+        ]
+        summary = {
+            "status": finished.attributes.get(
+                "status", "error" if finished.error else "ok"
+            ),
+            "duration_seconds": finished.elapsed,
+            "llm_calls": len(calls),
+            "attempts": len(attempts),
+            "retries": len(attempts) - len(calls),
+            "llm_seconds": sum(s.elapsed for s in calls),
+            "queue_wait_seconds": sum(
+                s.attributes.get("queue_wait_seconds", 0) for s in attempts
+            ),
+            "network_seconds": sum(
+                s.attributes.get("network_seconds", 0) for s in attempts
+            ),
+            "time_to_first_token_seconds": min(first_tokens) if first_tokens else None,
+        }
+        for field in TOKEN_ATTRIBUTES:
+            summary[field] = sum(s.attributes.get(field, 0) for s in attempts)
+        if "cost_usd" in finished.attributes:
+            summary["cost_usd"] = finished.attributes["cost_usd"]
+        steps[finished.attributes.get("step", finished.name)] = summary
+
+    runs = [s for s in spans if s.name == "pipeline.run"]
+    return {
+        "trace_id": runs[0].trace_id if runs else None,
+        "duration_seconds": runs[0].elapsed if runs else None,
+        "spans": len(spans),
+        "steps": steps,
+    }
+
+
+class SpanExporter:
+    """Sends finished spans somewhere, in the OTLP/JSON trace format."""
+
+    def __init__(self, service_name: str = "course-writer"):
+        """
+        Initialize the exporter.
+
+        Args:
+            service_name: The service.name resource attribute
+        """
+        self.logger = logging.getLogger(__name__)
+        self.service_name = service_name
+
+    def encode(self, spans: List[Span]) -> Dict[str, Any]:
+        """
+        Encode spans as an OTLP ExportTraceServiceRequest.
+
+        Args:
+            spans: Finished spans
+
+        Returns:
+            The request, as JSON-serializable data
+        """
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [s.to_otlp() for s in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    async def export(self, spans: List[Span]) -> bool:
+        """
+        Export spans; errors are logged rather than raised.
+
+        Args:
+            spans: Finished spans
+
+        Returns:
+            True if the spans were exported
+        """
+        raise NotImplementedError
+
+
+class OTLPHTTPExporter(SpanExporter):
+    """Posts spans to an OpenTelemetry collector's OTLP/HTTP endpoint."""
+
+    def __init__(
+        self,
+        endpoint: str = DEFAULT_TELEMETRY_CONFIG["endpoint"],
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 10.0,
+        service_name: str = "course-writer",
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Initialize the exporter.
+
+        Args:
+            endpoint: OTLP/HTTP traces URL, e.g. http://localhost:4318/v1/traces
+            headers: Extra request headers, e.g. for authentication
+            timeout: Seconds to wait for the collector
+            service_name: The service.name resource attribute
+            transport: Custom httpx transport (used by tests to mock responses)
+        """
+        super().__init__(service_name)
+        self.endpoint = endpoint
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self._transport = transport
+
+    async def export(self, spans: List[Span]) -> bool:
+        """Post the spans to the collector."""
+        if not spans:
+            return True
+        try:
+            async with httpx.AsyncClient(
+                timeout=self.timeout, transport=self._transport
+            ) as client:
+                response = await client.post(
+                    self.endpoint, json=self.encode(spans), headers=self.headers
+                )
+                response.raise_for_status()
+            return True
+        except Exception as e:
+            self.logger.warning(f"Error exporting spans to {self.endpoint}: {e}")
+            return False
+
+
+class OTLPFileExporter(SpanExporter):
+    """
+    Appends spans to a file as OTLP/JSON lines, the format the OpenTelemetry
+    collector's `otlpjsonfile` receiver reads.
+    """
+
+    def __init__(self, path: str, service_name: str = "course-writer"):
+        """
+        Initialize the exporter.
+
+        Args:
+            path: File to append to (written through its shared log sink)
+            service_name: The service.name resource attribute
+        """
+        super().__init__(service_name)
+        self.path = path
+
+    async def export(self, spans: List[Span]) -> bool:
+        """Append the spans to the file."""
+        if not spans:
+            return True
+        sink = get_log_sink(self.path)
+        sink.write(self.encode(spans))
+        return await asyncio.to_thread(sink.flush)
+
+
+def create_span_exporter(
+    telemetry_config: Optional[Dict[str, Any]] = None,
+    course_dir: Optional[str] = None,
+) -> Optional[SpanExporter]:
+    """
+    Create the exporter configured for a pipeline.
+
+    Args:
+        telemetry_config: The `pipeline.telemetry` section of app_config.yaml
+        course_dir: Course directory, where the otlp_file exporter writes by
+            default
+
+    Returns:
+        The exporter, or None if spans aren't exported
+
+    Raises:
+        ValueError: If the configured exporter is unknown
+    """
+    settings = dict(DEFAULT_TELEMETRY_CONFIG)
+    settings.update(telemetry_config or {})
+    exporter = settings["exporter"]
+    if not exporter:
+        return None
+    if exporter == "otlp_http":
+        return OTLPHTTPExporter(
+            endpoint=settings["endpoint"],
+            headers=settings["headers"],
+            timeout=settings["timeout_seconds"],
+            service_name=settings["service_name"],
+        )
+    if exporter == "otlp_file":
+        path = settings["path"] or os.path.join(course_dir or ".", TRACE_FILE_NAME)
+        return OTLPFileExporter(path, service_name=settings["service_name"])
+    raise ValueError(f"Unknown telemetry exporter: {exporter}")
@@ -0,0 +1,188 @@
+import re
+import math
+import importlib.util
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+# Context window and maximum output tokens by model name prefix (the longest
+# matching prefix wins), overridable with a `token_limits` block under
+# `llm.models.<provider>` in config/app_config.yaml
+MODEL_TOKEN_LIMITS = {
+    "claude-opus-4": (200000, 32000),
+    "claude-sonnet-4": (200000, 64000),
+    "claude-3-7-sonnet": (200000, 64000),
+    "claude-3-5-sonnet": (200000, 8192),
+    "claude-3.5-sonnet": (200000, 8192),
+    "claude-3-5-haiku": (200000, 8192),
+    "claude-3.5-haiku": (200000, 8192),
+    "claude-3-opus": (200000, 4096),
+    "claude-3-sonnet": (200000, 4096),
+    "claude-3-haiku": (200000, 4096),
+    "claude-2": (100000, 4096),
+    "gpt-4o": (128000, 16384),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4": (8192, 8192),
+    "gpt-3.5-turbo": (16385, 4096),
+}
+
+# Limits for models not in the table, such as local models (whose context
+# depends on how the server loaded them)
+DEFAULT_TOKEN_LIMITS = (8192, 4096)
+
+# Tokens kept free of the context window, for the message framing the
+# estimates don't see
+SAFETY_MARGIN_TOKENS = 256
+
+# Least room for output a request may be left with before it's refused
+MIN_OUTPUT_TOKENS = 1024
+
+# Share of the context window above which the provider is asked for an
+# exact count, where it can give one
+EXACT_COUNT_THRESHOLD = 0.9
+
+
+class TokenBudgetError(ValueError):
+    """A prompt leaves too little of the model's context window for the output."""
+
+
+class TokenLimits:
+    """Token limits of a model."""
+
+    def __init__(self, context_window: int, max_output_tokens: int):
+        """
+        Initialize the limits.
+
+        Args:
+            context_window: Tokens the model can attend to, prompt and output together
+            max_output_tokens: Most tokens the model generates in one response
+        """
+        self.context_window = int(context_window)
+        self.max_output_tokens = int(max_output_tokens)
+
+    def plan_max_tokens(
+        self, prompt_tokens: int, requested: int, min_output: Optional[int] = None
+    ) -> int:
+        """
+        Work out the max_tokens to request, given the prompt's size.
+
+        Args:
+            prompt_tokens: Tokens in the prompt (system prompt included)
+            requested: max_tokens the caller asked for
+            min_output: Least acceptable room for output (defaults to the
+                smaller of requested and MIN_OUTPUT_TOKENS)
+
+        Returns:
+            The requested max_tokens, reduced to what the model can generate
+            and what fits in the context window after the prompt
+
+        Raises:
+            TokenBudgetError: If the prompt leaves less than min_output tokens
+        """
+        if min_output is None:
+            min_output = min(requested, MIN_OUTPUT_TOKENS)
+
+        available = self.context_window - prompt_tokens - SAFETY_MARGIN_TOKENS
+        if available < min_output:
+            raise TokenBudgetError(
+                f"Prompt of ~{prompt_tokens} tokens leaves {max(available, 0)} of "
+                f"the {self.context_window}-token context window for output "
+                f"(at least {min_output} needed)"
+            )
+        return min(requested, self.max_output_tokens, available)
+
+
+def load_token_limits(
+    provider: str, model: Optional[str], llm_config: Optional[Dict[str, Any]] = None
+) -> Tuple[int, int]:
+    """
+    Resolve the context window and maximum output tokens for a model.
+
+    Args:
+        provider: LLM provider name
+        model: Model name
+        llm_config: The `llm` section of app_config.yaml
+
+    Returns:
+        Tuple of (context window, maximum output tokens)
+    """
+    context_window, max_output = DEFAULT_TOKEN_LIMITS
+    matches = [
+        prefix for prefix in MODEL_TOKEN_LIMITS if (model or "").startswith(prefix)
+    ]
+    if matches:
+        context_window, max_output = MODEL_TOKEN_LIMITS[max(matches, key=len)]
+
+    if llm_config:
+        provider_config = llm_config.get("models", {}).get(provider.lower(), {})
+        token_limits = dict(provider_config.get("token_limits") or {})
+        model_limits = (token_limits.pop("models", None) or {}).get(model) or {}
+        token_limits.update(model_limits)
+        context_window = token_limits.get("context_window", context_window)
+        max_output = token_limits.get("max_output_tokens", max_output)
+
+    return context_window, max_output
+
+
+def get_token_limits(
+    provider: str, model: Optional[str], llm_config: Optional[Dict[str, Any]] = None
+) -> TokenLimits:
+    """
+    Get the token limits for a provider and model.
+
+    Args:
+        provider: LLM provider name
+        model: Model name
+        llm_config: The `llm` section of app_config.yaml
+
+    Returns:
+        The model's TokenLimits
+    """
+    return TokenLimits(*load_token_limits(provider, model, llm_config))
+
+
+# Words, runs of digits and single punctuation marks; each is roughly one
+# token per four characters
+_TOKEN_PIECE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """Get the tiktoken encoder, if the optional package is installed."""
+    global _encoder, _encoder_loaded
+    with _encoder_lock:
+        if not _encoder_loaded:
+            _encoder_loaded = True
+            if importlib.util.find_spec("tiktoken") is not None:
+                try:
+                    import tiktoken
+
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception:
+                    # The encoding is downloaded on first use, which can fail
+                    _encoder = None
+        return _encoder
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Estimate the number of tokens in a text without calling a provider.
+
+    Uses tiktoken's cl100k encoding when the optional package is installed,
+    and otherwise counts words, numbers and punctuation at roughly four
+    characters per token, which errs on the high side for English and code.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Approximate token count
+    """
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PIECE.findall(text))
@@ -3,11 +3,28 @@ Configuration file for pytest containing shared fixtures and setup/teardown func
 """
 
 import os
+import json
+import httpx
 import pytest
 import yaml
 from unittest.mock import MagicMock
 
+from services.anthropic_service import AnthropicLLMService
+from services.http_transport import HTTPTransport
 from services.llm_service import LLMService
+from services.llm_service_registry import get_service_registry
+
+
+@pytest.fixture(autouse=True)
+def reset_llm_service_registry():
+    """
+    Fixture that clears the process-wide LLM service registry around each test.
+
+    Prevents services (or mocks) created by one test from being reused by another.
+    """
+    get_service_registry().clear()
+    yield
+    get_service_registry().clear()
 
 
 @pytest.fixture
@@ -36,12 +53,175 @@ def mock_llm_service():
     return mock_service
 
 
+class FakeBatchServer:
+    """
+    In-memory stand-in for the Anthropic Message Batches API.
+
+    A batch ends on its `polls`-th status check (never, if `polls` is None).
+    Each request succeeds with `reply`, unless its user message contains
+    `fail_marker`, in which case it comes back errored.
+    """
+
+    def __init__(self, reply="LO 1: Mock learning outcome", polls=1, fail_marker=None):
+        self.reply = reply
+        self.polls = polls
+        self.fail_marker = fail_marker
+        self.batches = {}
+        self.cancelled = []
+
+    def service(self) -> AnthropicLLMService:
+        """Create an Anthropic service whose requests go to this server."""
+        transport = HTTPTransport(
+            "anthropic", transport=httpx.MockTransport(self.handle)
+        )
+        return AnthropicLLMService(api_key="test_key", transport=transport)
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """Answer one HTTP request."""
+        parts = request.url.path.rstrip("/").split("/")
+        if request.method == "POST" and parts[-1] == "batches":
+            batch_id = f"msgbatch_{len(self.batches) + 1:02d}"
+            self.batches[batch_id] = {
+                "requests": json.loads(request.content)["requests"],
+                "checks": 0,
+                "status": "in_progress",
+            }
+            return httpx.Response(200, json=self._batch(batch_id))
+        if parts[-1] == "cancel":
+            self.cancelled.append(parts[-2])
+            self.batches[parts[-2]]["status"] = "canceling"
+            return httpx.Response(200, json=self._batch(parts[-2]))
+        if parts[-1] == "results":
+            lines = [
+                json.dumps(
+                    {"custom_id": entry["custom_id"], "result": self._result(entry)}
+                )
+                for entry in self.batches[parts[-2]]["requests"]
+            ]
+            return httpx.Response(200, text="\n".join(lines))
+
+        batch = self.batches[parts[-1]]
+        batch["checks"] += 1
+        if self.polls is not None and batch["checks"] >= self.polls:
+            batch["status"] = "ended"
+        return httpx.Response(200, json=self._batch(parts[-1]))
+
+    def _batch(self, batch_id):
+        """Build the batch object returned for a batch."""
+        status = self.batches[batch_id]["status"]
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": status,
+            "results_url": (
+                f"https://api.anthropic.com/v1/messages/batches/{batch_id}/results"
+                if status == "ended"
+                else None
+            ),
+        }
+
+    def _result(self, entry):
+        """Build the result of one batch request."""
+        content = entry["params"]["messages"][0]["content"]
+        if isinstance(content, list):
+            content = "".join(block["text"] for block in content)
+        if self.fail_marker and self.fail_marker in content:
+            return {
+                "type": "errored",
+                "error": {
+                    "type": "error",
+                    "error": {"type": "invalid_request_error", "message": "bad"},
+                },
+            }
+        return {
+            "type": "succeeded",
+            "message": {
+                "type": "message",
+                "content": [{"type": "text", "text": self.reply}],
+                "usage": {"input_tokens": 10, "output_tokens": 5},
+            },
+        }
+
+
+@pytest.fixture
+def fake_batch_server():
+    """
+    Fixture that provides a fake Message Batches server.
+
+    Create a service talking to it with `fake_batch_server.service()`.
+    """
+    return FakeBatchServer()
+
+
+class RecordingTransport:
+    """
+    Builds HTTPTransports whose requests go to an httpx.MockTransport.
+
+    Every request sent through a transport it built is kept in `requests`.
+    A transport answers with `responses`: a handler called with each request,
+    a list of bodies answered in turn (the last one repeating), or a single
+    body. A body is an httpx.Response, a dict sent as JSON, or text.
+    """
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, provider, responses, status_code=200) -> HTTPTransport:
+        """Create a transport for a provider that answers with responses."""
+        if not isinstance(responses, list) and not callable(responses):
+            responses = [responses]
+        answered = []
+
+        def handle(request):
+            self.requests.append(request)
+            if callable(responses):
+                return responses(request)
+            body = responses[min(len(answered), len(responses) - 1)]
+            answered.append(request)
+            if isinstance(body, httpx.Response):
+                return body
+            if isinstance(body, str):
+                return httpx.Response(status_code, text=body)
+            return httpx.Response(status_code, json=body)
+
+        return HTTPTransport(provider, transport=httpx.MockTransport(handle))
+
+    @property
+    def payloads(self):
+        """The JSON bodies of the recorded requests (None for those without)."""
+        return [
+            json.loads(request.content) if request.content else None
+            for request in self.requests
+        ]
+
+
+@pytest.fixture
+def recording_transport():
+    """
+    Fixture that builds mock HTTP transports recording their requests.
+
+    Create one with `recording_transport(provider, responses)` and inspect
+    what was sent with `recording_transport.requests` or `.payloads`.
+    """
+    return RecordingTransport()
+
+
 @pytest.fixture
 def test_course_dir():
     """
     Fixture that provides a path to a test course directory.
+
+    Pipeline run manifests written during the test are removed afterwards, so
+    later runs don't resume from them.
     """
-    return os.path.join("courses", "test_course_fixed")
+    course_dir = os.path.join("courses", "test_course_fixed")
+    yield course_dir
+
+    lessons_dir = os.path.join(course_dir, "lessons")
+    if os.path.isdir(lessons_dir):
+        for filename in os.listdir(lessons_dir):
+            if filename.endswith("_manifest.json"):
+                os.remove(os.path.join(lessons_dir, filename))
 
 
 @pytest.fixture
@@ -0,0 +1,155 @@
+"""
+Integration tests for the offline benchmark and its fake LLM server.
+"""
+
+import json
+import pytest
+import httpx
+
+from benchmarks.fake_llm_server import FakeLLMBehavior, FakeLLMServer
+from benchmarks.pipeline_benchmark import (
+    compare_to_baseline,
+    main,
+    make_service,
+    run_benchmark,
+)
+
+
+@pytest.fixture
+def server():
+    """A running fake LLM server with no delay."""
+    with FakeLLMServer(FakeLLMBehavior(latency=0.0)) as server:
+        yield server
+
+
+class TestFakeLLMServer:
+    """Tests for FakeLLMServer speaking each provider's API."""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("provider", ["anthropic", "openai", "ollama", "lmstudio"])
+    async def test_services_generate_and_stream(self, server, provider):
+        """Test that every LLM service works unchanged against the server."""
+        service = make_service(provider, server.url)
+        try:
+            text = await service.generate_text("Write outcomes", max_tokens=50)
+            chunks = [
+                chunk
+                async for chunk in service.stream_text("Write outcomes", max_tokens=50)
+            ]
+        finally:
+            await service.transport.aclose()
+
+        assert text.startswith("# Lesson: Benchmark")
+        assert "".join(chunks) == text
+        assert len(chunks) > 1
+        assert server.stats["completions"] == 2
+
+    def test_injected_rate_limit(self):
+        """Test that rate limited requests get a 429 with retry-after."""
+        behavior = FakeLLMBehavior(latency=0.0, rate_limit_rate=1.0, retry_after=2)
+        with FakeLLMServer(behavior) as server:
+            response = httpx.post(
+                f"{server.url}/v1/chat/completions",
+                json={"model": "gpt-4o", "messages": []},
+            )
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "2"
+        assert server.stats["rate_limited"] == 1
+        assert "completions" not in server.stats
+
+    def test_failures_are_deterministic(self):
+        """Test that the same seed fails the same requests."""
+        outcomes = []
+        for _ in range(2):
+            behavior = FakeLLMBehavior(latency=0.0, error_rate=0.5, seed=7)
+            with FakeLLMServer(behavior) as server:
+                outcomes.append(
+                    [
+                        httpx.post(
+                            f"{server.url}/v1/messages", json={"max_tokens": 10}
+                        ).status_code
+                        for _ in range(10)
+                    ]
+                )
+
+        assert outcomes[0] == outcomes[1]
+        assert set(outcomes[0]) == {200, 529}
+
+
+@pytest.mark.asyncio
+async def test_course_benchmark_report():
+    """Test a course-wide benchmark through the fake server."""
+    report = await run_benchmark(
+        scenario="course",
+        provider="ollama",
+        lessons=2,
+        concurrency=2,
+        behavior=FakeLLMBehavior(latency=0.01, rate_limit_rate=0.3, retry_after=0),
+    )
+
+    assert report["lessons_succeeded"] == 2
+    assert report["throughput"]["lessons_per_minute"] > 0
+    assert report["lesson_latency"]["p95_seconds"] >= 0.01
+    assert report["server"]["rate_limited"] > 0
+
+    steps = report["steps"]
+    assert steps["expanded_draft"]["count"] == 2
+    assert sum(step["retries"] for step in steps.values()) > 0
+    for step in steps.values():
+        assert 0 <= step["overhead_p50_seconds"] <= step["p50_seconds"]
+
+
+@pytest.mark.asyncio
+async def test_draft_benchmark_stops_at_expanded_draft():
+    """Test that the draft scenario runs DraftPipeline up to the expanded draft."""
+    report = await run_benchmark(
+        scenario="draft",
+        provider="lmstudio",
+        lessons=1,
+        behavior=FakeLLMBehavior(latency=0.0),
+    )
+
+    assert report["lessons_succeeded"] == 1
+    assert "expanded_draft" in report["steps"]
+    assert "quiz_multiple_choice" not in report["steps"]
+
+
+def test_regressions_against_baseline(tmp_path, capsys):
+    """Test that slower steps and lower throughput fail the comparison."""
+    baseline = {
+        "throughput": {"lessons_per_minute": 100.0},
+        "lesson_latency": {"p50_seconds": 1.0, "p95_seconds": 2.0},
+        "steps": {"rough_draft": {"p95_seconds": 0.5, "overhead_p95_seconds": 0.1}},
+    }
+    report = json.loads(json.dumps(baseline))
+    report["steps"]["rough_draft"]["p95_seconds"] = 0.51
+    assert compare_to_baseline(report, baseline) == []
+
+    report["throughput"]["lessons_per_minute"] = 50.0
+    report["steps"]["rough_draft"]["overhead_p95_seconds"] = 0.4
+    regressions = compare_to_baseline(report, baseline)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("lessons_per_minute")
+
+    # A baseline the current run can't match fails the command line run
+    slow_baseline = tmp_path / "baseline.json"
+    slow_baseline.write_text(
+        json.dumps({**baseline, "throughput": {"lessons_per_minute": 1e9}})
+    )
+    status = main(
+        [
+            "--scenario",
+            "draft",
+            "--provider",
+            "openai",
+            "--lessons",
+            "1",
+            "--latency",
+            "0",
+            "--baseline",
+            str(slow_baseline),
+        ]
+    )
+    assert status == 1
+    assert "Regression: lessons_per_minute" in capsys.readouterr().err
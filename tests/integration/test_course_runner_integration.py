@@ -0,0 +1,306 @@
+"""
+Integration tests for the CourseGenerationRunner.
+"""
+
+import asyncio
+import os
+import pytest
+import httpx
+from unittest.mock import patch, MagicMock
+
+from models.course import Course, LLMConfig
+from models.lesson import Lesson
+from services.course_runner import CourseGenerationRunner
+from services.file_service import FileService
+from services.llm_service import LLMService
+
+
+@pytest.fixture
+def course_with_lessons(tmp_path):
+    """Fixture that creates a course directory with three lessons."""
+    file_service = FileService()
+    course_dir = str(tmp_path / "course")
+    os.makedirs(os.path.join(course_dir, "lessons"))
+
+    course = Course(
+        title="Generative AI for Developers",
+        description="A test course",
+        target_audience="Software developers",
+        author="Tester",
+        skill_level="Intermediate",
+        llm_config=LLMConfig(provider="ollama", model="gemma3:12b"),
+    )
+    file_service.save_course_config(course, course_dir)
+
+    for number in range(1, 4):
+        lesson = Lesson(
+            number=number,
+            title=f"Lesson {number}",
+            learning_outcomes=[f"Understand topic {number}"],
+            objective=f"Objective {number}",
+        )
+        file_service.save_lesson(lesson, course_dir)
+
+    return course_dir
+
+
+def make_slow_service(tracker, delay=0.05):
+    """Build a mock LLM service that records how many calls overlap."""
+    service = MagicMock(spec=LLMService)
+
+    async def generate(*args, **kwargs):
+        tracker["active"] += 1
+        tracker["peak"] = max(tracker["peak"], tracker["active"])
+        await asyncio.sleep(delay)
+        tracker["active"] -= 1
+        return "LO 1: Mock learning outcome"
+
+    service.generate_text.side_effect = generate
+    service.generate_with_context.side_effect = generate
+    return service
+
+
+@pytest.mark.asyncio
+async def test_runner_generates_all_lessons(course_with_lessons):
+    """Test that every lesson is generated and its metadata updated."""
+    tracker = {"active": 0, "peak": 0}
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=make_slow_service(tracker),
+    ):
+        runner = CourseGenerationRunner(
+            course_with_lessons,
+            max_concurrency=3,
+            provider_limits={"ollama": 3},
+            use_cache=False,
+        )
+        updates = []
+        runner.set_progress_callback(
+            lambda lesson_id, step, status, message: updates.append((lesson_id, status))
+        )
+
+        result = await runner.run()
+
+    assert result["status"] == "success"
+    assert result["succeeded"] == 3
+    assert sorted(result["lessons"]) == ["lesson_01", "lesson_02", "lesson_03"]
+    assert {lesson_id for lesson_id, _ in updates} == set(result["lessons"])
+    assert result["steps"]["rough_draft"]["lessons"] == 3
+    assert result["steps"]["rough_draft"]["models"] == ["ollama/gemma3:12b"]
+    assert result["cost_usd"] == 0.0
+
+    # Lessons ran side by side rather than one after another
+    assert tracker["peak"] > 1
+
+    for lesson in runner.load_lessons():
+        assert lesson.has_expanded_draft
+        assert os.path.exists(
+            os.path.join(
+                course_with_lessons,
+                "lessons",
+                f"lesson_{lesson.number:02d}_expanded_draft.md",
+            )
+        )
+
+
+@pytest.mark.asyncio
+async def test_runner_respects_provider_limit(course_with_lessons):
+    """Test that LLM calls never exceed the provider's concurrency limit."""
+    tracker = {"active": 0, "peak": 0}
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=make_slow_service(tracker, delay=0.01),
+    ):
+        runner = CourseGenerationRunner(
+            course_with_lessons,
+            max_concurrency=3,
+            provider_limits={"ollama": 1},
+            use_cache=False,
+        )
+        result = await runner.run()
+
+    assert result["status"] == "success"
+    assert tracker["peak"] == 1
+
+
+@pytest.mark.asyncio
+async def test_runner_limits_each_step_provider(course_with_lessons):
+    """Test that steps sent to another provider get that provider's limit."""
+    file_service = FileService()
+    config_path = os.path.join(course_with_lessons, "course_config.yaml")
+    course = file_service.load_course_config(config_path)
+    course.llm_config = LLMConfig(provider="anthropic", model="claude-3-7-sonnet")
+    course.step_llm_configs = {
+        "rough_draft": LLMConfig(provider="ollama", model="gemma3:12b")
+    }
+    file_service.save_course_config(course, course_with_lessons)
+
+    trackers = {
+        provider: {"active": 0, "peak": 0} for provider in ("anthropic", "ollama")
+    }
+    services = {
+        provider: make_slow_service(tracker) for provider, tracker in trackers.items()
+    }
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        side_effect=lambda provider=None, model=None: services[provider],
+    ):
+        runner = CourseGenerationRunner(
+            course_with_lessons,
+            max_concurrency=3,
+            provider_limits={"anthropic": 3, "ollama": 1},
+            use_cache=False,
+        )
+        result = await runner.run()
+
+    assert result["status"] == "success"
+    assert result["steps"]["rough_draft"]["models"] == ["ollama/gemma3:12b"]
+    assert trackers["ollama"]["peak"] == 1
+    assert trackers["anthropic"]["peak"] > 1
+
+
+@pytest.mark.asyncio
+async def test_runner_reports_partial_failure(course_with_lessons):
+    """Test that one failing lesson doesn't stop the others."""
+    service = MagicMock(spec=LLMService)
+
+    async def generate(prompt, *args, **kwargs):
+        if "Lesson 2" in prompt:
+            raise RuntimeError("provider error")
+        return "LO 1: Mock learning outcome"
+
+    service.generate_text.side_effect = generate
+    service.generate_with_context.side_effect = generate
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=service,
+    ), patch("asyncio.sleep", return_value=None):
+        runner = CourseGenerationRunner(course_with_lessons, use_cache=False)
+        result = await runner.run()
+
+    assert result["status"] == "partial"
+    assert result["succeeded"] == 2
+    assert result["failed"] == 1
+    assert result["lessons"]["lesson_02"]["status"] == "error"
+    assert runner.progress["lesson_02"]["status"] == "error"
+
+
+@pytest.mark.asyncio
+async def test_runner_rebuilds_only_edited_lessons(course_with_lessons):
+    """Test that editing one lesson's learning outcomes only rebuilds that lesson."""
+    tracker = {"active": 0, "peak": 0}
+    service = make_slow_service(tracker, delay=0)
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=service,
+    ):
+        runner = CourseGenerationRunner(course_with_lessons, use_cache=False)
+        await runner.run()
+        assert runner.plan() == {}
+
+        # A human edits lesson 2's learning outcomes
+        file_service = FileService()
+        metadata_path = os.path.join(
+            course_with_lessons, "lessons", "lesson_02_metadata.yaml"
+        )
+        lesson = file_service.load_lesson(metadata_path)
+        lesson.learning_outcomes = ["LO: Explain topic 2 in depth"]
+        file_service.save_lesson(lesson, course_with_lessons)
+
+        plan = runner.plan()
+        assert list(plan) == ["lesson_02"]
+        assert plan["lesson_02"][0] == {
+            "step": "lesson_shell",
+            "reason": "input changed: LOs",
+        }
+        assert [entry["step"] for entry in plan["lesson_02"]] == [
+            "lesson_shell",
+            "rough_draft",
+            "expanded_draft",
+        ]
+
+        service.generate_text.reset_mock()
+        service.generate_with_context.reset_mock()
+        result = await runner.rebuild()
+
+    assert list(result["lessons"]) == ["lesson_02"]
+    # The regenerated shell is unchanged, so later steps are reused
+    calls = service.generate_text.call_count + service.generate_with_context.call_count
+    assert calls == 1
+    assert result["lessons"]["lesson_02"]["skipped_steps"] == [
+        "rough_draft",
+        "expanded_draft",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_runner_batch_mode_submits_one_batch_per_stage(
+    course_with_lessons, fake_batch_server
+):
+    """Test that a batch run sends each pipeline stage for all lessons together."""
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=fake_batch_server.service(),
+    ):
+        runner = CourseGenerationRunner(
+            course_with_lessons, max_concurrency=1, use_cache=False
+        )
+        runner.batch_config.update(collect_window_seconds=0.05, poll_interval_seconds=0)
+        result = await runner.run(batch=True)
+
+    assert result["status"] == "success"
+    assert result["succeeded"] == 3
+    # Shell, rough draft and expanded draft, each batched across the lessons
+    assert result["batches"]["batches"] == 3
+    assert [batch["requests"] for batch in result["batches"]["details"]] == [3, 3, 3]
+    assert result["token_usage"]["requests"] == 9
+
+    for lesson in runner.load_lessons():
+        assert lesson.has_expanded_draft
+        assert os.path.exists(
+            os.path.join(
+                course_with_lessons,
+                "lessons",
+                f"lesson_{lesson.number:02d}_expanded_draft.md",
+            )
+        )
+
+
+@pytest.mark.asyncio
+async def test_runner_fails_over_to_additional_config(course_with_lessons):
+    """Test that a routed run keeps going when the primary provider is down."""
+    file_service = FileService()
+    config_path = os.path.join(course_with_lessons, "course_config.yaml")
+    course = file_service.load_course_config(config_path)
+    course.additional_llm_configs = [
+        LLMConfig(provider="anthropic", model="claude-sonnet-4-20250514")
+    ]
+    file_service.save_course_config(course, course_with_lessons)
+
+    primary = MagicMock(spec=LLMService)
+    primary.generate_text.side_effect = httpx.ConnectError("connection refused")
+    primary.generate_with_context.side_effect = httpx.ConnectError("connection refused")
+    secondary = make_slow_service({"active": 0, "peak": 0}, delay=0)
+
+    def get_llm_service(provider=None, model=None, **kwargs):
+        return primary if provider == "ollama" else secondary
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        side_effect=get_llm_service,
+    ):
+        runner = CourseGenerationRunner(
+            course_with_lessons, use_cache=False, route=True
+        )
+        result = await runner.run()
+
+    assert result["status"] == "success"
+    routing = result["routing"]
+    assert routing["ollama/gemma3:12b"]["healthy"] is False
+    assert routing["ollama/gemma3:12b"]["failures"] >= 1
+    assert routing["anthropic/claude-sonnet-4-20250514"]["failures"] == 0
@@ -5,6 +5,7 @@ Migrated from the standalone test_lesson_pipeline.py script.
 """
 
 import asyncio
+import re
 import os
 import pytest
 from datetime import datetime
@@ -12,6 +13,8 @@ from unittest.mock import patch, MagicMock
 
 from services.pipeline_service import LessonPipeline, PolishingPipeline
 from services.anthropic_service import AnthropicLLMService
+from services.token_budget import TokenLimits
+from models.course import LLMConfig
 
 
 @pytest.mark.asyncio
@@ -171,3 +174,503 @@ async def test_lesson_pipeline_error_handling(mock_llm_service, test_course_dir)
         # Verify that we have an error status in our progress steps
         has_error = any(status == "error" for _, status in progress_steps)
         assert has_error
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_post_draft_fan_out(mock_llm_service, tmp_path):
+    """
+    Test that post-draft steps run from the expanded draft, in parallel.
+    """
+    active = {"now": 0, "peak": 0}
+
+    async def slow_generate(prompt, *args, **kwargs):
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        await asyncio.sleep(0.02)
+        active["now"] -= 1
+        return f"Mock response for: {prompt[:30]}..."
+
+    mock_llm_service.generate_text.side_effect = slow_generate
+    mock_llm_service.generate_with_context.side_effect = slow_generate
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(
+            course_dir=str(tmp_path), lesson_id="lesson_01", use_cache=False
+        )
+
+        result = await pipeline.run_pipeline(
+            module="Introduction to Generative AI",
+            lesson_objective="Help software developers understand RAG systems",
+            lesson_topics="- Definition and components of RAG systems",
+            title="Implementing RAG Systems",
+            course_context={
+                "title": "Generative AI for Developers",
+                "target_audience": "Software developers",
+                "skill_level": "Intermediate",
+            },
+            include_post_draft=True,
+        )
+
+    assert result["status"] == "success"
+    assert result["files"]["quiz1"] == "lesson_01_quiz1.md"
+    assert result["files"]["activity_analysis"] == "lesson_01_activity_analysis.md"
+    for file_name in result["files"].values():
+        assert os.path.exists(os.path.join(tmp_path, "lessons", file_name))
+
+    # Quizzes, activities, intro/conclusion and code matching fan out together
+    assert active["peak"] == 6
+
+    # Post-draft prompts are rendered with the lesson's artifacts
+    quiz_prompts = [
+        call.kwargs["prompt"]
+        for call in mock_llm_service.generate_text.call_args_list
+        if "## Quiz Type\nfill_in_blank" in call.kwargs["prompt"]
+    ]
+    assert len(quiz_prompts) == 1
+    assert "$expanded_draft" not in quiz_prompts[0]
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_reports_failed_parallel_step(mock_llm_service, tmp_path):
+    """
+    Test that the error names the step that failed, not one running beside it.
+    """
+
+    async def generate(prompt, *args, **kwargs):
+        if "## Quiz Type\nfill_in_blank" in prompt:
+            raise ValueError("Simulated quiz failure")
+        if "## Quiz Type" in prompt:
+            # Other post-draft steps finish after the failure
+            await asyncio.sleep(0.05)
+        return f"Mock response for: {prompt[:30]}..."
+
+    mock_llm_service.generate_text.side_effect = generate
+    mock_llm_service.generate_with_context.side_effect = generate
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        result = await pipeline.run_pipeline(
+            module="Test Module",
+            lesson_objective="Test failures",
+            lesson_topics="Topic 1",
+            title="Failure Test",
+            course_context={},
+            include_post_draft=True,
+        )
+
+    assert result["status"] == "error"
+    assert result["step"] == "quiz_fill_in_blank"
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_resumes_after_failure(mock_llm_service, tmp_path):
+    """
+    Test that a rerun resumes from the failed step instead of starting over.
+    """
+    calls = []
+
+    async def generate(prompt, *args, **kwargs):
+        calls.append(prompt)
+        if fail_rough_draft and "Draft a rough lesson" in prompt:
+            raise RuntimeError("Simulated rough draft failure")
+        return f"Mock response for: {prompt[:30]}..."
+
+    mock_llm_service.generate_text.side_effect = generate
+    mock_llm_service.generate_with_context.side_effect = generate
+
+    inputs = dict(
+        module="Test Module",
+        lesson_objective="Test resume",
+        lesson_topics="Topic 1, Topic 2",
+        title="Resume Test",
+        course_context={},
+    )
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ), patch("asyncio.sleep", return_value=None):
+        # The rough draft fails on every attempt
+        fail_rough_draft = True
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        result = await pipeline.run_pipeline(**inputs)
+        assert result["status"] == "error"
+        assert result["step"] == "rough_draft"
+
+        fail_rough_draft = False
+        calls.clear()
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        result = await pipeline.run_pipeline(**inputs)
+
+        assert result["status"] == "success"
+        assert result["skipped_steps"] == ["learning_outcomes", "lesson_shell"]
+        assert len(calls) == 2
+
+        # A changed title invalidates the shell; the mock returns the same shell,
+        # so the steps after it can still be reused
+        calls.clear()
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        result = await pipeline.run_pipeline(**{**inputs, "title": "New Title"})
+
+        assert result["skipped_steps"] == [
+            "learning_outcomes",
+            "rough_draft",
+            "expanded_draft",
+        ]
+        assert len(calls) == 1
+
+    manifest = pipeline.file_service.load_run_manifest(str(tmp_path), "lesson_01")
+    assert manifest.steps["expanded_draft"].status == "success"
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_plan_after_manual_edit(mock_llm_service, tmp_path):
+    """
+    Test that a hand-edited output is kept and only its dependents are dirty.
+    """
+    inputs = dict(
+        module="Test Module",
+        lesson_objective="Test planning",
+        lesson_topics="Topic 1",
+        title="Plan Test",
+        course_context={},
+    )
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        await pipeline.run_pipeline(**inputs)
+        assert pipeline.plan(**inputs) == []
+
+        los_file = os.path.join(tmp_path, "lessons", "lesson_01_los.md")
+        with open(los_file, "w", encoding="utf-8") as f:
+            f.write("LO 1: Edited by hand")
+
+        plan = pipeline.plan(**inputs)
+        assert [entry["step"] for entry in plan] == [
+            "lesson_shell",
+            "rough_draft",
+            "expanded_draft",
+        ]
+
+        result = await pipeline.run_pipeline(**inputs)
+
+    assert result["skipped_steps"][0] == "learning_outcomes"
+    with open(los_file, encoding="utf-8") as f:
+        assert f.read() == "LO 1: Edited by hand"
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_plan_after_model_change(mock_llm_service, tmp_path):
+    """Test that moving a step to another model makes it dirty."""
+    inputs = dict(
+        module="Test Module",
+        lesson_objective="Test planning",
+        lesson_topics="Topic 1",
+        title="Plan Test",
+        course_context={},
+    )
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(
+            str(tmp_path), "lesson_01", llm_provider="anthropic", use_cache=False
+        )
+        await pipeline.run_pipeline(**inputs)
+        assert pipeline.plan(**inputs) == []
+
+        # Only the course's step_llm_configs change
+        pipeline = LessonPipeline(
+            str(tmp_path),
+            "lesson_01",
+            llm_provider="anthropic",
+            use_cache=False,
+            step_llm_configs={
+                "rough_draft": LLMConfig(provider="openai", model="gpt-4o-mini")
+            },
+        )
+        plan = pipeline.plan(**inputs)
+
+    assert plan[0]["step"] == "rough_draft"
+    assert plan[0]["reason"].startswith("model changed: anthropic/")
+    assert plan[0]["reason"].endswith("-> openai/gpt-4o-mini")
+    assert [entry["step"] for entry in plan] == ["rough_draft", "expanded_draft"]
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_marks_cacheable_prefixes(mock_llm_service, tmp_path):
+    """
+    Test that providers with prompt caching get the system prompt and the
+    shared lesson prefix marked for caching.
+    """
+    calls = []
+
+    async def generate(prompt, *args, **kwargs):
+        calls.append({"prompt": prompt, **kwargs})
+        return "LO 1: Mock output"
+
+    mock_llm_service.supports_prompt_caching = True
+    mock_llm_service.generate_text.side_effect = generate
+    mock_llm_service.generate_with_context.side_effect = generate
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        result = await pipeline.run_pipeline(
+            module="Test Module",
+            lesson_objective="Test caching",
+            lesson_topics="Topic 1",
+            title="Cache Test",
+            course_context={},
+            include_post_draft=True,
+        )
+
+    assert result["status"] == "success"
+    assert result["token_usage"]["requests"] == 0
+
+    # Steps with a system prompt mark it for caching
+    system_calls = [call for call in calls if "context" in call]
+    assert len(system_calls) == 3
+    assert all(call["cache_system"] for call in system_calls)
+
+    # The quiz steps differ only after the lesson and outcomes
+    quiz_calls = [call for call in calls if "## Quiz Type" in call["prompt"]]
+    assert len(quiz_calls) == 3
+    prefixes = {call["cache_prefix"] for call in quiz_calls}
+    assert len(prefixes) == 1
+    assert prefixes.pop().rstrip().endswith("LO 1: Mock output")
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_budgets_max_tokens(mock_llm_service, tmp_path):
+    """
+    Test that max_tokens comes from the templates and the model's limits,
+    and that a prompt too large for the context window is never sent.
+    """
+    calls = []
+
+    async def generate(prompt, *args, **kwargs):
+        calls.append(kwargs["max_tokens"])
+        return "LO 1: Mock output"
+
+    mock_llm_service.token_limits = TokenLimits(200000, 16000)
+    mock_llm_service.generate_text.side_effect = generate
+    mock_llm_service.generate_with_context.side_effect = generate
+    inputs = dict(
+        module="Test Module",
+        lesson_objective="Test budgeting",
+        title="Budget Test",
+        course_context={},
+    )
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01", use_cache=False)
+        result = await pipeline.run_pipeline(lesson_topics="Topic 1", **inputs)
+
+        assert result["status"] == "success"
+        # Templates ask for 15000-20000 tokens, limited by the model's output
+        assert sorted(set(calls)) == [15000, 16000]
+
+        calls.clear()
+        mock_llm_service.token_limits = TokenLimits(3000, 2000)
+        pipeline = LessonPipeline(str(tmp_path), "lesson_02", use_cache=False)
+        result = await pipeline.run_pipeline(lesson_topics="- topic\n" * 2000, **inputs)
+
+    assert result["status"] == "error"
+    assert "context window" in result["message"]
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_rerun_hits_default_cache(mock_llm_service, tmp_path):
+    """
+    Test that with the default cache settings a re-run is served from the cache.
+    """
+    inputs = dict(
+        module="Test Module",
+        lesson_objective="Test caching",
+        lesson_topics="Topic 1",
+        title="Cache Test",
+        course_context={},
+    )
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(str(tmp_path), "lesson_01")
+        assert (await pipeline.run_pipeline(**inputs))["status"] == "success"
+        calls = mock_llm_service.generate_with_context.call_count
+        assert calls > 0
+
+        # Sampled steps are reused too, not only temperature 0 ones
+        pipeline = LessonPipeline(str(tmp_path), "lesson_02")
+        assert (await pipeline.run_pipeline(**inputs))["status"] == "success"
+
+    assert mock_llm_service.generate_with_context.call_count == calls
+    assert pipeline.response_cache.stats()["hits"] > 0
+
+
+ROUGH_DRAFT = """<lesson_content>
+# Lesson: Sections
+
+## Introduction
+Why this matters.
+
+## Learning Outcomes
+LO1: Explain tokens
+LO2: Apply prompts
+
+<LO1>
+Tokens are pieces of text.
+</LO1>
+
+<LO2>
+Prompts steer models.
+</LO2>
+
+## Conclusion
+Wrap up.
+
+## Glossary
+- **Token**: a piece of text
+</lesson_content>"""
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_expands_sections_in_parallel(mock_llm_service, tmp_path):
+    """
+    Test that parallel section mode expands each LO section concurrently and
+    reassembles the draft with a merged glossary and expansion check.
+    """
+    tracker = {"active": 0, "peak": 0, "sections": []}
+
+    async def generate(prompt, *args, **kwargs):
+        if "Expand only this section" not in prompt:
+            return ROUGH_DRAFT
+        tag = re.search(r"tagged <(LO\d+)>", prompt).group(1)
+        tracker["sections"].append(tag)
+        tracker["active"] += 1
+        tracker["peak"] = max(tracker["peak"], tracker["active"])
+        await asyncio.sleep(0.01)
+        tracker["active"] -= 1
+        return (
+            f"<expanded_section>\n<{tag}>\nExpanded {tag} content.\n</{tag}>\n"
+            f"</expanded_section>\n<glossary_terms>\n- **Term {tag}**: new\n"
+            f"- **token**: duplicate\n</glossary_terms>"
+        )
+
+    mock_llm_service.generate_text.side_effect = generate
+    mock_llm_service.generate_with_context.side_effect = generate
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        return_value=mock_llm_service,
+    ):
+        pipeline = LessonPipeline(
+            str(tmp_path), "lesson_01", use_cache=False, parallel_sections=True
+        )
+        result = await pipeline.run_pipeline(
+            module="Test Module",
+            lesson_objective="Test sections",
+            lesson_topics="Topic 1",
+            title="Sections",
+            course_context={},
+        )
+
+    assert result["status"] == "success"
+    assert sorted(tracker["sections"]) == ["LO1", "LO2"]
+    assert tracker["peak"] == 2
+
+    with open(tmp_path / "lessons" / "lesson_01_expanded_draft.md") as f:
+        expanded = f.read()
+    assert "<LO1>\nExpanded LO1 content.\n</LO1>" in expanded
+    assert "<LO2>\nExpanded LO2 content.\n</LO2>" in expanded
+    assert expanded.count("**Token**") + expanded.count("**token**") == 1
+    assert "- **Term LO1**: new\n- **Term LO2**: new" in expanded
+    assert expanded.endswith("Expansion Check: 41 → 47; LOs and structure preserved")
+
+
+@pytest.mark.asyncio
+async def test_lesson_pipeline_uses_per_step_models(tmp_path):
+    """
+    Test that steps go to the models their prompt templates and the course's
+    per-step configurations ask for, and that each step is reported.
+    """
+    services = {}
+
+    def get_llm_service(provider=None, model=None, **kwargs):
+        if (provider, model) not in services:
+            service = MagicMock(spec=AnthropicLLMService)
+            service.generate_text.return_value = f"LO 1: from {model}"
+            service.generate_with_context.return_value = f"LO 1: from {model}"
+            services[(provider, model)] = service
+        return services[(provider, model)]
+
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        side_effect=get_llm_service,
+    ):
+        pipeline = LessonPipeline(
+            str(tmp_path),
+            "lesson_01",
+            llm_provider="anthropic",
+            model="claude-3-7-sonnet-20250219",
+            use_cache=False,
+            step_llm_configs={
+                "rough_draft": LLMConfig(provider="openai", model="gpt-4o-mini")
+            },
+        )
+        result = await pipeline.run_pipeline(
+            module="Test Module",
+            lesson_objective="Test tiering",
+            lesson_topics="Topic 1",
+            title="Tiering",
+            course_context={},
+        )
+
+    assert result["status"] == "success"
+    report = result["step_report"]
+    assert report["learning_outcomes"]["model"] == "claude-3-5-haiku-20241022"
+    assert report["lesson_shell"]["model"] == "claude-3-5-haiku-20241022"
+    assert report["rough_draft"]["provider"] == "openai"
+    assert report["rough_draft"]["model"] == "gpt-4o-mini"
+    assert report["expanded_draft"]["model"] == "claude-3-7-sonnet-20250219"
+    assert report["expanded_draft"]["duration_seconds"] >= 0
+    assert services[("openai", "gpt-4o-mini")].generate_with_context.call_count == 1
+
+    # Templates only pick a model within the pipeline's own provider
+    services.clear()
+    with patch(
+        "services.llm_service_provider.LLMServiceProvider.get_llm_service",
+        side_effect=get_llm_service,
+    ):
+        pipeline = LessonPipeline(
+            str(tmp_path), "lesson_02", llm_provider="ollama", use_cache=False
+        )
+        result = await pipeline.run_pipeline(
+            module="Test Module",
+            lesson_objective="Test tiering",
+            lesson_topics="Topic 1",
+            title="Tiering",
+            course_context={},
+        )
+
+    assert result["status"] == "success"
+    assert list(services) == [("ollama", None)]
+    assert {step["model"] for step in result["step_report"].values()} == {"gemma3:12b"}
@@ -3,12 +3,16 @@ Unit tests for the AnthropicLLMService classes.
 """
 
 import os
+import json
 import pytest
+import httpx
 from unittest.mock import patch, MagicMock
 import asyncio
 
 # We already import the regular AnthropicLLMService
 from services.anthropic_service import AnthropicLLMService
+from services.http_transport import HTTPTransport
+from services.llm_usage import track_usage
 
 
 class TestAnthropicLLMService:
@@ -43,84 +47,190 @@ class TestAnthropicLLMService:
         result = service._check_token_limit(5000)
         assert result == 4096  # Should be capped at the model's max tokens
 
-    @patch("requests.post")
     @pytest.mark.asyncio
-    async def test_generate_text(self, mock_post):
+    async def test_generate_text(self, recording_transport):
         """Test the generate_text method with a mocked API response."""
-        # Configure the mock
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "content": [{"text": "This is a test response."}]
-        }
-        mock_post.return_value = mock_response
+        # Configure the mock transport
+        transport = recording_transport(
+            "anthropic", {"content": [{"text": "This is a test response."}]}
+        )
 
         # Create service and call method
-        service = AnthropicLLMService(api_key="test_key")
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
         result = await service.generate_text(
             "Test prompt", temperature=0.5, max_tokens=100
         )
 
         # Verify the request
-        mock_post.assert_called_once()
+        assert len(recording_transport.requests) == 1
+        request = recording_transport.requests[0]
+        payload = recording_transport.payloads[0]
         # Check that the URL is correct
-        assert mock_post.call_args[0][0] == "https://api.anthropic.com/v1/messages"
+        assert str(request.url) == "https://api.anthropic.com/v1/messages"
         # Check that the API key is in the headers
-        assert mock_post.call_args[1]["headers"]["x-api-key"] == "test_key"
+        assert request.headers["x-api-key"] == "test_key"
         # Check that the model is in the payload
-        assert mock_post.call_args[1]["json"]["model"] == "claude-3-sonnet-20240229"
+        assert payload["model"] == service.model
         # Check the temperature and max_tokens
-        assert mock_post.call_args[1]["json"]["temperature"] == 0.5
-        assert mock_post.call_args[1]["json"]["max_tokens"] == 100
+        assert payload["temperature"] == 0.5
+        assert payload["max_tokens"] == 100
         # Check that the prompt is in the messages
-        assert mock_post.call_args[1]["json"]["messages"][0]["content"] == "Test prompt"
+        assert payload["messages"][0]["content"] == "Test prompt"
 
         # Verify the result
         assert result == "This is a test response."
 
-    @patch("requests.post")
     @pytest.mark.asyncio
-    async def test_generate_with_context(self, mock_post):
+    async def test_generate_with_context(self, recording_transport):
         """Test the generate_with_context method with a mocked API response."""
-        # Configure the mock
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            "content": [{"text": "This is a test response with context."}]
-        }
-        mock_post.return_value = mock_response
+        # Configure the mock transport
+        transport = recording_transport(
+            "anthropic",
+            {"content": [{"text": "This is a test response with context."}]},
+        )
 
         # Create service and call method
-        service = AnthropicLLMService(api_key="test_key")
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
         result = await service.generate_with_context(
             "Test prompt", "Test context", temperature=0.5, max_tokens=100
         )
 
         # Verify the request
-        mock_post.assert_called_once()
+        assert len(recording_transport.requests) == 1
+        payload = recording_transport.payloads[0]
         # Check that the context is in the system parameter at the top level
-        assert mock_post.call_args[1]["json"]["system"] == "Test context"
+        assert payload["system"] == "Test context"
         # Check that the prompt is in the messages
-        assert mock_post.call_args[1]["json"]["messages"][0]["content"] == "Test prompt"
+        assert payload["messages"][0]["content"] == "Test prompt"
 
         # Verify the result
         assert result == "This is a test response with context."
 
-    @patch("requests.post")
     @pytest.mark.asyncio
-    async def test_api_error_handling(self, mock_post):
+    async def test_api_error_handling(self, recording_transport):
         """Test handling of API errors."""
-        # Configure the mock to raise an exception
-        mock_response = MagicMock()
-        mock_response.status_code = 400
-        mock_response.text = "Bad Request"
-        mock_response.raise_for_status.side_effect = Exception("API Error")
-        mock_post.return_value = mock_response
+        # Configure the mock transport to return an error status
+        transport = recording_transport("anthropic", "Bad Request", status_code=400)
 
         # Create service and call method, expecting an exception
-        service = AnthropicLLMService(api_key="test_key")
-        with pytest.raises(Exception, match="API Error"):
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+        with pytest.raises(httpx.HTTPStatusError, match="400 Bad Request"):
             await service.generate_text("Test prompt")
 
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_overlap(self):
+        """Test that concurrent calls wait on the network together, not in turn."""
+
+        async def slow_handler(request):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={"content": [{"text": "ok"}]})
+
+        transport = HTTPTransport(
+            "anthropic", transport=httpx.MockTransport(slow_handler)
+        )
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await asyncio.gather(
+            *(service.generate_text(f"Prompt {i}") for i in range(5))
+        )
+        elapsed = loop.time() - start
+
+        assert results == ["ok"] * 5
+        # Five serial calls would take at least a second
+        assert elapsed < 0.6
+
+    @pytest.mark.asyncio
+    async def test_prompt_caching_breakpoints(self, recording_transport):
+        """Test that the system prompt and stable prefix are marked for caching."""
+        usage = {
+            "input_tokens": 20,
+            "output_tokens": 5,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 1500,
+        }
+        transport = recording_transport(
+            "anthropic", {"content": [{"text": "ok"}], "usage": usage}
+        )
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+
+        with track_usage() as recorder:
+            result = await service.generate_with_context(
+                "Write the quiz",
+                "You write quizzes",
+                cache_prefix="<lesson>...</lesson>\n",
+                cache_system=True,
+            )
+
+        # Prompt caching is generally available, so no beta header is sent
+        assert "anthropic-beta" not in recording_transport.requests[0].headers
+        payload = recording_transport.payloads[0]
+        assert payload["system"] == [
+            {
+                "type": "text",
+                "text": "You write quizzes",
+                "cache_control": {"type": "ephemeral"},
+            }
+        ]
+        assert payload["messages"][0]["content"] == [
+            {
+                "type": "text",
+                "text": "<lesson>...</lesson>\n",
+                "cache_control": {"type": "ephemeral"},
+            },
+            {"type": "text", "text": "Write the quiz"},
+        ]
+        assert result == "ok"
+        assert recorder.to_dict()["cache_read_input_tokens"] == 1500
+        assert recorder.to_dict()["cache_hit_ratio"] == pytest.approx(1500 / 1520)
+
+    @pytest.mark.asyncio
+    async def test_streaming_reports_usage(self, recording_transport):
+        """Test that usage from streamed message events is recorded."""
+        events = [
+            {
+                "type": "message_start",
+                "message": {
+                    "usage": {"input_tokens": 10, "cache_creation_input_tokens": 900}
+                },
+            },
+            {
+                "type": "content_block_delta",
+                "delta": {"type": "text_delta", "text": "Hi"},
+            },
+            {"type": "message_delta", "usage": {"output_tokens": 3}},
+        ]
+        body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+        transport = recording_transport("anthropic", body)
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+
+        with track_usage() as recorder:
+            chunks = [chunk async for chunk in service.stream_text("Hi")]
+
+        assert chunks == ["Hi"]
+        assert recorder.to_dict()["requests"] == 1
+        assert recorder.to_dict()["cache_creation_input_tokens"] == 900
+        assert recorder.to_dict()["output_tokens"] == 3
+
+    @pytest.mark.asyncio
+    async def test_count_tokens(self, recording_transport):
+        """Test token counting with the API, and the estimate if it fails."""
+        transport = recording_transport("anthropic", {"input_tokens": 42})
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+
+        assert await service.count_tokens("Hello", "Be brief") == 42
+        assert str(recording_transport.requests[0].url).endswith(
+            "/v1/messages/count_tokens"
+        )
+        payload = recording_transport.payloads[0]
+        assert payload["system"] == "Be brief"
+        assert "max_tokens" not in payload
+
+        service.transport = recording_transport(
+            "anthropic", "Server error", status_code=500
+        )
+        assert await service.count_tokens("Hello there") > 0
+
 
 # Optional: Add similar tests for the original AnthropicLLMService if needed
@@ -0,0 +1,121 @@
+"""
+Unit tests for FileService's atomic artifact and manifest writes.
+"""
+
+import os
+import threading
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+
+from models.lesson import Lesson
+from models.pipeline import RunManifest, StepRecord
+from services.file_service import FileService
+from services.pipeline_service import LessonPipeline
+
+
+def step_record(step):
+    """Build a successful step record."""
+    return StepRecord(
+        step=step,
+        status="success",
+        input_hash="abc",
+        updated_at=datetime.now().isoformat(),
+    )
+
+
+@pytest.fixture
+def file_service(tmp_path):
+    """A FileService rooted in tmp_path."""
+    return FileService(base_dir=str(tmp_path))
+
+
+class TestAtomicWrites:
+    """Tests for FileService.write_atomic and the saves built on it."""
+
+    def test_failed_write_keeps_old_content(self, tmp_path, file_service):
+        """Test that a write interrupted before the rename changes nothing."""
+        path = tmp_path / "lesson_01_rough_draft.md"
+        file_service.save_markdown("old draft", str(path))
+
+        with patch("services.file_service.os.replace", side_effect=OSError("crash")):
+            with pytest.raises(OSError):
+                file_service.save_markdown("new draft", str(path))
+
+        assert path.read_text() == "old draft"
+        assert os.listdir(tmp_path) == ["lesson_01_rough_draft.md"]
+
+    def test_save_lesson_replaces_metadata(self, tmp_path, file_service):
+        """Test that saved lessons load back and leave no temporary files."""
+        lesson = Lesson(number=1, title="Lesson 1", learning_outcomes=["LO 1"])
+        path = file_service.save_lesson(lesson, str(tmp_path))
+        lesson.title = "Renamed"
+        file_service.save_lesson(lesson, str(tmp_path))
+
+        assert file_service.load_lesson(path).title == "Renamed"
+        assert os.listdir(tmp_path / "lessons") == ["lesson_01_metadata.yaml"]
+
+    def test_content_addressed_artifacts(self, tmp_path, file_service):
+        """Test that artifacts can be named after their content."""
+        path = str(tmp_path / "artifacts" / "lesson_01_rough_draft.md")
+
+        first = file_service.save_artifact("draft", path, content_addressed=True)
+        again = file_service.save_artifact("draft", path, content_addressed=True)
+        other = file_service.save_artifact("edited", path, content_addressed=True)
+
+        assert first == again != other
+        assert os.path.basename(first).startswith("lesson_01_rough_draft.")
+        assert first.endswith(".md")
+        assert len(os.listdir(tmp_path / "artifacts")) == 2
+
+
+def test_concurrent_manifest_updates_are_kept(tmp_path, file_service):
+    """Test that step records updated from many threads are all saved."""
+    course_dir = str(tmp_path)
+
+    def record(step):
+        def add_record(manifest):
+            manifest.steps[step] = step_record(step)
+
+        file_service.update_run_manifest(course_dir, "lesson_01", add_record)
+
+    threads = [threading.Thread(target=record, args=(f"step_{i}",)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    manifest = file_service.load_run_manifest(course_dir, "lesson_01")
+    assert len(manifest.steps) == 20
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_records_from_other_runs(tmp_path, mock_llm_service):
+    """Test that a pipeline merges its records into the saved manifest."""
+    pipeline = LessonPipeline(
+        str(tmp_path), "lesson_01", use_cache=False, llm_service=mock_llm_service
+    )
+    pipeline.content_addressed = True
+
+    # Another pipeline records a step after this one loaded the manifest
+    FileService().save_run_manifest(
+        RunManifest(
+            lesson_id="lesson_01", steps={"activities": step_record("activities")}
+        ),
+        str(tmp_path),
+    )
+
+    result = await pipeline.run_pipeline(
+        module="Test Module",
+        lesson_objective="Test durability",
+        lesson_topics="Topic 1",
+        title="Durable",
+        course_context={},
+    )
+
+    assert result["status"] == "success"
+    manifest = FileService().load_run_manifest(str(tmp_path), "lesson_01")
+    assert "activities" in manifest.steps
+    record = manifest.steps["rough_draft"]
+    with open(record.output_path) as output, open(record.artifact_path) as artifact:
+        assert artifact.read() == output.read()
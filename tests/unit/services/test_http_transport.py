@@ -0,0 +1,89 @@
+"""
+Unit tests for the shared async HTTP transport.
+"""
+
+import asyncio
+import pytest
+import httpx
+
+from services import http_transport
+from services.http_transport import (
+    HTTPTransport,
+    get_transport,
+    load_transport_config,
+    close_all_transports,
+)
+
+
+class TestHTTPTransport:
+    """Tests for HTTPTransport and the per-provider transport pool."""
+
+    def test_load_transport_config_overrides(self):
+        """Test that provider settings override global settings."""
+        llm_config = {
+            "http": {"timeout": 30, "max_connections": 5},
+            "models": {"ollama": {"http": {"timeout": 900}}},
+        }
+
+        settings = load_transport_config("ollama", llm_config)
+
+        assert settings["timeout"] == 900
+        assert settings["max_connections"] == 5
+        assert settings["http2"] is True
+
+    def test_get_transport_is_shared_per_provider(self):
+        """Test that one transport is shared by all services of a provider."""
+        http_transport._transports.clear()
+
+        first = get_transport("anthropic")
+        second = get_transport("Anthropic")
+        other = get_transport("openai")
+
+        assert first is second
+        assert first is not other
+        http_transport._transports.clear()
+
+    def test_client_per_event_loop(self):
+        """Test that each event loop gets its own pooled client."""
+
+        def handler(request):
+            return httpx.Response(200, json={"ok": True})
+
+        transport = HTTPTransport("ollama", transport=httpx.MockTransport(handler))
+
+        async def fetch():
+            response = await transport.post("http://localhost/api", json={})
+            return transport._get_client(), response.json()
+
+        client_a, body = asyncio.run(fetch())
+        client_b, _ = asyncio.run(fetch())
+
+        assert body == {"ok": True}
+        assert client_a is not client_b
+
+    @pytest.mark.asyncio
+    async def test_client_reused_within_loop(self):
+        """Test that calls on the same loop reuse the pooled client."""
+
+        def handler(request):
+            return httpx.Response(200, json={})
+
+        transport = HTTPTransport("lmstudio", transport=httpx.MockTransport(handler))
+
+        await transport.post("http://localhost/v1/chat/completions", json={})
+        client = transport._get_client()
+        await transport.post("http://localhost/v1/chat/completions", json={})
+
+        assert transport._get_client() is client
+        await transport.aclose()
+        assert client.is_closed
+
+    @pytest.mark.asyncio
+    async def test_close_all_transports(self):
+        """Test that closing the pool forgets every provider transport."""
+        http_transport._transports.clear()
+        get_transport("anthropic")
+
+        await close_all_transports()
+
+        assert http_transport._transports == {}
@@ -0,0 +1,45 @@
+"""
+Unit tests for splitting drafts into LO sections and reassembling them.
+"""
+
+from services.lesson_sections import (
+    SectionedDraft,
+    merge_glossary,
+    parse_section_response,
+)
+
+
+def test_merge_glossary_formats():
+    """Test that entries are merged into plain and heading-style glossaries."""
+    plain = "Body\n\nGlossary:\nRAG: retrieval\n\nExercise: try it\n"
+    missing = "Body text"
+
+    assert merge_glossary(plain, ["- **rag**: again", "- **LLM**: model"]) == (
+        "Body\n\nGlossary:\nRAG: retrieval\n- **LLM**: model\n\nExercise: try it\n"
+    )
+    assert merge_glossary(missing, ["- **LLM**: model"]) == (
+        "Body text\n\n## Glossary\n- **LLM**: model"
+    )
+    assert merge_glossary(plain, []) == plain
+
+
+def test_sections_round_trip():
+    """Test that a draft reassembles unchanged apart from the expansion check."""
+    text = "# Title\n<LO1>\nOne\n</LO1>\nMiddle\n<LO2>\nTwo\n</LO2>\nEnd\n"
+    draft = SectionedDraft(text)
+
+    assert draft.sections == [("LO1", "One"), ("LO2", "Two")]
+    assert draft.assemble({}) == (
+        text.rstrip() + "\n\nExpansion Check: 10 → 10; LOs and structure preserved"
+    )
+    assert SectionedDraft("<LO1> unclosed").sections == []
+
+
+def test_parse_section_response_without_tags():
+    """Test that an untagged response is used whole, minus glossary terms."""
+    content, terms = parse_section_response(
+        "Expanded text\n<glossary_terms>\n- **A**: b\n\n</glossary_terms>"
+    )
+
+    assert content == "Expanded text"
+    assert terms == ["- **A**: b"]
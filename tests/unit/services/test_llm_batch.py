@@ -0,0 +1,101 @@
+"""
+Unit tests for sending LLM requests as message batches.
+"""
+
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+
+from services.llm_batch import BatchedLLMService, BatchError
+from services.llm_service import LLMService
+from services.llm_usage import track_usage
+
+
+def make_batched(server, **kwargs):
+    """Build a batched service against the fake server with short timings."""
+    options = {"collect_window": 0.01, "poll_interval": 0}
+    options.update(kwargs)
+    return BatchedLLMService(server.service(), **options)
+
+
+class TestBatchedLLMService:
+    """Tests for BatchedLLMService."""
+
+    def test_requires_batch_support(self):
+        """Test that providers without a batch API are rejected."""
+        with pytest.raises(ValueError):
+            BatchedLLMService(MagicMock(spec=LLMService))
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_a_batch(self, fake_batch_server):
+        """Test that requests made together are submitted as one batch."""
+        fake_batch_server.polls = 3
+        service = make_batched(fake_batch_server)
+
+        with track_usage() as usage:
+            results = await asyncio.gather(
+                service.generate_text("First"),
+                service.generate_with_context("Second", "System", cache_system=True),
+                service.generate_text("Third", cache_prefix="Stable context. "),
+            )
+
+        assert results == ["LO 1: Mock learning outcome"] * 3
+        assert list(fake_batch_server.batches) == ["msgbatch_01"]
+        requests = fake_batch_server.batches["msgbatch_01"]["requests"]
+        assert [request["custom_id"] for request in requests] == [
+            "request-0",
+            "request-1",
+            "request-2",
+        ]
+        assert requests[1]["params"]["system"][0]["text"] == "System"
+        assert fake_batch_server.batches["msgbatch_01"]["checks"] == 3
+        assert usage.to_dict()["requests"] == 3
+        assert service.stats()["details"] == [
+            {"id": "msgbatch_01", "requests": 3, "status": "ended", "succeeded": 3}
+        ]
+
+    @pytest.mark.asyncio
+    async def test_full_queue_is_submitted_at_once(self, fake_batch_server):
+        """Test that a batch is submitted as soon as it reaches its maximum size."""
+        service = make_batched(
+            fake_batch_server, collect_window=60, max_batch_requests=2
+        )
+
+        results = await asyncio.wait_for(
+            asyncio.gather(service.generate_text("A"), service.generate_text("B")),
+            timeout=5,
+        )
+
+        assert len(results) == 2
+        assert service.stats()["batches"] == 1
+
+    @pytest.mark.asyncio
+    async def test_errored_request_raises(self, fake_batch_server):
+        """Test that an errored result fails only its own request."""
+        fake_batch_server.fail_marker = "broken"
+        service = make_batched(fake_batch_server)
+
+        results = await asyncio.gather(
+            service.generate_text("fine"),
+            service.generate_text("broken"),
+            return_exceptions=True,
+        )
+
+        assert results[0] == "LO 1: Mock learning outcome"
+        assert isinstance(results[1], BatchError)
+        assert "invalid_request_error" in str(results[1])
+        assert results[1].error_type == "invalid_request_error"
+        assert results[1].retryable is False
+        assert service.stats()["details"][0]["succeeded"] == 1
+
+    @pytest.mark.asyncio
+    async def test_timeout_cancels_batch(self, fake_batch_server):
+        """Test that a batch that never ends is cancelled after max_wait."""
+        fake_batch_server.polls = None
+        service = make_batched(fake_batch_server, poll_interval=0.01, max_wait=0.05)
+
+        with pytest.raises(TimeoutError):
+            await service.generate_text("Slow")
+
+        assert fake_batch_server.cancelled == ["msgbatch_01"]
+        assert service.stats()["details"][0]["status"] == "failed"
@@ -0,0 +1,119 @@
+"""
+Unit tests for the LLM response cache.
+"""
+
+import os
+import time
+import pytest
+
+from services.llm_cache import ResponseCache, CachedLLMService
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Fixture that provides an empty response cache in a temp directory."""
+    return ResponseCache(str(tmp_path / "cache" / "llm_responses.sqlite"))
+
+
+class TestResponseCache:
+    """Tests for the ResponseCache store."""
+
+    def test_key_depends_on_every_field(self):
+        """Test that changing any request field changes the key."""
+        base = ("anthropic", "claude", "system", "prompt", 0.7, 2000)
+        key = ResponseCache.make_key(*base)
+
+        assert key == ResponseCache.make_key(*base)
+        for index, value in enumerate(["openai", "gpt", "other", "other", 0.1, 10]):
+            changed = list(base)
+            changed[index] = value
+            assert ResponseCache.make_key(*changed) != key
+
+    def test_put_get_and_stats(self, cache):
+        """Test storing and retrieving a response with hit/miss tracking."""
+        key = ResponseCache.make_key("anthropic", "claude", None, "hi", 0.0, 10)
+
+        assert cache.get(key) is None
+        cache.put(key, "hello")
+        assert cache.get(key) == "hello"
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["entries"] == 1
+        assert stats["bytes"] == len("hello")
+
+    def test_lru_eviction_by_size(self, tmp_path):
+        """Test that the least recently used entry is evicted first."""
+        cache = ResponseCache(str(tmp_path / "lru.sqlite"), max_bytes=10)
+
+        cache.put("a", "12345")
+        cache.put("b", "12345")
+        time.sleep(0.01)
+        cache.get("a")  # "b" is now the least recently used entry
+        time.sleep(0.01)
+        cache.put("c", "12345")
+
+        assert cache.get("a") == "12345"
+        assert cache.get("b") is None
+        assert cache.get("c") == "12345"
+
+    def test_expired_entries_are_misses(self, tmp_path):
+        """Test that entries older than max_age_seconds are not served."""
+        cache = ResponseCache(str(tmp_path / "age.sqlite"), max_age_seconds=0.01)
+
+        cache.put("a", "stale")
+        time.sleep(0.05)
+
+        assert cache.get("a") is None
+
+
+class TestCachedLLMService:
+    """Tests for the CachedLLMService wrapper."""
+
+    @pytest.mark.asyncio
+    async def test_repeated_requests_hit_cache(self, mock_llm_service, cache):
+        """Test that an identical request is only sent to the provider once."""
+        service = CachedLLMService(mock_llm_service, cache)
+
+        first = await service.generate_with_context("prompt", "system", 0.7, 100)
+        second = await service.generate_with_context("prompt", "system", 0.7, 100)
+
+        assert first == second
+        assert mock_llm_service.generate_with_context.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_different_parameters_miss_cache(self, mock_llm_service, cache):
+        """Test that changing generation parameters bypasses the cached entry."""
+        service = CachedLLMService(mock_llm_service, cache)
+
+        await service.generate_text("prompt", temperature=0.0, max_tokens=100)
+        await service.generate_text("prompt", temperature=0.0, max_tokens=200)
+
+        assert mock_llm_service.generate_text.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_bypass_sampled(self, mock_llm_service, cache):
+        """Test that bypass_sampled always calls the LLM for temperature > 0."""
+        service = CachedLLMService(mock_llm_service, cache, bypass_sampled=True)
+
+        await service.generate_text("prompt", temperature=0.7)
+        await service.generate_text("prompt", temperature=0.7)
+        await service.generate_text("prompt", temperature=0.0)
+        await service.generate_text("prompt", temperature=0.0)
+
+        assert mock_llm_service.generate_text.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_cache_prefix_joined_for_services_without_caching(
+        self, mock_llm_service, cache
+    ):
+        """Test that a prompt cache prefix is folded into the prompt and the key."""
+        service = CachedLLMService(mock_llm_service, cache)
+
+        await service.generate_text("rest", temperature=0.0, cache_prefix="prefix ")
+        await service.generate_text("prefix rest", temperature=0.0)
+
+        mock_llm_service.generate_text.assert_called_once_with(
+            prompt="prefix rest", temperature=0.0, max_tokens=2000
+        )
@@ -0,0 +1,240 @@
+"""
+Unit tests for continuing responses cut off at max_tokens.
+"""
+
+import json
+import pytest
+
+from services.anthropic_service import AnthropicLLMService
+from services.llm_batch import BatchedLLMService
+from services.llm_service import (
+    CONTINUE_PROMPT,
+    LMStudioService,
+    OllamaLLMService,
+    OpenAILLMService,
+)
+from services.llm_usage import track_usage
+
+
+def message(text, stop_reason):
+    """Build an Anthropic Messages API response."""
+    return {
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": stop_reason,
+        "usage": {"input_tokens": 10, "output_tokens": 5},
+    }
+
+
+def sse(text, stop_reason):
+    """Build an Anthropic streamed response."""
+    events = [
+        {"type": "message_start", "message": {"usage": {"input_tokens": 10}}},
+        {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text}},
+        {
+            "type": "message_delta",
+            "delta": {"stop_reason": stop_reason},
+            "usage": {"output_tokens": 5},
+        },
+    ]
+    return "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+
+
+class TestAnthropicContinuation:
+    """Tests for continuing truncated Anthropic responses with prefill."""
+
+    @pytest.mark.asyncio
+    async def test_generate_continues_truncated_response(self, recording_transport):
+        """Test that the partial output is sent as prefill and stitched."""
+        transport = recording_transport(
+            "anthropic",
+            [
+                message("# Lesson\n\n## Introduction\n\n", "max_tokens"),
+                message("\n\n## Conclusion\nDone.", "end_turn"),
+            ],
+        )
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+
+        result = await service.generate_with_context("Write", "System")
+
+        assert result == "# Lesson\n\n## Introduction\n\n## Conclusion\nDone."
+        assert len(recording_transport.requests) == 2
+        assert recording_transport.payloads[1]["system"] == "System"
+        assert recording_transport.payloads[1]["messages"] == [
+            {"role": "user", "content": "Write"},
+            {"role": "assistant", "content": "# Lesson\n\n## Introduction"},
+        ]
+
+    @pytest.mark.asyncio
+    async def test_continuations_are_limited(self, recording_transport):
+        """Test that a response still truncated is returned after the limit."""
+        transport = recording_transport(
+            "anthropic", [message("part", "max_tokens")] * 3
+        )
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+        service.max_continuations = 2
+
+        assert await service.generate_text("Write") == "partpartpart"
+        assert len(recording_transport.requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_stream_continues_truncated_response(self, recording_transport):
+        """Test that streams continue without duplicating held-back whitespace."""
+        transport = recording_transport(
+            "anthropic",
+            [sse("First part.\n\n", "max_tokens"), sse("\n\nSecond part.", "end_turn")],
+        )
+        service = AnthropicLLMService(api_key="test_key", transport=transport)
+
+        chunks = [chunk async for chunk in service.stream_text("Write")]
+
+        assert "".join(chunks) == "First part.\n\nSecond part."
+        assert recording_transport.payloads[1]["stream"] is True
+        assert recording_transport.payloads[1]["messages"][1] == {
+            "role": "assistant",
+            "content": "First part.",
+        }
+
+    @pytest.mark.asyncio
+    async def test_batch_continues_in_next_batch(self, fake_batch_server):
+        """Test that a truncated batch result is continued in a later batch."""
+        replies = iter(
+            [
+                message("Start of lesson ", "max_tokens"),
+                message(" and the end.", "end_turn"),
+            ]
+        )
+        fake_batch_server._result = lambda entry: {
+            "type": "succeeded",
+            "message": next(replies),
+        }
+        service = BatchedLLMService(
+            fake_batch_server.service(), collect_window=0.01, poll_interval=0
+        )
+
+        assert await service.generate_text("Write") == "Start of lesson and the end."
+        second = fake_batch_server.batches["msgbatch_02"]["requests"][0]["params"]
+        assert second["messages"][1]["content"] == "Start of lesson"
+
+
+@pytest.mark.asyncio
+async def test_chat_completion_continues_after_length(recording_transport):
+    """Test that OpenAI-compatible replies cut off at length are continued."""
+    transport = recording_transport(
+        "lmstudio",
+        [
+            {"choices": [{"message": {"content": "One "}, "finish_reason": "length"}]},
+            {"choices": [{"message": {"content": "two."}, "finish_reason": "stop"}]},
+        ],
+    )
+    service = LMStudioService(base_url="http://localhost:1234/v1", transport=transport)
+
+    assert await service.generate_text("Count") == "One two."
+    assert recording_transport.payloads[1]["messages"] == [
+        {"role": "user", "content": "Count"},
+        {"role": "assistant", "content": "One "},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+def chat_sse(text, finish_reason):
+    """Build an OpenAI-compatible streamed response."""
+    events = [
+        {"choices": [{"delta": {"content": text}, "finish_reason": None}]},
+        {"choices": [{"delta": {}, "finish_reason": finish_reason}]},
+    ]
+    lines = [f"data: {json.dumps(event)}\n\n" for event in events]
+    return "".join(lines) + "data: [DONE]\n\n"
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_continues_after_length(recording_transport):
+    """Test that OpenAI-compatible streams cut off at length are continued."""
+    transport = recording_transport(
+        "lmstudio",
+        [chat_sse("One ", "length"), chat_sse("two.", "stop")],
+    )
+    service = LMStudioService(base_url="http://localhost:1234/v1", transport=transport)
+
+    chunks = [chunk async for chunk in service.stream_text("Count", "Be brief")]
+
+    assert chunks == ["One ", "two."]
+    assert recording_transport.payloads[1]["stream"] is True
+    assert recording_transport.payloads[1]["messages"] == [
+        {"role": "system", "content": "Be brief"},
+        {"role": "user", "content": "Count"},
+        {"role": "assistant", "content": "One "},
+        {"role": "user", "content": CONTINUE_PROMPT},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_continuations_are_limited(recording_transport):
+    """Test that a stream still cut off is returned after the limit."""
+    transport = recording_transport("openai", [chat_sse("part", "length")] * 2)
+    service = OpenAILLMService(
+        api_key="test_key", base_url="http://openai", transport=transport
+    )
+    service.max_continuations = 1
+
+    chunks = [chunk async for chunk in service.stream_text("Count")]
+
+    assert "".join(chunks) == "partpart"
+    assert len(recording_transport.requests) == 2
+
+
+def ndjson(*chunks):
+    """Build an Ollama streamed response."""
+    return "".join(json.dumps(chunk) + "\n" for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_ollama_continues_after_length(recording_transport):
+    """Test that Ollama replies cut off at num_predict are continued and counted."""
+    transport = recording_transport(
+        "ollama",
+        [
+            ndjson(
+                {"response": "One ", "done": False},
+                {
+                    "done": True,
+                    "done_reason": "length",
+                    "context": [1, 2, 3],
+                    "prompt_eval_count": 10,
+                    "eval_count": 5,
+                },
+            ),
+            ndjson(
+                {"response": "two.", "done": False},
+                {
+                    "done": True,
+                    "done_reason": "stop",
+                    "prompt_eval_count": 12,
+                    "eval_count": 3,
+                },
+            ),
+        ],
+    )
+    service = OllamaLLMService(base_url="http://ollama:11434", transport=transport)
+
+    with track_usage() as usage:
+        assert await service.generate_text("Count", max_tokens=5) == "One two."
+    assert usage.to_dict()["input_tokens"] == 22
+    assert usage.to_dict()["output_tokens"] == 8
+    assert recording_transport.payloads[1]["prompt"] == CONTINUE_PROMPT
+    assert recording_transport.payloads[1]["context"] == [1, 2, 3]
+    assert recording_transport.payloads[1]["options"]["num_predict"] == 5
+
+
+@pytest.mark.asyncio
+async def test_ollama_continuations_are_limited(recording_transport):
+    """Test that an Ollama reply still cut off is returned after the limit."""
+    truncated = ndjson(
+        {"response": "part", "done": False}, {"done": True, "done_reason": "length"}
+    )
+    transport = recording_transport("ollama", [truncated] * 2)
+    service = OllamaLLMService(base_url="http://ollama:11434", transport=transport)
+    service.max_continuations = 1
+
+    assert await service.generate_text("Count") == "partpart"
+    # Without a returned context the partial reply is sent back in the prompt
+    assert "Your reply so far:\npart" in recording_transport.payloads[1]["prompt"]
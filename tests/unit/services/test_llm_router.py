@@ -0,0 +1,171 @@
+"""
+Unit tests for routing LLM requests over several providers.
+"""
+
+import random
+import pytest
+import httpx
+
+from models.course import Course, LLMConfig
+from services.llm_router import LLMRouter, RouteTarget, routing_step
+from services.llm_service import LLMService
+from services.token_budget import TokenLimits
+
+
+def status_error(status_code, headers=None):
+    """Build the error httpx raises for a response with a status code."""
+    request = httpx.Request("POST", "https://api.example.com/v1/messages")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class FakeService(LLMService):
+    """LLM service that answers with its name, or raises a given error."""
+
+    def __init__(self, name, error=None, token_limits=None):
+        super().__init__()
+        self.name = name
+        self.error = error
+        self.token_limits = token_limits
+        self.prompts = []
+
+    async def generate_text(self, prompt, temperature=0.7, max_tokens=2000):
+        self.prompts.append(prompt)
+        if self.error is not None:
+            raise self.error
+        return self.name
+
+    async def generate_with_context(
+        self, prompt, context, temperature=0.7, max_tokens=2000
+    ):
+        return await self.generate_text(prompt, temperature, max_tokens)
+
+
+def make_router(*services, **kwargs):
+    """Build a router over services, each its own target."""
+    return LLMRouter(
+        [RouteTarget(service, service.name) for service in services], **kwargs
+    )
+
+
+class TestLLMRouter:
+    """Tests for LLMRouter."""
+
+    def test_spreads_requests_by_weight_and_latency(self):
+        """Test that faster and more heavily weighted targets are tried first."""
+        random.seed(0)
+        fast, slow = FakeService("fast"), FakeService("slow")
+        targets = [
+            RouteTarget(fast, "fast", weight=1),
+            RouteTarget(slow, "slow", weight=3),
+        ]
+        router = LLMRouter(targets)
+
+        firsts = [router._candidates()[0].name for _ in range(400)]
+        assert 250 < firsts.count("slow") < 350
+
+        targets[0].latency, targets[1].latency = 1.0, 6.0
+        firsts = [router._candidates()[0].name for _ in range(400)]
+        assert 250 < firsts.count("fast") < 350
+
+    @pytest.mark.asyncio
+    async def test_fails_over_on_outage(self):
+        """Test that a failing target is skipped until its cooldown ends."""
+        primary = FakeService("primary", error=status_error(529))
+        secondary = FakeService("secondary")
+        router = make_router(primary, secondary, failure_cooldown=60)
+
+        results = [await router.generate_text("Write") for _ in range(5)]
+
+        assert results == ["secondary"] * 5
+        assert len(primary.prompts) <= 1
+        stats = router.stats()
+        assert stats["primary"]["healthy"] is False
+        assert stats["secondary"]["requests"] == 5
+
+    @pytest.mark.asyncio
+    async def test_bad_request_is_not_failed_over(self):
+        """Test that an error caused by the request itself is raised at once."""
+        primary = FakeService("primary", error=status_error(400))
+        secondary = FakeService("secondary", error=status_error(400))
+        router = make_router(primary, secondary)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await router.generate_text("Write")
+
+        assert len(primary.prompts) + len(secondary.prompts) == 1
+        assert router.stats()["primary"]["healthy"] is True
+
+    @pytest.mark.asyncio
+    async def test_all_targets_failing_raises(self):
+        """Test that the last error is raised when every target fails."""
+        router = make_router(
+            FakeService("primary", error=status_error(503)),
+            FakeService("secondary", error=status_error(429)),
+        )
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await router.generate_text("Write")
+
+    @pytest.mark.asyncio
+    async def test_pinned_step_uses_its_target(self):
+        """Test that a pinned step only goes to its target."""
+        primary, secondary = FakeService("primary"), FakeService("secondary")
+        router = make_router(primary, secondary, pins={"expanded_draft": "secondary"})
+
+        with routing_step("expanded_draft"):
+            results = {await router.generate_text("Expand") for _ in range(20)}
+
+        assert results == {"secondary"}
+
+    def test_pin_to_unknown_target_is_rejected(self):
+        """Test that pins must name one of the targets."""
+        with pytest.raises(ValueError):
+            make_router(FakeService("primary"), pins={"rough_draft": "missing"})
+
+    @pytest.mark.asyncio
+    async def test_prompt_prefix_joined_for_targets_without_caching(self):
+        """Test that prompt caching hints become plain prompt text."""
+        service = FakeService("primary")
+        router = make_router(service)
+
+        await router.generate_text("Question", cache_prefix="Lesson. ")
+
+        assert service.prompts == ["Lesson. Question"]
+
+    def test_token_limits_fit_every_target(self):
+        """Test that requests are sized for the most limited target."""
+        router = make_router(
+            FakeService("large", token_limits=TokenLimits(200000, 64000)),
+            FakeService("small", token_limits=TokenLimits(8192, 4096)),
+        )
+
+        assert router.token_limits.context_window == 8192
+        assert router.token_limits.max_output_tokens == 4096
+
+    def test_from_course_skips_unusable_configs(self):
+        """Test that configurations without a usable service are left out."""
+        course = Course(
+            title="Course",
+            description="A course",
+            target_audience="Developers",
+            author="Tester",
+            llm_config=LLMConfig(provider="anthropic", model="claude-sonnet-4"),
+            additional_llm_configs=[
+                LLMConfig(provider="openai", model="gpt-4o", weight=2),
+                LLMConfig(provider="ollama", model="gemma3:12b"),
+            ],
+        )
+
+        class Provider:
+            def get_llm_service(self, provider, model):
+                if provider == "openai":
+                    raise ValueError("OpenAI API key not found")
+                return FakeService(model)
+
+        router = LLMRouter.from_course(course, Provider())
+
+        assert list(router.stats()) == [
+            "anthropic/claude-sonnet-4",
+            "ollama/gemma3:12b",
+        ]
@@ -0,0 +1,71 @@
+"""
+Unit tests for the process-wide LLM service registry.
+"""
+
+import pytest
+from unittest.mock import patch, MagicMock
+
+from services.llm_service import LLMService
+from services.llm_service_provider import LLMServiceProvider
+from services.llm_service_registry import LLMServiceRegistry, get_service_registry
+
+
+class TestLLMServiceRegistry:
+    """Tests for LLMServiceRegistry."""
+
+    def test_key_fingerprints_api_key(self):
+        """Test that keys carry a fingerprint rather than the raw API key."""
+        registry = LLMServiceRegistry()
+
+        key = registry.make_key("Anthropic", "claude", None, "secret-key")
+
+        assert key[0] == "anthropic"
+        assert key[1] == "claude"
+        assert "secret-key" not in key
+        assert key == registry.make_key("anthropic", "claude", None, "secret-key")
+        assert key != registry.make_key("anthropic", "claude", None, "other-key")
+
+    def test_get_or_create_reuses_instances(self):
+        """Test that the factory only runs once per key."""
+        registry = LLMServiceRegistry()
+        factory = MagicMock(side_effect=lambda: MagicMock(spec=LLMService))
+        key = registry.make_key("ollama", "gemma3:12b", "http://localhost:11434")
+
+        first = registry.get_or_create(key, factory)
+        second = registry.get_or_create(key, factory)
+
+        assert first is second
+        assert factory.call_count == 1
+        assert len(registry) == 1
+
+    @patch("services.llm_service_provider.LLMServiceFactory.create_llm_service")
+    def test_provider_shares_services(self, mock_create_llm_service):
+        """Test that separate providers hand out the same registered service."""
+        mock_create_llm_service.side_effect = lambda **kwargs: MagicMock(
+            spec=LLMService, model=kwargs["model"]
+        )
+
+        first = LLMServiceProvider().get_llm_service(
+            provider="ollama", model="phi4:latest"
+        )
+        second = LLMServiceProvider().get_llm_service(
+            provider="ollama", model="phi4:latest"
+        )
+        other = LLMServiceProvider().get_llm_service(
+            provider="ollama", model="gemma3:12b"
+        )
+
+        assert first is second
+        assert first is not other
+        assert mock_create_llm_service.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_aclose_forgets_services(self):
+        """Test that closing the registry drains and forgets services."""
+        registry = get_service_registry()
+        key = registry.make_key("lmstudio", "custom", "http://localhost:1234/v1")
+        registry.get_or_create(key, lambda: MagicMock(spec=LLMService))
+
+        await registry.aclose(timeout=1.0)
+
+        assert len(registry) == 0
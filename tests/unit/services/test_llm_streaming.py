@@ -0,0 +1,162 @@
+"""
+Unit tests for streaming text generation across LLM providers.
+"""
+
+import os
+import pytest
+
+from services.anthropic_service import AnthropicLLMService
+from services.llm_service import LMStudioService, OllamaLLMService, OpenAILLMService
+from services.llm_usage import track_usage
+from services.pipeline_service import LessonPipeline
+
+
+async def collect(stream):
+    """Collect the chunks of an async text stream."""
+    return [chunk async for chunk in stream]
+
+
+class TestProviderStreaming:
+    """Tests for stream_text on each provider."""
+
+    @pytest.mark.asyncio
+    async def test_anthropic_sse(self, recording_transport):
+        """Test decoding Anthropic server-sent events."""
+        body = "\n".join(
+            [
+                "event: message_start",
+                'data: {"type": "message_start", "message": {}}',
+                "",
+                "event: content_block_delta",
+                'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hello"}}',
+                "",
+                "event: content_block_delta",
+                'data: {"type": "content_block_delta", "delta": {"type": "text_delta", "text": " world"}}',
+                "",
+                "event: message_stop",
+                'data: {"type": "message_stop"}',
+                "",
+            ]
+        )
+        service = AnthropicLLMService(
+            api_key="test_key",
+            transport=recording_transport("anthropic", body),
+        )
+
+        chunks = await collect(service.stream_text("Hi", context="Be brief"))
+
+        assert chunks == ["Hello", " world"]
+        payload = recording_transport.payloads[0]
+        assert payload["stream"] is True
+        assert payload["system"] == "Be brief"
+
+    @pytest.mark.asyncio
+    async def test_anthropic_stream_error_event(self, recording_transport):
+        """Test that an error event in the stream raises."""
+        body = 'event: error\ndata: {"type": "error", "error": {"type": "overloaded_error"}}\n'
+        service = AnthropicLLMService(
+            api_key="test_key", transport=recording_transport("anthropic", body)
+        )
+
+        with pytest.raises(RuntimeError, match="overloaded_error"):
+            await collect(service.stream_text("Hi"))
+
+    @pytest.mark.asyncio
+    async def test_openai_sse(self, recording_transport):
+        """Test decoding OpenAI chat completion chunks and their usage."""
+        body = "\n\n".join(
+            [
+                'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+                'data: {"choices": [{"delta": {"content": "Hel"}}]}',
+                'data: {"choices": [{"delta": {"content": "lo"}}]}',
+                'data: {"choices": [], "usage": {"prompt_tokens": 9, "completion_tokens": 2}}',
+                "data: [DONE]",
+            ]
+        )
+        service = OpenAILLMService(
+            api_key="test_key",
+            transport=recording_transport("openai", body),
+        )
+
+        with track_usage() as usage:
+            assert await collect(service.stream_text("Hi")) == ["Hel", "lo"]
+
+        payload = recording_transport.payloads[0]
+        assert payload["stream_options"] == {"include_usage": True}
+        assert usage.to_dict()["input_tokens"] == 9
+        assert usage.to_dict()["output_tokens"] == 2
+
+    @pytest.mark.asyncio
+    async def test_lmstudio_sse(self, recording_transport):
+        """Test that LM Studio sends the system context as a system message."""
+        body = 'data: {"choices": [{"delta": {"content": "ok"}}]}\n\ndata: [DONE]\n'
+        service = LMStudioService(
+            base_url="http://localhost:1234/v1",
+            transport=recording_transport("lmstudio", body),
+        )
+
+        assert await collect(service.stream_text("Hi", context="System")) == ["ok"]
+        payload = recording_transport.payloads[0]
+        assert payload["messages"][0] == {"role": "system", "content": "System"}
+
+    @pytest.mark.asyncio
+    async def test_ollama_ndjson(self, recording_transport):
+        """Test decoding Ollama's newline-delimited JSON stream."""
+        body = "\n".join(
+            [
+                '{"response": "Hel", "done": false}',
+                '{"response": "lo", "done": false}',
+                '{"response": "", "done": true}',
+            ]
+        )
+        service = OllamaLLMService(
+            base_url="http://localhost:11434",
+            transport=recording_transport("ollama", body),
+        )
+
+        assert await collect(service.stream_text("Hi")) == ["Hel", "lo"]
+        assert await service.generate_text("Hi", max_tokens=50) == "Hello"
+        payload = recording_transport.payloads[-1]
+        assert payload["options"]["num_predict"] == 50
+
+
+class TestPipelineStreaming:
+    """Tests for streaming output through the lesson pipeline."""
+
+    @pytest.mark.asyncio
+    async def test_progress_callback_receives_tokens(self, tmp_path):
+        """Test that streamed text reaches the progress callback as it arrives."""
+
+        class ChunkedService:
+            async def stream_text(
+                self, prompt, context=None, temperature=0.7, max_tokens=2000
+            ):
+                for chunk in ["LO 1: ", "Build ", "things"]:
+                    yield chunk
+
+        pipeline = LessonPipeline(
+            course_dir=str(tmp_path), lesson_id="lesson", use_cache=False
+        )
+        pipeline._llm_service = ChunkedService()
+        pipeline.STREAM_UPDATE_INTERVAL = 0
+
+        updates = []
+        pipeline.set_progress_callback(
+            lambda step, status, message: updates.append((status, message)),
+            stream_tokens=True,
+        )
+        result = await pipeline._call_llm_with_retry(
+            "prompt",
+            {
+                "prompt_type": "with_system",
+                "system_prompt": "system",
+                "step": "learning_outcomes",
+            },
+        )
+
+        assert result == "LO 1: Build things"
+        streamed = [message for status, message in updates if status == "streaming"]
+        assert streamed[0] == "LO 1: "
+        assert streamed[-1] == "LO 1: Build things"
+        # Partial output isn't written to the pipeline log
+        assert not os.path.exists(pipeline.log_file)
@@ -0,0 +1,32 @@
+"""
+Unit tests for LLM token usage tracking and cost estimates.
+"""
+
+import pytest
+
+from services.llm_usage import estimate_cost, record_usage, track_usage
+
+
+def test_nested_recorders_each_count_calls():
+    """Test that a call is counted by every enclosing recorder."""
+    with track_usage() as outer:
+        record_usage({"input_tokens": 100, "output_tokens": 10})
+        with track_usage() as inner:
+            record_usage({"input_tokens": 50, "output_tokens": 5})
+
+    assert outer.to_dict()["input_tokens"] == 150
+    assert inner.to_dict()["requests"] == 1
+
+
+def test_estimate_cost_by_model():
+    """Test that costs follow the model's price, including cache reads."""
+    usage = {
+        "input_tokens": 1_000_000,
+        "output_tokens": 100_000,
+        "cache_read_input_tokens": 1_000_000,
+    }
+
+    assert estimate_cost("claude-3-7-sonnet-20250219", usage) == pytest.approx(4.8)
+    assert estimate_cost("claude-3-5-haiku-20241022", usage) == pytest.approx(1.28)
+    assert estimate_cost("gemma3:12b", usage) == 0.0
+    assert estimate_cost(None, usage) == 0.0
@@ -0,0 +1,134 @@
+"""
+Unit tests for warming up local models and keeping them loaded.
+"""
+
+import json
+import pytest
+import httpx
+
+from services.llm_service import LMStudioService, OllamaLLMService
+from services.pipeline_service import LessonPipeline
+
+
+def ollama_handler(request):
+    """Answer like an Ollama server with nothing loaded."""
+    if request.url.path == "/api/ps":
+        return httpx.Response(200, json={"models": []})
+    body = json.loads(request.content)
+    if not body["prompt"]:
+        return httpx.Response(200, json={"done": True, "done_reason": "load"})
+    lines = [{"response": "LO 1: Warm"}, {"response": "", "done": True}]
+    return httpx.Response(
+        200, content="\n".join(json.dumps(line) for line in lines).encode()
+    )
+
+
+class TestOllamaWarmUp:
+    """Tests for preloading Ollama models."""
+
+    @pytest.mark.asyncio
+    async def test_warm_up_loads_model_with_keep_alive(self, recording_transport):
+        """Test that warm-up loads the model once and reports the load."""
+        service = OllamaLLMService(
+            base_url="http://ollama:11434",
+            model="gemma3:12b",
+            transport=recording_transport("ollama", ollama_handler),
+            keep_alive="1h",
+        )
+
+        metrics = await service.warm_up()
+
+        assert metrics["model"] == "gemma3:12b"
+        assert metrics["was_loaded"] is False
+        assert metrics["load_seconds"] >= 0
+        assert metrics["keep_alive"] == "1h"
+        assert recording_transport.requests[-1].url.path == "/api/generate"
+        assert recording_transport.payloads[-1] == {
+            "model": "gemma3:12b",
+            "prompt": "",
+            "stream": False,
+            "keep_alive": "1h",
+        }
+
+        # Used within keep_alive, so the model is still loaded
+        assert await service.warm_up() is None
+        assert (await service.warm_up(force=True))["model"] == "gemma3:12b"
+
+    @pytest.mark.asyncio
+    async def test_requests_renew_keep_alive(self, recording_transport):
+        """Test that every generation request carries keep_alive."""
+        service = OllamaLLMService(
+            base_url="http://ollama:11434",
+            model="gemma3:12b",
+            transport=recording_transport("ollama", ollama_handler),
+            keep_alive=-1,
+        )
+
+        assert await service.generate_text("Write") == "LO 1: Warm"
+        assert recording_transport.payloads[0]["keep_alive"] == -1
+        assert await service.warm_up() is None
+
+
+class TestLMStudioWarmUp:
+    """Tests for preloading LM Studio models."""
+
+    @pytest.mark.asyncio
+    async def test_warm_up_sends_one_token_request_with_ttl(self, recording_transport):
+        """Test that warm-up checks the model state and loads it with a TTL."""
+
+        def handler(request):
+            if request.method == "GET":
+                return httpx.Response(200, json={"state": "not-loaded"})
+            return httpx.Response(
+                200,
+                json={
+                    "choices": [{"message": {"content": "Hi"}, "finish_reason": "stop"}]
+                },
+            )
+
+        service = LMStudioService(
+            base_url="http://lmstudio:1234/v1",
+            model="gemma-3-12b-it-qat",
+            transport=recording_transport("lmstudio", handler),
+            ttl=600,
+        )
+
+        metrics = await service.warm_up()
+
+        assert metrics["was_loaded"] is False
+        assert metrics["ttl"] == 600
+        request = recording_transport.requests[0]
+        assert request.method == "GET"
+        assert request.url.path == "/api/v0/models/gemma-3-12b-it-qat"
+        assert recording_transport.payloads[1]["max_tokens"] == 1
+        assert recording_transport.payloads[1]["ttl"] == 600
+        assert await service.warm_up() is None
+
+
+@pytest.mark.asyncio
+async def test_pipeline_warms_up_before_first_step(recording_transport, tmp_path):
+    """Test that the pipeline loads the model once, before the first step."""
+    service = OllamaLLMService(
+        base_url="http://ollama:11434",
+        model="gemma3:12b",
+        transport=recording_transport("ollama", ollama_handler),
+    )
+    pipeline = LessonPipeline(
+        str(tmp_path), "lesson_01", use_cache=False, llm_service=service
+    )
+
+    result = await pipeline.run_pipeline(
+        module="Test Module",
+        lesson_objective="Test warm-up",
+        lesson_topics="Topic 1",
+        title="Warm-up",
+        course_context={},
+    )
+
+    assert result["status"] == "success"
+    assert result["warm_up"]["model"] == "gemma3:12b"
+    payloads = recording_transport.payloads
+    loads = [body for body in payloads if body and not body["prompt"]]
+    assert len(loads) == 1
+    assert recording_transport.requests[0].url.path == "/api/ps"
+    assert payloads[1] == loads[0]
@@ -0,0 +1,126 @@
+"""
+Unit tests for the background pipeline log sink.
+"""
+
+import time
+import gzip
+import json
+import threading
+import pytest
+
+from services.log_sink import LogSink, get_log_sink
+from services.pipeline_service import LessonPipeline
+
+
+def read_entries(path):
+    """Read the JSON entries of a log file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+class TestLogSink:
+    """Tests for LogSink."""
+
+    def test_entries_are_written_in_order_on_flush(self, tmp_path):
+        """Test that queued entries reach the file once flushed."""
+        path = tmp_path / "pipeline_logs.jsonl"
+        sink = LogSink(str(path), flush_interval=60)
+
+        for i in range(5):
+            sink.write({"step": f"step_{i}"})
+        assert sink.flush()
+
+        assert [entry["step"] for entry in read_entries(path)] == [
+            f"step_{i}" for i in range(5)
+        ]
+        sink.close()
+
+    def test_full_batch_is_written_without_waiting(self, tmp_path):
+        """Test that a full batch doesn't wait for the flush interval."""
+        path = tmp_path / "pipeline_logs.jsonl"
+        sink = LogSink(str(path), flush_interval=60, max_batch=3)
+
+        for i in range(3):
+            sink.write({"step": f"step_{i}"})
+
+        for _ in range(100):
+            if sink.written == 3:
+                break
+            time.sleep(0.01)
+        assert len(read_entries(path)) == 3
+        sink.close()
+
+    def test_close_writes_queued_entries(self, tmp_path):
+        """Test that closing the sink doesn't lose entries."""
+        path = tmp_path / "pipeline_logs.jsonl"
+        sink = LogSink(str(path), flush_interval=60)
+
+        sink.write({"step": "last"})
+        sink.close()
+
+        assert read_entries(path) == [{"step": "last"}]
+
+    def test_concurrent_writers_share_one_file(self, tmp_path):
+        """Test that entries from many threads are written whole."""
+        path = tmp_path / "pipeline_logs.jsonl"
+        sink = get_log_sink(str(path), {"flush_interval_seconds": 0.01})
+        assert get_log_sink(str(path)) is sink
+
+        def write(writer):
+            for i in range(50):
+                sink.write({"writer": writer, "entry": i})
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sink.flush()
+
+        entries = read_entries(path)
+        assert len(entries) == 400
+        for writer in range(8):
+            mine = [e["entry"] for e in entries if e["writer"] == writer]
+            assert mine == list(range(50))
+
+    def test_rotates_to_compressed_backups(self, tmp_path):
+        """Test that a full log is compressed and only a few backups are kept."""
+        path = tmp_path / "pipeline_logs.jsonl"
+        sink = LogSink(str(path), max_bytes=100, backup_count=2)
+
+        for i in range(4):
+            sink.write({"step": f"step_{i}", "message": "x" * 100})
+            assert sink.flush()
+        sink.close()
+
+        assert read_entries(path)[0]["step"] == "step_3"
+        with gzip.open(f"{path}.1.gz", "rt") as f:
+            assert json.loads(f.read())["step"] == "step_2"
+        with gzip.open(f"{path}.2.gz", "rt") as f:
+            assert json.loads(f.read())["step"] == "step_1"
+        assert not (tmp_path / "pipeline_logs.jsonl.3.gz").exists()
+        assert sink.rotations == 3
+
+
+@pytest.mark.asyncio
+async def test_pipeline_log_is_written_by_end_of_run(tmp_path, mock_llm_service):
+    """Test that a finished run's progress is in the log file."""
+    mock_llm_service.generate_text.return_value = "LO 1: Logging"
+    pipeline = LessonPipeline(
+        str(tmp_path), "lesson_01", use_cache=False, llm_service=mock_llm_service
+    )
+
+    result = await pipeline.run_pipeline(
+        module="Test Module",
+        lesson_objective="Test logging",
+        lesson_topics="Topic 1",
+        title="Logging",
+        course_context={},
+    )
+
+    assert result["status"] == "success"
+    entries = read_entries(pipeline.log_file)
+    assert {entry["lesson_id"] for entry in entries} == {"lesson_01"}
+    assert ("rough_draft", "success") in {
+        (entry["step"], entry["status"]) for entry in entries
+    }
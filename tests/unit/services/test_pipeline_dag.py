@@ -0,0 +1,103 @@
+"""
+Unit tests for the pipeline DAG executor.
+"""
+
+import asyncio
+import pytest
+
+from models.pipeline import PipelineStep
+from services.pipeline_dag import PipelineDAG
+
+
+def make_step(name, inputs=(), output=None):
+    """Build a step whose template variables are named after its inputs."""
+    return PipelineStep(
+        name=name,
+        prompt=name,
+        inputs={artifact: artifact for artifact in inputs},
+        output=output or name,
+        output_file=f"{name}.md",
+    )
+
+
+class TestPipelineDAG:
+    """Tests for PipelineDAG."""
+
+    def test_order_and_external_inputs(self):
+        """Test that steps are ordered after their dependencies."""
+        dag = PipelineDAG(
+            [
+                make_step("quiz", ["draft"]),
+                make_step("draft", ["outline"]),
+                make_step("outline", ["objective"]),
+            ]
+        )
+
+        assert dag.order == ["outline", "draft", "quiz"]
+        assert dag.dependencies("quiz") == {"draft"}
+        assert dag.external_inputs() == {"objective"}
+
+    def test_rejects_cycles_and_duplicate_outputs(self):
+        """Test that invalid graphs are rejected."""
+        with pytest.raises(ValueError, match="cycle"):
+            PipelineDAG([make_step("a", ["b"]), make_step("b", ["a"])])
+
+        with pytest.raises(ValueError, match="produced by both"):
+            PipelineDAG([make_step("a", output="x"), make_step("b", output="x")])
+
+    @pytest.mark.asyncio
+    async def test_independent_steps_run_in_parallel(self):
+        """Test that steps sharing a dependency fan out concurrently."""
+        dag = PipelineDAG(
+            [make_step("draft", ["objective"])]
+            + [make_step(f"quiz{i}", ["draft"]) for i in range(3)]
+        )
+        active = {"now": 0, "peak": 0}
+
+        async def run_step(step, artifacts):
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            await asyncio.sleep(0.02)
+            active["now"] -= 1
+            inputs = "+".join(artifacts[a] for a in step.inputs.values())
+            return f"{step.name}({inputs})"
+
+        artifacts = await dag.run(run_step, {"objective": "goal"})
+
+        assert artifacts["draft"] == "draft(goal)"
+        assert artifacts["quiz2"] == "quiz2(draft(goal))"
+        assert active["peak"] == 3
+
+    @pytest.mark.asyncio
+    async def test_failure_stops_dependent_steps(self):
+        """Test that a failing step's dependents never start and the error is raised."""
+        dag = PipelineDAG(
+            [
+                make_step("draft", ["objective"]),
+                make_step("quiz", ["draft"]),
+                make_step("notes", ["objective"]),
+            ]
+        )
+        started = []
+
+        async def run_step(step, artifacts):
+            started.append(step.name)
+            if step.name == "draft":
+                raise RuntimeError("draft failed")
+            await asyncio.sleep(0.01)
+            return step.name
+
+        with pytest.raises(RuntimeError, match="draft failed"):
+            await dag.run(run_step, {"objective": "goal"})
+
+        assert "quiz" not in started
+        assert "notes" in started
+        assert dag.failed_step == "draft"
+
+    @pytest.mark.asyncio
+    async def test_missing_inputs(self):
+        """Test that running without the external inputs fails early."""
+        dag = PipelineDAG([make_step("draft", ["objective"])])
+
+        with pytest.raises(ValueError, match="objective"):
+            await dag.run(lambda step, artifacts: None, {})
@@ -0,0 +1,193 @@
+"""
+Unit tests for prompt template compilation and rendering.
+"""
+
+import os
+import time
+import string
+import pytest
+
+from services.prompt_service import (
+    CompiledPrompt,
+    CompiledTemplate,
+    PromptService,
+    get_prompt_service,
+)
+
+BRACE_TEMPLATE = """# Shell Prompt
+
+## API Parameters
+- Max Tokens: 20000
+- Temperature: 0.1
+
+## System Prompt
+You plan lessons.
+
+## User Message Template
+Title: {{TITLE}}
+Outcomes: {{LOs}} and {{MISSING}}
+"""
+
+DOLLAR_TEMPLATE = """# Quiz Prompt
+
+Draft: $expanded_draft
+Audience: ${target_audience}s, cost $$5, stray $ and $unknown
+"""
+
+
+@pytest.fixture
+def prompts_dir(tmp_path):
+    """Fixture that provides a prompts directory with two templates."""
+    (tmp_path / "shell.md").write_text(BRACE_TEMPLATE, encoding="utf-8")
+    (tmp_path / "quiz.md").write_text(DOLLAR_TEMPLATE, encoding="utf-8")
+    return tmp_path
+
+
+def touch(path, text):
+    """Rewrite a file and move its mtime forward so the change is detectable."""
+    path.write_text(text, encoding="utf-8")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+class TestCompiledPrompt:
+    """Tests for parsing templates into CompiledPrompt objects."""
+
+    def test_parses_sections(self):
+        """Test that API parameters, system prompt and slots are parsed once."""
+        compiled = CompiledPrompt("shell", BRACE_TEMPLATE)
+
+        assert compiled.api_params == {"temperature": 0.1, "max_tokens": 20000}
+        assert compiled.system_prompt == "You plan lessons."
+        assert compiled.user_message.variables == ["TITLE", "LOs", "MISSING"]
+
+    def test_parses_preferred_model(self):
+        """Test that a template's Provider and Model lines are read."""
+        compiled = CompiledPrompt(
+            "los",
+            BRACE_TEMPLATE.replace(
+                "- Max Tokens",
+                "- Provider: Anthropic\n- Model: claude-3-5-haiku\n- Max Tokens",
+            ),
+        )
+
+        assert compiled.api_params["provider"] == "anthropic"
+        assert compiled.api_params["model"] == "claude-3-5-haiku"
+
+    def test_brace_rendering_leaves_unknown_placeholders(self):
+        """Test that only supplied {{VARIABLES}} are substituted."""
+        compiled = CompiledPrompt("shell", BRACE_TEMPLATE)
+
+        message = compiled.render_user_message(
+            {"TITLE": "Intro {{LOs}}", "LOs": "LO1", "UNUSED": "x"}
+        )
+
+        assert message == "Title: Intro {{LOs}}\nOutcomes: LO1 and {{MISSING}}"
+
+    def test_template_tags_take_precedence(self):
+        """Test that only the <template> part of the user message is sent."""
+        text = "## User Message Template\nIgnore me\n<template>\nUse {{X}}\n</template>"
+
+        assert CompiledPrompt("p", text).render_user_message({"X": "1"}) == "Use 1"
+
+    def test_split_after_cached_variables(self):
+        """Test that the message splits after the last cacheable variable."""
+        compiled = CompiledPrompt("shell", BRACE_TEMPLATE)
+        variables = {"TITLE": "Intro", "LOs": "LO1"}
+
+        prefix, rest = compiled.split_user_message(variables, ["TITLE"])
+
+        assert prefix == "Title: Intro"
+        assert prefix + rest == compiled.render_user_message(variables)
+        assert compiled.split_user_message(variables, ["MISSING"])[0] == ""
+
+    def test_dollar_rendering_matches_safe_substitute(self):
+        """Test that $variable templates render like string.Template."""
+        variables = {"expanded_draft": "Text", "target_audience": "dev", "n": 1}
+        expected = string.Template(DOLLAR_TEMPLATE).safe_substitute(variables)
+
+        template = CompiledTemplate.from_dollars(DOLLAR_TEMPLATE)
+        compiled = CompiledPrompt("quiz", DOLLAR_TEMPLATE)
+
+        assert template.render(variables) == expected
+        assert compiled.render_user_message(variables) == expected
+
+
+class TestPromptService:
+    """Tests for PromptService's compiled template cache."""
+
+    def test_loads_lazily_and_reuses_compiled_template(self, prompts_dir):
+        """Test that templates are read on first use and not parsed again."""
+        service = PromptService(str(prompts_dir))
+
+        assert service.compiled == {}
+        first = service.get_compiled("shell")
+
+        assert set(service.compiled) == {"shell", "quiz"}
+        assert service.get_compiled("shell") is first
+        assert service.get_compiled("missing") is None
+
+    def test_polling_picks_up_changes(self, prompts_dir):
+        """Test that added, edited and removed files are swapped in on access."""
+        service = PromptService(str(prompts_dir), poll_interval=0)
+        first = service.get_compiled("quiz")
+        shell = service.get_compiled("shell")
+
+        touch(prompts_dir / "quiz.md", "New $expanded_draft")
+        touch(prompts_dir / "extra.md", "Extra")
+        os.remove(prompts_dir / "shell.md")
+
+        assert service.get_compiled("quiz") is not first
+        assert service.render_prompt("quiz", {"expanded_draft": "x"}) == "New x"
+        assert service.templates == {"quiz": "New $expanded_draft", "extra": "Extra"}
+        assert service.get_compiled("shell") is None
+        assert shell.render_user_message({"TITLE": "t"}).startswith("Title: t")
+
+    def test_poll_interval_limits_rescans(self, prompts_dir):
+        """Test that changes within the poll interval wait for the next rescan."""
+        service = PromptService(str(prompts_dir), poll_interval=60)
+        service.get_compiled("quiz")
+
+        touch(prompts_dir / "quiz.md", "New")
+
+        assert service.get_prompt("quiz") == DOLLAR_TEMPLATE
+        assert service.refresh() == ["quiz"]
+        assert service.get_prompt("quiz") == "New"
+
+    def test_watcher_reloads_in_background(self, prompts_dir):
+        """Test that the watcher thread swaps in edited templates."""
+        service = PromptService(str(prompts_dir), poll_interval=None)
+        service.get_compiled("quiz")
+        service.start_watching(interval=0.01)
+        service.start_watching(interval=0.01)
+        try:
+            touch(prompts_dir / "quiz.md", "Watched")
+            deadline = time.monotonic() + 2
+            while service.get_prompt("quiz") != "Watched":
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            service.stop_watching()
+
+        assert service._watcher is None
+
+    def test_add_template(self, prompts_dir):
+        """Test that an added template is compiled and saved."""
+        service = PromptService(str(prompts_dir))
+
+        service.add_template("extra", "Hello $name")
+        compiled = service.get_compiled("extra")
+
+        assert service.render_prompt("extra", {"name": "Ada"}) == "Hello Ada"
+        assert service.refresh() == []
+        assert service.get_compiled("extra") is compiled
+        assert (prompts_dir / "extra.md").read_text(encoding="utf-8") == "Hello $name"
+
+    def test_shared_per_directory(self, prompts_dir, tmp_path_factory):
+        """Test that get_prompt_service returns one instance per directory."""
+        other = tmp_path_factory.mktemp("other_prompts")
+
+        service = get_prompt_service(str(prompts_dir))
+
+        assert get_prompt_service(os.path.join(str(prompts_dir), ".")) is service
+        assert get_prompt_service(str(other)) is not service
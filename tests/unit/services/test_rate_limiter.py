@@ -0,0 +1,168 @@
+"""
+Unit tests for the per-provider rate limiter.
+"""
+
+import asyncio
+import time
+import pytest
+import httpx
+
+from services.http_transport import HTTPTransport
+from services.llm_service import OpenAILLMService
+from services.rate_limiter import (
+    RateLimiter,
+    TokenBucket,
+    load_rate_limit_config,
+    parse_duration,
+    parse_rate_limit_headers,
+    parse_retry_after,
+)
+
+
+class TestHeaderParsing:
+    """Tests for parsing provider rate limit headers."""
+
+    def test_parse_retry_after(self):
+        """Test retry-after given in seconds, as a date, or missing."""
+        assert parse_retry_after("2.5") == 2.5
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+
+    def test_parse_duration(self):
+        """Test OpenAI-style reset durations."""
+        assert parse_duration("1s") == 1.0
+        assert parse_duration("6m0s") == 360.0
+        assert parse_duration("20ms") == pytest.approx(0.02)
+        assert parse_duration("1x") is None
+
+    def test_parse_rate_limit_headers(self):
+        """Test reading remaining budgets from Anthropic and OpenAI headers."""
+        anthropic = parse_rate_limit_headers(
+            {
+                "anthropic-ratelimit-requests-remaining": "0",
+                "anthropic-ratelimit-requests-reset": "2015-10-21T07:28:00Z",
+            }
+        )
+        openai = parse_rate_limit_headers(
+            {
+                "x-ratelimit-remaining-tokens": "1200",
+                "x-ratelimit-reset-tokens": "1.5s",
+            }
+        )
+
+        assert anthropic == {"requests": (0.0, 0.0)}
+        assert openai == {"tokens": (1200.0, 1.5)}
+
+
+class TestRateLimiter:
+    """Tests for RateLimiter admission and adaptive concurrency."""
+
+    def test_load_rate_limit_config(self):
+        """Test that per-model limits override provider limits."""
+        llm_config = {
+            "models": {
+                "openai": {
+                    "rate_limits": {
+                        "requests_per_minute": 500,
+                        "max_concurrency": 8,
+                        "models": {"gpt-4o": {"tokens_per_minute": 30000}},
+                    }
+                }
+            }
+        }
+
+        settings = load_rate_limit_config("openai", "gpt-4o", llm_config)
+
+        assert settings["requests_per_minute"] == 500
+        assert settings["tokens_per_minute"] == 30000
+        assert settings["max_concurrency"] == 8
+        assert "models" not in settings
+
+    def test_token_bucket_wait_time(self):
+        """Test that an empty bucket reports the refill time."""
+        bucket = TokenBucket(per_minute=60)
+        now = bucket.updated
+
+        assert bucket.wait_time(60, now) == 0
+        bucket.consume(60)
+        assert bucket.wait_time(1, now) == pytest.approx(1.0)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self):
+        """Test that no more than max_concurrency requests run at once."""
+        limiter = RateLimiter("openai", max_concurrency=2)
+        active = {"now": 0, "peak": 0}
+
+        async def request():
+            async with limiter.acquire():
+                active["now"] += 1
+                active["peak"] = max(active["peak"], active["now"])
+                await asyncio.sleep(0.02)
+                active["now"] -= 1
+
+        await asyncio.gather(*(request() for _ in range(6)))
+
+        assert active["peak"] == 2
+        assert limiter.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_aimd_halves_once_per_congestion_event(self):
+        """Test that concurrent 429s shrink the limit once, and success regrows it."""
+        limiter = RateLimiter("anthropic", max_concurrency=8)
+        throttled = httpx.Response(429)
+
+        async with limiter.acquire() as first:
+            async with limiter.acquire() as second:
+                first.record_response(throttled)
+                second.record_response(throttled)
+
+        assert limiter.concurrency_limit == 4
+        assert limiter.throttled == 2
+
+        for _ in range(8):
+            limiter.blocked_until = 0
+            async with limiter.acquire() as slot:
+                slot.record_response(httpx.Response(200))
+
+        assert limiter.concurrency_limit == 5
+
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_admission(self):
+        """Test that a retry-after header holds back the next request."""
+        limiter = RateLimiter("openai")
+
+        async with limiter.acquire() as slot:
+            slot.record_response(httpx.Response(429, headers={"retry-after": "0.2"}))
+
+        start = time.monotonic()
+        async with limiter.acquire():
+            pass
+
+        assert time.monotonic() - start >= 0.15
+
+    @pytest.mark.asyncio
+    async def test_service_refunds_unused_tokens(self):
+        """Test that a service reconciles its token estimate with reported usage."""
+
+        def handler(request):
+            return httpx.Response(
+                200,
+                json={
+                    "choices": [{"message": {"content": "ok"}}],
+                    "usage": {"total_tokens": 10},
+                },
+                headers={"x-ratelimit-remaining-requests": "99"},
+            )
+
+        limiter = RateLimiter("openai", requests_per_minute=100, tokens_per_minute=6000)
+        service = OpenAILLMService(
+            api_key="test_key",
+            transport=HTTPTransport("openai", transport=httpx.MockTransport(handler)),
+            rate_limiter=limiter,
+        )
+
+        assert await service.generate_text("Hi", max_tokens=1000) == "ok"
+
+        assert limiter.token_bucket.tokens == pytest.approx(5990, abs=5)
+        assert limiter.request_bucket.tokens <= 99
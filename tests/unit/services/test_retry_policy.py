@@ -0,0 +1,145 @@
+"""
+Unit tests for the LLM call retry policy.
+"""
+
+import asyncio
+import pytest
+import httpx
+
+from services.llm_batch import BatchError
+from services.retry_policy import RetryPolicy, get_latency_window, is_retryable
+from services.token_budget import TokenBudgetError
+
+
+def status_error(status_code, headers=None):
+    """Build the error httpx raises for a response with a status code."""
+    request = httpx.Request("POST", "https://api.example.com/v1/messages")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+class FlakyCall:
+    """A call that raises the given errors in turn, then succeeds."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    async def __call__(self):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "done"
+
+
+class TestRetryPolicy:
+    """Tests for RetryPolicy."""
+
+    def test_classifies_errors(self):
+        """Test that transient errors are retryable and request errors fatal."""
+        assert is_retryable(status_error(429))
+        assert is_retryable(status_error(529))
+        assert is_retryable(httpx.ReadTimeout("timed out"))
+        assert is_retryable(RuntimeError("Anthropic stream error: overloaded"))
+        assert not is_retryable(status_error(400))
+        assert not is_retryable(status_error(401))
+        assert not is_retryable(ValueError("API key not found"))
+        assert not is_retryable(TokenBudgetError("prompt too long"))
+
+    def test_classifies_batch_errors(self):
+        """Test that fatal errors inside a message batch aren't resubmitted."""
+        assert not is_retryable(
+            BatchError("Batch request errored: ...", "invalid_request_error")
+        )
+        assert not is_retryable(BatchError("...", "authentication_error"))
+        assert is_retryable(BatchError("Batch request errored: ...", "api_error"))
+        assert is_retryable(BatchError("Batch request expired: None"))
+
+    def test_backoff_is_jittered_and_honors_retry_after(self):
+        """Test that delays are capped, jittered and follow retry-after."""
+        policy = RetryPolicy(initial_delay=1.0, max_delay=5.0)
+
+        for attempt in range(6):
+            delay = policy.backoff(attempt)
+            expected = min(5.0, 2**attempt)
+            assert expected / 2 <= delay <= expected
+        assert policy.backoff(0, status_error(429, {"retry-after": "7"})) == 7.0
+
+    @pytest.mark.asyncio
+    async def test_retries_transient_errors_without_final_sleep(self, monkeypatch):
+        """Test that retries stop at the limit without sleeping afterwards."""
+        sleeps = []
+
+        async def sleep(delay):
+            sleeps.append(delay)
+
+        monkeypatch.setattr(asyncio, "sleep", sleep)
+        policy = RetryPolicy(max_retries=2)
+
+        call = FlakyCall(status_error(503), status_error(503))
+        assert await policy.run(call) == "done"
+        assert call.attempts == 3
+
+        sleeps.clear()
+        call = FlakyCall(*[status_error(503)] * 3)
+        with pytest.raises(httpx.HTTPStatusError):
+            await policy.run(call)
+        assert call.attempts == 3
+        assert len(sleeps) == 2
+
+    @pytest.mark.asyncio
+    async def test_fatal_errors_fail_fast(self):
+        """Test that a bad request isn't retried."""
+        call = FlakyCall(status_error(400))
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await RetryPolicy(max_retries=3).run(call)
+
+        assert call.attempts == 1
+
+    @pytest.mark.asyncio
+    async def test_deadline_stops_retries(self):
+        """Test that a call isn't retried past its deadline."""
+        policy = RetryPolicy(max_retries=5, initial_delay=1.0, deadline=0.5)
+
+        async def slow():
+            await asyncio.sleep(1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(policy.run(slow), timeout=2)
+
+        call = FlakyCall(status_error(503), status_error(503))
+        with pytest.raises(httpx.HTTPStatusError):
+            await policy.run(call)
+        assert call.attempts == 1
+
+    @pytest.mark.asyncio
+    async def test_hedges_slow_calls(self):
+        """Test that a call slower than recent ones gets a duplicate."""
+        window = get_latency_window("test/hedge")
+        for _ in range(5):
+            window.record(0.01)
+        policy = RetryPolicy(hedge_percentile=0.9, hedge_min_samples=5)
+        delays = [1.0, 0.0]
+        started = []
+
+        async def call():
+            delay = delays[len(started)]
+            started.append(delay)
+            await asyncio.sleep(delay)
+            return f"response after {delay}s"
+
+        result = await asyncio.wait_for(policy.run(call, key="test/hedge"), 0.5)
+
+        assert result == "response after 0.0s"
+        assert started == [1.0, 0.0]
+        assert len(window) == 6
+
+    @pytest.mark.asyncio
+    async def test_no_hedging_without_enough_samples(self):
+        """Test that calls aren't hedged before there's a latency history."""
+        policy = RetryPolicy(hedge_percentile=0.5, hedge_min_samples=5)
+        call = FlakyCall()
+
+        assert await policy.run(call, key="test/new") == "done"
+        assert call.attempts == 1
@@ -0,0 +1,202 @@
+"""
+Unit tests for the run history index.
+"""
+
+import gzip
+import json
+import pytest
+
+from services.run_history import RunHistory, main
+from services.pipeline_service import LessonPipeline
+
+
+def write_log(path, entries, mode="a"):
+    """Append entries to a JSON lines log file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, mode) as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def step_event(step, status, second, run_id="run1", lesson_id="lesson_01", **extra):
+    """Build a log entry for a step at a given second past noon."""
+    return {
+        "timestamp": f"2026-10-01T12:00:{second:02d}",
+        "run_id": run_id,
+        "lesson_id": lesson_id,
+        "step": step,
+        "status": status,
+        "message": "",
+        **extra,
+    }
+
+
+@pytest.fixture
+def history(tmp_path):
+    """A run history stored under tmp_path."""
+    with RunHistory(str(tmp_path / "run_history.sqlite")) as history:
+        yield history
+
+
+class TestRunHistory:
+    """Tests for RunHistory."""
+
+    def test_latency_and_failure_rates_across_courses(self, tmp_path, history):
+        """Test that steps are summarized over every course's log."""
+        courses = tmp_path / "courses"
+        write_log(
+            courses / "course_a" / "pipeline_logs.jsonl",
+            [
+                step_event("rough_draft", "success", 1, duration_seconds=10.0),
+                step_event(
+                    "expanded_draft",
+                    "success",
+                    2,
+                    duration_seconds=30.0,
+                    token_usage={"input_tokens": 900, "output_tokens": 300},
+                    cost_usd=0.01,
+                ),
+            ],
+        )
+        write_log(
+            courses / "course_b" / "pipeline_logs.jsonl",
+            [
+                step_event("rough_draft", "success", 3, duration_seconds=20.0),
+                step_event(
+                    "expanded_draft", "error", 4, duration_seconds=5.0, error="Timeout"
+                ),
+            ],
+        )
+
+        assert history.refresh(str(courses)) == 4
+
+        latency = history.step_latency()
+        assert latency["rough_draft"]["count"] == 2
+        assert latency["rough_draft"]["mean_seconds"] == 15.0
+        assert latency["rough_draft"]["p50"] == 20.0
+        assert latency["expanded_draft"]["mean_prompt_tokens"] == 900
+        assert latency["expanded_draft"]["mean_cost_usd"] == 0.01
+
+        failures = history.failure_rates()
+        assert failures["expanded_draft"] == {
+            "runs": 2,
+            "failures": 1,
+            "failure_rate": 0.5,
+        }
+        assert failures["rough_draft"]["failure_rate"] == 0.0
+        course_a = history.failure_rates(course="course_a")
+        assert course_a["expanded_draft"]["failures"] == 0
+
+        [error] = history.errors()
+        assert error["course"] == "course_b"
+        assert error["error"] == "Timeout"
+
+    def test_refresh_reads_only_new_entries(self, tmp_path, history):
+        """Test that indexing is incremental and never double counts."""
+        log = tmp_path / "courses" / "course" / "pipeline_logs.jsonl"
+        write_log(log, [step_event("rough_draft", "success", 1, duration_seconds=1)])
+
+        assert history.ingest_log(str(log)) == 1
+        assert history.ingest_log(str(log)) == 0
+
+        write_log(log, [step_event("rough_draft", "success", 2, duration_seconds=2)])
+        assert history.ingest_log(str(log)) == 1
+        assert history.step_latency()["rough_draft"]["count"] == 2
+
+    def test_rotated_log_is_read_from_backup(self, tmp_path, history):
+        """Test that entries rotated away before a refresh aren't lost."""
+        log = tmp_path / "courses" / "course" / "pipeline_logs.jsonl"
+        first = step_event("rough_draft", "success", 1, duration_seconds=1)
+        second = step_event("rough_draft", "success", 2, duration_seconds=2)
+        write_log(log, [first])
+        history.ingest_log(str(log))
+
+        # The log gets another entry, then rotates before the next refresh
+        with gzip.open(f"{log}.1.gz", "wt") as f:
+            f.write(json.dumps(first) + "\n" + json.dumps(second) + "\n")
+        write_log(
+            log,
+            [step_event("rough_draft", "success", 3, duration_seconds=3)],
+            mode="w",
+        )
+
+        assert history.ingest_log(str(log)) == 2
+        assert history.step_latency()["rough_draft"]["count"] == 3
+
+    def test_durations_from_older_log_entries(self, tmp_path, history):
+        """Test that entries without durations are timed from "starting"."""
+        log = tmp_path / "courses" / "course" / "pipeline_logs.jsonl"
+        write_log(
+            log,
+            [
+                {
+                    "timestamp": "2026-10-01T12:00:00",
+                    "step": "rough_draft",
+                    "status": "starting",
+                    "message": "",
+                },
+                {
+                    "timestamp": "2026-10-01T12:00:12.500000",
+                    "step": "rough_draft",
+                    "status": "success",
+                    "message": "Rough draft generated",
+                },
+            ],
+        )
+
+        history.ingest_log(str(log))
+
+        assert history.step_latency()["rough_draft"]["mean_seconds"] == 12.5
+
+    def test_since_filters_events(self, tmp_path, history):
+        """Test that queries can be limited to a time range."""
+        log = tmp_path / "courses" / "course" / "pipeline_logs.jsonl"
+        old = step_event("rough_draft", "error", 1, error="Timeout")
+        old["timestamp"] = "2026-09-01T12:00:00"
+        write_log(log, [old, step_event("rough_draft", "success", 1)])
+        history.ingest_log(str(log))
+
+        assert history.failure_rates()["rough_draft"]["failures"] == 1
+        recent = history.failure_rates(since="2026-09-15")
+        assert recent["rough_draft"]["failures"] == 0
+
+
+def test_cli_prints_failure_rates(tmp_path, capsys):
+    """Test the command line over a courses directory."""
+    courses = tmp_path / "courses"
+    write_log(
+        courses / "course" / "pipeline_logs.jsonl",
+        [step_event("rough_draft", "error", 1, error="Timeout")],
+    )
+
+    assert main(["--courses-dir", str(courses), "--json", "failures"]) == 0
+
+    output = json.loads(capsys.readouterr().out)
+    assert output["rough_draft"]["failure_rate"] == 1.0
+    assert (courses / "run_history.sqlite").exists()
+
+
+@pytest.mark.asyncio
+async def test_pipeline_events_are_indexed(tmp_path, mock_llm_service):
+    """Test that a pipeline run's log carries what the index needs."""
+    mock_llm_service.generate_text.return_value = "LO 1: History"
+    course_dir = tmp_path / "courses" / "course"
+    pipeline = LessonPipeline(
+        str(course_dir), "lesson_01", use_cache=False, llm_service=mock_llm_service
+    )
+
+    result = await pipeline.run_pipeline(
+        module="Test Module",
+        lesson_objective="Test history",
+        lesson_topics="Topic 1",
+        title="History",
+        course_context={},
+    )
+
+    with RunHistory(str(tmp_path / "run_history.sqlite")) as history:
+        history.refresh(str(tmp_path / "courses"))
+        latency = history.step_latency()
+
+    assert result["status"] == "success"
+    assert latency["rough_draft"]["count"] == 1
+    assert latency["rough_draft"]["mean_seconds"] >= 0
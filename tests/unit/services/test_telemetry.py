@@ -0,0 +1,211 @@
+"""
+Unit tests for pipeline telemetry: spans, metrics and exporters.
+"""
+
+import json
+import asyncio
+import pytest
+import httpx
+
+from services.http_transport import HTTPTransport
+from services.llm_service import LMStudioService
+from services.pipeline_service import LessonPipeline
+from services.telemetry import (
+    MetricsRegistry,
+    OTLPFileExporter,
+    OTLPHTTPExporter,
+    create_span_exporter,
+    get_metrics,
+    span,
+    start_span,
+    track_spans,
+)
+
+
+class TestSpans:
+    """Tests for spans and their collection."""
+
+    def test_spans_nest_and_are_collected(self):
+        """Test that spans started inside another become its children."""
+        with track_spans() as collector:
+            with span("pipeline.run") as run:
+                with span("pipeline.step", step="rough_draft") as step:
+                    step.add("input_tokens", 10)
+                    step.add("input_tokens", 5)
+
+        assert [s.name for s in collector.spans] == ["pipeline.step", "pipeline.run"]
+        assert step.parent_id == run.span_id
+        assert step.trace_id == run.trace_id
+        assert step.attributes["input_tokens"] == 15
+        assert run.elapsed >= step.elapsed
+
+    def test_failed_span_records_error(self):
+        """Test that an error raised in a span is recorded on it."""
+        with track_spans() as collector:
+            with pytest.raises(ValueError):
+                with span("llm.call"):
+                    raise ValueError("bad request")
+
+        assert collector.spans[0].error == "ValueError: bad request"
+        assert collector.spans[0].to_otlp()["status"]["code"] == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_tasks_get_their_own_spans(self):
+        """Test that spans in concurrent tasks share the parent, not each other."""
+
+        async def step(name):
+            with span("pipeline.step", step=name) as current:
+                await asyncio.sleep(0.01)
+                return current
+
+        with track_spans():
+            with span("pipeline.run") as run:
+                steps = await asyncio.gather(step("a"), step("b"))
+
+        assert {s.parent_id for s in steps} == {run.span_id}
+
+    def test_metrics_from_spans(self):
+        """Test that finished spans are recorded as labelled distributions."""
+        metrics = MetricsRegistry()
+        for seconds in (1.0, 2.0, 3.0):
+            finished = start_span("llm.call", step="rough_draft", provider="ollama")
+            finished.add("network_seconds", seconds)
+            finished.end()
+            metrics.record_span(finished)
+
+        [network] = metrics.snapshot("llm.call.network_seconds")
+        assert network["labels"] == {
+            "provider": "ollama",
+            "status": "ok",
+            "step": "rough_draft",
+        }
+        assert network["count"] == 3
+        assert network["mean"] == 2.0
+        assert network["p50"] == 2.0
+
+
+class TestExporters:
+    """Tests for the OTLP exporters."""
+
+    @pytest.mark.asyncio
+    async def test_otlp_http_exporter_posts_trace_request(self):
+        """Test that spans are posted in the OTLP/JSON format."""
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(json.loads(request.content))
+            return httpx.Response(200, json={})
+
+        with track_spans() as collector:
+            with span("pipeline.step", step="rough_draft", cost_usd=0.5):
+                pass
+
+        exporter = OTLPHTTPExporter(
+            endpoint="http://collector:4318/v1/traces",
+            transport=httpx.MockTransport(handler),
+        )
+        assert await exporter.export(collector.spans)
+
+        [resource_spans] = requests_seen[0]["resourceSpans"]
+        assert resource_spans["resource"]["attributes"] == [
+            {"key": "service.name", "value": {"stringValue": "course-writer"}}
+        ]
+        [exported] = resource_spans["scopeSpans"][0]["spans"]
+        assert exported["name"] == "pipeline.step"
+        assert len(exported["traceId"]) == 32
+        assert {"key": "cost_usd", "value": {"doubleValue": 0.5}} in exported[
+            "attributes"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_otlp_http_exporter_failure_is_not_raised(self):
+        """Test that an unreachable collector doesn't fail the run."""
+        exporter = OTLPHTTPExporter(
+            transport=httpx.MockTransport(lambda request: httpx.Response(503))
+        )
+        with track_spans() as collector:
+            with span("pipeline.run"):
+                pass
+
+        assert await exporter.export(collector.spans) is False
+
+    @pytest.mark.asyncio
+    async def test_otlp_file_exporter_appends_lines(self, tmp_path):
+        """Test that spans are appended to a file as OTLP/JSON lines."""
+        exporter = create_span_exporter({"exporter": "otlp_file"}, str(tmp_path))
+        assert isinstance(exporter, OTLPFileExporter)
+
+        for _ in range(2):
+            with track_spans() as collector:
+                with span("pipeline.run"):
+                    pass
+            assert await exporter.export(collector.spans)
+
+        with open(tmp_path / "traces.otlp.jsonl") as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 2
+        assert "resourceSpans" in lines[0]
+
+    def test_unknown_exporter_is_rejected(self):
+        """Test that a misspelled exporter fails loudly."""
+        assert create_span_exporter({"exporter": None}) is None
+        with pytest.raises(ValueError):
+            create_span_exporter({"exporter": "zipkin"})
+
+
+@pytest.mark.asyncio
+async def test_pipeline_reports_where_time_goes(tmp_path):
+    """Test that a run's result has per-step timing, retries and tokens."""
+    responses = [httpx.Response(503)]
+
+    def handler(request):
+        if responses:
+            return responses.pop(0)
+        return httpx.Response(
+            200,
+            json={
+                "choices": [
+                    {"message": {"content": "LO 1: Traced"}, "finish_reason": "stop"}
+                ],
+                "usage": {"prompt_tokens": 120, "completion_tokens": 30},
+            },
+        )
+
+    service = LMStudioService(
+        base_url="http://lmstudio:1234/v1",
+        model="telemetry-test",
+        transport=HTTPTransport("lmstudio", transport=httpx.MockTransport(handler)),
+    )
+    pipeline = LessonPipeline(
+        str(tmp_path), "lesson_01", use_cache=False, llm_service=service
+    )
+    pipeline.warm_up = False
+    pipeline.retry_policy.initial_delay = 0.01
+    pipeline.llm_semaphores = {"lmstudio": asyncio.Semaphore(1)}
+
+    result = await pipeline.run_pipeline(
+        module="Test Module",
+        lesson_objective="Test telemetry",
+        lesson_topics="Topic 1",
+        title="Telemetry",
+        course_context={},
+    )
+
+    assert result["status"] == "success"
+    telemetry = result["telemetry"]
+    assert telemetry["duration_seconds"] > 0
+    steps = telemetry["steps"]
+    assert set(steps) == set(result["step_report"])
+
+    first = steps["learning_outcomes"]
+    assert first["status"] == "success"
+    assert first["llm_calls"] == 1
+    assert first["retries"] == 1
+    assert first["network_seconds"] > 0
+    assert first["queue_wait_seconds"] >= 0
+    assert first["input_tokens"] == 120
+    assert first["output_tokens"] == 30
+    assert first["duration_seconds"] >= first["network_seconds"]
+
+    durations = get_metrics().snapshot("pipeline.step.duration_seconds")
+    assert any(m["labels"].get("step") == "learning_outcomes" for m in durations)
@@ -0,0 +1,67 @@
+"""
+Unit tests for token estimates and model token limits.
+"""
+
+import pytest
+
+from services.token_budget import (
+    DEFAULT_TOKEN_LIMITS,
+    TokenBudgetError,
+    TokenLimits,
+    estimate_tokens,
+    get_token_limits,
+)
+
+
+class TestTokenLimits:
+    """Tests for resolving model limits and sizing max_tokens."""
+
+    def test_longest_prefix_wins(self):
+        """Test that dated and family model names resolve to their limits."""
+        sonnet = get_token_limits("anthropic", "claude-3-7-sonnet-20250219")
+        mini = get_token_limits("openai", "gpt-4o-mini")
+        gpt4 = get_token_limits("openai", "gpt-4")
+        local = get_token_limits("ollama", "gemma3:12b")
+
+        assert (sonnet.context_window, sonnet.max_output_tokens) == (200000, 64000)
+        assert mini.max_output_tokens == 16384
+        assert gpt4.context_window == 8192
+        assert (local.context_window, local.max_output_tokens) == DEFAULT_TOKEN_LIMITS
+
+    def test_config_overrides(self):
+        """Test that app_config.yaml limits override the built-in table."""
+        llm_config = {
+            "models": {
+                "ollama": {
+                    "token_limits": {
+                        "context_window": 32768,
+                        "models": {"phi4:latest": {"max_output_tokens": 8000}},
+                    }
+                }
+            }
+        }
+
+        limits = get_token_limits("Ollama", "phi4:latest", llm_config)
+
+        assert (limits.context_window, limits.max_output_tokens) == (32768, 8000)
+
+    def test_plan_max_tokens(self):
+        """Test that max_tokens is reduced to fit, and refused when it can't."""
+        limits = TokenLimits(context_window=10000, max_output_tokens=4096)
+
+        assert limits.plan_max_tokens(1000, 2000) == 2000
+        assert limits.plan_max_tokens(1000, 20000) == 4096
+        assert limits.plan_max_tokens(7000, 4000) == 10000 - 7000 - 256
+        with pytest.raises(TokenBudgetError):
+            limits.plan_max_tokens(9500, 4000)
+
+
+def test_estimate_tokens():
+    """Test that the local estimate is in the right range for prose and code."""
+    prose = "The quick brown fox jumps over the lazy dog. " * 20
+    code = "def add(a, b):\n    return a + b\n" * 20
+
+    assert estimate_tokens("") == 0
+    assert estimate_tokens(None) == 0
+    assert 180 <= estimate_tokens(prose) <= 300
+    assert 180 <= estimate_tokens(code) <= 320
@@ -11,7 +11,7 @@ from models.course import Course
 from models.lesson import Lesson
 from services.file_service import FileService
 from services.draft_pipeline_service import DraftPipeline
-from services.prompt_service import PromptService
+from services.prompt_service import get_prompt_service
 
 
 def render_learning_outcomes() -> None:
@@ -23,7 +23,7 @@ def render_learning_outcomes() -> None:
 
     # Initialize services
     file_service = FileService()
-    prompt_service = PromptService()
+    prompt_service = get_prompt_service()
 
     # Setup logger
     logger = logging.getLogger(__name__)
@@ -141,17 +141,17 @@ def render_learning_outcomes() -> None:
         if "lesson_module" in st.session_state:
             default_module = st.session_state.lesson_module
         else:
-            default_module = ""
+            default_module = lesson.module or ""
 
         if "lesson_objective" in st.session_state:
             default_objective = st.session_state.lesson_objective
         else:
-            default_objective = ""
+            default_objective = lesson.objective or ""
 
         if "lesson_topics" in st.session_state:
             default_topics = st.session_state.lesson_topics
         else:
-            default_topics = ""
+            default_topics = lesson.topics or ""
 
         is_new_lesson = False
     else:
@@ -223,6 +223,9 @@ def render_learning_outcomes() -> None:
                         number=lesson_number,
                         title=lesson_title,
                         learning_outcomes=learning_outcomes,
+                        module=module or None,
+                        objective=objective or None,
+                        topics=topics or None,
                     )
 
                     # Save to session state
@@ -278,25 +281,34 @@ def render_learning_outcomes() -> None:
                             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                             temp_lesson_id = f"temp_lesson_{timestamp}"
 
-                            # Create pipeline
+                            # Create pipeline (uncached: regenerating must
+                            # draw a fresh sample from the model)
                             pipeline = DraftPipeline(
                                 course_dir=course_dir,
                                 lesson_id=temp_lesson_id,
                                 llm_provider=course.llm_config.provider,
                                 model=course.llm_config.model,
+                                use_cache=False,
                             )
 
-                            # Progress indicator
+                            # Progress indicator and live output
                             progress_placeholder = st.empty()
+                            output_placeholder = st.empty()
 
                             # Define progress callback
                             def progress_callback(step, status, message):
-                                progress_placeholder.info(
-                                    f"[{status.upper()}] {step}: {message}"
-                                )
-
-                            # Set progress callback
-                            pipeline.set_progress_callback(progress_callback)
+                                if status == "streaming":
+                                    # Render the learning outcomes as they arrive
+                                    output_placeholder.markdown(message)
+                                else:
+                                    progress_placeholder.info(
+                                        f"[{status.upper()}] {step}: {message}"
+                                    )
+
+                            # Set progress callback, streaming generated tokens
+                            pipeline.set_progress_callback(
+                                progress_callback, stream_tokens=True
+                            )
 
                             # Run just the learning outcomes generation part
                             loop = asyncio.new_event_loop()
@@ -322,8 +334,7 @@ def render_learning_outcomes() -> None:
 
                                 # Save the actual LO file for reference
                                 los_file = lesson.file_path(course_dir, "LOs")
-                                with open(los_file, "w", encoding="utf-8") as f:
-                                    f.write(los)
+                                file_service.save_markdown(los, los_file)
 
                                 st.session_state.current_lesson = lesson
                                 st.success("Learning outcomes generated and saved!")